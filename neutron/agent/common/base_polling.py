@@ -29,6 +29,14 @@ class BasePollingManager(object):
     def _is_polling_required(self):
         raise NotImplementedError()
 
+    def get_events(self):
+        """Return the device events detected since the previous call.
+
+        None means that the events are not known and all the devices have
+        to be scanned.
+        """
+        return None
+
     @property
     def is_polling_required(self):
         # Always consume the updates to minimize polling.
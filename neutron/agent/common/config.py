@@ -37,6 +37,10 @@ ROOT_HELPER_OPTS = [
     # rootwrap daemon command, which may be necessary for Xen?
     cfg.StrOpt('root_helper_daemon',
                help=_('Root helper daemon application to use when possible.')),
+    cfg.IntOpt('root_helper_daemon_pool_size', default=1,
+               help=_('Maximum number of root helper daemons spawned to run '
+                      'commands concurrently from different green '
+                      'threads.')),
 ]
 
 AGENT_STATE_OPTS = [
@@ -61,6 +65,17 @@ USE_NAMESPACES_OPTS = [
 IPTABLES_OPTS = [
     cfg.BoolOpt('comment_iptables_rules', default=True,
                 help=_("Add comments to iptables rules.")),
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_("Apply iptables changes as per-chain deltas with "
+                       "iptables-restore --noflush instead of saving, "
+                       "rebuilding and restoring every table on each "
+                       "apply.")),
+    cfg.IntOpt('iptables_full_resync_interval', default=600,
+               help=_("When incremental iptables apply is enabled, the "
+                      "number of seconds after which the next apply "
+                      "rebuilds and restores the full tables, to correct "
+                      "any drift from externally modified rules. Use 0 to "
+                      "only resync when a delta fails to apply.")),
 ]
 
 PROCESS_MONITOR_OPTS = [
@@ -14,8 +14,10 @@
 #    under the License.
 
 import collections
+import contextlib
 import itertools
 import operator
+import time
 
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -40,6 +42,9 @@ UNASSIGNED_OFPORT = []
 # OVS bridge fail modes
 FAILMODE_SECURE = 'secure'
 
+# Keywords of the flow actions in the flow files of ovs-ofctl add-flows
+FLOW_FILE_COMMANDS = {'add': 'add', 'mod': 'modify', 'del': 'delete'}
+
 OPTS = [
     cfg.IntOpt('ovs_vsctl_timeout',
                default=DEFAULT_OVS_VSCTL_TIMEOUT,
@@ -144,6 +149,9 @@ class OVSBridge(BaseOVS):
     def __init__(self, br_name):
         super(OVSBridge, self).__init__()
         self.br_name = br_name
+        # (action, flow string) tuples deferred until defer_apply_off
+        self._deferred_flows = None
+        self._use_bundle = False
 
     def set_controller(self, controllers):
         self.ovsdb.set_controller(self.br_name,
@@ -203,15 +211,17 @@ class OVSBridge(BaseOVS):
     def delete_port(self, port_name):
         self.ovsdb.del_port(port_name, self.br_name).execute()
 
-    def run_ofctl(self, cmd, args, process_input=None):
+    def run_ofctl(self, cmd, args, process_input=None, check_error=False):
         full_args = ["ovs-ofctl", cmd, self.br_name] + args
         try:
             return utils.execute(full_args, run_as_root=True,
                                  process_input=process_input)
         except Exception as e:
-            LOG.error(_LE("Unable to execute %(cmd)s. Exception: "
-                          "%(exception)s"),
-                      {'cmd': full_args, 'exception': e})
+            with excutils.save_and_reraise_exception() as ctx:
+                LOG.error(_LE("Unable to execute %(cmd)s. Exception: "
+                              "%(exception)s"),
+                          {'cmd': full_args, 'exception': e})
+                ctx.reraise = check_error
 
     def count_flows(self):
         flow_list = self.run_ofctl("dump-flows", []).split("\n")[1:]
@@ -241,7 +251,101 @@ class OVSBridge(BaseOVS):
 
     def do_action_flows(self, action, kwargs_list):
         flow_strs = [_build_flow_expr_str(kw, action) for kw in kwargs_list]
-        self.run_ofctl('%s-flows' % action, ['-'], '\n'.join(flow_strs))
+        if self._deferred_flows is not None:
+            self._deferred_flows.extend((action, flow_str)
+                                        for flow_str in flow_strs)
+        else:
+            self.run_ofctl('%s-flows' % action, ['-'], '\n'.join(flow_strs))
+
+    def do_bundle_flows(self, action_flow_tuples):
+        """Apply flows of different actions atomically, in their order.
+
+        :param action_flow_tuples: (action, flow kwargs) tuples, the action
+               being add, mod or del.
+
+        The flows are applied with one ovs-ofctl call in an OpenFlow bundle,
+        which requires OpenFlow 1.4 to be enabled on the bridge.
+        """
+        action_flow_strs = [(action, _build_flow_expr_str(kw, action))
+                            for action, kw in action_flow_tuples]
+        if self._deferred_flows is not None:
+            self._deferred_flows.extend(action_flow_strs)
+        else:
+            self._run_bundle_flows(action_flow_strs)
+
+    def _run_bundle_flows(self, action_flow_strs, check_error=False):
+        flow_strs = ['%s %s' % (FLOW_FILE_COMMANDS[action], flow_str)
+                     for action, flow_str in action_flow_strs]
+        self.run_ofctl('add-flows', ['--bundle', '-'], '\n'.join(flow_strs),
+                       check_error=check_error)
+
+    @contextlib.contextmanager
+    def defer_apply(self, use_bundle=False):
+        """Defer apply context."""
+        self.defer_apply_on(use_bundle=use_bundle)
+        try:
+            yield
+        finally:
+            self.defer_apply_off()
+
+    def defer_apply_on(self, use_bundle=False):
+        """Defer the flow changes of the bridge until defer_apply_off.
+
+        :param use_bundle: Optional, apply the deferred flows in one
+               OpenFlow bundle, see do_bundle_flows.
+        """
+        if self._deferred_flows is None:
+            self._deferred_flows = []
+            self._use_bundle = use_bundle
+
+    def defer_apply_off(self):
+        """Apply the flow changes deferred since defer_apply_on.
+
+        See apply_deferred_flows, the flow changes are no longer deferred
+        afterwards, even if applying them fails.
+        """
+        try:
+            return self.apply_deferred_flows()
+        finally:
+            self._deferred_flows = None
+
+    def apply_deferred_flows(self):
+        """Apply the flow changes deferred so far, and keep deferring.
+
+        The flows are applied in the order of the calls, consecutive flows
+        of the same action with one ovs-ofctl call, or all the flows with
+        one call if a bundle is used.  Return the number of flows applied
+        per action and the time it took.
+
+        Unlike the flow changes applied immediately, a failure of ovs-ofctl
+        is raised: the flows not applied are dropped, and the caller has to
+        set up the bridge again.
+        """
+        action_flow_strs = self._deferred_flows or []
+        if self._deferred_flows is not None:
+            self._deferred_flows = []
+        stats = dict((action, 0) for action in FLOW_FILE_COMMANDS)
+        stats['elapsed'] = 0
+        if not action_flow_strs:
+            return stats
+        start = time.time()
+        if self._use_bundle:
+            self._run_bundle_flows(action_flow_strs, check_error=True)
+        else:
+            grouped = itertools.groupby(action_flow_strs,
+                                        key=operator.itemgetter(0))
+            for action, action_flow_list in grouped:
+                flow_strs = [flow_str for _, flow_str in action_flow_list]
+                self.run_ofctl('%s-flows' % action, ['-'],
+                               '\n'.join(flow_strs), check_error=True)
+        stats['elapsed'] = time.time() - start
+        for action, _ in action_flow_strs:
+            stats[action] += 1
+        LOG.debug("Applied %(count)d flows on bridge %(bridge)s in "
+                  "%(elapsed).3f seconds",
+                  {'count': len(action_flow_strs), 'bridge': self.br_name,
+                   'elapsed': stats['elapsed']})
+        return stats
 
     def add_flow(self, **kwargs):
         self.do_action_flows('add', [kwargs])
@@ -292,6 +396,9 @@ class OVSBridge(BaseOVS):
         return self.add_port(local_name, *attrs)
 
     def get_port_name_list(self):
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            return port_index.get_port_names(self.br_name)
         return self.ovsdb.list_ports(self.br_name).execute(check_error=True)
 
     def get_port_stats(self, port_name):
@@ -308,15 +415,39 @@ class OVSBridge(BaseOVS):
                               "Exception: %(exception)s"),
                           {'cmd': args, 'exception': e})
 
-    # returns a VIF object for each VIF port
-    def get_vif_ports(self):
-        edge_ports = []
+    def _get_interfaces(self):
+        """Return the name, external_ids and ofport of the bridge's ports.
+
+        They are read from the in-memory port index when the OVSDB
+        interface provides one, and listed from OVSDB otherwise.
+        """
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            return port_index.get_interfaces(self.br_name)
         port_names = self.get_port_name_list()
-        for name in port_names:
+        cmd = self.ovsdb.db_list(
+            'Interface', port_names,
+            columns=['name', 'external_ids', 'ofport'], if_exists=True)
+        return cmd.execute(check_error=True)
+
+    def _iter_interfaces(self):
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            for interface in port_index.get_interfaces(self.br_name):
+                yield (interface['name'], interface['external_ids'],
+                       interface['ofport'])
+            return
+        for name in self.get_port_name_list():
             external_ids = self.db_get_val("Interface", name, "external_ids",
                                            check_error=True)
             ofport = self.db_get_val("Interface", name, "ofport",
                                      check_error=True)
+            yield name, external_ids, ofport
+
+    # returns a VIF object for each VIF port
+    def get_vif_ports(self):
+        edge_ports = []
+        for name, external_ids, ofport in self._iter_interfaces():
             if "iface-id" in external_ids and "attached-mac" in external_ids:
                 p = VifPort(name, ofport, external_ids["iface-id"],
                             external_ids["attached-mac"], self)
@@ -333,13 +464,8 @@ class OVSBridge(BaseOVS):
         return edge_ports
 
     def get_vif_port_to_ofport_map(self):
-        port_names = self.get_port_name_list()
-        cmd = self.ovsdb.db_list(
-            'Interface', port_names,
-            columns=['name', 'external_ids', 'ofport'], if_exists=True)
-        results = cmd.execute(check_error=True)
         port_map = {}
-        for r in results:
+        for r in self._get_interfaces():
             # fall back to basic interface name
             key = self.portid_from_external_ids(r['external_ids']) or r['name']
             try:
@@ -351,12 +477,7 @@ class OVSBridge(BaseOVS):
 
     def get_vif_port_set(self):
         edge_ports = set()
-        port_names = self.get_port_name_list()
-        cmd = self.ovsdb.db_list(
-            'Interface', port_names,
-            columns=['name', 'external_ids', 'ofport'], if_exists=True)
-        results = cmd.execute(check_error=True)
-        for result in results:
+        for result in self._get_interfaces():
             if result['ofport'] == UNASSIGNED_OFPORT:
                 LOG.warn(_LW("Found not yet ready openvswitch port: %s"),
                          result['name'])
@@ -392,18 +513,32 @@ class OVSBridge(BaseOVS):
         in the "Interface" table queried by the get_vif_port_set() method.
 
         """
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            return port_index.get_port_tags(self.br_name)
         port_names = self.get_port_name_list()
         cmd = self.ovsdb.db_list('Port', port_names, columns=['name', 'tag'])
         results = cmd.execute(check_error=True)
         return {p['name']: p['tag'] for p in results}
 
     def get_vif_port_by_id(self, port_id):
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            ports = [
+                port for port in port_index.get_interfaces_by_iface_id(port_id)
+                if port['external_ids'].get('attached-mac')]
+            return self._get_vif_port_by_id(port_id, ports)
         ports = self.ovsdb.db_find(
             'Interface', ('external_ids', '=', {'iface-id': port_id}),
             ('external_ids', '!=', {'attached-mac': ''}),
             columns=['external_ids', 'name', 'ofport']).execute()
+        return self._get_vif_port_by_id(port_id, ports)
+
+    def _get_vif_port_by_id(self, port_id, ports):
         for port in ports:
-            if self.br_name != self.get_bridge_for_iface(port['name']):
+            bridge = port.get('bridge') or self.get_bridge_for_iface(
+                port['name'])
+            if self.br_name != bridge:
                 continue
             if port['ofport'] in [UNASSIGNED_OFPORT, INVALID_OFPORT]:
                 LOG.warn(_LW("ofport: %(ofport)s for VIF: %(vif)s is not a"
@@ -415,6 +550,21 @@ class OVSBridge(BaseOVS):
         LOG.info(_LI("Port %(port_id)s not present in bridge %(br_name)s"),
                  {'port_id': port_id, 'br_name': self.br_name})
 
+    def get_vif_port_by_ofport(self, ofport):
+        """Return the VIF port of the bridge with the ofport, or None."""
+        port_index = self.ovsdb.get_port_index()
+        if port_index is not None:
+            port = port_index.get_interface_by_ofport(self.br_name, ofport)
+        else:
+            port = next((p for p in self._get_interfaces()
+                         if p['ofport'] == ofport), None)
+        if not port:
+            return
+        external_ids = port['external_ids']
+        if 'iface-id' in external_ids and 'attached-mac' in external_ids:
+            return VifPort(port['name'], ofport, external_ids['iface-id'],
+                           external_ids['attached-mac'], self)
+
     def delete_ports(self, all_ports=False):
         if all_ports:
             port_names = self.get_port_name_list()
@@ -456,16 +606,19 @@ class DeferredOVSBridge(object):
     ALLOWED_PASSTHROUGHS = 'add_port', 'add_tunnel_port', 'delete_port'
 
     def __init__(self, br, full_ordered=False,
-                 order=('add', 'mod', 'del')):
+                 order=('add', 'mod', 'del'), use_bundle=False):
         '''Constructor.
 
         :param br: wrapped bridge
         :param full_ordered: Optional, disable flow reordering (slower)
         :param order: Optional, define in which order flow are applied
+        :param use_bundle: Optional, apply all the flows with one ovs-ofctl
+                           call in an OpenFlow bundle (requires OpenFlow 1.4)
         '''
 
         self.br = br
         self.full_ordered = full_ordered
+        self.use_bundle = use_bundle
         self.order = order
         if not self.full_ordered:
             self.weights = dict((y, x) for x, y in enumerate(self.order))
@@ -494,6 +647,10 @@ class DeferredOVSBridge(object):
         if not self.full_ordered:
             action_flow_tuples.sort(key=lambda af: self.weights[af[0]])
 
+        if self.use_bundle:
+            self.br.do_bundle_flows(action_flow_tuples)
+            return
+
         grouped = itertools.groupby(action_flow_tuples,
                                     key=operator.itemgetter(0))
         itemgetter_1 = operator.itemgetter(1)
@@ -14,7 +14,9 @@
 #    under the License.
 
 import collections
+import math
 import os
+import time
 
 import eventlet
 
@@ -57,6 +59,10 @@ class DhcpAgent(manager.Manager):
         self.needs_resync_reasons = collections.defaultdict(list)
         self.conf = cfg.CONF
         self.cache = NetworkCache()
+        self._pending_reloads = set()
+        # The networks served before the agent started
+        self._restored_network_ids = set()
+        self.sync_stats = NetworkSyncStats()
         self.dhcp_driver_cls = importutils.import_class(self.conf.dhcp_driver)
         ctx = context.get_admin_context_without_session()
         self.plugin_rpc = DhcpPluginApi(topics.PLUGIN,
@@ -85,6 +91,7 @@ class DhcpAgent(manager.Manager):
                                      "subnets": [],
                                      "ports": []})
                 self.cache.put(net)
+                self._restored_network_ids.add(net_id)
         except NotImplementedError:
             # just go ahead with an empty networks cache
             LOG.debug("The '%s' DHCP-driver does not support retrieving of a "
@@ -164,17 +171,32 @@ class DhcpAgent(manager.Manager):
                     LOG.exception(_LE('Unable to sync network state on '
                                       'deleted network %s'), deleted_id)
 
-            for network in active_networks:
+            networks = [
+                network for network in active_networks
                 if (not only_nets or  # specifically resync all
-                        network.id not in known_network_ids or  # missing net
-                        network.id in only_nets):  # specific network to sync
-                    pool.spawn(self.safe_configure_dhcp_for_network, network)
+                    network.id not in known_network_ids or  # missing net
+                    network.id in only_nets)]  # specific network to sync
+            # The networks with pending changes are configured first
+            pending_ids = only_nets | self._pending_reloads
+            networks.sort(key=lambda network: network.id not in pending_ids)
+            self.sync_stats.start(len(networks))
+            for network in networks:
+                pool.spawn(self._sync_network, network)
             pool.waitall()
             LOG.info(_LI('Synchronizing state complete'))
 
         except Exception as e:
             self.schedule_resync(e)
             LOG.exception(_LE('Unable to sync network state.'))
+        finally:
+            self.sync_stats.finish()
+
+    def _sync_network(self, network):
+        start = time.time()
+        try:
+            self.safe_configure_dhcp_for_network(network)
+        finally:
+            self.sync_stats.record(time.time() - start)
 
     @utils.exception_logger()
     def _periodic_resync_helper(self):
@@ -228,10 +250,15 @@ class DhcpAgent(manager.Manager):
         enable_metadata = self.dhcp_driver_cls.should_enable_metadata(
                 self.conf, network)
         dhcp_network_enabled = False
+        action = 'enable'
+        if network.id in self._restored_network_ids:
+            # The DHCP server of the network may still be running
+            self._restored_network_ids.discard(network.id)
+            action = 'restore'
 
         for subnet in network.subnets:
             if subnet.enable_dhcp:
-                if self.call_driver('enable', network):
+                if self.call_driver(action, network):
                     dhcp_network_enabled = True
                     self.cache.put(network)
                 break
@@ -333,7 +360,10 @@ class DhcpAgent(manager.Manager):
                 if old_ips != new_ips:
                     driver_action = 'restart'
             self.cache.put_port(updated_port)
-            self.call_driver(driver_action, network)
+            if driver_action == 'reload_allocations':
+                self._reload_allocations(network)
+            else:
+                self.call_driver(driver_action, network)
 
     def _is_port_on_this_agent(self, port):
         thishost = utils.get_dhcp_agent_device_id(
@@ -350,6 +380,26 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
+            self._reload_allocations(network)
+
+    def _reload_allocations(self, network):
+        """Reload the allocations of the network after a port event.
+
+        With dhcp_reload_delay, the events of the network received until the
+        delay elapses are gathered into a single reload.
+        """
+        if not self.conf.dhcp_reload_delay:
+            self.call_driver('reload_allocations', network)
+        elif network.id not in self._pending_reloads:
+            self._pending_reloads.add(network.id)
+            eventlet.spawn_after(self.conf.dhcp_reload_delay,
+                                 self._reload_pending_allocations, network.id)
+
+    @utils.synchronized('dhcp-agent')
+    def _reload_pending_allocations(self, network_id):
+        self._pending_reloads.discard(network_id)
+        network = self.cache.get_network_by_id(network_id)
+        if network:
             self.call_driver('reload_allocations', network)
 
     def enable_isolated_metadata_proxy(self, network):
@@ -546,6 +596,61 @@ class NetworkCache(object):
                 'ports': num_ports}
 
 
+class NetworkSyncStats(object):
+    """Progress of the synchronization of the networks with the server.
+
+    The latency of the configuration of each network is given in
+    milliseconds, its percentiles are computed over the latest ones.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, max_samples=1000):
+        self._latencies = collections.deque(maxlen=max_samples)
+        self._count = 0
+        self._max = 0.0
+        self._networks = 0
+        self._networks_done = 0
+        self._started_at = None
+        self._last_duration = None
+
+    def start(self, networks):
+        """Starts a synchronization of a number of networks."""
+        self._networks = networks
+        self._networks_done = 0
+        self._started_at = time.time()
+
+    def record(self, duration):
+        """Records the configuration of a network."""
+        latency = duration * 1000
+        self._latencies.append(latency)
+        self._count += 1
+        self._max = max(self._max, latency)
+        self._networks_done += 1
+
+    def finish(self):
+        if self._started_at is not None:
+            self._last_duration = (time.time() - self._started_at) * 1000
+            self._started_at = None
+
+    def get_state(self):
+        latencies = sorted(self._latencies)
+        state = {'in_progress': self._started_at is not None,
+                 'networks': self._networks,
+                 'networks_done': self._networks_done,
+                 'last_duration': self._last_duration,
+                 'network_latency': {'count': self._count,
+                                     'max': self._max}}
+        for percentile in self.PERCENTILES:
+            value = None
+            if latencies:
+                # The nearest-rank percentile
+                rank = int(math.ceil(percentile * len(latencies) / 100.0))
+                value = latencies[max(rank, 1) - 1]
+            state['network_latency']['p%d' % percentile] = value
+        return state
+
+
 class DhcpAgentWithStateReport(DhcpAgent):
     def __init__(self, host=None):
         super(DhcpAgentWithStateReport, self).__init__(host=host)
@@ -571,6 +676,10 @@ class DhcpAgentWithStateReport(DhcpAgent):
         try:
             self.agent_state.get('configurations').update(
                 self.cache.get_state())
+            self.agent_state['configurations']['sync_state'] = (
+                self.sync_stats.get_state())
+            self.agent_state['configurations']['execute_latency'] = (
+                linux_utils.get_execute_latency_summary())
             ctx = context.get_admin_context_without_session()
             self.state_rpc.report_state(ctx, self.agent_state, self.use_call)
             self.use_call = False
@@ -29,7 +29,11 @@ DHCP_AGENT_OPTS = [
                        "dedicated network. Requires "
                        "enable_isolated_metadata = True")),
     cfg.IntOpt('num_sync_threads', default=4,
-               help=_('Number of threads to use during sync process.'))
+               help=_('Number of threads to use during sync process.')),
+    cfg.IntOpt('dhcp_reload_delay', default=0,
+               help=_("Number of seconds during which the port events of a "
+                      "network are gathered into a single reload of its "
+                      "allocations. 0 reloads them on each event.")),
 ]
 
 DHCP_OPTS = [
@@ -21,6 +21,7 @@ from oslo_config import cfg
 from neutron.agent.common import config
 from neutron.agent.dhcp import config as dhcp_config
 from neutron.agent.linux import interface
+from neutron.agent.linux import ip_lib
 from neutron.agent.metadata import config as metadata_config
 from neutron.common import config as common_config
 from neutron.common import topics
@@ -38,6 +39,7 @@ def register_options():
     cfg.CONF.register_opts(metadata_config.DRIVER_OPTS)
     cfg.CONF.register_opts(metadata_config.SHARED_OPTS)
     cfg.CONF.register_opts(interface.OPTS)
+    cfg.CONF.register_opts(ip_lib.OPTS)
 
 
 def main():
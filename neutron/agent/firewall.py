@@ -113,6 +113,15 @@ class FirewallDriver(object):
         """Update rules in a security group."""
         raise NotImplementedError()
 
+    def update_security_group_member_deltas(self, sg_id, member_deltas):
+        """Add and remove members IPs of a security group.
+
+        :param member_deltas: {ethertype: {'added': [ip], 'removed': [ip]}}
+        :returns: True if the filters of the ports with rules referencing
+        the security group have to be updated for the change to apply.
+        """
+        raise NotImplementedError()
+
 
 class NoopFirewallDriver(FirewallDriver):
     """Noop Firewall Driver.
@@ -148,3 +157,6 @@ class NoopFirewallDriver(FirewallDriver):
 
     def update_security_group_rules(self, sg_id, rules):
         pass
+
+    def update_security_group_member_deltas(self, sg_id, member_deltas):
+        return False
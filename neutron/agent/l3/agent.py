@@ -13,6 +13,8 @@
 #    under the License.
 #
 
+import time
+
 import eventlet
 import netaddr
 from oslo_config import cfg
@@ -33,6 +35,7 @@ from neutron.agent.l3 import router_info as rinf
 from neutron.agent.l3 import router_processing_queue as queue
 from neutron.agent.linux import external_process
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import utils as linux_utils
 from neutron.agent.metadata import driver as metadata_driver
 from neutron.agent import rpc as agent_rpc
 from neutron.callbacks import events
@@ -41,6 +44,7 @@ from neutron.callbacks import resources
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
 from neutron.common import ipv6_utils
+from neutron.common import router_sync
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron import context as n_context
@@ -62,6 +66,11 @@ NS_PREFIX = namespaces.NS_PREFIX
 INTERNAL_DEV_PREFIX = namespaces.INTERNAL_DEV_PREFIX
 EXTERNAL_DEV_PREFIX = namespaces.EXTERNAL_DEV_PREFIX
 
+# Number of routers to fetch from the server at a time on a full sync,
+# halved down to the minimum on each RPC timeout
+SYNC_ROUTERS_MAX_CHUNK_SIZE = 256
+SYNC_ROUTERS_MIN_CHUNK_SIZE = 32
+
 
 class L3PluginApi(object):
     """Agent side of the l3 agent RPC API.
@@ -77,6 +86,8 @@ class L3PluginApi(object):
         1.4 - Added L3 HA update_router_state. This method was reworked in
               to update_ha_routers_states
         1.5 - Added update_ha_routers_states
+        1.6 - Added get_router_changes
+        1.7 - Added get_router_ids
 
     """
 
@@ -91,6 +102,26 @@ class L3PluginApi(object):
         return cctxt.call(context, 'sync_routers', host=self.host,
                           router_ids=router_ids)
 
+    def get_router_changes(self, context, revisions):
+        """Make a remote process call to retrieve the changes of routers.
+
+        The reply carries only the changes, the server builds the routers
+        as for get_routers.
+
+        :param revisions: the revisions of the routers by router id, see
+                          neutron.common.router_sync
+        """
+        cctxt = self.client.prepare(version='1.6')
+        return cctxt.call(context, 'sync_router_changes', host=self.host,
+                          revisions=revisions)
+
+    def get_router_ids(self, context):
+        """Make a remote process call to retrieve the ids of the routers
+        to sync.
+        """
+        cctxt = self.client.prepare(version='1.7')
+        return cctxt.call(context, 'get_router_ids', host=self.host)
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -177,6 +208,9 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
         self.context = n_context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.L3PLUGIN, host)
         self.fullsync = True
+        self._use_router_changes = self.conf.incremental_router_sync
+        self._use_router_ids = True
+        self.sync_routers_chunk_size = SYNC_ROUTERS_MAX_CHUNK_SIZE
 
         # Get the list of service plugins from Neutron Server
         # This is the first place where we contact neutron-server on startup
@@ -215,6 +249,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
             self.conf.use_namespaces)
 
         self._queue = queue.RouterProcessingQueue()
+        self.router_processing_stats = queue.RouterProcessingStats()
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -330,6 +365,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
 
         ri.delete(self)
         del self.router_info[router_id]
+        self.router_processing_stats.remove(router_id)
 
         registry.notify(resources.ROUTER, events.AFTER_DELETE, self, router=ri)
 
@@ -426,20 +462,43 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
         ri.process(self)
         registry.notify(resources.ROUTER, events.AFTER_UPDATE, self, router=ri)
 
+    def _fetch_routers(self, router_id):
+        """Fetch a router, or only its changes if the agent knows it.
+
+        The changes are only fetched with incremental_router_sync. They are
+        merged into the router known, which is returned whole and processed
+        as a fetched router would be.
+        """
+        ri = self.router_info.get(router_id)
+        if ri and self._use_router_changes:
+            revisions = ri.router.get(router_sync.REVISIONS)
+            try:
+                changes = self.plugin_rpc.get_router_changes(
+                    self.context, {router_id: revisions})
+            except oslo_messaging.UnsupportedVersion:
+                LOG.info(_LI("Server does not support incremental router "
+                             "sync, falling back to full router sync"))
+                self._use_router_changes = False
+            else:
+                return [router_sync.apply_router_changes(ri.router, change)
+                        for change in changes]
+        return self.plugin_rpc.get_routers(self.context, [router_id])
+
     def _process_router_update(self):
         for rp, update in self._queue.each_update_to_next_router():
             LOG.debug("Starting router update for %s, action %s, priority %s",
                       update.id, update.action, update.priority)
+            start = time.time()
             router = update.router
             if update.action != queue.DELETE_ROUTER and not router:
                 try:
                     update.timestamp = timeutils.utcnow()
-                    routers = self.plugin_rpc.get_routers(self.context,
-                                                          [update.id])
+                    routers = self._fetch_routers(update.id)
                 except Exception:
                     msg = _LE("Failed to fetch router information for '%s'")
                     LOG.exception(msg, update.id)
                     self.fullsync = True
+                    self._record_router_update(update.id, start, failed=True)
                     continue
 
                 if routers:
@@ -453,6 +512,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
                     # one router by sticking the update at the end of the queue
                     # at a lower priority.
                     self.fullsync = True
+                    self._record_router_update(update.id, start, failed=True)
                 else:
                     # need to update timestamp of removed router in case
                     # there are older events for the same router in the
@@ -474,14 +534,24 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
                 msg = _LE("Failed to process compatible router '%s'")
                 LOG.exception(msg, update.id)
                 self.fullsync = True
+                self._record_router_update(update.id, start, failed=True)
                 continue
 
-            LOG.debug("Finished a router update for %s", update.id)
+            duration = self._record_router_update(update.id, start)
+            LOG.debug("Finished a router update for %(router_id)s in "
+                      "%(duration).3fs",
+                      {'router_id': update.id, 'duration': duration})
             rp.fetched_and_processed(update.timestamp)
 
+    def _record_router_update(self, router_id, start, failed=False):
+        duration = time.time() - start
+        self.router_processing_stats.record(router_id, duration,
+                                            failed=failed)
+        return duration
+
     def _process_routers_loop(self):
         LOG.debug("Starting _process_routers_loop")
-        pool = eventlet.GreenPool(size=8)
+        pool = eventlet.GreenPool(size=self.conf.router_processing_workers)
         while True:
             pool.spawn_n(self._process_router_update)
 
@@ -511,34 +581,65 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback,
         except n_exc.AbortSyncRouters:
             self.fullsync = True
 
+    def _fetch_router_ids(self, context):
+        """Return the ids of the routers to sync, None for all of them."""
+        if not self.conf.use_namespaces:
+            return [self.conf.router_id]
+        if self._use_router_ids:
+            try:
+                return self.plugin_rpc.get_router_ids(context)
+            except oslo_messaging.UnsupportedVersion:
+                LOG.info(_LI("Server does not support fetching the router "
+                             "ids, falling back to fetching all the routers "
+                             "at once"))
+                self._use_router_ids = False
+
+    def _fetch_routers_by_chunks(self, context):
+        """Fetch the routers to sync, yielding them chunk by chunk."""
+        router_ids = self._fetch_router_ids(context)
+        if router_ids is None:
+            yield self.plugin_rpc.get_routers(context)
+            return
+        chunk_size = self.sync_routers_chunk_size
+        for i in range(0, len(router_ids), chunk_size):
+            try:
+                yield self.plugin_rpc.get_routers(
+                    context, router_ids[i:i + chunk_size])
+            except oslo_messaging.MessagingTimeout:
+                if chunk_size > SYNC_ROUTERS_MIN_CHUNK_SIZE:
+                    self.sync_routers_chunk_size = max(
+                        chunk_size / 2, SYNC_ROUTERS_MIN_CHUNK_SIZE)
+                    LOG.warning(_LW("Server failed to return the routers in "
+                                    "time, decreasing the chunk size to "
+                                    "%s"), self.sync_routers_chunk_size)
+                raise
+
     def fetch_and_sync_all_routers(self, context, ns_manager):
         prev_router_ids = set(self.router_info)
+        curr_router_ids = set()
         timestamp = timeutils.utcnow()
 
         try:
-            if self.conf.use_namespaces:
-                routers = self.plugin_rpc.get_routers(context)
-            else:
-                routers = self.plugin_rpc.get_routers(context,
-                                                      [self.conf.router_id])
-
+            # The routers of each chunk are queued for processing while the
+            # next chunk is fetched
+            for routers in self._fetch_routers_by_chunks(context):
+                LOG.debug('Processing :%r', routers)
+                for r in routers:
+                    curr_router_ids.add(r['id'])
+                    ns_manager.keep_router(r['id'])
+                    update = queue.RouterUpdate(
+                        r['id'],
+                        queue.PRIORITY_SYNC_ROUTERS_TASK,
+                        router=r,
+                        timestamp=timestamp)
+                    self._queue.add(update)
         except oslo_messaging.MessagingException:
             LOG.exception(_LE("Failed synchronizing routers due to RPC error"))
             raise n_exc.AbortSyncRouters()
         else:
-            LOG.debug('Processing :%r', routers)
-            for r in routers:
-                ns_manager.keep_router(r['id'])
-                update = queue.RouterUpdate(r['id'],
-                                            queue.PRIORITY_SYNC_ROUTERS_TASK,
-                                            router=r,
-                                            timestamp=timestamp)
-                self._queue.add(update)
             self.fullsync = False
             LOG.debug("periodic_sync_routers_task successfully completed")
 
-            curr_router_ids = set([r['id'] for r in routers])
-
             # Delete routers that have disappeared since the last sync
             for router_id in prev_router_ids - curr_router_ids:
                 ns_manager.keep_router(router_id)
@@ -579,7 +680,9 @@ class L3NATAgentWithStateReport(L3NATAgent):
                 'external_network_bridge': self.conf.external_network_bridge,
                 'gateway_external_network_id':
                 self.conf.gateway_external_network_id,
-                'interface_driver': self.conf.interface_driver},
+                'interface_driver': self.conf.interface_driver,
+                'router_processing_workers':
+                self.conf.router_processing_workers},
             'start_flag': True,
             'agent_type': l3_constants.AGENT_TYPE_L3}
         report_interval = self.conf.AGENT.report_interval
@@ -608,6 +711,13 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        configurations['router_processing_latency'] = (
+            self.router_processing_stats.get_stats())
+        configurations['slowest_routers'] = (
+            self.router_processing_stats.get_slowest_routers())
+        configurations['router_queue'] = self._queue.get_stats()
+        configurations['execute_latency'] = (
+            linux_utils.get_execute_latency_summary())
         try:
             self.state_rpc.report_state(self.context, self.agent_state,
                                         self.use_call)
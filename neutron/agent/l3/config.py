@@ -15,6 +15,7 @@
 #    under the License.
 
 from oslo_config import cfg
+from oslo_config import types
 
 from neutron.common import constants
 
@@ -78,6 +79,17 @@ OPTS = [
                 help=_("Allow running metadata proxy.")),
     cfg.BoolOpt('router_delete_namespaces', default=False,
                 help=_("Delete namespace after removing a router.")),
+    cfg.Opt('router_processing_workers', type=types.Integer(min=1),
+            default=8,
+            help=_("Number of routers processed concurrently by the "
+                   "agent. Updates of a given router are always "
+                   "processed in order.")),
+    cfg.BoolOpt('incremental_router_sync', default=False,
+                help=_("Fetch only the changes of the routers known by the "
+                       "agent. This only reduces the size of the replies: "
+                       "the server still builds the whole routers and "
+                       "computes the digests of their parts, and the agent "
+                       "still processes the whole routers.")),
     cfg.StrOpt('metadata_access_mark',
                default='0x1',
                help=_('Iptables mangle mark used to mark metadata valid '
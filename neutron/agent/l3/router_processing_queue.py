@@ -13,8 +13,12 @@
 #    under the License.
 #
 
+import bisect
 import datetime
+import heapq
+import itertools
 import Queue
+import time
 
 from oslo_utils import timeutils
 
@@ -23,6 +27,12 @@ PRIORITY_RPC = 0
 PRIORITY_SYNC_ROUTERS_TASK = 1
 DELETE_ROUTER = 1
 
+# Upper bounds, in milliseconds, of the router processing latency histogram
+# buckets
+ROUTER_LATENCY_BUCKETS = (100, 500, 1000, 5000, 10000, 30000, 60000)
+# Number of routers with the slowest updates reported by the agent
+SLOWEST_ROUTERS_COUNT = 3
+
 
 class RouterUpdate(object):
     """Encapsulates a router update
@@ -135,14 +145,108 @@ class ExclusiveRouterProcessor(object):
                     yield update
 
 
+def coalesce_updates(update, new_update):
+    """Returns an update of a router standing for two updates of it.
+
+    The most recent update wins, the new one on equal timestamps, as
+    processing it makes processing the other one useless. It gets the
+    highest priority of the two.
+    """
+    latest = update if update.timestamp > new_update.timestamp else new_update
+    return RouterUpdate(latest.id, min(update.priority, new_update.priority),
+                        action=latest.action, router=latest.router,
+                        timestamp=latest.timestamp)
+
+
+class _RouterUpdateLanes(object):
+    """Router updates waiting to be processed, with one lane per priority.
+
+    An update added for a router that already has one waiting is coalesced
+    with it: a single update stands for both, keeping the place of the
+    older one in its lane, or moving to the lane of a higher priority.
+    Within a lane, the updates are taken in the order they were added.
+    """
+
+    def __init__(self):
+        self._lanes = {}
+        # The update waiting per router, with its place and the time it
+        # started waiting
+        self._waiting = {}
+        self._sequence = itertools.count()
+        self.coalesced = 0
+        self.dequeued = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def push(self, update):
+        waiting = self._waiting.get(update.id)
+        if waiting:
+            self.coalesced += 1
+            sequence, enqueued_at = waiting[1:]
+            update = coalesce_updates(waiting[0], update)
+        else:
+            sequence, enqueued_at = next(self._sequence), time.time()
+        self._waiting[update.id] = (update, sequence, enqueued_at)
+        # The entry of the update replaced in the lanes, if any, is left
+        # out when met
+        heapq.heappush(self._lanes.setdefault(update.priority, []),
+                       (sequence, update))
+
+    def pop(self):
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            while lane:
+                update = heapq.heappop(lane)[1]
+                waiting = self._waiting.get(update.id)
+                if waiting and waiting[0] is update:
+                    del self._waiting[update.id]
+                    wait = time.time() - waiting[2]
+                    self.dequeued += 1
+                    self.wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
+                    return update
+
+
+class _CoalescingQueue(Queue.Queue):
+    """Blocking queue of router updates, see _RouterUpdateLanes."""
+
+    def _init(self, maxsize):
+        self.queue = _RouterUpdateLanes()
+
+    def _put(self, update):
+        self.queue.push(update)
+
+    def _get(self):
+        return self.queue.pop()
+
+
 class RouterProcessingQueue(object):
     """Manager of the queue of routers to process."""
     def __init__(self):
-        self._queue = Queue.PriorityQueue()
+        self._queue = _CoalescingQueue()
 
     def add(self, update):
         self._queue.put(update)
 
+    def get_stats(self):
+        """Returns statistics of the queue.
+
+        They give the number of updates waiting, the number of updates
+        taken from the queue with the total and maximum time they waited in
+        whole milliseconds, and the number of updates coalesced with an
+        update of the same router already waiting. They are part of the
+        agent state reported to the server, so they are kept short.
+        """
+        updates = self._queue.queue
+        return {'depth': len(updates),
+                'dequeued': updates.dequeued,
+                'wait_total': int(round(updates.wait_total * 1000)),
+                'wait_max': int(round(updates.wait_max * 1000)),
+                'coalesced': updates.coalesced}
+
     def each_update_to_next_router(self):
         """Grabs the next router from the queue and processes
 
@@ -160,3 +264,65 @@ class RouterProcessingQueue(object):
             # noop.
             for update in rp.updates():
                 yield (rp, update)
+
+
+class RouterProcessingStats(object):
+    """Latency of the processing of the routers of the agent.
+
+    The latency of a router update covers fetching the router from the
+    server, if needed, and processing it, until it succeeds or fails. The
+    statistics are part of the agent state reported to the server, stored
+    in a size-limited column, so only the maximum latency of each router
+    is kept and the latencies are given in whole milliseconds.
+    """
+
+    def __init__(self, buckets=ROUTER_LATENCY_BUCKETS):
+        self.buckets = buckets
+        # The maximum latency of the updates of each router
+        self._routers = {}
+        self._count = 0
+        self._failed = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._histogram = [0] * (len(buckets) + 1)
+
+    def record(self, router_id, duration, failed=False):
+        duration_ms = duration * 1000
+        self._count += 1
+        self._total += duration_ms
+        self._max = max(self._max, duration_ms)
+        self._histogram[bisect.bisect_left(self.buckets, duration_ms)] += 1
+        if failed:
+            self._failed += 1
+        self._routers[router_id] = max(self._routers.get(router_id, 0.0),
+                                       duration_ms)
+
+    def remove(self, router_id):
+        """Forgets the latencies of a removed router."""
+        self._routers.pop(router_id, None)
+
+    def get_slowest_routers(self, count=SLOWEST_ROUTERS_COUNT):
+        """Returns the routers with the slowest updates.
+
+        Up to count routers are given by decreasing maximum latency, with
+        their id and the maximum latency of their updates.
+        """
+        slowest = heapq.nlargest(count, self._routers.items(),
+                                 key=lambda item: item[1])
+        return [{'router_id': router_id, 'max': int(round(latency))}
+                for router_id, latency in slowest]
+
+    def get_stats(self):
+        """Returns the number of router updates and their latency.
+
+        The number of failed updates is also given. The latencies given are
+        the total and maximum ones in milliseconds, with the number of
+        updates per bucket, keyed by their upper bound in milliseconds
+        ('inf' for the last one).
+        """
+        bucket_names = [str(b) for b in self.buckets] + ['inf']
+        return {'count': self._count,
+                'failed': self._failed,
+                'total': int(round(self._total)),
+                'max': int(round(self._max)),
+                'buckets': dict(zip(bucket_names, self._histogram))}
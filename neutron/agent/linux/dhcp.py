@@ -133,6 +133,14 @@ class DhcpBase(object):
         self.disable(retain_port=True)
         self.enable()
 
+    def restore(self):
+        """Enable DHCP for a network served before the agent started.
+
+        Drivers able to keep serving the network without setting it up
+        again override this.
+        """
+        self.enable()
+
     @abc.abstractproperty
     def active(self):
         """Boolean representing the running state of the DHCP server."""
@@ -282,6 +290,12 @@ class Dnsmasq(DhcpLocalProcess):
 
     _TAG_PREFIX = 'tag%d'
 
+    # The Dnsmasq instances are created for each call of the driver, the
+    # contents of the config files last written and the host entries last
+    # rendered for each port are kept here, by network id.
+    _rendered_files = {}
+    _port_entries = {}
+
     @classmethod
     def check_version(cls):
         pass
@@ -391,17 +405,45 @@ class Dnsmasq(DhcpLocalProcess):
         or it's reloaded if the process is not running.
         """
 
-        self._output_config_files()
+        changed = self._output_config_files()
 
         pm = self._get_process_manager(
             cmd_callback=self._build_cmdline_callback)
 
+        if reload_with_HUP and not changed and pm.active:
+            LOG.debug('Config files of network %s are unchanged, not '
+                      'reloading dnsmasq', self.network.id)
+            return
+
         pm.enable(reload_cfg=reload_with_HUP)
 
         self.process_monitor.register(uuid=self.network.id,
                                       service_name=DNSMASQ_SERVICE_NAME,
                                       monitored_process=pm)
 
+    def restore(self):
+        """Keep the running dnsmasq if it is up to date, or enable DHCP.
+
+        dnsmasq is up to date when it runs with the command line and the
+        config files of the network and its device exists, e.g. when the
+        network did not change while the agent was not running.
+        """
+        pm = self._get_process_manager(
+            cmd_callback=self._build_cmdline_callback)
+        interface_name = self.interface_name
+        if (interface_name and pm.active and
+                ip_lib.device_exists(interface_name,
+                                     namespace=self.network.namespace) and
+                pm.cmdline == self._build_cmdline_callback(
+                    pm.get_pid_file_name()) and
+                not self._output_config_files()):
+            LOG.debug('Reusing dnsmasq of network %s', self.network.id)
+            self.process_monitor.register(uuid=self.network.id,
+                                          service_name=DNSMASQ_SERVICE_NAME,
+                                          monitored_process=pm)
+            return
+        self.enable()
+
     def _release_lease(self, mac_address, ip):
         """Release a DHCP lease."""
         cmd = ['dhcp_release', self.interface_name, ip, mac_address]
@@ -409,9 +451,29 @@ class Dnsmasq(DhcpLocalProcess):
         ip_wrapper.netns.execute(cmd, run_as_root=True)
 
     def _output_config_files(self):
+        """Write the config files, returns whether any of them changed."""
+        self._config_files_changed = False
         self._output_hosts_file()
         self._output_addn_hosts_file()
         self._output_opts_file()
+        return self._config_files_changed
+
+    def _replace_file(self, filename, contents):
+        """Write a config file, unless it already has the contents."""
+        rendered = self._rendered_files.setdefault(self.network.id, {})
+        if filename not in rendered:
+            # The file may have been written before the agent started
+            rendered[filename] = utils.get_value_from_file(filename)
+        if rendered[filename] == contents and os.path.exists(filename):
+            return
+        utils.replace_file(filename, contents)
+        rendered[filename] = contents
+        self._config_files_changed = True
+
+    def _remove_config_files(self):
+        super(Dnsmasq, self)._remove_config_files()
+        self._rendered_files.pop(self.network.id, None)
+        self._port_entries.pop(self.network.id, None)
 
     def reload_allocations(self):
         """Rebuild the dnsmasq config and signal the dnsmasq to reload."""
@@ -483,28 +545,101 @@ class Dnsmasq(DhcpLocalProcess):
                        self.network.subnets if subnet.ip_version == 6)
 
         for port in self.network.ports:
-            fixed_ips = self._sort_fixed_ips_for_dnsmasq(port.fixed_ips,
-                                                         v6_nets)
-            for alloc in fixed_ips:
-                # Note(scollins) Only create entries that are
-                # associated with the subnet being managed by this
-                # dhcp agent
-                if alloc.subnet_id in v6_nets:
-                    addr_mode = v6_nets[alloc.subnet_id].ipv6_address_mode
-                    if addr_mode == constants.IPV6_SLAAC:
-                        continue
-                    elif addr_mode == constants.DHCPV6_STATELESS:
-                        alloc = hostname = fqdn = None
-                        yield (port, alloc, hostname, fqdn)
-                        continue
-
-                hostname = 'host-%s' % alloc.ip_address.replace(
-                    '.', '-').replace(':', '-')
-                fqdn = hostname
-                if self.conf.dhcp_domain:
-                    fqdn = '%s.%s' % (fqdn, self.conf.dhcp_domain)
+            for (alloc, hostname, fqdn) in self._iter_port_hosts(port,
+                                                                 v6_nets):
                 yield (port, alloc, hostname, fqdn)
 
+    def _iter_port_hosts(self, port, v6_nets):
+        """Iterate over the hosts of a port, as _iter_hosts without port."""
+        fixed_ips = self._sort_fixed_ips_for_dnsmasq(port.fixed_ips, v6_nets)
+        for alloc in fixed_ips:
+            # Note(scollins) Only create entries that are
+            # associated with the subnet being managed by this
+            # dhcp agent
+            if alloc.subnet_id in v6_nets:
+                addr_mode = v6_nets[alloc.subnet_id].ipv6_address_mode
+                if addr_mode == constants.IPV6_SLAAC:
+                    continue
+                elif addr_mode == constants.DHCPV6_STATELESS:
+                    alloc = hostname = fqdn = None
+                    yield (alloc, hostname, fqdn)
+                    continue
+
+            hostname = 'host-%s' % alloc.ip_address.replace(
+                '.', '-').replace(':', '-')
+            fqdn = hostname
+            if self.conf.dhcp_domain:
+                fqdn = '%s.%s' % (fqdn, self.conf.dhcp_domain)
+            yield (alloc, hostname, fqdn)
+
+    def _get_port_entries(self):
+        """Return the hosts and addn_hosts entries of each port.
+
+        The entries rendered for a port are reused as long as its mac
+        address, fixed ips and extra dhcp opts, and the subnets of the
+        network, are unchanged.
+        """
+        dhcp_enabled_subnet_ids = set(s.id for s in self.network.subnets
+                                      if s.enable_dhcp)
+        v6_nets = dict((subnet.id, subnet) for subnet in
+                       self.network.subnets if subnet.ip_version == 6)
+        context = (sorted(dhcp_enabled_subnet_ids),
+                   sorted((subnet_id, getattr(subnet, 'ipv6_address_mode',
+                                              None))
+                          for subnet_id, subnet in v6_nets.items()),
+                   self.conf.dhcp_domain)
+        last_context, last_entries = self._port_entries.get(
+            self.network.id, (None, {}))
+        if context != last_context:
+            last_entries = {}
+
+        entries = {}
+        port_entries = []
+        for port in self.network.ports:
+            key = (port.id, port.mac_address,
+                   bool(getattr(port, 'extra_dhcp_opts', False)),
+                   tuple((alloc.ip_address, alloc.subnet_id)
+                         for alloc in port.fixed_ips))
+            entry = entries.get(key) or last_entries.get(key)
+            if not entry:
+                entry = self._render_port_entries(port, v6_nets,
+                                                  dhcp_enabled_subnet_ids)
+            entries[key] = entry
+            port_entries.append(entry)
+        self._port_entries[self.network.id] = (context, entries)
+        return port_entries
+
+    def _render_port_entries(self, port, v6_nets, dhcp_enabled_subnet_ids):
+        hosts = []
+        addn_hosts = []
+        extra_dhcp_opts = getattr(port, 'extra_dhcp_opts', False)
+        for (alloc, hostname, fqdn) in self._iter_port_hosts(port, v6_nets):
+            if not alloc:
+                if extra_dhcp_opts:
+                    hosts.append('%s,%s%s\n' %
+                                 (port.mac_address, 'set:', port.id))
+                continue
+
+            # It is compulsory to write the `fqdn` before the `hostname` in
+            # order to obtain it in PTR responses.
+            addn_hosts.append('%s\t%s %s\n' %
+                              (alloc.ip_address, fqdn, hostname))
+
+            # don't write ip address which belongs to a dhcp disabled subnet.
+            if alloc.subnet_id not in dhcp_enabled_subnet_ids:
+                continue
+
+            ip_address = self._format_address_for_dnsmasq(alloc.ip_address)
+
+            if extra_dhcp_opts:
+                hosts.append('%s,%s,%s,%s%s\n' %
+                             (port.mac_address, fqdn, ip_address,
+                              'set:', port.id))
+            else:
+                hosts.append('%s,%s,%s\n' %
+                             (port.mac_address, fqdn, ip_address))
+        return ''.join(hosts), ''.join(addn_hosts)
+
     def _output_init_lease_file(self):
         """Write a fake lease file to bootstrap dnsmasq.
 
@@ -573,38 +708,17 @@ class Dnsmasq(DhcpLocalProcess):
         should receive a dhcp lease, the hosts resolution in itself is
         defined by the `_output_addn_hosts_file` method.
         """
-        buf = six.StringIO()
         filename = self.get_conf_file_name('host')
 
         LOG.debug('Building host file: %s', filename)
-        dhcp_enabled_subnet_ids = [s.id for s in self.network.subnets
-                                   if s.enable_dhcp]
         # NOTE(ihrachyshka): the loop should not log anything inside it, to
         # avoid potential performance drop when lots of hosts are dumped
-        for (port, alloc, hostname, name) in self._iter_hosts():
-            if not alloc:
-                if getattr(port, 'extra_dhcp_opts', False):
-                    buf.write('%s,%s%s\n' %
-                              (port.mac_address, 'set:', port.id))
-                continue
-
-            # don't write ip address which belongs to a dhcp disabled subnet.
-            if alloc.subnet_id not in dhcp_enabled_subnet_ids:
-                continue
-
-            ip_address = self._format_address_for_dnsmasq(alloc.ip_address)
-
-            if getattr(port, 'extra_dhcp_opts', False):
-                buf.write('%s,%s,%s,%s%s\n' %
-                          (port.mac_address, name, ip_address,
-                           'set:', port.id))
-            else:
-                buf.write('%s,%s,%s\n' %
-                          (port.mac_address, name, ip_address))
+        contents = ''.join(hosts for (hosts, addn_hosts)
+                           in self._get_port_entries())
 
-        utils.replace_file(filename, buf.getvalue())
+        self._replace_file(filename, contents)
         LOG.debug('Done building host file %s with contents:\n%s', filename,
-                  buf.getvalue())
+                  contents)
         return filename
 
     def _read_hosts_file_leases(self, filename):
@@ -638,14 +752,10 @@ class Dnsmasq(DhcpLocalProcess):
         Each line in this file is in the same form as a standard /etc/hosts
         file.
         """
-        buf = six.StringIO()
-        for (port, alloc, hostname, fqdn) in self._iter_hosts():
-            # It is compulsory to write the `fqdn` before the `hostname` in
-            # order to obtain it in PTR responses.
-            if alloc:
-                buf.write('%s\t%s %s\n' % (alloc.ip_address, fqdn, hostname))
+        contents = ''.join(addn_hosts for (hosts, addn_hosts)
+                           in self._get_port_entries())
         addn_hosts = self.get_conf_file_name('addn_hosts')
-        utils.replace_file(addn_hosts, buf.getvalue())
+        self._replace_file(addn_hosts, contents)
         return addn_hosts
 
     def _output_opts_file(self):
@@ -654,7 +764,7 @@ class Dnsmasq(DhcpLocalProcess):
         options += self._generate_opts_per_port(subnet_index_map)
 
         name = self.get_conf_file_name('opts')
-        utils.replace_file(name, '\n'.join(options))
+        self._replace_file(name, '\n'.join(options))
         return name
 
     def _generate_opts_per_subnet(self):
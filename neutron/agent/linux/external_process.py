@@ -138,6 +138,19 @@ class ProcessManager(MonitoredProcess):
         except IOError:
             return False
 
+    @property
+    def cmdline(self):
+        """The arguments of the process, None if it is not running."""
+        pid = self.pid
+        if pid is None:
+            return None
+
+        try:
+            with open('/proc/%s/cmdline' % pid, "r") as f:
+                return f.read().rstrip('\0').split('\0')
+        except IOError:
+            return None
+
 
 ServiceId = collections.namedtuple('ServiceId', ['uuid', 'service'])
 
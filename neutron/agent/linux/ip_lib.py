@@ -18,8 +18,10 @@ import netaddr
 import os
 from oslo_config import cfg
 from oslo_log import log as logging
+import socket
 
 from neutron.agent.common import utils
+from neutron.agent.linux import netlink
 from neutron.common import exceptions
 from neutron.i18n import _LE
 
@@ -29,6 +31,14 @@ OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.StrOpt('ip_lib_backend', default='cli',
+               choices=['cli', 'netlink'],
+               help=_("Backend used by ip_lib to query devices, addresses, "
+                      "routes and neighbours: 'cli' runs the ip command, "
+                      "'netlink' queries the kernel over rtnetlink, falling "
+                      "back to the ip command when a query can't be made "
+                      "(querying other namespaces requires the "
+                      "CAP_SYS_ADMIN capability).")),
 ]
 
 
@@ -48,6 +58,34 @@ class SubProcessBase(object):
             # Only callers that need to force use of the root helper
             # need to register the option.
             self.force_root = False
+        try:
+            # Forcing the root helper means the commands run in another
+            # domain than the one the netlink sockets would query.
+            self.use_netlink = (cfg.CONF.ip_lib_backend == 'netlink' and
+                                not self.force_root)
+        except cfg.NoSuchOptError:
+            self.use_netlink = False
+
+    def _netlink_query(self, query, *args, **kwargs):
+        """Run a netlink query in the namespace.
+
+        Returns None if the query has to be made with the ip command
+        instead, and raises RuntimeError, as a failed ip command would, if
+        the device queried does not exist. A NamespaceRestoreError is not
+        caught: the process is left in the wrong namespace and must not
+        carry on.
+        """
+        if not self.use_netlink:
+            return None
+        try:
+            return query(*args, namespace=self.namespace, **kwargs)
+        except netlink.DeviceNotFound as e:
+            if self.log_fail_as_error:
+                LOG.error(e)
+            raise RuntimeError(e)
+        except netlink.NetlinkError as e:
+            LOG.debug("Falling back to the ip command: %s", e)
+            return None
 
     def _run(self, options, command, args):
         if self.namespace:
@@ -91,7 +129,10 @@ class IPWrapper(SubProcessBase):
 
     def get_devices(self, exclude_loopback=False):
         retval = []
-        if self.namespace:
+        links = self._netlink_query(netlink.get_links)
+        if links is not None:
+            output = [link['name'] for link in links]
+        elif self.namespace:
             # we call out manually because in order to avoid screen scraping
             # iproute2 we use find to see what is in the sysfs directory, as
             # suggested by Stephen Hemminger (iproute2 dev).
@@ -318,8 +359,21 @@ class IpLinkCommand(IpDeviceCommandBase):
 
     @property
     def attributes(self):
+        link = self._parent._netlink_query(netlink.get_link, self.name)
+        if link is not None:
+            return self._link_attributes(link)
         return self._parse_line(self._run(['o'], ('show', self.name)))
 
+    @staticmethod
+    def _link_attributes(link):
+        """Returns the attributes of a netlink link as _parse_line would."""
+        retval = dict((key, link[key])
+                      for key in ('state', 'mtu', 'qdisc', 'qlen', 'alias')
+                      if key in link)
+        if link['type'] and 'address' in link:
+            retval[link['type']] = link['address']
+        return retval
+
     def _parse_line(self, value):
         if not value:
             return {}
@@ -355,6 +409,18 @@ class IpAddrCommand(IpDeviceCommandBase):
         self._as_root([ip_version], ('flush', self.name))
 
     def list(self, scope=None, to=None, filters=None, ip_version=None):
+        if not filters or filters == ['permanent']:
+            addresses = self._parent._netlink_query(
+                netlink.get_addresses, self.name,
+                family=_get_socket_family(ip_version, socket.AF_UNSPEC))
+            if addresses is not None:
+                return [dict(cidr=a['cidr'], scope=a['scope'],
+                             dynamic=a['dynamic'])
+                        for a in addresses
+                        if (not scope or a['scope'] == scope) and
+                        (not to or _cidr_in_prefix(a['cidr'], to)) and
+                        not (filters and a['dynamic'])]
+
         options = [ip_version] if ip_version else []
         args = ['show', self.name]
         if filters:
@@ -436,6 +502,23 @@ class IpRouteCommand(IpDeviceCommandBase):
                        'scope', 'link'))
 
     def get_gateway(self, scope=None, filters=None, ip_version=None):
+        if not filters:
+            routes = self._parent._netlink_query(
+                netlink.get_routes, self.name,
+                family=_get_socket_family(ip_version, socket.AF_INET))
+            if routes is not None:
+                route = next((r for r in routes
+                              if r['dst'] == 'default' and
+                              (not scope or r['scope'] == scope)), None)
+                if not route:
+                    return None
+                # The ip command output parsing below reports the device
+                # as the gateway of a default route without a next hop.
+                retval = dict(gateway=route['gateway'] or self.name)
+                if route['metric'] is not None:
+                    retval.update(metric=route['metric'])
+                return retval
+
         options = [ip_version] if ip_version else []
 
         args = ['list', 'dev', self.name]
@@ -545,6 +628,16 @@ class IpNeighCommand(IpDeviceCommandBase):
                        'dev', self.name))
 
     def show(self):
+        neighbours = self._parent._netlink_query(netlink.get_neighbours,
+                                                 self.name)
+        if neighbours is not None:
+            # Formatted as the ip neigh show dev output
+            return ''.join(
+                '%s%s %s\n' % (n['dst'],
+                               ' lladdr %s' % n['lladdr'] if n['lladdr']
+                               else '',
+                               n['state'])
+                for n in neighbours)
         return self._as_root([],
                       ('show',
                        'dev', self.name))
@@ -722,6 +815,14 @@ def add_namespace_to_cmd(cmd, namespace=None):
     return ['ip', 'netns', 'exec', namespace] + cmd if namespace else cmd
 
 
+def _get_socket_family(ip_version, default):
+    return {4: socket.AF_INET, 6: socket.AF_INET6}.get(ip_version, default)
+
+
+def _cidr_in_prefix(cidr, prefix):
+    return netaddr.IPNetwork(cidr).ip in netaddr.IPNetwork(prefix)
+
+
 def get_ip_version(ip_or_cidr):
     return netaddr.IPNetwork(ip_or_cidr).version
 
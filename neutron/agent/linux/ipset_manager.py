@@ -11,7 +11,10 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import contextlib
+
 import netaddr
+from oslo_utils import excutils
 
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
@@ -26,12 +29,37 @@ class IpsetManager(object):
 
        Keeps track of ip addresses per set, using bulk
        or single ip add/remove for smaller changes.
+
+       Between defer_apply_on and defer_apply_off, the changes to the sets
+       are gathered and applied at once by a single ipset restore.
     """
 
     def __init__(self, execute=None, namespace=None):
         self.execute = execute or linux_utils.execute
         self.namespace = namespace
         self.ipset_sets = {}
+        self.ipset_apply_deferred = False
+        # ipset restore lines, and the sets they modify, gathered while
+        # deferred
+        self._deferred_input = []
+        self._deferred_sets = set()
+
+    @contextlib.contextmanager
+    def defer_apply(self):
+        """Defer apply context."""
+        self.defer_apply_on()
+        try:
+            yield
+        finally:
+            self.defer_apply_off()
+
+    def defer_apply_on(self):
+        self.ipset_apply_deferred = True
+
+    @utils.synchronized('ipset', external=True)
+    def defer_apply_off(self):
+        self.ipset_apply_deferred = False
+        self._apply_deferred()
 
     def _sanitize_addresses(self, addresses):
         """This method converts any address to ipset format.
@@ -98,7 +126,10 @@ class IpsetManager(object):
     @utils.synchronized('ipset', external=True)
     def destroy(self, id, ethertype, forced=False):
         set_name = self.get_name(id, ethertype)
-        self._destroy(set_name, forced)
+        # A set is destroyed once the iptables rules using it are removed,
+        # which deferred changes could precede, so it is never deferred.
+        self._apply_deferred()
+        self._destroy(set_name, forced, defer=False)
 
     def _add_member_to_set(self, set_name, member_ip):
         cmd = ['ipset', 'add', '-exist', set_name, member_ip]
@@ -129,7 +160,10 @@ class IpsetManager(object):
         self._apply(cmd)
         self.ipset_sets[set_name] = []
 
-    def _apply(self, cmd, input=None):
+    def _apply(self, cmd, input=None, defer=True):
+        if defer and self.ipset_apply_deferred:
+            self._defer(cmd, input)
+            return
         input = '\n'.join(input) if input else None
         cmd_ns = []
         if self.namespace:
@@ -137,6 +171,34 @@ class IpsetManager(object):
         cmd_ns.extend(cmd)
         self.execute(cmd_ns, run_as_root=True, process_input=input)
 
+    def _defer(self, cmd, input=None):
+        if cmd[1] == 'restore':
+            self._deferred_input.extend(input or [])
+        else:
+            # ipset restore accepts the other commands, the deferred
+            # restore is run with -exist
+            self._deferred_input.append(
+                ' '.join(arg for arg in cmd[1:] if arg != '-exist'))
+        self._deferred_sets.update(arg for arg in cmd[2:]
+                                   if arg in self.ipset_sets)
+
+    def _apply_deferred(self):
+        deferred_input = self._deferred_input
+        deferred_sets = self._deferred_sets
+        self._deferred_input = []
+        self._deferred_sets = set()
+        if not deferred_input:
+            return
+        try:
+            self._apply(['ipset', 'restore', '-exist'], deferred_input,
+                        defer=False)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                # The sets are in an unknown state, let the next
+                # set_members recreate them from scratch
+                for set_name in deferred_sets:
+                    self.ipset_sets.pop(set_name, None)
+
     def _get_new_set_ips(self, set_name, expected_ips):
         new_member_ips = (set(expected_ips) -
                           set(self.ipset_sets.get(set_name, [])))
@@ -168,8 +230,8 @@ class IpsetManager(object):
         cmd = ['ipset', 'swap', src_set, dest_set]
         self._apply(cmd)
 
-    def _destroy(self, set_name, forced=False):
+    def _destroy(self, set_name, forced=False, defer=True):
         if set_name in self.ipset_sets or forced:
             cmd = ['ipset', 'destroy', set_name]
-            self._apply(cmd)
+            self._apply(cmd, defer=defer)
             self.ipset_sets.pop(set_name, None)
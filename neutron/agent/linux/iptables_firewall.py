@@ -14,6 +14,8 @@
 #    under the License.
 
 import collections
+import hashlib
+
 import netaddr
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -36,6 +38,10 @@ SPOOF_FILTER = 'spoof-filter'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
                      SPOOF_FILTER: 's'}
+# Port chain names are made of hexadecimal digits after their prefix, so
+# these can't clash with them
+SG_CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'gi',
+                        EGRESS_DIRECTION: 'go'}
 DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
@@ -71,6 +77,13 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             lambda: collections.defaultdict(list))
         self.pre_sg_members = None
         self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        # Compiled security group rules, shared by all the ports of a
+        # security group, per (sg_id, direction, ethertype)
+        self._sg_rule_fragments = {}
+        self.shared_sg_chains = (
+            cfg.CONF.SECURITYGROUP.shared_security_group_chains)
+        # Names of the chains shared by the ports of the same security groups
+        self._shared_sg_chains = set()
 
     @property
     def ports(self):
@@ -79,11 +92,35 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
     def update_security_group_rules(self, sg_id, sg_rules):
         LOG.debug("Update rules of security group (%s)", sg_id)
         self.sg_rules[sg_id] = sg_rules
+        self._clear_sg_rule_fragments(sg_id)
 
     def update_security_group_members(self, sg_id, sg_members):
         LOG.debug("Update members of security group (%s)", sg_id)
         self.sg_members[sg_id] = collections.defaultdict(list, sg_members)
 
+    def update_security_group_member_deltas(self, sg_id, member_deltas):
+        LOG.debug("Update members of security group (%s) by deltas", sg_id)
+        # Without ipset, the rules are expanded with the member IPs
+        update_filters = not self.enable_ipset
+        for ethertype, deltas in member_deltas.items():
+            removed = set(deltas.get('removed', []))
+            members = [ip for ip in self.sg_members[sg_id][ethertype]
+                       if ip not in removed]
+            known = set(members)
+            for ip in deltas.get('added', []):
+                if ip not in known:
+                    known.add(ip)
+                    members.append(ip)
+            self.sg_members[sg_id][ethertype] = members
+            if not self.enable_ipset:
+                continue
+            if self.ipset.set_exists(sg_id, ethertype):
+                self.ipset.set_members(sg_id, ethertype, members)
+            elif members:
+                # The rules of an empty group do not reference its set
+                update_filters = True
+        return update_filters
+
     def _ps_enabled(self, port):
         return port.get(psec.PORTSECURITY, True)
 
@@ -175,6 +212,9 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         for port in unfiltered_ports.values():
             self._remove_rule_port_sec(port, INGRESS_DIRECTION)
             self._remove_rule_port_sec(port, EGRESS_DIRECTION)
+        for chain_name in self._shared_sg_chains:
+            self._remove_chain_by_name_v4v6(chain_name)
+        self._shared_sg_chains.clear()
         self._remove_chain_by_name_v4v6(SG_CHAIN)
 
     def _setup_chain(self, port, DIRECTION):
@@ -356,21 +396,96 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                              icmp6_type]
         return icmpv6_rules
 
-    def _select_sg_rules_for_port(self, port, direction):
-        """Select rules from the security groups the port is member of."""
-        port_sg_ids = port.get('security_groups', [])
-        port_rules = []
+    def _clear_sg_rule_fragments(self, sg_id):
+        for direction in (INGRESS_DIRECTION, EGRESS_DIRECTION):
+            for ethertype in (constants.IPv4, constants.IPv6):
+                self._sg_rule_fragments.pop((sg_id, direction, ethertype),
+                                            None)
 
-        for sg_id in port_sg_ids:
-            for rule in self.sg_rules.get(sg_id, []):
-                if rule['direction'] == direction:
-                    if self.enable_ipset:
-                        port_rules.append(rule)
-                    else:
-                        port_rules.extend(
-                            self._expand_sg_rule_with_remote_ips(
-                                rule, port, direction))
-        return port_rules
+    def _get_sg_rule_fragment(self, sg_id, direction, ethertype):
+        """Return the compiled rules of a security group.
+
+        The fragment is a list of (sg_rule, iptables_rule) tuples, where
+        iptables_rule is None for remote group rules which depend on the
+        port or on the ipsets and are converted for each port.
+        """
+        sg_rules = self.sg_rules.get(sg_id, [])
+        key = (sg_id, direction, ethertype)
+        cached_rules, fragment = self._sg_rule_fragments.get(key,
+                                                             (None, None))
+        # sg_rules entries may be replaced without going through
+        # update_security_group_rules
+        if cached_rules is sg_rules:
+            return fragment
+
+        rules = [rule for rule in sg_rules if rule['direction'] == direction]
+        ipv4_sg_rules, ipv6_sg_rules = self._split_sgr_by_ethertype(rules)
+        fragment = []
+        for rule in (ipv4_sg_rules if ethertype == constants.IPv4
+                     else ipv6_sg_rules):
+            if rule.get('remote_group_id'):
+                fragment.append((rule, None))
+            else:
+                fragment.append(
+                    (rule, ' '.join(self._generate_plain_rule_args(rule))))
+        self._sg_rule_fragments[key] = (sg_rules, fragment)
+        return fragment
+
+    def _get_sg_iptables_rules_for_port(self, port, direction, ethertype):
+        """Convert rules from the security groups the port is member of.
+
+        Returns a list of (iptables_rule, shared) tuples, shared telling if
+        the rule is the same for all the ports of the security groups.
+        """
+        iptables_rules = []
+        for sg_id in port.get('security_groups', []):
+            fragment = self._get_sg_rule_fragment(sg_id, direction, ethertype)
+            for rule, iptables_rule in fragment:
+                if iptables_rule is not None:
+                    iptables_rules.append((iptables_rule, True))
+                elif self.enable_ipset:
+                    args = self._generate_ipset_rule_args(
+                        rule, rule['remote_group_id'])
+                    if args:
+                        iptables_rules.append((' '.join(args), True))
+                else:
+                    iptables_rules.extend(
+                        (' '.join(self._generate_plain_rule_args(ip_rule)),
+                         False)
+                        for ip_rule in self._expand_sg_rule_with_remote_ips(
+                            rule, port, direction))
+        return iptables_rules
+
+    def _shared_sg_chain_name(self, port, direction):
+        sg_ids = ','.join(sorted(set(port['security_groups'])))
+        return iptables_manager.get_chain_name(
+            '%s%s' % (SG_CHAIN_NAME_PREFIX[direction],
+                      hashlib.sha1(sg_ids).hexdigest()))
+
+    def _setup_shared_sg_chain(self, port, direction, ipv4_sg_iptables_rules,
+                               ipv6_sg_iptables_rules):
+        """Setup the chain shared by the ports of the same security groups.
+
+        The shared rules are added to the chain the first time it is set up,
+        the rules specific to the port are returned.
+        """
+        chain_name = self._shared_sg_chain_name(port, direction)
+        if chain_name not in self._shared_sg_chains:
+            self._shared_sg_chains.add(chain_name)
+            self._add_chain_by_name_v4v6(chain_name)
+            self._add_rules_to_chain_v4v6(
+                chain_name,
+                [rule for rule, shared in ipv4_sg_iptables_rules if shared],
+                [rule for rule, shared in ipv6_sg_iptables_rules if shared])
+            fallback_rule = comment_rule('-j $sg-fallback',
+                                         comment=ic.UNMATCHED)
+            self._add_rules_to_chain_v4v6(chain_name, [fallback_rule],
+                                          [fallback_rule])
+        return (chain_name,
+                [(rule, shared)
+                 for rule, shared in ipv4_sg_iptables_rules if not shared],
+                [(rule, shared)
+                 for rule, shared in ipv6_sg_iptables_rules if not shared])
 
     def _expand_sg_rule_with_remote_ips(self, rule, port, direction):
         """Expand a remote group rule to rule per remote group IP."""
@@ -402,9 +517,9 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         return remote_sg_ids
 
     def _add_rules_by_security_group(self, port, direction):
-        # select rules for current port and direction
+        # select rules for current port and direction, the rules of its
+        # security groups are compiled once for all the ports
         security_group_rules = self._select_sgr_by_direction(port, direction)
-        security_group_rules += self._select_sg_rules_for_port(port, direction)
         # make sure ipset members are updated for remote security groups
         if self.enable_ipset:
             remote_sg_ids = self._get_remote_sg_ids(port, direction)
@@ -424,10 +539,22 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         elif direction == INGRESS_DIRECTION:
             ipv6_iptables_rules += self._accept_inbound_icmpv6()
         # include IPv4 and IPv6 iptable rules from security group
+        ipv4_sg_iptables_rules = self._get_sg_iptables_rules_for_port(
+            port, direction, constants.IPv4)
+        ipv6_sg_iptables_rules = self._get_sg_iptables_rules_for_port(
+            port, direction, constants.IPv6)
+        shared_chain_name = None
+        if self.shared_sg_chains and port.get('security_groups'):
+            (shared_chain_name, ipv4_sg_iptables_rules,
+             ipv6_sg_iptables_rules) = self._setup_shared_sg_chain(
+                port, direction, ipv4_sg_iptables_rules,
+                ipv6_sg_iptables_rules)
         ipv4_iptables_rules += self._convert_sgr_to_iptables_rules(
-            ipv4_sg_rules)
+            ipv4_sg_rules, [rule for rule, shared in ipv4_sg_iptables_rules],
+            shared_chain_name)
         ipv6_iptables_rules += self._convert_sgr_to_iptables_rules(
-            ipv6_sg_rules)
+            ipv6_sg_rules, [rule for rule, shared in ipv6_sg_iptables_rules],
+            shared_chain_name)
         # finally add the rules to the port chain for a given direction
         self._add_rules_to_chain_v4v6(self._port_chain_name(port, direction),
                                       ipv4_iptables_rules,
@@ -490,7 +617,9 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         else:
             return self._generate_plain_rule_args(sg_rule)
 
-    def _convert_sgr_to_iptables_rules(self, security_group_rules):
+    def _convert_sgr_to_iptables_rules(self, security_group_rules,
+                                       sg_iptables_rules=None,
+                                       shared_chain_name=None):
         iptables_rules = []
         self._drop_invalid_packets(iptables_rules)
         self._allow_established(iptables_rules)
@@ -498,9 +627,16 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             args = self._convert_sg_rule_to_iptables_args(rule)
             if args:
                 iptables_rules += [' '.join(args)]
+        iptables_rules += sg_iptables_rules or []
 
-        iptables_rules += [comment_rule('-j $sg-fallback',
-                                        comment=ic.UNMATCHED)]
+        if shared_chain_name:
+            # With goto, a RETURN from the shared chain returns from the
+            # port chain, as if the rule matched in the port chain.
+            iptables_rules += [comment_rule('-g $%s' % shared_chain_name,
+                                            comment=ic.SG_SHARED)]
+        else:
+            iptables_rules += [comment_rule('-j $sg-fallback',
+                                            comment=ic.UNMATCHED)]
         return iptables_rules
 
     def _drop_invalid_packets(self, iptables_rules):
@@ -560,6 +696,8 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
     def filter_defer_apply_on(self):
         if not self._defer_apply:
             self.iptables.defer_apply_on()
+            if self.enable_ipset:
+                self.ipset.defer_apply_on()
             self._pre_defer_filtered_ports = dict(self.filtered_ports)
             self._pre_defer_unfiltered_ports = dict(self.unfiltered_ports)
             self.pre_sg_members = dict(self.sg_members)
@@ -589,6 +727,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         for remove_group_id in self._determine_sg_rules_to_remove(
                 filtered_ports):
             self.sg_rules.pop(remove_group_id, None)
+            self._clear_sg_rule_fragments(remove_group_id)
 
     def _determine_remote_sgs_to_remove(self, filtered_ports):
         """Calculate which remote security groups we don't need anymore.
@@ -657,6 +796,10 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                       self._pre_defer_unfiltered_ports)
             self._setup_chains_apply(self.filtered_ports,
                                      self.unfiltered_ports)
+            # The sets have to be in place before the rules referencing
+            # them are applied.
+            if self.enable_ipset:
+                self.ipset.defer_apply_off()
             self.iptables.defer_apply_off()
             self._remove_unused_security_group_info()
             self._pre_defer_filtered_ports = None
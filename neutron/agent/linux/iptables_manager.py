@@ -18,10 +18,14 @@
 
 """Implements iptables rules using linux utilities."""
 
+import collections
 import contextlib
+import difflib
+import itertools
 import os
 import re
 import sys
+import time
 
 from oslo_concurrency import lockutils
 from oslo_config import cfg
@@ -63,10 +67,10 @@ def comment_rule(rule, comment):
         return rule
     # iptables-save outputs the comment before the jump so we need to match
     # that order so _find_last_entry works
-    try:
-        start_of_jump = rule.index(' -j ')
-    except ValueError:
+    match = re.search(' -[jg] ', rule)
+    if not match:
         return '%s -m comment --comment "%s"' % (rule, comment)
+    start_of_jump = match.start()
     return ' '.join([rule[0:start_of_jump],
                      '-m comment --comment "%s"' % comment,
                      rule[start_of_jump + 1:]])
@@ -79,6 +83,55 @@ def get_chain_name(chain_name, wrap=True):
         return chain_name[:MAX_CHAIN_LEN_NOWRAP]
 
 
+def _generate_chain_diff_iptables_commands(chain, old_chain_rules,
+                                           new_chain_rules):
+    """Return the iptables statements turning old_chain_rules into new ones.
+
+    The rules of a chain are unique. Rules are deleted by their
+    specification, so that deleting a rule missing from the chain fails
+    instead of deleting another one, and then inserted in order at their
+    position in new_chain_rules.
+    """
+    statements = []
+    inserted = []
+    matcher = difflib.SequenceMatcher(None, old_chain_rules, new_chain_rules,
+                                      autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag in ('delete', 'replace'):
+            statements += ['-D %s %s' % (chain, rule)
+                           for rule in old_chain_rules[i1:i2]]
+        if tag in ('insert', 'replace'):
+            # once the deletions are done, the rules before position j1 of
+            # the chain are new_chain_rules[:j1]
+            inserted += ['-I %s %d %s' % (chain, j1 + idx + 1, rule)
+                         for idx, rule in enumerate(new_chain_rules[j1:j2])]
+    return statements + inserted
+
+
+def _strip_packets_bytes(line):
+    # strip any [packet:byte] counts at start or end of lines
+    if line.startswith(':'):
+        # it's a chain, for example, ":neutron-billing - [0:0]"
+        line = line.split(':')[1]
+        line = line.split(' - [', 1)[0]
+    elif line.startswith('['):
+        # it's a rule, for example, "[0:0] -A neutron-billing..."
+        line = line.split('] ', 1)[1]
+    line = line.strip()
+    return line
+
+
+def _get_filter_key(line):
+    # chains are keyed as ":neutron-billing" and rules as
+    # "-A neutron-billing ...", whatever their [packet:byte] counts
+    if line.startswith(':'):
+        return line.split(' ', 1)[0]
+    elif line.startswith('['):
+        return line.split('] ', 1)[1].strip()
+    elif line.startswith('-A '):
+        return line
+
+
 class IptablesRule(object):
     """An iptables rule.
 
@@ -118,13 +171,70 @@ class IptablesTable(object):
     """An iptables table."""
 
     def __init__(self, binary_name=binary_name):
-        self.rules = []
+        # Rules are stored in insertion order under a sequence number, and
+        # indexed by rule, chain, jump target and tag so that adding and
+        # removing them costs the same whatever the size of the table.
+        self._rules = collections.OrderedDict()
+        self._rule_seq = itertools.count()
+        self._rules_by_key = collections.defaultdict(list)
+        self._rules_by_chain = collections.defaultdict(
+            collections.OrderedDict)
+        self._rules_by_jump = collections.defaultdict(set)
+        self._rules_by_tag = collections.defaultdict(set)
         self.remove_rules = []
         self.chains = set()
         self.unwrapped_chains = set()
         self.remove_chains = set()
         self.wrap_name = binary_name[:16]
 
+    @property
+    def rules(self):
+        return list(self._rules.values())
+
+    @staticmethod
+    def _get_rule_key(rule):
+        # the attributes IptablesRule.__eq__ compares
+        return (rule.chain, rule.rule, rule.top, rule.wrap)
+
+    @staticmethod
+    def _get_jump_target(rule):
+        args = rule.split()
+        for target_arg in ('-j', '-g'):
+            if target_arg in args[:-1]:
+                return args[args.index(target_arg) + 1]
+
+    def _store_rule(self, rule):
+        seq = next(self._rule_seq)
+        self._rules[seq] = rule
+        self._rules_by_key[self._get_rule_key(rule)].append(seq)
+        self._rules_by_chain[rule.chain][seq] = None
+        target = self._get_jump_target(rule.rule)
+        if target:
+            self._rules_by_jump[target].add(seq)
+        if rule.tag:
+            self._rules_by_tag[rule.tag].add(seq)
+
+    def _delete_rule(self, seq):
+        rule = self._rules.pop(seq)
+
+        key = self._get_rule_key(rule)
+        self._rules_by_key[key].remove(seq)
+        if not self._rules_by_key[key]:
+            del self._rules_by_key[key]
+
+        del self._rules_by_chain[rule.chain][seq]
+        if not self._rules_by_chain[rule.chain]:
+            del self._rules_by_chain[rule.chain]
+
+        for index, key in ((self._rules_by_jump,
+                            self._get_jump_target(rule.rule)),
+                           (self._rules_by_tag, rule.tag)):
+            if key:
+                index[key].discard(seq)
+                if not index[key]:
+                    del index[key]
+        return rule
+
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
 
@@ -168,28 +278,25 @@ class IptablesTable(object):
 
         chain_set.remove(name)
 
+        # first, remove rules that have a matching chain name
+        removed = [self._delete_rule(seq)
+                   for seq in list(self._rules_by_chain.get(name, ()))]
+
         if not wrap:
             # non-wrapped chains and rules need to be dealt with specially,
             # so we keep a list of them to be iterated over in apply()
             self.remove_chains.add(name)
-
-            # first, add rules to remove that have a matching chain name
-            self.remove_rules += [r for r in self.rules if r.chain == name]
-
-        # next, remove rules from list that have a matching chain name
-        self.rules = [r for r in self.rules if r.chain != name]
-
-        if not wrap:
-            jump_snippet = '-j %s' % name
-            # next, add rules to remove that have a matching jump chain
-            self.remove_rules += [r for r in self.rules
-                                  if jump_snippet in r.rule]
+            self.remove_rules += removed
+            jump_target = name
         else:
-            jump_snippet = '-j %s-%s' % (self.wrap_name, name)
+            jump_target = '%s-%s' % (self.wrap_name, name)
 
-        # finally, remove rules from list that have a matching jump chain
-        self.rules = [r for r in self.rules
-                      if jump_snippet not in r.rule]
+        # finally, remove rules that have a matching jump chain
+        removed = [self._delete_rule(seq)
+                   for seq in sorted(self._rules_by_jump.get(jump_target,
+                                                             ()))]
+        if not wrap:
+            self.remove_rules += removed
 
     def add_rule(self, chain, rule, wrap=True, top=False, tag=None,
                  comment=None):
@@ -211,8 +318,8 @@ class IptablesTable(object):
             rule = ' '.join(
                 self._wrap_target_chain(e, wrap) for e in rule.split(' '))
 
-        self.rules.append(IptablesRule(chain, rule, wrap, top, self.wrap_name,
-                                       tag, comment))
+        self._store_rule(IptablesRule(chain, rule, wrap, top, self.wrap_name,
+                                      tag, comment))
 
     def _wrap_target_chain(self, s, wrap):
         if s.startswith('$'):
@@ -229,41 +336,43 @@ class IptablesTable(object):
 
         """
         chain = get_chain_name(chain, wrap)
-        try:
-            if '$' in rule:
-                rule = ' '.join(
-                    self._wrap_target_chain(e, wrap) for e in rule.split(' '))
-
-            self.rules.remove(IptablesRule(chain, rule, wrap, top,
-                                           self.wrap_name,
-                                           comment=comment))
-            if not wrap:
-                self.remove_rules.append(IptablesRule(chain, rule, wrap, top,
-                                                      self.wrap_name,
-                                                      comment=comment))
-        except ValueError:
+        if '$' in rule:
+            rule = ' '.join(
+                self._wrap_target_chain(e, wrap) for e in rule.split(' '))
+
+        seqs = self._rules_by_key.get((chain, rule, top, wrap))
+        if not seqs:
             LOG.warn(_LW('Tried to remove rule that was not there:'
                          ' %(chain)r %(rule)r %(wrap)r %(top)r'),
                      {'chain': chain, 'rule': rule,
                       'top': top, 'wrap': wrap})
+            return
 
-    def _get_chain_rules(self, chain, wrap):
+        self._delete_rule(seqs[0])
+        if not wrap:
+            self.remove_rules.append(IptablesRule(chain, rule, wrap, top,
+                                                  self.wrap_name,
+                                                  comment=comment))
+
+    def _get_chain_rule_seqs(self, chain, wrap):
         chain = get_chain_name(chain, wrap)
-        return [rule for rule in self.rules
-                if rule.chain == chain and rule.wrap == wrap]
+        return [seq for seq in self._rules_by_chain.get(chain, ())
+                if self._rules[seq].wrap == wrap]
+
+    def _get_chain_rules(self, chain, wrap):
+        return [self._rules[seq]
+                for seq in self._get_chain_rule_seqs(chain, wrap)]
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = self._get_chain_rules(chain, wrap)
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        for seq in self._get_chain_rule_seqs(chain, wrap):
+            self._delete_rule(seq)
 
     def clear_rules_by_tag(self, tag):
         if not tag:
             return
-        rules = [rule for rule in self.rules if rule.tag == tag]
-        for rule in rules:
-            self.rules.remove(rule)
+        for seq in list(self._rules_by_tag.get(tag, ())):
+            self._delete_rule(seq)
 
 
 class IptablesManager(object):
@@ -302,6 +411,11 @@ class IptablesManager(object):
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
 
+        # Rules of our chains as of the last successful apply, per
+        # (command, table name), used by the incremental apply mode.
+        self._applied_state = {}
+        self._last_full_apply = 0
+
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
 
@@ -426,6 +540,12 @@ class IptablesManager(object):
         finally:
             LOG.debug('Semaphore / lock released "%s"', lock_name)
 
+    def _get_cmd_tables(self):
+        s = [('iptables', self.ipv4)]
+        if self.use_ipv6:
+            s += [('ip6tables', self.ipv6)]
+        return s
+
     def _apply_synchronized(self):
         """Apply the current in-memory set of iptables rules.
 
@@ -433,10 +553,15 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        When incremental apply is enabled, only the differences with the
+        previously applied rules are sent whenever possible, see
+        _apply_incremental_synchronized.
+
         """
-        s = [('iptables', self.ipv4)]
-        if self.use_ipv6:
-            s += [('ip6tables', self.ipv6)]
+        if self._apply_incremental_synchronized():
+            return
+
+        s = self._get_cmd_tables()
 
         for cmd, tables in s:
             args = ['%s-save' % (cmd,), '-c']
@@ -478,8 +603,126 @@ class IptablesManager(object):
                     LOG.error(_LE("IPTablesManager.apply failed to apply the "
                                   "following set of iptables rules:\n%s"),
                               '\n'.join(log_lines))
+        if cfg.CONF.AGENT.iptables_incremental_apply:
+            self._applied_state = dict(
+                ((cmd, table_name), self._get_table_state(table))
+                for cmd, tables in s
+                for table_name, table in tables.items())
+            self._last_full_apply = time.time()
         LOG.debug("IPTablesManager.apply completed with success")
 
+    def _full_resync_needed(self):
+        if not self._applied_state:
+            return True
+        interval = cfg.CONF.AGENT.iptables_full_resync_interval
+        return bool(interval and
+                    time.time() - self._last_full_apply > interval)
+
+    def _apply_incremental_synchronized(self):
+        """Apply only what changed since the last apply.
+
+        The statements are fed to iptables-restore --noflush, which leaves
+        alone every chain they don't mention. Returns False if the tables
+        must be fully saved and restored instead: when incremental apply is
+        disabled, on the first apply, once the full resync interval has
+        expired, when the shared (unwrapped) chains changed, or when the
+        deltas couldn't be applied because the rules drifted.
+
+        """
+        if (not cfg.CONF.AGENT.iptables_incremental_apply or
+                self._full_resync_needed()):
+            return False
+
+        new_state = {}
+        all_lines = []
+        for cmd, tables in self._get_cmd_tables():
+            lines = []
+            # Traverse tables in sorted order for predictable dump output
+            for table_name in sorted(tables):
+                table = tables[table_name]
+                old_wrapped, old_unwrapped = self._applied_state.get(
+                    (cmd, table_name), (None, None))
+                new_wrapped, new_unwrapped = self._get_table_state(table)
+                if (old_wrapped is None or old_unwrapped != new_unwrapped or
+                        table.remove_rules or table.remove_chains):
+                    # Chains shared with other components can't be addressed
+                    # by rule position, leave them to _modify_rules
+                    return False
+                new_state[(cmd, table_name)] = (new_wrapped, new_unwrapped)
+                statements = self._generate_table_diff_iptables_commands(
+                    old_wrapped, new_wrapped)
+                if statements:
+                    lines += ['*%s' % table_name] + statements + ['COMMIT']
+            if lines:
+                all_lines.append((cmd, lines))
+
+        for cmd, lines in all_lines:
+            args = ['%s-restore' % (cmd,), '-n']
+            if self.namespace:
+                args = ['ip', 'netns', 'exec', self.namespace] + args
+            try:
+                self.execute(args, process_input='\n'.join(lines) + '\n',
+                             run_as_root=True)
+            except RuntimeError as r_error:
+                LOG.warn(_LW("IPTablesManager.apply failed to apply "
+                             "incremental iptables changes, doing a full "
+                             "resync: %s"), r_error)
+                self._applied_state = {}
+                return False
+
+        self._applied_state = new_state
+        LOG.debug("IPTablesManager.apply completed with success, "
+                  "incrementally")
+        return True
+
+    def _get_table_state(self, table):
+        """Return the wrapped and unwrapped chains of the table.
+
+        Each is a dict mapping the full chain name to the list of rules, in
+        the order _modify_rules writes them and without the '-A <chain>'
+        prefix.
+
+        """
+        wrapped = dict(('%s-%s' % (self.wrap_name, name), [])
+                       for name in table.chains)
+        unwrapped = dict((name, []) for name in table.unwrapped_chains)
+        top_rules = [rule for rule in table.rules if rule.top]
+        bottom_rules = [rule for rule in table.rules if not rule.top]
+        for rule in top_rules + bottom_rules:
+            if rule.wrap:
+                chain = '%s-%s' % (self.wrap_name, rule.chain)
+                chains = wrapped
+            else:
+                chain = rule.chain
+                chains = unwrapped
+            rule_str = str(rule)[len('-A %s ' % chain):]
+            chains.setdefault(chain, []).append(rule_str)
+
+        for chains in (wrapped, unwrapped):
+            for chain, rules in chains.items():
+                # Like _modify_rules, keep the last of duplicated rules
+                seen_rules = set()
+                unique_rules = []
+                for rule in reversed(rules):
+                    if rule not in seen_rules:
+                        seen_rules.add(rule)
+                        unique_rules.append(rule)
+                unique_rules.reverse()
+                chains[chain] = unique_rules
+        return wrapped, unwrapped
+
+    def _generate_table_diff_iptables_commands(self, old_chains, new_chains):
+        removed_chains = sorted(set(old_chains) - set(new_chains))
+        statements = [':%s - [0:0]' % chain
+                      for chain in sorted(set(new_chains) - set(old_chains))]
+        for chain in sorted(new_chains):
+            statements += _generate_chain_diff_iptables_commands(
+                chain, old_chains.get(chain, []), new_chains[chain])
+        # Jumps to the removed chains are gone by now, they can be deleted
+        statements += ['-F %s' % chain for chain in removed_chains]
+        statements += ['-X %s' % chain for chain in removed_chains]
+        return statements
+
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
             # length only <2 when fake iptables
@@ -509,12 +752,25 @@ class IptablesManager(object):
 
         return rules_index
 
-    def _find_last_entry(self, filter_list, match_str):
-        # find a matching entry, starting from the bottom
-        for s in reversed(filter_list):
-            s = s.strip()
-            if match_str in s:
-                return s
+    def _make_filter_map(self, filter_list):
+        """Index lines by chain or rule, without the [packet:byte] counts.
+
+        Chains are indexed as ':<chain name>' and rules as
+        '-A <chain name> ...'; other lines like COMMIT are not indexed.
+
+        """
+        filter_map = collections.defaultdict(list)
+        for line in filter_list:
+            key = _get_filter_key(line)
+            if key:
+                filter_map[key].append(line)
+        return filter_map
+
+    def _find_last_entry(self, filter_map, match_str):
+        # find the last matching entry
+        entries = filter_map.get(match_str)
+        if entries:
+            return entries[-1]
 
     def _modify_rules(self, current_lines, table, table_name):
         # Chains are stored as sets to avoid duplicates.
@@ -539,6 +795,12 @@ class IptablesManager(object):
             (old_filter if self.wrap_name in line else
              new_filter).append(line.strip())
 
+        old_filter_map = self._make_filter_map(old_filter)
+        new_filter_map = self._make_filter_map(new_filter)
+        # Chains and rules of new_filter which we are writing ourselves,
+        # they are dropped from new_filter once everything is matched.
+        dup_keys = set()
+
         rules_index = self._find_rules_index(new_filter)
 
         all_chains = [':%s' % name for name in unwrapped_chains]
@@ -550,10 +812,11 @@ class IptablesManager(object):
         for chain in all_chains:
             chain_str = str(chain).strip()
 
-            old = self._find_last_entry(old_filter, chain_str)
-            if not old:
-                dup = self._find_last_entry(new_filter, chain_str)
-            new_filter = [s for s in new_filter if chain_str not in s.strip()]
+            old = self._find_last_entry(old_filter_map, chain_str)
+            dup = None
+            if not old and chain_str not in dup_keys:
+                dup = self._find_last_entry(new_filter_map, chain_str)
+            dup_keys.add(chain_str)
 
             # if no old or duplicates, use original chain
             if old or dup:
@@ -573,10 +836,11 @@ class IptablesManager(object):
             # Further down, we weed out duplicates from the bottom of the
             # list, so here we remove the dupes ahead of time.
 
-            old = self._find_last_entry(old_filter, rule_str)
-            if not old:
-                dup = self._find_last_entry(new_filter, rule_str)
-            new_filter = [s for s in new_filter if rule_str not in s.strip()]
+            old = self._find_last_entry(old_filter_map, rule_str)
+            dup = None
+            if not old and rule_str not in dup_keys:
+                dup = self._find_last_entry(new_filter_map, rule_str)
+            dup_keys.add(rule_str)
 
             # if no old or duplicates, use original rule
             if old or dup:
@@ -596,21 +860,11 @@ class IptablesManager(object):
 
         our_rules += bot_rules
 
+        new_filter = [line for line in new_filter
+                      if _get_filter_key(line) not in dup_keys]
         new_filter[rules_index:rules_index] = our_rules
         new_filter[rules_index:rules_index] = our_chains
 
-        def _strip_packets_bytes(line):
-            # strip any [packet:byte] counts at start or end of lines
-            if line.startswith(':'):
-                # it's a chain, for example, ":neutron-billing - [0:0]"
-                line = line.split(':')[1]
-                line = line.split(' - [', 1)[0]
-            elif line.startswith('['):
-                # it's a rule, for example, "[0:0] -A neutron-billing..."
-                line = line.split('] ', 1)[1]
-            line = line.strip()
-            return line
-
         seen_chains = set()
 
         def _weed_out_duplicate_chains(line):
@@ -638,21 +892,23 @@ class IptablesManager(object):
             # Leave it alone
             return True
 
+        # Number of occurrences of each rule to remove
+        rules_to_remove = collections.defaultdict(int)
+        for rule in remove_rules:
+            rules_to_remove[_strip_packets_bytes(str(rule))] += 1
+
         def _weed_out_removes(line):
             # We need to find exact matches here
             if line.startswith(':'):
                 line = _strip_packets_bytes(line)
-                for chain in remove_chains:
-                    if chain == line:
-                        remove_chains.remove(chain)
-                        return False
+                if line in remove_chains:
+                    remove_chains.remove(line)
+                    return False
             elif line.startswith('['):
                 line = _strip_packets_bytes(line)
-                for rule in remove_rules:
-                    rule_str = _strip_packets_bytes(str(rule))
-                    if rule_str == line:
-                        remove_rules.remove(rule)
-                        return False
+                if rules_to_remove.get(line):
+                    rules_to_remove[line] -= 1
+                    return False
 
             # Leave it alone
             return True
@@ -670,8 +926,7 @@ class IptablesManager(object):
 
         # flush lists, just in case we didn't find something
         remove_chains.clear()
-        for rule in remove_rules:
-            remove_rules.remove(rule)
+        del remove_rules[:]
 
         return new_filter
 
@@ -0,0 +1,401 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-only rtnetlink queries of links, addresses, routes and neighbours.
+
+The queries talk to the kernel over a NETLINK_ROUTE socket instead of
+forking the ip command and parsing its output. Queries in a namespace use a
+socket created inside the namespace, which requires the CAP_SYS_ADMIN
+capability to enter it.
+"""
+
+import contextlib
+import ctypes
+import ctypes.util
+import errno
+import itertools
+import os
+import socket
+import struct
+
+from neutron.common import exceptions as n_exc
+
+NETNS_RUN_DIR = '/var/run/netns'
+CLONE_NEWNET = 0x40000000
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+RTM_NEWNEIGH = 28
+RTM_GETNEIGH = 30
+
+IFLA_ADDRESS = 1
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_QDISC = 6
+IFLA_TXQLEN = 13
+IFLA_OPERSTATE = 16
+IFLA_IFALIAS = 20
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_FLAGS = 8
+IFA_F_PERMANENT = 0x80
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+
+NDA_DST = 1
+NDA_LLADDR = 2
+
+NLMSGHDR = struct.Struct('=IHHII')
+NLMSGERR = struct.Struct('=i')
+RTATTR = struct.Struct('=HH')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBi')
+RTMSG = struct.Struct('=BBBBBBBBI')
+NDMSG = struct.Struct('=BxxxiHBB')
+
+RECV_BUFFER_SIZE = 65536
+
+# The names the ip command uses for the values below
+LINK_TYPES = {1: 'link/ether', 772: 'link/loopback', 65534: 'link/none'}
+OPER_STATES = ['UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN',
+               'TESTING', 'DORMANT', 'UP']
+SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host',
+          255: 'nowhere'}
+NUD_STATES = [(0x01, 'INCOMPLETE'), (0x02, 'REACHABLE'), (0x04, 'STALE'),
+              (0x08, 'DELAY'), (0x10, 'PROBE'), (0x20, 'FAILED'),
+              (0x40, 'NOARP'), (0x80, 'PERMANENT')]
+
+_sequence = itertools.count(1)
+_libc = None
+
+
+class NetlinkError(n_exc.NeutronException):
+    message = _("Netlink request failed: %(reason)s")
+
+
+class DeviceNotFound(NetlinkError):
+    message = _("Device %(device)s does not exist")
+
+
+class NamespaceRestoreError(n_exc.NeutronException):
+    """The process could not switch back to its own network namespace.
+
+    This is not a NetlinkError: every later command of the process would
+    run in the wrong namespace, so callers must not fall back and carry on.
+    """
+    message = _("Failed to switch back to the original network namespace "
+                "after entering %(namespace)s: %(reason)s")
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _setns(fd):
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if _libc.setns(fd, CLONE_NEWNET) != 0:
+        raise NetlinkError(reason=os.strerror(ctypes.get_errno()))
+
+
+def _create_socket(namespace=None):
+    if not namespace:
+        return socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                             NETLINK_ROUTE)
+    # The socket stays bound to the namespace it was created in. setns
+    # applies to the whole process thread, so nothing may yield to another
+    # green thread before switching back.
+    try:
+        own_ns = open('/proc/self/ns/net')
+    except IOError as e:
+        raise NetlinkError(reason=e)
+    try:
+        try:
+            target_ns = open(os.path.join(NETNS_RUN_DIR, namespace))
+        except IOError as e:
+            raise NetlinkError(reason=e)
+        try:
+            _setns(target_ns.fileno())
+        finally:
+            target_ns.close()
+        sock = None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                 NETLINK_ROUTE)
+        finally:
+            try:
+                _setns(own_ns.fileno())
+            except NetlinkError as e:
+                if sock is not None:
+                    sock.close()
+                raise NamespaceRestoreError(namespace=namespace,
+                                            reason=e.msg)
+        return sock
+    finally:
+        own_ns.close()
+
+
+@contextlib.contextmanager
+def _rtnl_socket(namespace=None):
+    try:
+        sock = _create_socket(namespace)
+    except socket.error as e:
+        raise NetlinkError(reason=e)
+    try:
+        sock.bind((0, 0))
+        yield sock
+    except socket.error as e:
+        raise NetlinkError(reason=e)
+    finally:
+        sock.close()
+
+
+def _pack_attr(attr_type, value):
+    length = RTATTR.size + len(value)
+    return (RTATTR.pack(length, attr_type) + value +
+            '\0' * (_align(length) - length))
+
+
+def _parse_attrs(data):
+    attrs = {}
+    offset = 0
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _request(sock, msg_type, payload, dump=True):
+    """Send a request and return the payloads of the messages answered."""
+    seq = next(_sequence)
+    flags = NLM_F_REQUEST | (NLM_F_DUMP if dump else 0)
+    sock.send(NLMSGHDR.pack(NLMSGHDR.size + len(payload), msg_type, flags,
+                            seq, 0) + payload)
+    messages = []
+    while True:
+        data = sock.recv(RECV_BUFFER_SIZE)
+        offset = 0
+        while offset + NLMSGHDR.size <= len(data):
+            length, reply_type, reply_flags, reply_seq, _pid = (
+                NLMSGHDR.unpack_from(data, offset))
+            body = data[offset + NLMSGHDR.size:offset + length]
+            offset += _align(length)
+            if reply_seq != seq:
+                continue
+            if reply_type == NLMSG_DONE:
+                return messages
+            if reply_type == NLMSG_ERROR:
+                error = -NLMSGERR.unpack_from(body)[0]
+                if error:
+                    raise OSError(error, os.strerror(error))
+                return messages
+            messages.append(body)
+            if not reply_flags & NLM_F_MULTI:
+                return messages
+
+
+def _format_mac(value):
+    return ':'.join('%02x' % ord(c) for c in value)
+
+
+def _format_ip(family, value):
+    return socket.inet_ntop(family, value)
+
+
+def _parse_link(data):
+    _family, link_type, index, _flags, _change = IFINFOMSG.unpack_from(data)
+    attrs = _parse_attrs(data[IFINFOMSG.size:])
+    link = {'index': index,
+            'name': attrs.get(IFLA_IFNAME, '').rstrip('\0'),
+            'type': LINK_TYPES.get(link_type)}
+    if IFLA_ADDRESS in attrs:
+        link['address'] = _format_mac(attrs[IFLA_ADDRESS])
+    if IFLA_MTU in attrs:
+        link['mtu'] = struct.unpack('=I', attrs[IFLA_MTU])[0]
+    if IFLA_TXQLEN in attrs:
+        link['qlen'] = struct.unpack('=I', attrs[IFLA_TXQLEN])[0]
+    if IFLA_QDISC in attrs:
+        link['qdisc'] = attrs[IFLA_QDISC].rstrip('\0')
+    if IFLA_OPERSTATE in attrs:
+        state = ord(attrs[IFLA_OPERSTATE][0])
+        link['state'] = (OPER_STATES[state] if state < len(OPER_STATES)
+                         else 'UNKNOWN')
+    if attrs.get(IFLA_IFALIAS, '').rstrip('\0'):
+        link['alias'] = attrs[IFLA_IFALIAS].rstrip('\0')
+    return link
+
+
+def _get_link(sock, name):
+    payload = (IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0) +
+               _pack_attr(IFLA_IFNAME, name + '\0'))
+    try:
+        messages = _request(sock, RTM_GETLINK, payload, dump=False)
+    except OSError as e:
+        if e.errno == errno.ENODEV:
+            raise DeviceNotFound(device=name)
+        raise NetlinkError(reason=e)
+    return _parse_link(messages[0])
+
+
+def get_link(name, namespace=None):
+    """Returns the attributes of the device name as a dict.
+
+    Raises DeviceNotFound if the device does not exist.
+    """
+    with _rtnl_socket(namespace) as sock:
+        return _get_link(sock, name)
+
+
+def get_links(namespace=None):
+    """Returns the attributes of all the devices, as dicts."""
+    with _rtnl_socket(namespace) as sock:
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        return [_parse_link(m) for m in _dump(sock, RTM_GETLINK, payload)]
+
+
+def _dump(sock, msg_type, payload):
+    try:
+        return _request(sock, msg_type, payload)
+    except OSError as e:
+        raise NetlinkError(reason=e)
+
+
+def _parse_addr(data):
+    family, prefixlen, flags, scope, index = IFADDRMSG.unpack_from(data)
+    attrs = _parse_attrs(data[IFADDRMSG.size:])
+    if IFA_FLAGS in attrs:
+        flags = struct.unpack('=I', attrs[IFA_FLAGS])[0]
+    # As with the ip command, the local address is reported for
+    # point-to-point addresses
+    address = attrs.get(IFA_LOCAL, attrs.get(IFA_ADDRESS))
+    return {'index': index,
+            'family': family,
+            'cidr': '%s/%s' % (_format_ip(family, address), prefixlen),
+            'scope': SCOPES.get(scope, str(scope)),
+            'dynamic': not flags & IFA_F_PERMANENT}
+
+
+def get_addresses(name, family=socket.AF_UNSPEC, namespace=None):
+    """Returns the addresses of the device name, in the ip addr order.
+
+    Each address is a dict with the cidr, scope and dynamic keys of
+    IpAddrCommand.list. Raises DeviceNotFound if the device does not exist.
+    """
+    with _rtnl_socket(namespace) as sock:
+        index = _get_link(sock, name)['index']
+        payload = IFADDRMSG.pack(family, 0, 0, 0, 0)
+        addresses = [_parse_addr(m)
+                     for m in _dump(sock, RTM_GETADDR, payload)]
+    return [a for a in addresses
+            if a['index'] == index and
+            a['family'] in (socket.AF_INET, socket.AF_INET6)]
+
+
+def _parse_route(data):
+    (family, dst_len, _src_len, _tos, table, _protocol, scope, route_type,
+     _flags) = RTMSG.unpack_from(data)
+    attrs = _parse_attrs(data[RTMSG.size:])
+    if RTA_TABLE in attrs:
+        table = struct.unpack('=I', attrs[RTA_TABLE])[0]
+    route = {'family': family,
+             'table': table,
+             'type': route_type,
+             'scope': SCOPES.get(scope, str(scope)),
+             'dst': 'default',
+             'gateway': None,
+             'oif': None,
+             'metric': None}
+    if RTA_DST in attrs:
+        route['dst'] = '%s/%s' % (_format_ip(family, attrs[RTA_DST]),
+                                  dst_len)
+    if RTA_GATEWAY in attrs:
+        route['gateway'] = _format_ip(family, attrs[RTA_GATEWAY])
+    if RTA_OIF in attrs:
+        route['oif'] = struct.unpack('=i', attrs[RTA_OIF])[0]
+    if RTA_PRIORITY in attrs:
+        route['metric'] = struct.unpack('=I', attrs[RTA_PRIORITY])[0]
+    return route
+
+
+def get_routes(name, family=socket.AF_INET, namespace=None):
+    """Returns the unicast routes of the main table going out of name.
+
+    Each route is a dict with the dst ('default' for the default route),
+    gateway, metric and scope keys. Raises DeviceNotFound if the device does
+    not exist.
+    """
+    with _rtnl_socket(namespace) as sock:
+        index = _get_link(sock, name)['index']
+        payload = RTMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0)
+        routes = [_parse_route(m)
+                  for m in _dump(sock, RTM_GETROUTE, payload)]
+    return [r for r in routes
+            if r['oif'] == index and r['table'] == RT_TABLE_MAIN and
+            r['type'] == RTN_UNICAST]
+
+
+def _parse_neigh(data):
+    family, index, state, _flags, _type = NDMSG.unpack_from(data)
+    attrs = _parse_attrs(data[NDMSG.size:])
+    neigh = {'index': index,
+             'family': family,
+             'dst': None,
+             'lladdr': None,
+             'state': ','.join(name for flag, name in NUD_STATES
+                               if state & flag) or 'NONE'}
+    if NDA_DST in attrs:
+        neigh['dst'] = _format_ip(family, attrs[NDA_DST])
+    if NDA_LLADDR in attrs:
+        neigh['lladdr'] = _format_mac(attrs[NDA_LLADDR])
+    return neigh
+
+
+def get_neighbours(name, family=socket.AF_UNSPEC, namespace=None):
+    """Returns the neighbour entries of the device name.
+
+    Each entry is a dict with the dst, lladdr and state keys. Raises
+    DeviceNotFound if the device does not exist.
+    """
+    with _rtnl_socket(namespace) as sock:
+        index = _get_link(sock, name)['index']
+        payload = NDMSG.pack(family, 0, 0, 0, 0)
+        neighbours = [_parse_neigh(m)
+                      for m in _dump(sock, RTM_GETNEIGH, payload)]
+    return [n for n in neighbours
+            if n['index'] == index and n['dst'] is not None]
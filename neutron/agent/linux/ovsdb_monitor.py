@@ -14,13 +14,31 @@
 
 import eventlet
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 
 from neutron.agent.linux import async_process
-from neutron.i18n import _LE
+from neutron.i18n import _LE, _LW
 
 
 LOG = logging.getLogger(__name__)
 
+OVSDB_ACTION_INITIAL = 'initial'
+OVSDB_ACTION_INSERT = 'insert'
+OVSDB_ACTION_DELETE = 'delete'
+OVSDB_ACTION_NEW = 'new'
+
+
+def _val_to_py(val):
+    """Convert a json ovsdb value to a native python object."""
+    if isinstance(val, list) and len(val) == 2:
+        if val[0] == 'set':
+            return [_val_to_py(x) for x in val[1]]
+        elif val[0] == 'map':
+            return dict((_val_to_py(k), _val_to_py(v)) for k, v in val[1])
+        elif val[0] == 'uuid':
+            return val[1]
+    return val
+
 
 class OvsdbMonitor(async_process.AsyncProcess):
     """Manages an invocation of 'ovsdb-client monitor'."""
@@ -57,17 +75,22 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     The has_updates() method indicates whether changes to the ovsdb
     Interface table have been detected since the monitor started or
-    since the previous access.
+    since the previous access.  The changes themselves are returned by
+    get_events().
     """
 
     def __init__(self, respawn_interval=None):
         super(SimpleInterfaceMonitor, self).__init__(
             'Interface',
-            columns=['name', 'ofport'],
+            columns=['name', 'ofport', 'external_ids'],
             format='json',
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.new_events = {'added': [], 'removed': [], 'modified': []}
+        # The initial content of the table is received when the monitor
+        # (re)starts, the changes made before are unknown.
+        self.events_complete = False
 
     @property
     def is_active(self):
@@ -84,7 +107,60 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         the absence of updates at the expense of potential false
         positives.
         """
-        return bool(list(self.iter_stdout())) or not self.is_active
+        return self.process_events() or not self.is_active
+
+    def process_events(self):
+        """Parse the output of the monitor into interface events.
+
+        Return whether output was received since the previous call.
+        """
+        updated = False
+        for line in self.iter_stdout():
+            updated = True
+            try:
+                output = jsonutils.loads(line)
+                headings = output['headings']
+                rows = output['data']
+            except (ValueError, KeyError, TypeError):
+                LOG.warn(_LW('Unable to parse output of ovsdb monitor: %s'),
+                         line)
+                self.events_complete = False
+                continue
+            for row in rows:
+                row = dict(zip(headings, row))
+                action = row.get('action')
+                if action == OVSDB_ACTION_INITIAL:
+                    self.events_complete = False
+                    continue
+                device = {'name': row.get('name'),
+                          'ofport': _val_to_py(row.get('ofport')),
+                          'external_ids': _val_to_py(
+                              row.get('external_ids')) or {}}
+                if action == OVSDB_ACTION_INSERT:
+                    self.new_events['added'].append(device)
+                elif action == OVSDB_ACTION_DELETE:
+                    self.new_events['removed'].append(device)
+                elif action == OVSDB_ACTION_NEW:
+                    # The old values come in a preceding 'old' row, the
+                    # agent only cares about the new ones.
+                    self.new_events['modified'].append(device)
+        return updated
+
+    def get_events(self):
+        """Return the interface events received since the previous call.
+
+        The events are a dict of lists of added, removed and modified
+        interfaces, each given by its name, ofport and external_ids.  None
+        is returned when the events may not cover all the changes, i.e.
+        the monitor (re)started or is not active, and the interfaces have
+        to be fully scanned.
+        """
+        self.process_events()
+        events = self.new_events
+        complete = self.events_complete and self.is_active
+        self.new_events = {'added': [], 'removed': [], 'modified': []}
+        self.events_complete = True
+        return events if complete else None
 
     def start(self, block=False, timeout=5):
         super(SimpleInterfaceMonitor, self).start()
@@ -95,6 +171,7 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
 
     def _kill(self, *args, **kwargs):
         self.data_received = False
+        self.events_complete = False
         super(SimpleInterfaceMonitor, self)._kill(*args, **kwargs)
 
     def _read_stdout(self):
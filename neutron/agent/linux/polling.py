@@ -60,3 +60,6 @@ class InterfacePollingMinimizer(base_polling.BasePollingManager):
         # collect output.
         eventlet.sleep()
         return self._monitor.has_updates
+
+    def get_events(self):
+        return self._monitor.get_events()
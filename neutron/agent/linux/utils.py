@@ -13,9 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
+import collections
+import contextlib
 import fcntl
 import glob
 import grp
+import heapq
 import httplib
 import os
 import pwd
@@ -24,10 +28,12 @@ import socket
 import struct
 import tempfile
 import threading
+import time
 
 import eventlet
 from eventlet.green import subprocess
 from eventlet import greenthread
+from eventlet import queue
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_log import loggers
@@ -45,8 +51,21 @@ LOG = logging.getLogger(__name__)
 config.register_root_helper(cfg.CONF)
 
 
+# Upper bounds, in milliseconds, of the execute latency histogram buckets
+EXECUTE_LATENCY_BUCKETS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+# Number of commands in the execute latency summary reported by the agents
+EXECUTE_LATENCY_SUMMARY_COUNT = 5
+
+
 class RootwrapDaemonHelper(object):
-    __client = None
+    """Pool of rootwrap daemon clients.
+
+    Up to root_helper_daemon_pool_size daemons are spawned, on demand, so
+    that commands executed from different green threads don't wait for
+    each other.
+    """
+    __clients = None
+    __num_clients = 0
     __lock = threading.Lock()
 
     def __new__(cls):
@@ -54,12 +73,107 @@ class RootwrapDaemonHelper(object):
         raise NotImplementedError()
 
     @classmethod
+    def _create_client(cls):
+        return client.Client(
+            shlex.split(cfg.CONF.AGENT.root_helper_daemon))
+
+    @classmethod
+    @contextlib.contextmanager
     def get_client(cls):
+        """Check out a client from the pool for the duration of the block."""
         with cls.__lock:
-            if cls.__client is None:
-                cls.__client = client.Client(
-                    shlex.split(cfg.CONF.AGENT.root_helper_daemon))
-            return cls.__client
+            if cls.__clients is None:
+                cls.__clients = queue.LightQueue()
+            if (cls.__clients.empty() and cls.__num_clients <
+                    cfg.CONF.AGENT.root_helper_daemon_pool_size):
+                cls.__num_clients += 1
+                cls.__clients.put(cls._create_client())
+        daemon_client = cls.__clients.get()
+        try:
+            yield daemon_client
+        finally:
+            cls.__clients.put(daemon_client)
+
+
+class ExecuteLatencyHistogram(object):
+    """Latency histogram of the commands run by execute, per command."""
+
+    def __init__(self, buckets=EXECUTE_LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = collections.defaultdict(
+                lambda: {'count': 0, 'total': 0.0, 'max': 0.0,
+                         'buckets': [0] * (len(self.buckets) + 1)})
+
+    @staticmethod
+    def get_command_name(cmd):
+        """Returns the name a command is accounted under.
+
+        Commands run in a namespace are accounted under the command run in
+        the namespace, e.g. 'ip netns exec qrouter-x iptables-save' is
+        accounted under 'iptables-save'.
+        """
+        if cmd[:3] == ['ip', 'netns', 'exec'] and len(cmd) > 4:
+            cmd = cmd[4:]
+        return os.path.basename(str(cmd[0])) if cmd else ''
+
+    def record(self, cmd, duration):
+        name = self.get_command_name(cmd)
+        duration_ms = duration * 1000
+        with self._lock:
+            stats = self._stats[name]
+            stats['count'] += 1
+            stats['total'] += duration_ms
+            stats['max'] = max(stats['max'], duration_ms)
+            stats['buckets'][bisect.bisect_left(self.buckets,
+                                                duration_ms)] += 1
+
+    def get_stats(self):
+        """Returns a dict of the latencies recorded per command name.
+
+        Each value gives the number of executions, their total and maximum
+        durations in milliseconds and the number of executions per bucket,
+        with buckets keyed by their upper bound in milliseconds ('inf' for
+        the last one).
+        """
+        bucket_names = [str(b) for b in self.buckets] + ['inf']
+        with self._lock:
+            return dict(
+                (name, {'count': stats['count'],
+                        'total': stats['total'],
+                        'max': stats['max'],
+                        'buckets': dict(zip(bucket_names,
+                                            stats['buckets']))})
+                for name, stats in self._stats.items())
+
+    def get_summary(self, count=EXECUTE_LATENCY_SUMMARY_COUNT):
+        """Returns the latencies of the commands taking the most time.
+
+        Up to count command names are given, by decreasing total duration,
+        with their number of executions and their total and maximum
+        durations in whole milliseconds. Unlike the histograms, the summary
+        is small enough for the agent state reported to the server.
+        """
+        with self._lock:
+            slowest = heapq.nlargest(count, self._stats.items(),
+                                     key=lambda item: item[1]['total'])
+            return dict(
+                (name, {'count': stats['count'],
+                        'total': int(round(stats['total'])),
+                        'max': int(round(stats['max']))})
+                for name, stats in slowest)
+
+
+execute_latency = ExecuteLatencyHistogram()
+
+
+def get_execute_latency_summary():
+    """Returns the execute latency summary, see ExecuteLatencyHistogram."""
+    return execute_latency.get_summary()
 
 
 def addl_env_args(addl_env):
@@ -98,13 +212,15 @@ def execute_rootwrap_daemon(cmd, process_input, addl_env):
     # would throw those errors, and if it does it should be fixed as opposed to
     # just logging the execution error.
     LOG.debug("Running command (rootwrap daemon): %s", cmd)
-    client = RootwrapDaemonHelper.get_client()
-    return client.execute(cmd, process_input)
+    with RootwrapDaemonHelper.get_client() as daemon_client:
+        return daemon_client.execute(cmd, process_input)
 
 
 def execute(cmd, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False, log_fail_as_error=True,
             extra_ok_codes=None, run_as_root=False):
+    executed_cmd = cmd
+    start = time.time()
     try:
         if run_as_root and cfg.CONF.AGENT.root_helper_daemon:
             returncode, _stdout, _stderr = (
@@ -136,6 +252,7 @@ def execute(cmd, process_input=None, addl_env=None,
         if returncode and check_exit_code:
             raise RuntimeError(m)
     finally:
+        execute_latency.record(executed_cmd, time.time() - start)
         # NOTE(termie): this appears to be necessary to let the subprocess
         #               call clean something up in between calls, without
         #               it two execute calls in a row hangs the second one
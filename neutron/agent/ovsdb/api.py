@@ -92,6 +92,18 @@ class API(object):
         :rtype: :class:`Transaction`
         """
 
+    def get_port_index(self):
+        """Return in-memory indexes of the bridges' ports, if available
+
+        Implementations keeping a replica of the database return an object
+        with the interface of
+        :class:`neutron.agent.ovsdb.native.indexes.PortIndex`, which
+        answers port queries without a round trip to OVSDB.
+
+        :returns: The port index, or None if not available
+        """
+        return None
+
     @abc.abstractmethod
     def add_br(self, name, may_exist=True):
         """Create an command to add an OVS bridge
@@ -136,6 +136,9 @@ class OvsdbIdl(api.API):
     def transaction(self, check_error=False, log_errors=True, **kwargs):
         return Transaction(self.context, self, check_error, log_errors)
 
+    def get_port_index(self):
+        return ovsdb_connection.port_index
+
     def add_br(self, name, may_exist=True):
         return cmd.AddBridgeCommand(self, name, may_exist)
 
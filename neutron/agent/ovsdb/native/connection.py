@@ -21,6 +21,7 @@ from ovs.db import idl
 from ovs import poller
 
 from neutron.agent.ovsdb.native import idlutils
+from neutron.agent.ovsdb.native import indexes
 
 
 class TransactionQueue(Queue.Queue, object):
@@ -48,9 +49,20 @@ class TransactionQueue(Queue.Queue, object):
         return self.alertin.fileno()
 
 
+class PortIndexIdl(idl.Idl):
+    """An IDL passing its row change notifications to a PortIndex."""
+
+    port_index = None
+
+    def notify(self, event, row, updates=None):
+        if self.port_index is not None:
+            self.port_index.notify(event, row, updates)
+
+
 class Connection(object):
     def __init__(self, connection, timeout):
         self.idl = None
+        self.port_index = None
         self.connection = connection
         self.timeout = timeout
         self.txns = TransactionQueue(1)
@@ -63,8 +75,11 @@ class Connection(object):
 
             helper = idlutils.get_schema_helper(self.connection)
             helper.register_all()
-            self.idl = idl.Idl(self.connection, helper)
+            self.idl = PortIndexIdl(self.connection, helper)
             idlutils.wait_for_change(self.idl, self.timeout)
+            self.port_index = indexes.PortIndex(self.idl, self.lock)
+            self.port_index.build()
+            self.idl.port_index = self.port_index
             self.poller = poller.Poller()
             self.thread = threading.Thread(target=self.run)
             self.thread.setDaemon(True)
@@ -76,14 +91,18 @@ class Connection(object):
             self.poller.fd_wait(self.txns.alert_fileno, poller.POLLIN)
             self.poller.block()
             self.idl.run()
+            self.port_index.apply_changes()
             txn = self.txns.get_nowait()
             if txn is not None:
                 try:
-                    txn.results.put(txn.do_commit())
+                    result = txn.do_commit()
                 except Exception as ex:
-                    er = idlutils.ExceptionResult(ex=ex,
-                                                  tb=traceback.format_exc())
-                    txn.results.put(er)
+                    result = idlutils.ExceptionResult(
+                        ex=ex, tb=traceback.format_exc())
+                # The commit ran the IDL, index its changes before the
+                # caller can query them.
+                self.port_index.apply_changes()
+                txn.results.put(result)
                 self.txns.task_done()
 
     def queue_txn(self, txn):
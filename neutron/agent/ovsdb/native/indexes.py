@@ -0,0 +1,187 @@
+# Copyright (c) 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+from neutron.agent.ovsdb.native import commands as cmd
+from neutron.agent.ovsdb.native import idlutils
+
+
+def _valid_ofport(ofport):
+    return isinstance(ofport, int) and ofport > 0
+
+
+class PortIndex(object):
+    """In-memory indexes of the ports and interfaces of the bridges
+
+    The indexes are built once from the replica of the database kept by the
+    IDL, then kept up to date from the IDL's change notifications: notify()
+    records the bridges whose ports or interfaces changed while the IDL
+    processes an update, and apply_changes() reindexes only those bridges
+    once the update is processed. Both are called from the thread running
+    the IDL, and apply_changes() and the queries hold the lock given, so the
+    queries never iterate over the replica while it is being updated.
+
+    Besides the ports and interfaces per bridge, interfaces are indexed by
+    the iface-id of their external_ids and by their ofport.
+
+    The values returned are the ones DbListCommand would return, i.e. the
+    ones ovs-vsctl returns.
+    """
+
+    def __init__(self, idl, lock=None):
+        self.idl = idl
+        self._lock = lock or threading.Lock()
+        self._changed_bridges = set()
+        # The bridge of every Port and Interface row indexed, by row uuid
+        self._row_bridges = {}
+        # The row uuids, port names and interfaces indexed, by bridge name
+        self._bridge_entries = {}
+        self._bridge_ports = {}
+        self._port_tags = {}
+        self._interfaces = {}
+        self._by_iface_id = collections.defaultdict(list)
+        self._by_ofport = {}
+
+    def build(self):
+        """Index all the bridges of the replica.
+
+        The caller must hold the lock, or not have started the thread
+        running the IDL yet.
+        """
+        for name in list(self._bridge_ports):
+            self._remove_bridge(name)
+        for bridge in self.idl.tables['Bridge'].rows.values():
+            self._add_bridge(bridge)
+        self._changed_bridges.clear()
+
+    def notify(self, event, row, updates=None):
+        """Record the bridge changed by a row event of the IDL."""
+        table = row._table.name
+        if table == 'Bridge':
+            self._changed_bridges.add(row.name)
+        elif table in ('Port', 'Interface'):
+            # A new row is indexed when the row referencing it is updated
+            bridge = self._row_bridges.get(row.uuid)
+            if bridge is not None:
+                self._changed_bridges.add(bridge)
+
+    def apply_changes(self):
+        """Reindex the bridges recorded by notify()."""
+        if not self._changed_bridges:
+            return
+        with self._lock:
+            changed = self._changed_bridges
+            self._changed_bridges = set()
+            for name in changed:
+                self._remove_bridge(name)
+            for bridge in self.idl.tables['Bridge'].rows.values():
+                if bridge.name in changed:
+                    self._add_bridge(bridge)
+
+    def _remove_bridge(self, name):
+        self._bridge_ports.pop(name, None)
+        uuids, port_names, interfaces = self._bridge_entries.pop(
+            name, ((), (), ()))
+        for uuid in uuids:
+            self._row_bridges.pop(uuid, None)
+        for port_name in port_names:
+            self._port_tags.pop(port_name, None)
+        for interface in interfaces:
+            if self._interfaces.get(interface['name']) is interface:
+                del self._interfaces[interface['name']]
+            iface_id = interface['external_ids'].get('iface-id')
+            if iface_id:
+                others = [i for i in self._by_iface_id[iface_id]
+                          if i is not interface]
+                if others:
+                    self._by_iface_id[iface_id] = others
+                else:
+                    del self._by_iface_id[iface_id]
+            if _valid_ofport(interface['ofport']):
+                self._by_ofport.pop((name, interface['ofport']), None)
+
+    def _add_bridge(self, bridge):
+        uuids = []
+        all_port_names = []
+        interfaces = []
+        port_names = []
+        for port in bridge.ports:
+            uuids.append(port.uuid)
+            all_port_names.append(port.name)
+            self._port_tags[port.name] = idlutils.get_column_value(port, 'tag')
+            # As list-ports, leave out the bridge's local port
+            if port.name != bridge.name:
+                port_names.append(port.name)
+            for iface in port.interfaces:
+                uuids.append(iface.uuid)
+                interface = {
+                    'name': iface.name,
+                    'external_ids': dict(iface.external_ids),
+                    'ofport': idlutils.get_column_value(iface, 'ofport'),
+                    'bridge': bridge.name}
+                interfaces.append(interface)
+                self._interfaces[iface.name] = interface
+                iface_id = interface['external_ids'].get('iface-id')
+                if iface_id:
+                    self._by_iface_id[iface_id].append(interface)
+                if _valid_ofport(interface['ofport']):
+                    self._by_ofport[bridge.name, interface['ofport']] = (
+                        interface)
+        for uuid in uuids:
+            self._row_bridges[uuid] = bridge.name
+        self._bridge_ports[bridge.name] = port_names
+        self._bridge_entries[bridge.name] = (uuids, all_port_names,
+                                             interfaces)
+
+    def get_port_names(self, bridge):
+        """Return the names of the ports of the bridge, as list-ports."""
+        with self._lock:
+            return self._get_port_names(bridge)
+
+    def _get_port_names(self, bridge):
+        try:
+            return list(self._bridge_ports[bridge])
+        except KeyError:
+            raise cmd.RowNotFound(table='Bridge', col='name', match=bridge)
+
+    def get_interfaces(self, bridge):
+        """Return the name, external_ids and ofport of the bridge's
+        interfaces, leaving out the bridge's local interface.
+        """
+        with self._lock:
+            return [self._interfaces[name]
+                    for name in self._get_port_names(bridge)
+                    if name in self._interfaces]
+
+    def get_port_tags(self, bridge):
+        """Return a dict of the tags of the bridge's ports, by port name."""
+        with self._lock:
+            return dict((name, self._port_tags[name])
+                        for name in self._get_port_names(bridge)
+                        if name in self._port_tags)
+
+    def get_interfaces_by_iface_id(self, iface_id):
+        """Return the interfaces with iface-id in their external_ids.
+
+        The bridge of the interface is also given, under the bridge key.
+        """
+        with self._lock:
+            return list(self._by_iface_id.get(iface_id, []))
+
+    def get_interface_by_ofport(self, bridge, ofport):
+        """Return the interface of the bridge with the ofport, or None."""
+        with self._lock:
+            return self._by_ofport.get((bridge, ofport))
@@ -89,6 +89,7 @@ class PluginApi(object):
               return value to include fixed_ips and device_owner for
               the device port
         1.4 - tunnel_sync rpc signature upgrade to obtain 'host'
+        1.5 - update_devices_up and update_devices_down
     '''
 
     def __init__(self, topic):
@@ -127,6 +128,25 @@ class PluginApi(object):
         return cctxt.call(context, 'update_device_up', device=device,
                           agent_id=agent_id, host=host)
 
+    def update_devices_down(self, context, devices, agent_id, host=None):
+        try:
+            cctxt = self.client.prepare(version='1.5')
+            res = cctxt.call(context, 'update_devices_down', devices=devices,
+                             agent_id=agent_id, host=host)
+        except oslo_messaging.UnsupportedVersion:
+            res = [self.update_device_down(context, device, agent_id, host)
+                   for device in devices]
+        return res
+
+    def update_devices_up(self, context, devices, agent_id, host=None):
+        try:
+            cctxt = self.client.prepare(version='1.5')
+            return cctxt.call(context, 'update_devices_up', devices=devices,
+                              agent_id=agent_id, host=host)
+        except oslo_messaging.UnsupportedVersion:
+            for device in devices:
+                self.update_device_up(context, device, agent_id, host)
+
     def tunnel_sync(self, context, tunnel_ip, tunnel_type=None, host=None):
         try:
             cctxt = self.client.prepare(version='1.4')
@@ -46,7 +46,15 @@ security_group_opts = [
     cfg.BoolOpt(
         'enable_ipset',
         default=True,
-        help=_('Use ipset to speed-up the iptables based security groups.'))
+        help=_('Use ipset to speed-up the iptables based security groups.')),
+    cfg.BoolOpt(
+        'shared_security_group_chains',
+        default=False,
+        help=_('Put the rules of the security groups in chains shared by '
+               'all the ports with the same security groups instead of '
+               'copying them in the chain of each port, so that the number '
+               'of iptables rules no longer grows with ports times rules. '
+               'Only used by the iptables based firewall drivers.'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -144,13 +152,17 @@ class SecurityGroupAgentRpcCallbackMixin(object):
         """Callback for security group member update.
 
         :param security_groups: list of updated security_groups
+        :param sg_member_deltas: optional, the IPs added to and removed from
+        the members of the security groups
         """
         security_groups = kwargs.get('security_groups', [])
+        member_deltas = kwargs.get('sg_member_deltas')
         LOG.debug("Security group member updated on remote: %s",
                   security_groups)
         if not self.sg_agent:
             return self._security_groups_agent_not_set()
-        self.sg_agent.security_groups_member_updated(security_groups)
+        self.sg_agent.security_groups_member_updated(
+            security_groups, member_deltas=member_deltas)
 
     def security_groups_provider_updated(self, context, **kwargs):
         """Callback for security group provider update."""
@@ -185,6 +197,9 @@ class SecurityGroupAgentRpc(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Security group member deltas to apply when deferred refresh is
+        # enabled, as (security_groups, member_deltas) tuples
+        self.member_deltas_to_apply = []
         self._use_enhanced_rpc = None
 
     @property
@@ -259,19 +274,67 @@ class SecurityGroupAgentRpc(object):
             security_groups,
             'security_groups')
 
-    def security_groups_member_updated(self, security_groups):
+    def security_groups_member_updated(self, security_groups,
+                                       member_deltas=None):
         LOG.info(_LI("Security group "
                  "member updated %r"), security_groups)
+        if member_deltas and self.use_enhanced_rpc:
+            if self.defer_refresh_firewall:
+                self.member_deltas_to_apply.append(
+                    (security_groups, member_deltas))
+                return
+            security_groups = self._apply_security_group_member_deltas(
+                security_groups, member_deltas)
         self._security_group_updated(
             security_groups,
             'security_group_source_groups')
 
-    def _security_group_updated(self, security_groups, attribute):
+    def _get_devices_by_security_groups(self, security_groups, attribute):
         devices = []
         sec_grp_set = set(security_groups)
         for device in self.firewall.ports.values():
             if sec_grp_set & set(device.get(attribute, [])):
                 devices.append(device['device'])
+        return devices
+
+    def _apply_security_group_member_deltas(self, security_groups,
+                                            member_deltas):
+        """Apply the member deltas of security groups to the firewall.
+
+        The filters of the ports are updated from the ports known to the
+        firewall when needed, without fetching them from the server.
+        Returns the security groups whose members have to be refreshed from
+        the server.
+        """
+        to_refresh = []
+        devices = set()
+        with self.firewall.defer_apply():
+            for sg_id in security_groups:
+                if sg_id not in member_deltas:
+                    to_refresh.append(sg_id)
+                    continue
+                if not self._get_devices_by_security_groups(
+                        [sg_id], 'security_group_source_groups'):
+                    continue
+                try:
+                    update_filters = (
+                        self.firewall.update_security_group_member_deltas(
+                            sg_id, member_deltas[sg_id]))
+                except NotImplementedError:
+                    to_refresh.append(sg_id)
+                    continue
+                if update_filters:
+                    devices.update(self._get_devices_by_security_groups(
+                        [sg_id], 'security_group_source_groups'))
+            ports = self.firewall.ports
+            for device in devices:
+                LOG.debug("Update port filter for %s", device)
+                self.firewall.update_port_filter(ports[device])
+        return to_refresh
+
+    def _security_group_updated(self, security_groups, attribute):
+        devices = self._get_devices_by_security_groups(security_groups,
+                                                       attribute)
         if devices:
             if self.defer_refresh_firewall:
                 LOG.debug("Adding %s devices to the list of devices "
@@ -331,7 +394,8 @@ class SecurityGroupAgentRpc(object):
                     security_groups, security_group_member_ips)
 
     def firewall_refresh_needed(self):
-        return self.global_refresh_firewall or self.devices_to_refilter
+        return (self.global_refresh_firewall or self.devices_to_refilter or
+                self.member_deltas_to_apply)
 
     def setup_port_filters(self, new_devices, updated_devices):
         """Configure port filters for devices.
@@ -348,8 +412,17 @@ class SecurityGroupAgentRpc(object):
         # losing updates occurring during firewall refresh
         devices_to_refilter = self.devices_to_refilter
         global_refresh_firewall = self.global_refresh_firewall
+        member_deltas_to_apply = self.member_deltas_to_apply
         self.devices_to_refilter = set()
         self.global_refresh_firewall = False
+        self.member_deltas_to_apply = []
+        # The member deltas only apply to the filters already set up, the
+        # new and refreshed devices get the members from the server.
+        for security_groups, member_deltas in member_deltas_to_apply:
+            security_groups = self._apply_security_group_member_deltas(
+                security_groups, member_deltas)
+            devices_to_refilter |= set(self._get_devices_by_security_groups(
+                security_groups, 'security_group_source_groups'))
         # We must call prepare_devices_filter() after we've grabbed
         # self.devices_to_refilter since an update for a new port
         # could arrive while we're processing, and we need to make
@@ -392,15 +465,27 @@ class SecurityGroupAgentRpcApiMixin(object):
         cctxt.cast(context, 'security_groups_rule_updated',
                    security_groups=security_groups)
 
-    def security_groups_member_updated(self, context, security_groups):
-        """Notify member updated security groups."""
+    def security_groups_member_updated(self, context, security_groups,
+                                       member_deltas=None):
+        """Notify member updated security groups.
+
+        :param member_deltas: optional, the IPs added to and removed from
+        the members of the security groups, i.e.
+        {sg_id: {ethertype: {'added': [ip], 'removed': [ip]}}}
+        The agents refresh the members of the security groups missing from
+        it from the server, as do the agents not supporting it.
+        """
         if not security_groups:
             return
         cctxt = self.client.prepare(version=SG_RPC_VERSION,
                                     topic=self._get_security_group_topic(),
                                     fanout=True)
-        cctxt.cast(context, 'security_groups_member_updated',
-                   security_groups=security_groups)
+        kwargs = {'security_groups': security_groups}
+        if member_deltas is not None:
+            # NOTE: an optional argument, ignored by the agents before it,
+            # so the version is not bumped.
+            kwargs['sg_member_deltas'] = member_deltas
+        cctxt.cast(context, 'security_groups_member_updated', **kwargs)
 
     def security_groups_provider_updated(self, context):
         """Notify provider updated security groups."""
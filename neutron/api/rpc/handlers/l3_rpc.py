@@ -20,6 +20,7 @@ from oslo_serialization import jsonutils
 
 from neutron.common import constants
 from neutron.common import exceptions
+from neutron.common import router_sync
 from neutron.common import utils
 from neutron import context as neutron_context
 from neutron.extensions import l3
@@ -42,7 +43,9 @@ class L3RpcCallback(object):
     # 1.4 Added L3 HA update_router_state. This method was later removed,
     #     since it was unused. The RPC version was not changed
     # 1.5 Added update_ha_routers_states
-    target = oslo_messaging.Target(version='1.5')
+    # 1.6 Added sync_router_changes
+    # 1.7 Added get_router_ids
+    target = oslo_messaging.Target(version='1.7')
 
     @property
     def plugin(self):
@@ -89,6 +92,50 @@ class L3RpcCallback(object):
                                               routers, indent=5))
         return routers
 
+    def get_router_ids(self, context, **kwargs):
+        """Return the ids of the routers to sync to a specific agent.
+
+        The agents fetch their routers by chunks of these ids, rather than
+        all at once.
+        """
+        host = kwargs.get('host')
+        context = neutron_context.get_admin_context()
+        if not self.l3plugin:
+            LOG.error(_LE('No plugin for L3 routing registered! Will reply '
+                          'to l3 agent with empty router list.'))
+            return []
+        if utils.is_extension_supported(
+                self.l3plugin, constants.L3_AGENT_SCHEDULER_EXT_ALIAS):
+            if cfg.CONF.router_auto_schedule:
+                self.l3plugin.auto_schedule_routers(context, host, None)
+            return self.l3plugin.list_router_ids_on_host(context, host)
+        return [router['id'] for router in
+                self.l3plugin.get_routers(context, fields=['id'])]
+
+    def sync_router_changes(self, context, **kwargs):
+        """Sync the changes of routers to a specific agent.
+
+        The routers are built as by sync_routers and compared with the
+        revisions given, only the reply is smaller than the one of
+        sync_routers. The agents only call it when incremental_router_sync
+        is set.
+
+        @param context: contain user information
+        @param kwargs: host, revisions: the revisions of the routers known
+                       by the agent by router id, None for a router to be
+                       returned whole
+        @return: a list of router changes, see neutron.common.router_sync.
+                 The routers no longer hosted by the agent are left out.
+        """
+        revisions = kwargs.get('revisions')
+        if not revisions:
+            return []
+        routers = self.sync_routers(context, host=kwargs.get('host'),
+                                    router_ids=list(revisions))
+        return [router_sync.get_router_changes(router,
+                                               revisions.get(router['id']))
+                for router in routers]
+
     def _ensure_host_set_on_ports(self, context, host, routers):
         for router in routers:
             LOG.debug("Checking router: %(id)s for host: %(host)s",
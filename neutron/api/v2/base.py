@@ -66,9 +66,24 @@ class Controller(object):
         self._allow_bulk = allow_bulk
         self._allow_pagination = allow_pagination
         self._allow_sorting = allow_sorting
+        if parent:
+            self._parent_id_name = '%s_id' % parent['member_name']
+            parent_part = '_%s' % parent['member_name']
+        else:
+            self._parent_id_name = None
+            parent_part = ''
+        self._plugin_handlers = {
+            self.LIST: 'get%s_%s' % (parent_part, self._collection),
+            self.SHOW: 'get%s_%s' % (parent_part, self._resource)
+        }
+        for action in [self.CREATE, self.UPDATE, self.DELETE]:
+            self._plugin_handlers[action] = '%s%s_%s' % (action, parent_part,
+                                                         self._resource)
         self._native_bulk = self._is_native_bulk_supported()
         self._native_pagination = self._is_native_pagination_supported()
         self._native_sorting = self._is_native_sorting_supported()
+        self._native_policy_filtering = (
+            self._is_native_policy_filtering_supported())
         self._policy_attrs = [name for (name, info) in self._attr_info.items()
                               if info.get('required_by_policy')]
         self._notifier = n_rpc.get_notifier('network')
@@ -94,20 +109,6 @@ class Controller(object):
                              "pagination requires native sorting"))
                 self._allow_sorting = True
 
-        if parent:
-            self._parent_id_name = '%s_id' % parent['member_name']
-            parent_part = '_%s' % parent['member_name']
-        else:
-            self._parent_id_name = None
-            parent_part = ''
-        self._plugin_handlers = {
-            self.LIST: 'get%s_%s' % (parent_part, self._collection),
-            self.SHOW: 'get%s_%s' % (parent_part, self._resource)
-        }
-        for action in [self.CREATE, self.UPDATE, self.DELETE]:
-            self._plugin_handlers[action] = '%s%s_%s' % (action, parent_part,
-                                                         self._resource)
-
     def _get_primary_key(self, default_primary_key='id'):
         for key, value in self._attr_info.iteritems():
             if value.get('primary_key', False):
@@ -119,29 +120,49 @@ class Controller(object):
                                  % self._plugin.__class__.__name__)
         return getattr(self._plugin, native_bulk_attr_name, False)
 
+    def _is_native_list_feature_supported(self, feature):
+        """Whether the plugin supports a feature when listing natively.
+
+        The support is declared by the class of the plugin, or else by
+        the base class implementing the list of the collection, from
+        which the plugin inherits it.
+        """
+        native_attr_name = "_%s__native_%s_support"
+        support = getattr(self._plugin, native_attr_name % (
+            self._plugin.__class__.__name__, feature), None)
+        if support is not None:
+            return support
+        list_handler = self._plugin_handlers[self.LIST]
+        for cls in self._plugin.__class__.__mro__:
+            cls_attrs = vars(cls)
+            if native_attr_name % (cls.__name__, feature) in cls_attrs:
+                return cls_attrs[native_attr_name % (cls.__name__, feature)]
+            if list_handler in cls_attrs:
+                break
+        return False
+
     def _is_native_pagination_supported(self):
-        native_pagination_attr_name = ("_%s__native_pagination_support"
-                                       % self._plugin.__class__.__name__)
-        return getattr(self._plugin, native_pagination_attr_name, False)
+        return self._is_native_list_feature_supported('pagination')
 
     def _is_native_sorting_supported(self):
-        native_sorting_attr_name = ("_%s__native_sorting_support"
-                                    % self._plugin.__class__.__name__)
-        return getattr(self._plugin, native_sorting_attr_name, False)
+        return self._is_native_list_feature_supported('sorting')
+
+    def _is_native_policy_filtering_supported(self):
+        return self._is_native_list_feature_supported('policy_filtering')
 
-    def _exclude_attributes_by_policy(self, context, data):
+    def _exclude_attributes_by_policy(self, context, data, checker=None):
         """Identifies attributes to exclude according to authZ policies.
 
         Return a list of attribute names which should be stripped from the
         response returned to the user because the user is not authorized
-        to see them.
+        to see them. The policy checker of the request is used if given.
         """
+        checker = checker or policy.Checker(context)
         attributes_to_exclude = []
         for attr_name in data.keys():
             attr_data = self._attr_info.get(attr_name)
             if attr_data and attr_data['is_visible']:
-                if policy.check(
-                    context,
+                if checker.check(
                     '%s:%s' % (self._plugin_handlers[self.SHOW], attr_name),
                     data,
                     might_not_exist=True,
@@ -245,21 +266,40 @@ class Controller(object):
         pagination_helper.update_fields(original_fields, fields_to_add)
         if parent_id:
             kwargs[self._parent_id_name] = parent_id
-        obj_getter = getattr(self._plugin, self._plugin_handlers[self.LIST])
-        obj_list = obj_getter(request.context, **kwargs)
+        query_filter = None
+        if do_authz:
+            # The elements the context may not read are filtered out by the
+            # plugin when the read policy can be compiled for its query
+            query_filter = policy.get_query_filter(
+                request.context, self._plugin_handlers[self.SHOW],
+                pluralized=self._collection)
+            if isinstance(query_filter, policy.QueryFilter):
+                if self._native_policy_filtering:
+                    filters[policy.QUERY_FILTER_KEY] = query_filter
+                else:
+                    query_filter = None
+        if query_filter is False:
+            obj_list = []
+        else:
+            obj_getter = getattr(self._plugin,
+                                 self._plugin_handlers[self.LIST])
+            obj_list = obj_getter(request.context, **kwargs)
         obj_list = sorting_helper.sort(obj_list)
         obj_list = pagination_helper.paginate(obj_list)
+        # The rules and parent resources are shared by the checks of the
+        # elements of the list
+        checker = policy.Checker(request.context)
         # Check authz
-        if do_authz:
+        if do_authz and (query_filter is None or
+                         isinstance(query_filter, policy.QueryFilter) and
+                         not query_filter.applied):
             # FIXME(salvatore-orlando): obj_getter might return references to
             # other resources. Must check authZ on them too.
             # Omit items from list that should not be visible
             obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
-                                        self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin,
-                                        pluralized=self._collection)]
+                        if checker.check(self._plugin_handlers[self.SHOW],
+                                         obj,
+                                         pluralized=self._collection)]
         # Use the first element in the list for discriminating which attributes
         # should be filtered out because of authZ policies
         # fields_to_add contains a list of attributes added for request policy
@@ -268,7 +308,7 @@ class Controller(object):
         fields_to_strip = fields_to_add or []
         if obj_list:
             fields_to_strip += self._exclude_attributes_by_policy(
-                request.context, obj_list[0])
+                request.context, obj_list[0], checker=checker)
         collection = {self._collection:
                       [self._filter_attributes(
                           request.context, obj,
@@ -345,13 +385,14 @@ class Controller(object):
 
     def _emulate_bulk_create(self, obj_creator, request, body, parent_id=None):
         objs = []
+        checker = policy.Checker(request.context)
         try:
             for item in body[self._collection]:
                 kwargs = {self._resource: item}
                 if parent_id:
                     kwargs[self._parent_id_name] = parent_id
                 fields_to_strip = self._exclude_attributes_by_policy(
-                    request.context, item)
+                    request.context, item, checker=checker)
                 objs.append(self._filter_attributes(
                     request.context,
                     obj_creator(request.context, **kwargs),
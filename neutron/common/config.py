@@ -71,6 +71,12 @@ core_opts = [
                help=_("Maximum number of host routes per subnet")),
     cfg.IntOpt('max_fixed_ips_per_port', default=5,
                help=_("Maximum number of fixed ips per port")),
+    cfg.StrOpt('ipam_address_allocator', default=None,
+               help=_("The class allocating the IP addresses of the ports, "
+                      "e.g. neutron.ipam.address_alloc."
+                      "RandomAddressAllocator. When not set, the addresses "
+                      "are allocated in order from the availability ranges "
+                      "of the subnets.")),
     cfg.StrOpt('default_ipv4_subnet_pool', default=None,
                help=_("Default IPv4 subnet-pool to be used for automatic "
                       "subnet CIDR allocation")),
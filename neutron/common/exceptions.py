@@ -144,6 +144,11 @@ class MacAddressInUse(InUse):
                 "The mac address %(mac)s is in use.")
 
 
+class PortIdInUse(InUse):
+    message = _("Unable to create port %(port_id)s. "
+                "The port id is in use.")
+
+
 class HostRoutesExhausted(BadRequest):
     # NOTE(xchenum): probably make sense to use quota exceeded exception?
     message = _("Unable to complete operation for %(subnet_id)s. "
@@ -0,0 +1,125 @@
+# Copyright (c) 2015 OpenStack Foundation.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Incremental synchronization of the routers to the L3 agents.
+
+The attributes of a router and each of its sub-resources are given a
+revision, the digest of their content. The agents give back the revisions
+of the routers they know, and only the attributes and the sub-resources
+changed since are sent to them.
+
+This only reduces the size of the RPC replies. Routers have no revision in
+the database, so the server still builds the whole sync data of the routers
+to compute the digests, and the agents merge the changes back into whole
+routers which they process as before. The agents only use it when
+incremental_router_sync is set.
+
+The changes of a router are either the whole router, with its revisions
+under REVISIONS, or a dict with:
+    - id: the id of the router
+    - ROUTER: the attributes of the router, if they changed
+    - for each of SUB_RESOURCE_KEYS: the sub-resources added or changed
+    - REMOVED: the ids of the removed sub-resources, by key
+    - REVISIONS: the revisions of the router
+"""
+
+import hashlib
+
+from oslo_serialization import jsonutils
+
+from neutron.common import constants
+
+# The lists of sub-resources of a router, with an id
+SUB_RESOURCE_KEYS = (constants.INTERFACE_KEY,
+                     constants.FLOATINGIP_KEY,
+                     constants.SNAT_ROUTER_INTF_KEY,
+                     constants.FLOATINGIP_AGENT_INTF_KEY)
+ROUTER = 'router'
+REMOVED = '_removed'
+REVISIONS = '_revisions'
+
+
+def _digest(obj):
+    return hashlib.sha1(jsonutils.dumps(obj, sort_keys=True)).hexdigest()
+
+
+def _get_router_attributes(router):
+    return dict((key, value) for key, value in router.items()
+                if key not in SUB_RESOURCE_KEYS and key != REVISIONS)
+
+
+def get_router_revisions(router):
+    """Return the revisions of a router."""
+    revisions = {ROUTER: _digest(_get_router_attributes(router))}
+    for key in SUB_RESOURCE_KEYS:
+        if key in router:
+            revisions[key] = dict((item['id'], _digest(item))
+                                  for item in router[key])
+    return revisions
+
+
+def get_router_changes(router, revisions=None):
+    """Return the changes of a router since the revisions.
+
+    Without revisions, the changes are the whole router.
+    """
+    new_revisions = get_router_revisions(router)
+    if not revisions:
+        changes = dict(router)
+        changes[REVISIONS] = new_revisions
+        return changes
+
+    changes = {'id': router['id'], REMOVED: {}, REVISIONS: new_revisions}
+    if revisions.get(ROUTER) != new_revisions[ROUTER]:
+        changes[ROUTER] = _get_router_attributes(router)
+    for key in SUB_RESOURCE_KEYS:
+        known = revisions.get(key, {})
+        current = new_revisions.get(key, {})
+        changed = [item for item in router.get(key, [])
+                   if known.get(item['id']) != current[item['id']]]
+        if changed:
+            changes[key] = changed
+        removed = [item_id for item_id in known if item_id not in current]
+        if removed:
+            changes[REMOVED][key] = removed
+    return changes
+
+
+def apply_router_changes(router, changes):
+    """Return the router updated with the changes, with their revisions.
+
+    The router is not modified, the unchanged sub-resources are shared.
+    """
+    if REMOVED not in changes:
+        return dict(changes)
+
+    if ROUTER in changes:
+        new_router = dict(changes[ROUTER])
+        new_router.update((key, router[key])
+                          for key in SUB_RESOURCE_KEYS if key in router)
+    else:
+        new_router = dict(router)
+    for key in SUB_RESOURCE_KEYS:
+        changed = changes.get(key, [])
+        removed = set(changes[REMOVED].get(key, []))
+        if not changed and not removed:
+            continue
+        changed_by_id = dict((item['id'], item) for item in changed)
+        items = [changed_by_id.pop(item['id'], item)
+                 for item in router.get(key, [])
+                 if item['id'] not in removed]
+        items.extend(item for item in changed if item['id'] in changed_by_id)
+        new_router[key] = items
+    new_router[REVISIONS] = changes[REVISIONS]
+    return new_router
@@ -15,10 +15,12 @@
 
 import weakref
 
+import sqlalchemy as sa
 from sqlalchemy import sql
 
 from neutron.common import exceptions as n_exc
 from neutron.db import sqlalchemyutils
+from neutron import policy
 
 
 class CommonDbMixin(object):
@@ -129,9 +131,39 @@ class CommonDbMixin(object):
         query = self._model_query(context, model)
         return query.filter(model.id == id).one()
 
+    def _get_policy_clause(self, model, condition):
+        """Translate the condition of a QueryFilter into a SQL clause.
+
+        Returns None when a field of the condition is not a column of
+        the model, the condition can not be applied to the query then.
+        """
+        if condition[0] == '==':
+            field, value = condition[1:]
+            column = model.__table__.columns.get(field)
+            if column is None or (isinstance(value, basestring) and
+                                  not isinstance(column.type, sa.String)):
+                return None
+            return getattr(model, field) == value
+        clauses = [self._get_policy_clause(model, sub_condition)
+                   for sub_condition in condition[1]]
+        if any(clause is None for clause in clauses):
+            return None
+        return sql.and_(*clauses) if condition[0] == 'and' else sql.or_(
+            *clauses)
+
+    def _apply_policy_filter(self, query, model, query_filter):
+        clause = self._get_policy_clause(model, query_filter.condition)
+        if clause is not None:
+            query = query.filter(clause)
+            query_filter.applied = True
+        return query
+
     def _apply_filters_to_query(self, query, model, filters):
         if filters:
             for key, value in filters.iteritems():
+                if key == policy.QUERY_FILTER_KEY:
+                    query = self._apply_policy_filter(query, model, value)
+                    continue
                 column = getattr(model, key, None)
                 if column:
                     if not value:
@@ -173,15 +205,32 @@ class CommonDbMixin(object):
                                                     marker_obj=marker_obj)
         return collection
 
+    def _make_collection_items(self, query, model, dict_func, fields,
+                               column_fields=None):
+        """Make the dicts of the objects returned by a collection query.
+
+        When all the fields requested are column_fields, which dict_func
+        takes verbatim from the columns of the model, only these columns
+        are selected: the objects and their relationships are not loaded,
+        and no dict extend function is applied.
+        """
+        if fields and column_fields and set(fields) <= set(column_fields):
+            field_names = list(set(fields))
+            columns = [getattr(model, name) for name in field_names]
+            return [dict(zip(field_names, row))
+                    for row in query.with_entities(*columns)]
+        return [dict_func(c, fields) for c in query]
+
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
+                        page_reverse=False, column_fields=None):
         query = self._get_collection_query(context, model, filters=filters,
                                            sorts=sorts,
                                            limit=limit,
                                            marker_obj=marker_obj,
                                            page_reverse=page_reverse)
-        items = [dict_func(c, fields) for c in query]
+        items = self._make_collection_items(query, model, dict_func, fields,
+                                            column_fields=column_fields)
         if limit and page_reverse:
             items.reverse()
         return items
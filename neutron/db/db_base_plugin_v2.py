@@ -13,13 +13,17 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 import netaddr
 from oslo_config import cfg
 from oslo_db import api as oslo_db_api
 from oslo_db import exception as db_exc
 from oslo_log import log as logging
 from oslo_utils import excutils
+from oslo_utils import importutils
 from sqlalchemy import and_
+from sqlalchemy import bindparam
 from sqlalchemy import event
 from sqlalchemy import orm
 from sqlalchemy.orm import exc
@@ -55,6 +59,19 @@ LOG = logging.getLogger(__name__)
 # IP allocations being cleaned up by cascade.
 AUTO_DELETE_PORT_OWNERS = [constants.DEVICE_OWNER_DHCP]
 
+# The attributes which the dicts of networks, subnets and ports take
+# verbatim from the columns of their models. The lists requesting none
+# but these fields only select their columns.
+NETWORK_COLUMN_FIELDS = ('id', 'name', 'tenant_id', 'admin_state_up',
+                         'status', 'shared')
+SUBNET_COLUMN_FIELDS = ('id', 'name', 'tenant_id', 'network_id',
+                        'ip_version', 'cidr', 'subnetpool_id', 'gateway_ip',
+                        'enable_dhcp', 'ipv6_ra_mode', 'ipv6_address_mode',
+                        'shared')
+PORT_COLUMN_FIELDS = ('id', 'name', 'network_id', 'tenant_id',
+                      'mac_address', 'admin_state_up', 'status',
+                      'device_id', 'device_owner')
+
 
 class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                         common_db_mixin.CommonDbMixin):
@@ -67,11 +84,12 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
     """
 
     # This attribute specifies whether the plugin supports or not
-    # bulk/pagination/sorting operations. Name mangling is used in
-    # order to ensure it is qualified by class
+    # bulk/pagination/sorting/policy filtering operations. Name mangling
+    # is used in order to ensure it is qualified by class
     __native_bulk_support = True
     __native_pagination_support = True
     __native_sorting_support = True
+    __native_policy_filtering_support = True
 
     def __init__(self):
         if cfg.CONF.notify_nova_on_port_status_changes:
@@ -176,10 +194,72 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             ip_address=ip_address,
             subnet_id=subnet_id
         )
-        context.session.add(allocated)
+        if cfg.CONF.ipam_address_allocator:
+            # The allocator inserted the allocation, without port
+            context.session.merge(allocated)
+        else:
+            context.session.add(allocated)
+
+    @staticmethod
+    def _store_ip_allocations(context, network_id, ips, reserved=False):
+        """Store the allocations of IPs of ports, in one statement.
+
+        :param ips: the IPs, with the port_id of their port.
+        :param reserved: whether the address allocator inserted the
+        allocations, without port.
+        """
+        if not ips:
+            return
+        LOG.debug("Allocated IPs %s on network %s", ips, network_id)
+        table = models_v2.IPAllocation.__table__
+        if reserved:
+            context.session.execute(
+                table.update().where(and_(
+                    table.c.ip_address == bindparam('b_ip_address'),
+                    table.c.subnet_id == bindparam('b_subnet_id'))).values(
+                        port_id=bindparam('b_port_id')),
+                [{'b_ip_address': ip['ip_address'],
+                  'b_subnet_id': ip['subnet_id'],
+                  'b_port_id': ip['port_id']} for ip in ips])
+        else:
+            context.session.execute(
+                table.insert(),
+                [{'ip_address': ip['ip_address'],
+                  'subnet_id': ip['subnet_id'],
+                  'port_id': ip['port_id'],
+                  'network_id': network_id} for ip in ips])
+
+    @staticmethod
+    def _get_address_allocator(context, subnet):
+        """Returns the allocator of the addresses of the subnet.
+
+        None when the addresses are allocated from the availability ranges.
+        """
+        if not cfg.CONF.ipam_address_allocator:
+            return None
+        allocator_cls = importutils.import_class(
+            cfg.CONF.ipam_address_allocator)
+        return allocator_cls(context.session, subnet)
 
     @staticmethod
     def _generate_ip(context, subnets):
+        if cfg.CONF.ipam_address_allocator:
+            for subnet in subnets:
+                allocator = NeutronDbPluginV2._get_address_allocator(
+                    context, subnet)
+                try:
+                    ip_address = allocator.allocate(ipam.AnyAddressRequest())
+                except n_exc.IpAddressGenerationFailure:
+                    LOG.debug("All IPs from subnet %(subnet_id)s (%(cidr)s) "
+                              "allocated",
+                              {'subnet_id': subnet['id'],
+                               'cidr': subnet['cidr']})
+                    continue
+                return {'ip_address': str(ip_address),
+                        'subnet_id': subnet['id']}
+            raise n_exc.IpAddressGenerationFailure(
+                net_id=subnets[0]['network_id'])
+
         try:
             return NeutronDbPluginV2._try_generate_ip(context, subnets)
         except n_exc.IpAddressGenerationFailure:
@@ -224,6 +304,79 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                     'subnet_id': subnet['id']}
         raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
 
+    @staticmethod
+    def _generate_ips(context, subnets, count):
+        """Generate count IP addresses from the subnets of a network.
+
+        The addresses are taken from the first subnet and then from the
+        next ones when it is full, each subnet being reserved in batch.
+        """
+        if cfg.CONF.ipam_address_allocator:
+            ips = []
+            for subnet in subnets:
+                allocator = NeutronDbPluginV2._get_address_allocator(
+                    context, subnet)
+                try:
+                    addresses = allocator.bulk_allocate(count - len(ips))
+                except n_exc.IpAddressGenerationFailure:
+                    # Fewer addresses are free, take them one by one
+                    addresses = []
+                    try:
+                        while len(ips) + len(addresses) < count:
+                            addresses.append(allocator.allocate(
+                                ipam.AnyAddressRequest()))
+                    except n_exc.IpAddressGenerationFailure:
+                        LOG.debug("All IPs from subnet %(subnet_id)s "
+                                  "(%(cidr)s) allocated",
+                                  {'subnet_id': subnet['id'],
+                                   'cidr': subnet['cidr']})
+                ips.extend({'ip_address': str(address),
+                            'subnet_id': subnet['id']}
+                           for address in addresses)
+                if len(ips) == count:
+                    return ips
+            raise n_exc.IpAddressGenerationFailure(
+                net_id=subnets[0]['network_id'])
+
+        try:
+            return NeutronDbPluginV2._try_generate_ips(context, subnets,
+                                                       count)
+        except n_exc.IpAddressGenerationFailure:
+            NeutronDbPluginV2._rebuild_availability_ranges(context, subnets)
+
+        return NeutronDbPluginV2._try_generate_ips(context, subnets, count)
+
+    @staticmethod
+    def _try_generate_ips(context, subnets, count):
+        """Generate count IP addresses from the availability ranges.
+
+        The addresses are taken from the start of the ranges, which are
+        shortened by as many addresses at once.
+        """
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool).with_lockmode('update')
+        ips = []
+        for subnet in subnets:
+            for ip_range in range_qry.filter_by(subnet_id=subnet['id']):
+                first_ip = netaddr.IPAddress(ip_range['first_ip'])
+                last_ip = netaddr.IPAddress(ip_range['last_ip'])
+                size = int(last_ip) - int(first_ip) + 1
+                taken = min(count - len(ips), size)
+                ips.extend({'ip_address': str(first_ip + i),
+                            'subnet_id': subnet['id']}
+                           for i in range(taken))
+                if taken == size:
+                    context.session.delete(ip_range)
+                else:
+                    ip_range['first_ip'] = str(first_ip + taken)
+                if len(ips) == count:
+                    LOG.debug("Allocated %(count)s IPs of subnets %(subnets)s",
+                              {'count': count,
+                               'subnets': [s['id'] for s in subnets]})
+                    return ips
+        raise n_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
     @staticmethod
     def _rebuild_availability_ranges(context, subnets):
         """Rebuild availability ranges.
@@ -468,9 +621,14 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
             is_auto_addr = ipv6_utils.is_auto_address_subnet(subnet)
             if 'ip_address' in fixed:
                 if not is_auto_addr:
-                    # Remove the IP address from the allocation pool
-                    NeutronDbPluginV2._allocate_specific_ip(
-                        context, fixed['subnet_id'], fixed['ip_address'])
+                    allocator = self._get_address_allocator(context, subnet)
+                    if allocator:
+                        allocator.allocate(
+                            ipam.SpecificAddressRequest(fixed['ip_address']))
+                    else:
+                        # Remove the IP address from the allocation pool
+                        NeutronDbPluginV2._allocate_specific_ip(
+                            context, fixed['subnet_id'], fixed['ip_address'])
                 ips.append({'ip_address': fixed['ip_address'],
                             'subnet_id': fixed['subnet_id']})
             # Only subnet ID is specified => need to generate IP
@@ -1032,7 +1190,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    column_fields=NETWORK_COLUMN_FIELDS)
 
     def get_networks_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Network,
@@ -1644,7 +1803,8 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    column_fields=SUBNET_COLUMN_FIELDS)
 
     def get_subnets_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Subnet,
@@ -1808,6 +1968,221 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                   max_retries)
         raise n_exc.MacAddressGenerationFailure(net_id=network_id)
 
+    def _generate_macs(self, context, network_id, count, exclude=()):
+        """Generate count distinct MAC addresses unused on the network.
+
+        The generated MACs are checked against the ports of the network
+        together, and the ones in use generated again.
+        """
+        macs = set()
+        for i in range(cfg.CONF.mac_generation_retries):
+            candidates = set(self._generate_mac()
+                             for j in range(count - len(macs)))
+            candidates -= macs | set(exclude)
+            if candidates:
+                in_use = context.session.query(
+                    models_v2.Port.mac_address).filter(
+                        models_v2.Port.network_id == network_id,
+                        models_v2.Port.mac_address.in_(candidates))
+                macs |= candidates - set(mac for mac, in in_use)
+            if len(macs) == count:
+                return list(macs)
+            LOG.debug('Generated macs exist on network %s', network_id)
+
+        LOG.error(_LE("Unable to generate mac address after %s attempts"),
+                  cfg.CONF.mac_generation_retries)
+        raise n_exc.MacAddressGenerationFailure(net_id=network_id)
+
+    def _check_macs_unused(self, context, network_id, macs):
+        seen = set()
+        for mac in macs:
+            if mac in seen:
+                raise n_exc.MacAddressInUse(net_id=network_id, mac=mac)
+            seen.add(mac)
+        if macs:
+            in_use = context.session.query(models_v2.Port.mac_address).filter(
+                models_v2.Port.network_id == network_id,
+                models_v2.Port.mac_address.in_(macs)).first()
+            if in_use:
+                raise n_exc.MacAddressInUse(net_id=network_id,
+                                            mac=in_use.mac_address)
+
+    def _check_port_ids_unused(self, context, port_ids):
+        seen = set()
+        for port_id in port_ids:
+            if port_id in seen:
+                raise n_exc.PortIdInUse(port_id=port_id)
+            seen.add(port_id)
+        if port_ids:
+            in_use = context.session.query(models_v2.Port.id).filter(
+                models_v2.Port.id.in_(port_ids)).first()
+            if in_use:
+                raise n_exc.PortIdInUse(port_id=in_use.id)
+
+    def _insert_ports(self, context, network_id, rows):
+        """Insert the ports of a network, in one statement.
+
+        The MACs of the ports without mac_address are generated, and
+        generated again when one of them is taken concurrently. Other
+        duplicate entries are raised.
+        """
+        generated = [row for row in rows
+                     if row['mac_address'] is attributes.ATTR_NOT_SPECIFIED]
+        macs = [row['mac_address'] for row in rows
+                if row['mac_address'] is not attributes.ATTR_NOT_SPECIFIED]
+        max_retries = cfg.CONF.mac_generation_retries
+        for i in range(max_retries):
+            self._check_macs_unused(context, network_id, macs)
+            for row, mac in zip(generated, self._generate_macs(
+                    context, network_id, len(generated), macs)):
+                row['mac_address'] = mac
+            try:
+                with context.session.begin_nested():
+                    context.session.execute(
+                        models_v2.Port.__table__.insert(), rows)
+                return
+            except db_exc.DBDuplicateEntry as e:
+                if 'mac_address' not in e.columns:
+                    raise
+                LOG.debug('Generated macs were taken concurrently on '
+                          'network %s', network_id)
+
+        LOG.error(_LE("Unable to generate mac address after %s attempts"),
+                  max_retries)
+        raise n_exc.MacAddressGenerationFailure(net_id=network_id)
+
+    def _check_unique_ips(self, context, network_id, subnet_id, ip_addresses):
+        in_use = context.session.query(models_v2.IPAllocation.ip_address)
+        in_use = in_use.filter(
+            models_v2.IPAllocation.subnet_id == subnet_id,
+            models_v2.IPAllocation.ip_address.in_(ip_addresses)).first()
+        if in_use:
+            raise n_exc.IpAddressInUse(net_id=network_id,
+                                       ip_address=in_use.ip_address)
+
+    def _allocate_ips_for_ports(self, context, network_id, ports):
+        """Allocate and store the IP addresses of ports of a network.
+
+        The ports without fixed_ips get an address of the v4 and of the v6
+        stateful subnets generated in batch, and the addresses of the
+        auto-address subnets. The ports with fixed_ips are allocated theirs
+        port by port, as create_port does.
+
+        :param ports: the port attributes and rows of the ports.
+        :returns: the IPs of each port, by port id.
+        """
+        port_ips = {}
+        auto_rows = []
+        for p, row in ports:
+            if p['fixed_ips'] is attributes.ATTR_NOT_SPECIFIED:
+                auto_rows.append(row)
+                port_ips[row['id']] = []
+                continue
+            ips = self._allocate_ips_for_port(context, {'port': p})
+            for ip in ips:
+                NeutronDbPluginV2._store_ip_allocation(
+                    context, ip['ip_address'], network_id, ip['subnet_id'],
+                    row['id'])
+            port_ips[row['id']] = ips
+        if not auto_rows:
+            return port_ips
+
+        # Split into v4, v6 stateless and v6 stateful subnets
+        v4 = []
+        v6_stateful = []
+        v6_stateless = []
+        subnets = self.get_subnets(context,
+                                   filters={'network_id': [network_id]})
+        for subnet in subnets:
+            if subnet['ip_version'] == 4:
+                v4.append(subnet)
+            elif ipv6_utils.is_auto_address_subnet(subnet):
+                v6_stateless.append(subnet)
+            else:
+                v6_stateful.append(subnet)
+
+        for version_subnets in (v4, v6_stateful):
+            if not version_subnets:
+                continue
+            ips = self._generate_ips(context, version_subnets,
+                                     len(auto_rows))
+            for row, ip in zip(auto_rows, ips):
+                ip['port_id'] = row['id']
+                port_ips[row['id']].append(ip)
+            self._store_ip_allocations(
+                context, network_id, ips,
+                reserved=bool(cfg.CONF.ipam_address_allocator))
+
+        # IP addresses for IPv6 SLAAC and DHCPv6-stateless subnets
+        # are implicitly included.
+        host_rows = [row for row in auto_rows
+                     if row['device_owner'] not in
+                     constants.ROUTER_INTERFACE_OWNERS and
+                     row['device_owner'] != constants.DEVICE_OWNER_ROUTER_SNAT]
+        for subnet in v6_stateless:
+            if not host_rows:
+                break
+            ips = [{'ip_address': ipv6_utils.get_ipv6_addr_by_EUI64(
+                        subnet['cidr'], row['mac_address']).format(),
+                    'subnet_id': subnet['id'],
+                    'port_id': row['id']} for row in host_rows]
+            self._check_unique_ips(context, network_id, subnet['id'],
+                                   [ip['ip_address'] for ip in ips])
+            for ip in ips:
+                port_ips[ip['port_id']].append(ip)
+            self._store_ip_allocations(context, network_id, ips)
+        return port_ips
+
+    def _create_ports_bulk(self, context, ports):
+        """Create ports in batch, rather than one by one.
+
+        The MACs and the IPs of the ports are reserved per network in a few
+        statements and the ports and their IP allocations are inserted with
+        executemany. Plugins creating the ports in create_port_bulk go
+        through create_port instead.
+
+        :param ports: the list of port requests.
+        :returns: the ports, without their extensions, in the same order.
+        """
+        rows = []
+        network_ports = collections.OrderedDict()
+        for port in ports:
+            p = port['port']
+            tenant_id = self._get_tenant_id_for_create(context, p)
+            if p.get('device_owner'):
+                self._enforce_device_owner_not_router_intf_or_device_id(
+                    context, p.get('device_owner'), p.get('device_id'),
+                    tenant_id)
+            row = dict(tenant_id=tenant_id,
+                       name=p['name'],
+                       id=p.get('id') or uuidutils.generate_uuid(),
+                       network_id=p['network_id'],
+                       admin_state_up=p['admin_state_up'],
+                       status=p.get('status', constants.PORT_STATUS_ACTIVE),
+                       device_id=p['device_id'],
+                       device_owner=p['device_owner'],
+                       mac_address=p['mac_address'])
+            rows.append(row)
+            network_ports.setdefault(p['network_id'], []).append((p, row))
+
+        port_ips = {}
+        with context.session.begin(subtransactions=True):
+            self._check_port_ids_unused(context,
+                                        [r['id'] for r in rows])
+            for network_id, net_ports in network_ports.items():
+                # Ensure that the network exists.
+                self._get_network(context, network_id)
+                self._insert_ports(context, network_id,
+                                   [item[1] for item in net_ports])
+                for p, row in net_ports:
+                    p['mac_address'] = row['mac_address']
+                port_ips.update(self._allocate_ips_for_ports(
+                    context, network_id, net_ports))
+
+        return [self._make_port_dict(
+            dict(port_row, fixed_ips=port_ips[port_row['id']]),
+            process_extensions=False) for port_row in rows]
+
     def create_port(self, context, port):
         p = port['port']
         port_id = p.get('id') or uuidutils.generate_uuid()
@@ -1963,11 +2338,17 @@ class NeutronDbPluginV2(neutron_plugin_base_v2.NeutronPluginBaseV2,
                   sorts=None, limit=None, marker=None,
                   page_reverse=False):
         marker_obj = self._get_marker_obj(context, 'port', limit, marker)
+        # The rows of the ports joined to their IP allocations are only
+        # made unique by the loading of the port objects
+        column_fields = (None if filters and filters.get('fixed_ips')
+                         else PORT_COLUMN_FIELDS)
         query = self._get_ports_query(context, filters=filters,
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
                                       page_reverse=page_reverse)
-        items = [self._make_port_dict(c, fields) for c in query]
+        items = self._make_collection_items(query, models_v2.Port,
+                                            self._make_port_dict, fields,
+                                            column_fields=column_fields)
         if limit and page_reverse:
             items.reverse()
         return items
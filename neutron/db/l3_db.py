@@ -1150,7 +1150,7 @@ class L3_NAT_dbonly_mixin(l3.RouterPluginBase):
             return []
         qry = context.session.query(RouterPort)
         qry = qry.filter(
-            Router.id.in_(router_ids),
+            RouterPort.router_id.in_(router_ids),
             RouterPort.port_type.in_(device_owners)
         )
 
@@ -1182,13 +1182,21 @@ class L3_NAT_dbonly_mixin(l3.RouterPluginBase):
 
         network_ids = set(p['network_id']
                           for p in each_port_having_fixed_ips())
-        filters = {'network_id': [id for id in network_ids]}
-        fields = ['id', 'cidr', 'gateway_ip',
-                  'network_id', 'ipv6_ra_mode']
+        if not network_ids:
+            return
+
+        # Only select the columns needed, rather than building the whole
+        # subnet dicts of the core plugin
+        qry = context.session.query(models_v2.Subnet.id,
+                                    models_v2.Subnet.cidr,
+                                    models_v2.Subnet.gateway_ip,
+                                    models_v2.Subnet.network_id,
+                                    models_v2.Subnet.ipv6_ra_mode)
+        qry = qry.filter(models_v2.Subnet.network_id.in_(network_ids))
 
         subnets_by_network = dict((id, []) for id in network_ids)
-        for subnet in self._core_plugin.get_subnets(context, filters, fields):
-            subnets_by_network[subnet['network_id']].append(subnet)
+        for subnet in qry:
+            subnets_by_network[subnet.network_id].append(subnet)
 
         for port in each_port_having_fixed_ips():
 
@@ -1199,15 +1207,15 @@ class L3_NAT_dbonly_mixin(l3.RouterPluginBase):
                 # in the port's fixed_ips), then add this subnet to the
                 # port's subnets list, and populate the fixed_ips entry
                 # entry with the subnet's prefix length.
-                subnet_info = {'id': subnet['id'],
-                               'cidr': subnet['cidr'],
-                               'gateway_ip': subnet['gateway_ip'],
-                               'ipv6_ra_mode': subnet['ipv6_ra_mode']}
+                subnet_info = {'id': subnet.id,
+                               'cidr': subnet.cidr,
+                               'gateway_ip': subnet.gateway_ip,
+                               'ipv6_ra_mode': subnet.ipv6_ra_mode}
                 for fixed_ip in port['fixed_ips']:
-                    if fixed_ip['subnet_id'] == subnet['id']:
+                    if fixed_ip['subnet_id'] == subnet.id:
                         port['subnets'].append(subnet_info)
                         prefixlen = netaddr.IPNetwork(
-                            subnet['cidr']).prefixlen
+                            subnet.cidr).prefixlen
                         fixed_ip['prefixlen'] = prefixlen
                         break
                 else:
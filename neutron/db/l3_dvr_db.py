@@ -396,15 +396,19 @@ class L3_NAT_with_dvr_db_mixin(l3_db.L3_NAT_db_mixin,
         return routers
 
     def _process_routers(self, context, routers):
-        routers_dict = {}
-        for router in routers:
-            routers_dict[router['id']] = router
-            router_ids = [router['id']]
-            if router['gw_port_id']:
-                snat_router_intfs = self.get_snat_sync_interfaces(context,
-                                                                  router_ids)
-                LOG.debug("SNAT ports returned: %s ", snat_router_intfs)
-                router[SNAT_ROUTER_INTF_KEY] = snat_router_intfs
+        routers_dict = dict((router['id'], router) for router in routers)
+        gw_router_ids = [router['id'] for router in routers
+                         if router['gw_port_id']]
+        for router_id in gw_router_ids:
+            routers_dict[router_id][SNAT_ROUTER_INTF_KEY] = []
+        # Query the SNAT ports of all the routers at once
+        snat_router_intfs = self.get_snat_sync_interfaces(context,
+                                                          gw_router_ids)
+        LOG.debug("SNAT ports returned: %s ", snat_router_intfs)
+        for snat_router_intf in snat_router_intfs:
+            router = routers_dict.get(snat_router_intf['device_id'])
+            if router and SNAT_ROUTER_INTF_KEY in router:
+                router[SNAT_ROUTER_INTF_KEY].append(snat_router_intf)
         return routers_dict
 
     def _process_floating_ips_dvr(self, context, routers_dict,
@@ -13,27 +13,157 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import functools
+import threading
+import time
+
 import netaddr
+from oslo_config import cfg
 from oslo_log import log as logging
 from sqlalchemy.orm import exc
 
+from neutron.callbacks import events
+from neutron.callbacks import registry
+from neutron.callbacks import resources
 from neutron.common import constants as q_const
 from neutron.common import ipv6_utils as ipv6
 from neutron.common import utils
 from neutron.db import allowedaddresspairs_db as addr_pair
 from neutron.db import models_v2
 from neutron.db import securitygroups_db as sg_db
+from neutron.extensions import allowedaddresspairs as ext_addr_pair
 from neutron.extensions import securitygroup as ext_sg
 from neutron.i18n import _LW
 
 LOG = logging.getLogger(__name__)
 
+SG_CACHE_OPTS = [
+    cfg.IntOpt('security_group_cache_ttl', default=0,
+               help=_("Seconds the rules and the member IPs of a security "
+                      "group are cached to answer the security group "
+                      "requests of the agents. The cache is invalidated by "
+                      "the changes the server process handles, so it is "
+                      "only used when the API and RPC requests are all "
+                      "handled by one process, i.e. when api_workers and "
+                      "rpc_workers are 0. 0 disables the cache.")),
+]
+cfg.CONF.register_opts(SG_CACHE_OPTS)
 
 DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 DHCP_RULE_PORT = {4: (67, 68, q_const.IPv4), 6: (547, 546, q_const.IPv6)}
 
+# The changes of the members of security groups notified with deltas
+MEMBER_ADDED = 'added'
+MEMBER_REMOVED = 'removed'
+
+SG_RULE_FIELDS = ('id', 'security_group_id', 'direction', 'ethertype',
+                  'protocol', 'port_range_min', 'port_range_max',
+                  'remote_ip_prefix', 'remote_group_id')
+
+
+class SecurityGroupInfoCache(object):
+    """Cache of the rules and the member IPs of security groups
+
+    Entries are keyed by security group id and expire after ttl seconds.
+    Results loaded while an invalidation happened are returned but not
+    stored, as they may predate it.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rules = {}
+        self._member_ips = {}
+        self._rule_groups = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _get(self, entries, sg_ids, load):
+        result = {}
+        now = time.time()
+        with self._lock:
+            for sg_id in sg_ids:
+                entry = entries.get(sg_id)
+                if entry and entry[0] > now:
+                    result[sg_id] = entry[1]
+            missing = [sg_id for sg_id in sg_ids if sg_id not in result]
+            self.hits += len(result)
+            self.misses += len(missing)
+            generation = self._generation
+        if not missing:
+            return result
+        loaded = load(missing)
+        result.update(loaded)
+        expiry = time.time() + self.ttl
+        with self._lock:
+            if generation == self._generation:
+                for sg_id, value in loaded.items():
+                    entries[sg_id] = (expiry, value)
+                    if entries is self._rules:
+                        for rule in value:
+                            self._rule_groups[rule['id']] = sg_id
+        return result
+
+    def get_rules(self, sg_ids, load):
+        """Return the rule dicts of the security groups, by group id.
+
+        load is called with the ids of the groups missing from the cache and
+        returns their rules, as a list of dicts, by group id.
+        """
+        return self._get(self._rules, set(sg_ids),
+                         lambda missing: dict(
+                             (sg_id, tuple(rules))
+                             for sg_id, rules in load(missing).items()))
+
+    def get_member_ips(self, sg_ids, load):
+        """Return the IPs of the members of the security groups, by group id.
+
+        load is called with the ids of the groups missing from the cache and
+        returns the IPs of their members, as a set, by group id.
+        """
+        return self._get(self._member_ips, set(sg_ids),
+                         lambda missing: dict(
+                             (sg_id, frozenset(ips))
+                             for sg_id, ips in load(missing).items()))
+
+    def _invalidate(self, entries, sg_ids):
+        with self._lock:
+            self._generation += 1
+            for sg_id in sg_ids:
+                entry = entries.pop(sg_id, None)
+                if entry and entries is self._rules:
+                    for rule in entry[1]:
+                        self._rule_groups.pop(rule['id'], None)
+                self.invalidations += 1
+
+    def invalidate_rules(self, sg_ids):
+        self._invalidate(self._rules, sg_ids)
+
+    def invalidate_rule(self, rule_id):
+        """Invalidate the rules of the security group of the rule."""
+        with self._lock:
+            sg_id = self._rule_groups.get(rule_id)
+        if sg_id:
+            self.invalidate_rules([sg_id])
+
+    def invalidate_member_ips(self, sg_ids):
+        self._invalidate(self._member_ips, sg_ids)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'invalidations': self.invalidations,
+                    'hit_rate': float(self.hits) / lookups if lookups else 0.0,
+                    'rules': len(self._rules),
+                    'member_ips': len(self._member_ips)}
+
 
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
     """Mixin class to add agent-based security group implementation."""
@@ -80,6 +210,9 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                       self).create_security_group_rule_bulk_native(
                           context, security_group_rules)
         sgids = set([r['security_group_id'] for r in rules])
+        # The rules are notified as created before the transaction creating
+        # them all is committed, the groups may have been cached again since.
+        self._invalidate_security_group_rules(sgids)
         self.notifier.security_groups_rule_updated(context, list(sgids))
         return rules
 
@@ -133,9 +266,18 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                 original_port.get(ext_sg.SECURITYGROUPS),
                 updated_port.get(ext_sg.SECURITYGROUPS))):
             need_notify = True
+        if (need_notify or
+            original_port.get(ext_addr_pair.ADDRESS_PAIRS) !=
+                updated_port.get(ext_addr_pair.ADDRESS_PAIRS)):
+            # The port may have left or joined groups, or changed the IPs
+            # it gives them
+            self._invalidate_security_group_member_ips(
+                set(original_port.get(ext_sg.SECURITYGROUPS) or []) |
+                set(updated_port.get(ext_sg.SECURITYGROUPS) or []))
         return need_notify
 
-    def notify_security_groups_member_updated_bulk(self, context, ports):
+    def notify_security_groups_member_updated_bulk(self, context, ports,
+                                                   member_change=None):
         """Notify update event of security group members for ports.
 
         The agent setups the iptables rule to allow
@@ -145,9 +287,18 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         security_groups_provider_updated() just notifies that an event
         occurs and the plugin agent fetches the update provider
         rule in the other RPC call (security_group_rules_for_devices).
+
+        member_change is MEMBER_ADDED when the ports were created and
+        MEMBER_REMOVED when they were deleted, the IPs added to or removed
+        from the security groups are then notified to the agents, which
+        otherwise fetch all the members of the security groups.
         """
+        self._invalidate_security_group_member_ips(
+            set(sg_id for port in ports
+                for sg_id in port.get(ext_sg.SECURITYGROUPS) or []))
         security_groups_provider_updated = False
         sec_groups = set()
+        member_ports = []
         for port in ports:
             if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
                 security_groups_provider_updated = True
@@ -159,15 +310,88 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                     security_groups_provider_updated = True
             else:
                 sec_groups |= set(port.get(ext_sg.SECURITYGROUPS))
+                member_ports.append(port)
 
         if security_groups_provider_updated:
             self.notifier.security_groups_provider_updated(context)
         if sec_groups:
+            member_deltas = None
+            if member_change:
+                member_deltas = self._get_security_group_member_deltas(
+                    context, member_ports, member_change)
             self.notifier.security_groups_member_updated(
-                context, list(sec_groups))
+                context, list(sec_groups), member_deltas=member_deltas)
+
+    def notify_security_groups_member_updated(self, context, port,
+                                              member_change=None):
+        self.notify_security_groups_member_updated_bulk(
+            context, [port], member_change=member_change)
+
+    def _get_security_group_member_deltas(self, context, ports,
+                                          member_change):
+        """Return the IPs the ports add to or remove from their groups.
+
+        The result maps each security group of the ports to
+        {ethertype: {MEMBER_ADDED: [ip], MEMBER_REMOVED: [ip]}}.
+        """
+        ips_by_group = collections.defaultdict(set)
+        for port in ports:
+            ips = [ip['ip_address'] for ip in port['fixed_ips']]
+            ips.extend(pair['ip_address'] for pair in
+                       port.get(ext_addr_pair.ADDRESS_PAIRS) or [])
+            for sg_id in port.get(ext_sg.SECURITYGROUPS):
+                ips_by_group[sg_id].update(ips)
+        if member_change == MEMBER_REMOVED:
+            # An IP is still a member while another port of the group has
+            # it, e.g. as an allowed address pair
+            member_ips = self._select_ips_for_remote_group(
+                context, list(ips_by_group))
+            for sg_id, ips in ips_by_group.items():
+                ips -= member_ips[sg_id]
+        member_deltas = {}
+        for sg_id, ips in ips_by_group.items():
+            deltas = member_deltas[sg_id] = {}
+            for ip in sorted(ips):
+                ethertype = 'IPv%d' % netaddr.IPNetwork(ip).version
+                deltas.setdefault(ethertype, {MEMBER_ADDED: [],
+                                              MEMBER_REMOVED: []})
+                deltas[ethertype][member_change].append(ip)
+        return member_deltas
 
-    def notify_security_groups_member_updated(self, context, port):
-        self.notify_security_groups_member_updated_bulk(context, [port])
+    def _get_security_group_cache(self):
+        """Return the security group cache of the server, or None.
+
+        The cache is created on first use. It is not used when the API or
+        the RPC requests are handled by worker processes, as the changes
+        handled by a process would not invalidate the cache of the others.
+        """
+        cache = getattr(self, '_security_group_cache', None)
+        if cache is None and cfg.CONF.security_group_cache_ttl > 0:
+            if not _is_single_server_process():
+                if not getattr(self, '_security_group_cache_disabled', False):
+                    LOG.warn(_LW("The security group cache is disabled "
+                                 "as the API or RPC requests are handled "
+                                 "by worker processes"))
+                    self._security_group_cache_disabled = True
+                return None
+            cache = SecurityGroupInfoCache(cfg.CONF.security_group_cache_ttl)
+            self._security_group_cache = cache
+            subscribe()
+        return cache
+
+    def get_security_group_cache_stats(self):
+        cache = self._get_security_group_cache()
+        return cache.get_stats() if cache else {}
+
+    def _invalidate_security_group_rules(self, sg_ids):
+        cache = getattr(self, '_security_group_cache', None)
+        if cache and sg_ids:
+            cache.invalidate_rules(sg_ids)
+
+    def _invalidate_security_group_member_ips(self, sg_ids):
+        cache = getattr(self, '_security_group_cache', None)
+        if cache and sg_ids:
+            cache.invalidate_member_ips(sg_ids)
 
     def security_group_info_for_ports(self, context, ports):
         sg_info = {'devices': ports,
@@ -220,7 +444,11 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         # rules still reside in sg_info['devices'] [port_id]
         self._apply_provider_rule(context, sg_info['devices'])
 
-        return self._get_security_group_member_ips(context, sg_info)
+        sg_info = self._get_security_group_member_ips(context, sg_info)
+        if getattr(self, '_security_group_cache', None):
+            LOG.debug("Security group cache stats: %s",
+                      self._security_group_cache.get_stats())
+        return sg_info
 
     def _get_security_group_member_ips(self, context, sg_info):
         ips = self._select_ips_for_remote_group(
@@ -238,6 +466,19 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
         sg_binding_sgid = sg_db.SecurityGroupPortBinding.security_group_id
 
+        cache = self._get_security_group_cache()
+        if cache:
+            query = context.session.query(sg_binding_port, sg_binding_sgid)
+            query = query.filter(sg_binding_port.in_(ports.keys()))
+            bindings = query.all()
+            rules = cache.get_rules(
+                set(sg_id for port_id, sg_id in bindings),
+                functools.partial(self._query_rules_for_security_groups,
+                                  context))
+            return [(port_id, rule)
+                    for port_id, sg_id in bindings
+                    for rule in rules[sg_id]]
+
         sgr_sgid = sg_db.SecurityGroupRule.security_group_id
 
         query = context.session.query(sg_binding_port,
@@ -247,10 +488,27 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         query = query.filter(sg_binding_port.in_(ports.keys()))
         return query.all()
 
+    def _query_rules_for_security_groups(self, context, sg_ids):
+        rules_by_group = dict((sg_id, []) for sg_id in sg_ids)
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(
+            sg_db.SecurityGroupRule.security_group_id.in_(sg_ids))
+        for rule in query:
+            rules_by_group[rule.security_group_id].append(
+                dict((field, rule[field]) for field in SG_RULE_FIELDS))
+        return rules_by_group
+
     def _select_ips_for_remote_group(self, context, remote_group_ids):
-        ips_by_group = {}
         if not remote_group_ids:
-            return ips_by_group
+            return {}
+        load = functools.partial(self._query_ips_for_remote_group, context)
+        cache = self._get_security_group_cache()
+        if cache:
+            return cache.get_member_ips(remote_group_ids, load)
+        return load(remote_group_ids)
+
+    def _query_ips_for_remote_group(self, context, remote_group_ids):
+        ips_by_group = {}
         for remote_group_id in remote_group_ids:
             ips_by_group[remote_group_id] = set()
 
@@ -458,3 +716,44 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
             port['security_group_rules'].append(rule_dict)
         self._apply_provider_rule(context, ports)
         return self._convert_remote_group_id_to_ip_prefix(context, ports)
+
+
+def _is_single_server_process():
+    """Whether the API and RPC requests are all handled by this process."""
+    try:
+        return cfg.CONF.api_workers < 1 and cfg.CONF.rpc_workers < 1
+    except cfg.NoSuchOptError:
+        # The options of the server are not registered, e.g. in tests
+        return True
+
+
+def _invalidate_security_group_callback(resource, event, trigger, **kwargs):
+    cache = getattr(trigger, '_security_group_cache', None)
+    if not cache:
+        return
+    if event == events.AFTER_CREATE:
+        sg_id = kwargs['security_group']['id']
+    else:
+        sg_id = kwargs['security_group_id']
+    cache.invalidate_rules([sg_id])
+    cache.invalidate_member_ips([sg_id])
+
+
+def _invalidate_security_group_rule_callback(resource, event, trigger,
+                                             **kwargs):
+    cache = getattr(trigger, '_security_group_cache', None)
+    if not cache:
+        return
+    if event == events.AFTER_CREATE:
+        cache.invalidate_rules(
+            [kwargs['security_group_rule']['security_group_id']])
+    else:
+        cache.invalidate_rule(kwargs['security_group_rule_id'])
+
+
+def subscribe():
+    for event in (events.AFTER_CREATE, events.AFTER_DELETE):
+        registry.subscribe(_invalidate_security_group_callback,
+                           resources.SECURITY_GROUP, event)
+        registry.subscribe(_invalidate_security_group_rule_callback,
+                           resources.SECURITY_GROUP_RULE, event)
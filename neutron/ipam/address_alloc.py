@@ -0,0 +1,218 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import bisect
+import random
+import sys
+
+import netaddr
+from oslo_db import exception as db_exc
+from oslo_log import log as logging
+from six import moves
+
+from neutron.common import exceptions as n_exc
+from neutron.db import models_v2
+import neutron.ipam as ipam
+from neutron.ipam import driver
+
+LOG = logging.getLogger(__name__)
+
+# The number of times addresses are picked at random in the allocation
+# pools, before the free ranges are loaded when they are all allocated
+RANDOM_ATTEMPTS = 3
+# The number of times the free ranges are loaded again, after addresses
+# picked in them were allocated concurrently
+MAX_ATTEMPTS = 5
+
+
+class RandomAddressAllocator(driver.Subnet):
+    """Allocates the IP addresses of a subnet at random among the free ones.
+
+    No row is locked: an address is allocated by inserting its IPAllocation,
+    without port, in a savepoint. When the address is already allocated,
+    the insertion fails on the primary key and another address is picked.
+    The plugin then sets the port of the allocation, in the same
+    transaction.
+
+    Addresses are first picked at random in the allocation pools, without
+    reading the allocations of the subnet. Only when they keep being
+    allocated already, i.e. when the pools are mostly allocated, are the
+    free ranges of the pools loaded to pick among the free addresses.
+    """
+
+    def __init__(self, session, subnet):
+        """Initialize the allocator
+
+        :param session: The session of the transaction allocating.
+        :param subnet: The subnet, with its id, network_id and cidr.
+        """
+        self._session = session
+        self._subnet = subnet
+        self._version = netaddr.IPNetwork(subnet['cidr']).version
+
+    def _get_pools(self):
+        query = self._session.query(models_v2.IPAllocationPool.first_ip,
+                                    models_v2.IPAllocationPool.last_ip)
+        return sorted((int(netaddr.IPAddress(first_ip)),
+                       int(netaddr.IPAddress(last_ip)))
+                      for first_ip, last_ip in query.filter_by(
+                          subnet_id=self._subnet['id']))
+
+    def _get_allocated(self):
+        query = self._session.query(models_v2.IPAllocation.ip_address)
+        return sorted(int(netaddr.IPAddress(ip_address))
+                      for ip_address, in query.filter_by(
+                          subnet_id=self._subnet['id']))
+
+    def get_free_ranges(self, pools=None):
+        """Returns the free addresses, as sorted (first, last) int ranges.
+
+        :param pools: The allocation pools of the subnet, as sorted
+               (first, last) int ranges, read from the database if None.
+        """
+        allocated = self._get_allocated()
+        ranges = []
+        for first, last in pools or self._get_pools():
+            start = bisect.bisect_left(allocated, first)
+            end = bisect.bisect_right(allocated, last)
+            for address in allocated[start:end]:
+                if first < address:
+                    ranges.append((first, address - 1))
+                first = address + 1
+            if first <= last:
+                ranges.append((first, last))
+        return ranges
+
+    def _pick(self, ranges, count):
+        """Returns count distinct addresses picked at random in the ranges."""
+        bounds = []
+        total = 0
+        for first, last in ranges:
+            total += last - first + 1
+            bounds.append(total)
+        if total < count:
+            raise n_exc.IpAddressGenerationFailure(
+                net_id=self._subnet['network_id'])
+
+        if total <= sys.maxsize:
+            offsets = random.sample(moves.range(total), count)
+        else:
+            # An IPv6 subnet too large for random.sample, where drawing the
+            # same offset twice is unlikely
+            offsets = set()
+            while len(offsets) < count:
+                offsets.add(random.randrange(total))
+
+        addresses = []
+        for offset in offsets:
+            index = bisect.bisect_right(bounds, offset)
+            start = bounds[index - 1] if index else 0
+            addresses.append(netaddr.IPAddress(
+                ranges[index][0] + offset - start, self._version))
+        return addresses
+
+    def _reserve(self, address):
+        """Inserts the allocation of the address, False if it exists."""
+        try:
+            with self._session.begin_nested():
+                self._session.execute(
+                    models_v2.IPAllocation.__table__.insert(),
+                    {'ip_address': str(address),
+                     'subnet_id': self._subnet['id'],
+                     'network_id': self._subnet['network_id']})
+        except db_exc.DBDuplicateEntry:
+            LOG.debug("IP %(ip_address)s of subnet %(subnet_id)s allocated "
+                      "concurrently",
+                      {'ip_address': address,
+                       'subnet_id': self._subnet['id']})
+            return False
+        return True
+
+    def _reserve_all(self, addresses):
+        """Inserts the allocations of the addresses, in one statement.
+
+        Returns the addresses reserved: when one of them was allocated
+        concurrently, they are reserved one by one instead.
+        """
+        try:
+            with self._session.begin_nested():
+                self._session.execute(
+                    models_v2.IPAllocation.__table__.insert(),
+                    [{'ip_address': str(address),
+                      'subnet_id': self._subnet['id'],
+                      'network_id': self._subnet['network_id']}
+                     for address in addresses])
+            return addresses
+        except db_exc.DBDuplicateEntry:
+            return [address for address in addresses
+                    if self._reserve(address)]
+
+    def allocate(self, address_request):
+        if isinstance(address_request, ipam.SpecificAddressRequest):
+            address = address_request.address
+            with self._session.begin(subtransactions=True):
+                reserved = self._reserve(address)
+            if not reserved:
+                raise n_exc.IpAddressInUse(net_id=self._subnet['network_id'],
+                                           ip_address=str(address))
+            return address
+        return self.bulk_allocate(1)[0]
+
+    def _bulk_allocate(self, count):
+        allocated = []
+        pools = self._get_pools()
+        for attempt in moves.range(RANDOM_ATTEMPTS):
+            allocated.extend(self._reserve_all(
+                self._pick(pools, count - len(allocated))))
+            if len(allocated) == count:
+                return allocated
+        LOG.debug("Addresses picked in the pools of subnet %s already "
+                  "allocated, picking among the free ones",
+                  self._subnet['id'])
+        for attempt in moves.range(MAX_ATTEMPTS):
+            ranges = self.get_free_ranges(pools)
+            allocated.extend(self._reserve_all(
+                self._pick(ranges, count - len(allocated))))
+            if len(allocated) == count:
+                return allocated
+        raise n_exc.IpAddressGenerationFailure(
+            net_id=self._subnet['network_id'])
+
+    def bulk_allocate(self, count):
+        with self._session.begin(subtransactions=True):
+            # The reservations of a failed allocation are rolled back to a
+            # savepoint: raising in the transaction of the caller would roll
+            # it back, and the caller may go on with another subnet.
+            try:
+                with self._session.begin_nested():
+                    return self._bulk_allocate(count)
+            except n_exc.IpAddressGenerationFailure:
+                pass
+        raise n_exc.IpAddressGenerationFailure(
+            net_id=self._subnet['network_id'])
+
+    def deallocate(self, address):
+        query = self._session.query(models_v2.IPAllocation)
+        deleted = query.filter_by(subnet_id=self._subnet['id'],
+                                  ip_address=str(address)).delete()
+        if not deleted:
+            raise n_exc.NotFound()
+
+    def get_details(self):
+        pools = [netaddr.IPRange(netaddr.IPAddress(first, self._version),
+                                 netaddr.IPAddress(last, self._version))
+                 for first, last in self._get_pools()]
+        return ipam.SpecificSubnetRequest(self._subnet.get('tenant_id'),
+                                          self._subnet['id'],
+                                          self._subnet['cidr'],
+                                          self._subnet.get('gateway_ip'),
+                                          pools)
@@ -14,6 +14,8 @@ import abc
 
 import six
 
+import neutron.ipam as ipam
+
 
 @six.add_metaclass(abc.ABCMeta)
 class Pool(object):
@@ -105,6 +107,20 @@ class Subnet(object):
             AddressOutsideSubnet
         """
 
+    def bulk_allocate(self, count):
+        """Allocates a number of IP addresses at once
+
+        Drivers able to allocate many addresses more efficiently than one
+        at a time override this.
+
+        :param count: The number of addresses to allocate.
+        :type count: int
+        :returns: A list of netaddr.IPAddress
+        :raises: AddressNotAvailable
+        """
+        return [self.allocate(ipam.AnyAddressRequest())
+                for i in range(count)]
+
     @abc.abstractmethod
     def deallocate(self, address):
         """Returns a previously allocated address to the pool
@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 from oslo_db import exception as db_exc
 from oslo_log import log
 from sqlalchemy import or_
@@ -76,6 +78,26 @@ def get_network_segments(session, network_id, filter_dynamic=False):
         return [_make_segment_dict(record) for record in records]
 
 
+def get_networks_segments(session, network_ids, filter_dynamic=False):
+    """Return the segments of the networks, by network id."""
+    network_ids = list(network_ids)
+    segments = dict((network_id, []) for network_id in network_ids)
+    if not network_ids:
+        return segments
+    with session.begin(subtransactions=True):
+        for i in range(0, len(network_ids), MAX_PORTS_PER_QUERY):
+            query = (session.query(models.NetworkSegment).
+                     filter(models.NetworkSegment.network_id.in_(
+                         network_ids[i:i + MAX_PORTS_PER_QUERY])).
+                     order_by(models.NetworkSegment.segment_index))
+            if filter_dynamic is not None:
+                query = query.filter_by(is_dynamic=filter_dynamic)
+            for record in query:
+                segments[record.network_id].append(
+                    _make_segment_dict(record))
+    return segments
+
+
 def get_segment_by_id(session, segment_id):
     with session.begin(subtransactions=True):
         try:
@@ -178,6 +200,20 @@ def get_binding_levels(session, port_id, host):
         return result
 
 
+def get_ports_binding_levels(session, port_ids):
+    """Return the binding levels of the ports, by (port id, host)."""
+    port_ids = list(port_ids)
+    levels = collections.defaultdict(list)
+    for i in range(0, len(port_ids), MAX_PORTS_PER_QUERY):
+        query = (session.query(models.PortBindingLevel).
+                 filter(models.PortBindingLevel.port_id.in_(
+                     port_ids[i:i + MAX_PORTS_PER_QUERY])).
+                 order_by(models.PortBindingLevel.level))
+        for level in query:
+            levels[level.port_id, level.host].append(level)
+    return levels
+
+
 def clear_binding_levels(session, port_id, host):
     if host:
         (session.query(models.PortBindingLevel).
@@ -251,6 +287,31 @@ def get_port_from_device_mac(device_mac):
     return qry.first()
 
 
+def get_ports_by_id_prefixes(session, port_ids):
+    """Get the ports whose id starts with one of port_ids."""
+    port_ids = list(port_ids)
+    ports = []
+    with session.begin(subtransactions=True):
+        for i in range(0, len(port_ids), MAX_PORTS_PER_QUERY):
+            ports.extend(session.query(models_v2.Port).filter(
+                _port_id_prefixes_criteria(
+                    port_ids[i:i + MAX_PORTS_PER_QUERY])))
+    return ports
+
+
+def _port_id_prefixes_criteria(port_ids):
+    # partial UUIDs must be individually matched with startswith.
+    # full UUIDs may be matched directly in an IN statement
+    partial_uuids = set(port_id for port_id in port_ids
+                        if not uuidutils.is_uuid_like(port_id))
+    full_uuids = set(port_ids) - partial_uuids
+    or_criteria = [models_v2.Port.id.startswith(port_id)
+                   for port_id in partial_uuids]
+    if full_uuids:
+        or_criteria.append(models_v2.Port.id.in_(full_uuids))
+    return or_(*or_criteria)
+
+
 def get_ports_and_sgs(port_ids):
     """Get ports from database with security group info."""
 
@@ -278,21 +339,11 @@ def get_sg_ids_grouped_by_port(port_ids):
     sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
 
     with session.begin(subtransactions=True):
-        # partial UUIDs must be individually matched with startswith.
-        # full UUIDs may be matched directly in an IN statement
-        partial_uuids = set(port_id for port_id in port_ids
-                            if not uuidutils.is_uuid_like(port_id))
-        full_uuids = set(port_ids) - partial_uuids
-        or_criteria = [models_v2.Port.id.startswith(port_id)
-                       for port_id in partial_uuids]
-        if full_uuids:
-            or_criteria.append(models_v2.Port.id.in_(full_uuids))
-
         query = session.query(models_v2.Port,
                               sg_db.SecurityGroupPortBinding.security_group_id)
         query = query.outerjoin(sg_db.SecurityGroupPortBinding,
                                 models_v2.Port.id == sg_binding_port)
-        query = query.filter(or_(*or_criteria))
+        query = query.filter(_port_id_prefixes_criteria(port_ids))
 
         for port, sg_id in query:
             if port not in sg_ids_grouped_by_port:
@@ -712,6 +712,36 @@ class MechanismDriver(object):
         """
         pass
 
+    def create_port_bulk_precommit(self, contexts):
+        """Allocate resources for new ports created in bulk.
+
+        :param contexts: list of PortContext instances describing the
+        ports.
+
+        Called inside transaction context on session, once for all the
+        ports of a bulk create. Call cannot block. Raising an exception
+        will result in a rollback of the current transaction. By
+        default, create_port_precommit is called for each port; drivers
+        able to handle the ports together can override this method.
+        """
+        for context in contexts:
+            self.create_port_precommit(context)
+
+    def create_port_bulk_postcommit(self, contexts):
+        """Create ports created in bulk.
+
+        :param contexts: list of PortContext instances describing the
+        ports.
+
+        Called after the transaction completes, once for all the ports
+        of a bulk create. Raising an exception will result in the
+        deletion of all the ports. By default, create_port_postcommit is
+        called for each port; drivers able to handle the ports together,
+        in a single call to their backend, can override this method.
+        """
+        for context in contexts:
+            self.create_port_postcommit(context)
+
     def update_port_precommit(self, context):
         """Update resources of a port.
 
@@ -747,6 +777,22 @@ class MechanismDriver(object):
         """
         pass
 
+    def update_ports_postcommit(self, contexts):
+        """Update several ports.
+
+        :param contexts: list of PortContext instances describing the
+        new state of the ports, as well as their original state prior
+        to the update.
+
+        Called after a transaction updating several ports at once, the
+        status of the ports reported by an agent, completes. The
+        default implementation calls update_port_postcommit for each
+        port, mechanism drivers may override it to coalesce the work
+        done for the ports, e.g. their notifications.
+        """
+        for context in contexts:
+            self.update_port_postcommit(context)
+
     def delete_port_precommit(self, context):
         """Delete resources of a port.
 
@@ -38,12 +38,14 @@ class MechanismDriverContext(object):
 class NetworkContext(MechanismDriverContext, api.NetworkContext):
 
     def __init__(self, plugin, plugin_context, network,
-                 original_network=None):
+                 original_network=None, network_segments=None):
         super(NetworkContext, self).__init__(plugin, plugin_context)
         self._network = network
         self._original_network = original_network
-        self._segments = db.get_network_segments(plugin_context.session,
-                                                 network['id'])
+        if network_segments is None:
+            network_segments = db.get_network_segments(
+                plugin_context.session, network['id'])
+        self._segments = network_segments
 
     @property
     def current(self):
@@ -77,12 +79,13 @@ class SubnetContext(MechanismDriverContext, api.SubnetContext):
 class PortContext(MechanismDriverContext, api.PortContext):
 
     def __init__(self, plugin, plugin_context, port, network, binding,
-                 binding_levels, original_port=None):
+                 binding_levels, original_port=None, network_segments=None):
         super(PortContext, self).__init__(plugin, plugin_context)
         self._port = port
         self._original_port = original_port
-        self._network_context = NetworkContext(plugin, plugin_context,
-                                               network)
+        self._network_context = NetworkContext(
+            plugin, plugin_context, network,
+            network_segments=network_segments)
         self._binding = binding
         self._binding_levels = binding_levels
         self._segments_to_bind = None
@@ -178,6 +181,11 @@ class PortContext(MechanismDriverContext, api.PortContext):
                 self._original_binding_levels[-1].segment_id)
 
     def _expand_segment(self, segment_id):
+        # The segments of the network are already loaded, the database is
+        # only queried for a segment added since.
+        for segment in self._network_context.network_segments:
+            if segment[api.ID] == segment_id:
+                return segment
         segment = db.get_segment_by_id(self._plugin_context.session,
                                        segment_id)
         if not segment:
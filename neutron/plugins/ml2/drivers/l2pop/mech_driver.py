@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+
 from oslo_config import cfg
 from oslo_log import log as logging
 
@@ -65,7 +67,7 @@ class L2populationMechanismDriver(api.MechanismDriver,
         if orig_chg_ips or port_chg_ips:
             return orig_chg_ips, port_chg_ips
 
-    def _fixed_ips_changed(self, context, orig, port, diff_ips):
+    def _fixed_ips_changed(self, context, orig, port, diff_ips, notifier):
         orig_ips, port_ips = diff_ips
 
         if (port['device_owner'] == const.DEVICE_OWNER_DVR_INTERFACE):
@@ -94,12 +96,29 @@ class L2populationMechanismDriver(api.MechanismDriver,
         if port_mac_ip:
             ports['after'] = port_mac_ip
 
-        self.L2populationAgentNotify.update_fdb_entries(
-            self.rpc_ctx, {'chg_ip': upd_fdb_entries})
+        notifier.update_fdb_entries(self.rpc_ctx, {'chg_ip': upd_fdb_entries})
 
         return True
 
     def update_port_postcommit(self, context):
+        self._update_port_postcommit(context, self.L2populationAgentNotify)
+
+    def update_ports_postcommit(self, contexts):
+        notifier = l2pop_rpc.L2populationAgentNotifyBatch(
+            self.L2populationAgentNotify)
+        # The ports are all updated before their postcommit, the active
+        # ports of an agent in a network already include the ones activated
+        # by the batch.
+        activated_ports = collections.Counter(
+            (context.host, context.current['network_id'])
+            for context in contexts
+            if context.status == const.PORT_STATUS_ACTIVE)
+        for context in contexts:
+            self._update_port_postcommit(context, notifier, activated_ports)
+        notifier.notify(self.rpc_ctx)
+
+    def _update_port_postcommit(self, context, notifier,
+                                activated_ports=None):
         port = context.current
         orig = context.original
 
@@ -110,16 +129,15 @@ class L2populationMechanismDriver(api.MechanismDriver,
             raise ml2_exc.MechanismDriverError(method='update_port_postcommit')
         diff_ips = self._get_diff_ips(orig, port)
         if diff_ips:
-            self._fixed_ips_changed(context, orig, port, diff_ips)
+            self._fixed_ips_changed(context, orig, port, diff_ips, notifier)
         if port['device_owner'] == const.DEVICE_OWNER_DVR_INTERFACE:
             if context.status == const.PORT_STATUS_ACTIVE:
-                self._update_port_up(context)
+                self._update_port_up(context, notifier)
             if context.status == const.PORT_STATUS_DOWN:
                 agent_host = context.host
                 fdb_entries = self._update_port_down(
                         context, port, agent_host)
-                self.L2populationAgentNotify.remove_fdb_entries(
-                    self.rpc_ctx, fdb_entries)
+                notifier.remove_fdb_entries(self.rpc_ctx, fdb_entries)
         elif (context.host != context.original_host
             and context.status == const.PORT_STATUS_ACTIVE
             and not self.migrated_ports.get(orig['id'])):
@@ -130,12 +148,11 @@ class L2populationMechanismDriver(api.MechanismDriver,
                 (orig, context.original_host))
         elif context.status != context.original_status:
             if context.status == const.PORT_STATUS_ACTIVE:
-                self._update_port_up(context)
+                self._update_port_up(context, notifier, activated_ports)
             elif context.status == const.PORT_STATUS_DOWN:
                 fdb_entries = self._update_port_down(
                     context, port, context.host)
-                self.L2populationAgentNotify.remove_fdb_entries(
-                    self.rpc_ctx, fdb_entries)
+                notifier.remove_fdb_entries(self.rpc_ctx, fdb_entries)
             elif context.status == const.PORT_STATUS_BUILD:
                 orig = self.migrated_ports.pop(port['id'], None)
                 if orig:
@@ -144,8 +161,7 @@ class L2populationMechanismDriver(api.MechanismDriver,
                     # this port has been migrated: remove its entries from fdb
                     fdb_entries = self._update_port_down(
                         context, original_port, original_host)
-                    self.L2populationAgentNotify.remove_fdb_entries(
-                        self.rpc_ctx, fdb_entries)
+                    notifier.remove_fdb_entries(self.rpc_ctx, fdb_entries)
 
     def _get_port_infos(self, context, port, agent_host):
         if not agent_host:
@@ -216,7 +232,7 @@ class L2populationMechanismDriver(api.MechanismDriver,
 
         return agents
 
-    def _update_port_up(self, context):
+    def _update_port_up(self, context, notifier, activated_ports=None):
         port = context.current
         agent_host = context.host
         port_infos = self._get_port_infos(context, port, agent_host)
@@ -236,7 +252,13 @@ class L2populationMechanismDriver(api.MechanismDriver,
                               'ports': {agent_ip: []}}}
         other_fdb_ports = other_fdb_entries[network_id]['ports']
 
-        if agent_active_ports == 1 or (
+        # The fdb entries of the network are provided along with the first
+        # port activated, or the first ports of a batch.
+        new_active_ports = 1
+        if activated_ports is not None:
+            new_active_ports = activated_ports.pop((agent_host, network_id),
+                                                   0)
+        if agent_active_ports == new_active_ports or (
                 self.get_agent_uptime(agent) < cfg.CONF.l2pop.agent_boot_time):
             # First port activated on current agent in this network,
             # we have to provide it with the whole list of fdb entries
@@ -249,15 +271,14 @@ class L2populationMechanismDriver(api.MechanismDriver,
             other_fdb_ports[agent_ip].append(const.FLOODING_ENTRY)
 
             if agent_fdb_entries[network_id]['ports'].keys():
-                self.L2populationAgentNotify.add_fdb_entries(
+                notifier.add_fdb_entries(
                     self.rpc_ctx, agent_fdb_entries, agent_host)
 
         # Notify other agents to add fdb rule for current port
         if port['device_owner'] != const.DEVICE_OWNER_DVR_INTERFACE:
             other_fdb_ports[agent_ip] += port_fdb_entries
 
-        self.L2populationAgentNotify.add_fdb_entries(self.rpc_ctx,
-                                                     other_fdb_entries)
+        notifier.add_fdb_entries(self.rpc_ctx, other_fdb_entries)
 
     def _update_port_down(self, context, port, agent_host):
         port_infos = self._get_port_infos(context, port, agent_host)
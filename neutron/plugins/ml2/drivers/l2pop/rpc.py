@@ -113,3 +113,60 @@ class L2populationAgentNotifyAPI(object):
                     value['ports'][address] = [[mac, ip]
                                                for mac, ip in port_infos]
         return marshalled
+
+
+class L2populationAgentNotifyBatch(object):
+    """Coalesce the fdb entries notifications of several ports.
+
+    It has the notification methods of L2populationAgentNotifyAPI, but
+    the fdb entries given to them are merged per method and host, and
+    only sent by notify, one message per method and host.
+    """
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+        self._fdb_entries = collections.OrderedDict()
+
+    def _add(self, method, fdb_entries, host):
+        if fdb_entries:
+            _merge_fdb_entries(
+                self._fdb_entries.setdefault((method, host), {}),
+                fdb_entries)
+
+    def add_fdb_entries(self, context, fdb_entries, host=None):
+        self._add('add_fdb_entries', fdb_entries, host)
+
+    def remove_fdb_entries(self, context, fdb_entries, host=None):
+        self._add('remove_fdb_entries', fdb_entries, host)
+
+    def update_fdb_entries(self, context, fdb_entries, host=None):
+        self._add('update_fdb_entries', fdb_entries, host)
+
+    def notify(self, context):
+        for (method, host), fdb_entries in self._fdb_entries.items():
+            getattr(self.notifier, method)(context, fdb_entries, host)
+        self._fdb_entries.clear()
+
+
+def _extend_unique(entries, new_entries):
+    entries.extend(entry for entry in new_entries if entry not in entries)
+
+
+def _merge_fdb_entries(merged, fdb_entries):
+    for key, value in fdb_entries.items():
+        if key == 'chg_ip':
+            merged_chg_ip = merged.setdefault('chg_ip', {})
+            for network_id, agent_ports in value.items():
+                merged_ports = merged_chg_ip.setdefault(network_id, {})
+                for agent_ip, ports in agent_ports.items():
+                    merged_agent_ports = merged_ports.setdefault(agent_ip, {})
+                    for when, port_infos in ports.items():
+                        _extend_unique(
+                            merged_agent_ports.setdefault(when, []),
+                            port_infos)
+        else:
+            merged_network = merged.setdefault(key, dict(value, ports={}))
+            for agent_ip, port_infos in value['ports'].items():
+                _extend_unique(
+                    merged_network['ports'].setdefault(agent_ip, []),
+                    port_infos)
@@ -139,8 +139,18 @@ class TypeManager(stevedore.named.NamedExtensionManager):
         return value
 
     def extend_network_dict_provider(self, context, network):
+        segments = db.get_network_segments(context.session, network['id'])
+        self._extend_network_dict_provider(network, segments)
+
+    def extend_networks_dict_provider(self, context, networks):
+        segments = db.get_networks_segments(
+            context.session, [network['id'] for network in networks])
+        for network in networks:
+            self._extend_network_dict_provider(network,
+                                               segments[network['id']])
+
+    def _extend_network_dict_provider(self, network, segments):
         id = network['id']
-        segments = db.get_network_segments(context.session, id)
         if not segments:
             LOG.error(_LE("Network %s has no segments"), id)
             for attr in provider.ATTRIBUTES:
@@ -536,6 +546,34 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         """
         self._call_on_drivers("create_port_postcommit", context)
 
+    def create_port_bulk_precommit(self, contexts):
+        """Notify all mechanism drivers during bulk port creation.
+
+        :raises: neutron.plugins.ml2.common.MechanismDriverError
+        if any mechanism driver create_port_bulk_precommit call fails.
+
+        Called within the database transaction, with the PortContexts
+        of all the ports. If a mechanism driver raises an exception,
+        then a MechanismDriverError is propogated to the caller,
+        triggering a rollback. There is no guarantee that all mechanism
+        drivers are called in this case.
+        """
+        self._call_on_drivers("create_port_bulk_precommit", contexts)
+
+    def create_port_bulk_postcommit(self, contexts):
+        """Notify all mechanism drivers of bulk port creation.
+
+        :raises: neutron.plugins.ml2.common.MechanismDriverError
+        if any mechanism driver create_port_bulk_postcommit call fails.
+
+        Called after the database transaction, with the PortContexts of
+        all the ports. Errors raised by mechanism drivers are left to
+        propagate to the caller, where the ports will be deleted,
+        triggering any required cleanup. There is no guarantee that all
+        mechanism drivers are called in this case.
+        """
+        self._call_on_drivers("create_port_bulk_postcommit", contexts)
+
     def update_port_precommit(self, context):
         """Notify all mechanism drivers during port update.
 
@@ -563,6 +601,20 @@ class MechanismManager(stevedore.named.NamedExtensionManager):
         self._call_on_drivers("update_port_postcommit", context,
                               continue_on_failure=True)
 
+    def update_ports_postcommit(self, contexts):
+        """Notify all mechanism drivers after updating several ports.
+
+        :raises: neutron.plugins.ml2.common.MechanismDriverError
+        if any mechanism driver update_ports_postcommit call fails.
+
+        Called after the database transaction updating the ports. As
+        with update_port_postcommit, errors are logged and every other
+        mechanism driver is still called before a MechanismDriverError
+        is reraised.
+        """
+        self._call_on_drivers("update_ports_postcommit", contexts,
+                              continue_on_failure=True)
+
     def delete_port_precommit(self, context):
         """Notify all mechanism drivers during port deletion.
 
@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import contextlib
 
 from eventlet import greenthread
@@ -106,11 +107,12 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
     """
 
     # This attribute specifies whether the plugin supports or not
-    # bulk/pagination/sorting operations. Name mangling is used in
-    # order to ensure it is qualified by class
+    # bulk/pagination/sorting/policy filtering operations. Name mangling
+    # is used in order to ensure it is qualified by class
     __native_bulk_support = True
     __native_pagination_support = True
     __native_sorting_support = True
+    __native_policy_filtering_support = True
 
     # List of supported extensions
     _supported_extension_aliases = ["provider", "external-net", "binding",
@@ -667,8 +669,7 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             nets = super(Ml2Plugin,
                          self).get_networks(context, filters, None, sorts,
                                             limit, marker, page_reverse)
-            for net in nets:
-                self.type_manager.extend_network_dict_provider(context, net)
+            self.type_manager.extend_networks_dict_provider(context, nets)
 
             nets = self._filter_nets_provider(context, nets, filters)
             nets = self._filter_nets_l3(context, nets, filters)
@@ -936,6 +937,32 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
         elif attributes.is_attr_set(attrs.get(ext_sg.SECURITYGROUPS)):
             raise psec.PortSecurityAndIPRequiredForSecurityGroups()
 
+    def _process_port_create(self, context, port, result, network):
+        """Process the attributes of a port created in the core tables.
+
+        Returns the PortContext of the port.
+        """
+        attrs = port[attributes.PORT]
+        dhcp_opts = attrs.get(edo_ext.EXTRADHCPOPTS, [])
+        self.extension_manager.process_create_port(context, attrs, result)
+        self._portsec_ext_port_create_processing(context, result, port)
+
+        # sgids must be got after portsec checked with security group
+        sgids = self._get_security_groups_on_port(context, port)
+        self._process_port_create_security_group(context, result, sgids)
+        binding = db.add_port_binding(context.session, result['id'])
+        mech_context = driver_context.PortContext(self, context, result,
+                                                  network, binding, None)
+        self._process_port_binding(mech_context, attrs)
+
+        result[addr_pair.ADDRESS_PAIRS] = (
+            self._process_create_allowed_address_pairs(
+                context, result,
+                attrs.get(addr_pair.ADDRESS_PAIRS)))
+        self._process_port_create_extra_dhcp_opts(context, result,
+                                                  dhcp_opts)
+        return mech_context
+
     def _create_port_db(self, context, port):
         attrs = port[attributes.PORT]
         if not attrs.get('status'):
@@ -943,30 +970,44 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         session = context.session
         with session.begin(subtransactions=True):
-            dhcp_opts = attrs.get(edo_ext.EXTRADHCPOPTS, [])
             result = super(Ml2Plugin, self).create_port(context, port)
-            self.extension_manager.process_create_port(context, attrs, result)
-            self._portsec_ext_port_create_processing(context, result, port)
-
-            # sgids must be got after portsec checked with security group
-            sgids = self._get_security_groups_on_port(context, port)
-            self._process_port_create_security_group(context, result, sgids)
             network = self.get_network(context, result['network_id'])
-            binding = db.add_port_binding(session, result['id'])
-            mech_context = driver_context.PortContext(self, context, result,
-                                                      network, binding, None)
-            self._process_port_binding(mech_context, attrs)
-
-            result[addr_pair.ADDRESS_PAIRS] = (
-                self._process_create_allowed_address_pairs(
-                    context, result,
-                    attrs.get(addr_pair.ADDRESS_PAIRS)))
-            self._process_port_create_extra_dhcp_opts(context, result,
-                                                      dhcp_opts)
+            mech_context = self._process_port_create(context, port, result,
+                                                     network)
             self.mechanism_manager.create_port_precommit(mech_context)
 
         return result, mech_context
 
+    def _create_port_bulk_db(self, context, ports):
+        """Create ports in batch, in one transaction.
+
+        The core attributes of the ports are created together, and the
+        mechanism drivers called once with the contexts of all the ports.
+        """
+        for port in ports:
+            attrs = port[attributes.PORT]
+            if not attrs.get('status'):
+                attrs['status'] = const.PORT_STATUS_DOWN
+
+        objects = []
+        networks = {}
+        with context.session.begin(subtransactions=True):
+            results = super(Ml2Plugin, self)._create_ports_bulk(context,
+                                                                ports)
+            for port, result in zip(ports, results):
+                network_id = result['network_id']
+                if network_id not in networks:
+                    networks[network_id] = self.get_network(context,
+                                                            network_id)
+                mech_context = self._process_port_create(
+                    context, port, result, networks[network_id])
+                objects.append({'mech_context': mech_context,
+                                'result': result,
+                                'attributes': port[attributes.PORT]})
+            self.mechanism_manager.create_port_bulk_precommit(
+                [obj['mech_context'] for obj in objects])
+        return objects
+
     def create_port(self, context, port):
         attrs = port[attributes.PORT]
         result, mech_context = self._create_port_db(context, port)
@@ -985,7 +1026,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         # REVISIT(rkukura): Is there any point in calling this before
         # a binding has been successfully established?
-        self.notify_security_groups_member_updated(context, result)
+        self.notify_security_groups_member_updated(
+            context, result, member_change=sg_db_rpc.MEMBER_ADDED)
 
         try:
             bound_context = self._bind_port_if_needed(mech_context)
@@ -996,13 +1038,34 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
                 self.delete_port(context, result['id'])
         return bound_context._port
 
+    def _create_port_bulk_ml2(self, context, ports):
+        try:
+            objects = self._create_port_bulk_db(context, ports['ports'])
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                LOG.exception(_LE("An exception occurred while creating "
+                                  "the ports in bulk"))
+
+        try:
+            self.mechanism_manager.create_port_bulk_postcommit(
+                [obj['mech_context'] for obj in objects])
+            return objects
+        except ml2_exc.MechanismDriverError:
+            with excutils.save_and_reraise_exception():
+                resource_ids = [res['result']['id'] for res in objects]
+                LOG.exception(_LE("mechanism_manager.create_port_bulk"
+                                  "_postcommit failed. Deleting ports "
+                                  "%s"), ', '.join(resource_ids))
+                self._delete_objects(context, attributes.PORT, objects)
+
     def create_port_bulk(self, context, ports):
-        objects = self._create_bulk_ml2(attributes.PORT, context, ports)
+        objects = self._create_port_bulk_ml2(context, ports)
 
         # REVISIT(rkukura): Is there any point in calling this before
         # a binding has been successfully established?
         results = [obj['result'] for obj in objects]
-        self.notify_security_groups_member_updated_bulk(context, results)
+        self.notify_security_groups_member_updated_bulk(
+            context, results, member_change=sg_db_rpc.MEMBER_ADDED)
 
         for obj in objects:
             attrs = obj['attributes']
@@ -1293,7 +1356,8 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             LOG.error(_LE("mechanism_manager.delete_port_postcommit failed for"
                           " port %s"), port['id'])
         self.notifier.port_delete(context, port['id'])
-        self.notify_security_groups_member_updated(context, port)
+        self.notify_security_groups_member_updated(
+            context, port, member_change=sg_db_rpc.MEMBER_REMOVED)
 
     def get_bound_port_context(self, plugin_context, port_id, host=None,
                                cached_networks=None):
@@ -1346,6 +1410,84 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         return self._bind_port_if_needed(port_context)
 
+    def get_bound_ports_contexts(self, plugin_context, port_ids, host=None):
+        """Return the bound PortContext of each port, or None if not found.
+
+        Bulk version of get_bound_port_context: the ports, their bindings,
+        networks and segments are loaded with a few queries for all the
+        ports.  port_ids may be id prefixes, as in get_bound_port_context.
+        """
+        port_ids = list(port_ids)
+        contexts = dict.fromkeys(port_ids)
+        session = plugin_context.session
+        with session.begin(subtransactions=True):
+            port_dbs = self._get_ports_by_id_prefixes(session, port_ids)
+            networks, segments, levels = self._get_ports_networks_and_levels(
+                plugin_context, port_dbs.values())
+            for port_id, port_db in port_dbs.items():
+                port = self._make_port_dict(port_db)
+                if port['device_owner'] == const.DEVICE_OWNER_DVR_INTERFACE:
+                    binding = db.get_dvr_port_binding_by_host(
+                        session, port['id'], host)
+                    if not binding:
+                        LOG.error(_LE("Binding info for DVR port %s not "
+                                      "found"), port_id)
+                        continue
+                    binding_host = host
+                else:
+                    binding = port_db.port_binding
+                    if not binding:
+                        LOG.info(_LI("Binding info for port %s was not "
+                                     "found, it might have been deleted "
+                                     "already."), port_id)
+                        continue
+                    binding_host = binding.host
+                contexts[port_id] = driver_context.PortContext(
+                    self, plugin_context, port,
+                    networks[port['network_id']], binding,
+                    levels.get((port_db.id, binding_host)) if binding_host
+                    else None,
+                    network_segments=segments[port['network_id']])
+
+        return dict((port_id, context and self._bind_port_if_needed(context))
+                    for port_id, context in contexts.items())
+
+    def _get_ports_by_id_prefixes(self, session, port_ids):
+        """Return the ports of the port id prefixes, by prefix.
+
+        Prefixes matching no port or several ones are left out.
+        """
+        port_dbs = collections.defaultdict(list)
+        prefix_lens = set(len(port_id) for port_id in port_ids)
+        for port_db in db.get_ports_by_id_prefixes(session, port_ids):
+            for prefix_len in prefix_lens:
+                port_dbs[port_db.id[:prefix_len]].append(port_db)
+        result = {}
+        for port_id in port_ids:
+            if not port_dbs.get(port_id):
+                LOG.debug("No ports have port_id starting with %s", port_id)
+            elif len(port_dbs[port_id]) > 1:
+                LOG.error(_LE("Multiple ports have port_id starting with %s"),
+                          port_id)
+            else:
+                result[port_id] = port_dbs[port_id][0]
+        return result
+
+    def _get_ports_networks_and_levels(self, context, port_dbs):
+        """Load the networks, segments and binding levels of the ports.
+
+        Returns the network dicts and the segments by network id, and the
+        binding levels by (port id, host).
+        """
+        network_ids = set(port_db.network_id for port_db in port_dbs)
+        networks = dict(
+            (network['id'], network) for network in self.get_networks(
+                context, filters={'id': list(network_ids)}))
+        segments = db.get_networks_segments(context.session, network_ids)
+        levels = db.get_ports_binding_levels(
+            context.session, [port_db.id for port_db in port_dbs])
+        return networks, segments, levels
+
     def update_port_status(self, context, port_id, status, host=None):
         """
         Returns port_id (non-truncated uuid) if the port exists.
@@ -1415,6 +1557,62 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
 
         return port['id']
 
+    def update_ports_status(self, context, port_ids, status, host=None):
+        """Bulk version of update_port_status.
+
+        The status of the ports is updated in a single transaction, and
+        the mechanism drivers are then notified of all the updated ports
+        at once through update_ports_postcommit. The status of DVR ports,
+        which is kept per host, is still updated port by port.
+
+        Returns a dict of the port ids (non-truncated uuids) by port id,
+        None for the ports not found.
+        """
+        port_ids = list(port_ids)
+        result = dict.fromkeys(port_ids)
+        dvr_port_ids = []
+        mech_contexts = []
+        session = context.session
+        with contextlib.nested(lockutils.lock('db-access'),
+                               session.begin(subtransactions=True)):
+            port_dbs = self._get_ports_by_id_prefixes(session, port_ids)
+            updated_port_dbs = []
+            for port_id in port_ids:
+                port_db = port_dbs.get(port_id)
+                if not port_db:
+                    LOG.warning(_LW("Port %(port)s updated up by agent not "
+                                    "found"), {'port': port_id})
+                    continue
+                if port_db.device_owner == const.DEVICE_OWNER_DVR_INTERFACE:
+                    dvr_port_ids.append(port_id)
+                    continue
+                result[port_id] = port_db.id
+                if port_db.status != status:
+                    updated_port_dbs.append(port_db)
+            networks, segments, levels = self._get_ports_networks_and_levels(
+                context, updated_port_dbs)
+            for port_db in updated_port_dbs:
+                original_port = self._make_port_dict(port_db)
+                port_db.status = status
+                updated_port = self._make_port_dict(port_db)
+                network_id = updated_port['network_id']
+                mech_context = driver_context.PortContext(
+                    self, context, updated_port, networks[network_id],
+                    port_db.port_binding,
+                    levels.get((port_db.id, port_db.port_binding.host)),
+                    original_port=original_port,
+                    network_segments=segments[network_id])
+                self.mechanism_manager.update_port_precommit(mech_context)
+                mech_contexts.append(mech_context)
+
+        if mech_contexts:
+            self.mechanism_manager.update_ports_postcommit(mech_contexts)
+
+        for port_id in dvr_port_ids:
+            result[port_id] = self.update_port_status(context, port_id,
+                                                      status, host)
+        return result
+
     def port_bound_to_host(self, context, port_id, host):
         port = db.get_port(context.session, port_id)
         if not port:
@@ -1431,6 +1629,21 @@ class Ml2Plugin(db_base_plugin_v2.NeutronDbPluginV2,
             port_host = db.get_port_binding_host(context.session, port_id)
             return (port_host == host)
 
+    def ports_bound_to_host(self, context, port_ids, host):
+        """Bulk version of port_bound_to_host.
+
+        Returns the set of the port ids bound to host.
+        """
+        bound = set()
+        port_dbs = self._get_ports_by_id_prefixes(context.session, port_ids)
+        for port_id, port_db in port_dbs.items():
+            if port_db.device_owner == const.DEVICE_OWNER_DVR_INTERFACE:
+                if self.port_bound_to_host(context, port_db.id, host):
+                    bound.add(port_id)
+            elif port_db.port_binding and port_db.port_binding.host == host:
+                bound.add(port_id)
+        return bound
+
     def get_ports_from_devices(self, devices):
         port_ids_to_devices = dict((self._device_to_port_id(device), device)
                                    for device in devices)
@@ -48,7 +48,8 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
     #       return value to include fixed_ips and device_owner for
     #       the device port
     #   1.4 tunnel_sync rpc signature upgrade to obtain 'host'
-    target = oslo_messaging.Target(version='1.4')
+    #   1.5 Support update_devices_up and update_devices_down
+    target = oslo_messaging.Target(version='1.5')
 
     def __init__(self, notifier, type_manager):
         self.setup_tunnel_callback_mixin(notifier, type_manager)
@@ -72,6 +73,16 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
                                                      port_id,
                                                      host,
                                                      cached_networks)
+        # caching information about networks for future use
+        if port_context and cached_networks is not None:
+            network_id = port_context.current['network_id']
+            if network_id not in cached_networks:
+                cached_networks[network_id] = port_context.network.current
+        return self._get_device_details(rpc_context, agent_id, host, device,
+                                        port_id, port_context)
+
+    def _get_device_details(self, rpc_context, agent_id, host, device,
+                            port_id, port_context):
         if not port_context:
             LOG.warning(_LW("Device %(device)s requested by agent "
                             "%(agent_id)s not found in database"),
@@ -80,11 +91,6 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
 
         segment = port_context.bottom_bound_segment
         port = port_context.current
-        # caching information about networks for future use
-        if cached_networks is not None:
-            if port['network_id'] not in cached_networks:
-                cached_networks[port['network_id']] = (
-                    port_context.network.current)
 
         if not segment:
             LOG.warning(_LW("Device %(device)s requested by agent "
@@ -100,6 +106,7 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
             new_status = (q_const.PORT_STATUS_BUILD if port['admin_state_up']
                           else q_const.PORT_STATUS_DOWN)
             if port['status'] != new_status:
+                plugin = manager.NeutronManager.get_plugin()
                 plugin.update_port_status(rpc_context,
                                           port_id,
                                           new_status,
@@ -122,17 +129,28 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
         return entry
 
     def get_devices_details_list(self, rpc_context, **kwargs):
-        # cached networks used for reducing number of network db calls
-        cached_networks = {}
-        return [
-            self.get_device_details(
-                rpc_context,
-                device=device,
-                cached_networks=cached_networks,
-                **kwargs
-            )
-            for device in kwargs.pop('devices', [])
-        ]
+        """Agent requests the details of several devices.
+
+        The ports of all the devices are loaded at once, see
+        get_bound_ports_contexts of the plugin.
+        """
+        agent_id = kwargs.get('agent_id')
+        host = kwargs.get('host')
+        devices = kwargs.get('devices', [])
+        LOG.debug("Details of %(count)d devices requested by agent "
+                  "%(agent_id)s with host %(host)s",
+                  {'count': len(devices), 'agent_id': agent_id,
+                   'host': host})
+        if not devices:
+            return []
+
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = [plugin._device_to_port_id(device) for device in devices]
+        port_contexts = plugin.get_bound_ports_contexts(rpc_context,
+                                                        port_ids, host)
+        return [self._get_device_details(rpc_context, agent_id, host, device,
+                                         port_id, port_contexts[port_id])
+                for device, port_id in zip(devices, port_ids)]
 
     def update_device_down(self, rpc_context, **kwargs):
         """Device no longer exists on agent."""
@@ -200,6 +218,84 @@ class RpcCallbacks(type_tunnel.TunnelRpcCallbackMixin):
             registry.notify(
                 resources.PORT, events.AFTER_UPDATE, plugin, **kwargs)
 
+    def _get_bound_ports(self, rpc_context, devices, host):
+        """Return the port ids of the devices and the ones bound to host."""
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids = [plugin._device_to_port_id(device) for device in devices]
+        if host:
+            bound = plugin.ports_bound_to_host(rpc_context, port_ids, host)
+            for device, port_id in zip(devices, port_ids):
+                if port_id not in bound:
+                    LOG.debug("Device %(device)s not bound to the"
+                              " agent host %(host)s",
+                              {'device': device, 'host': host})
+        else:
+            bound = set(port_ids)
+        return port_ids, bound
+
+    def update_devices_down(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent.
+
+        Bulk version of update_device_down, the status of the ports is
+        updated in a single transaction.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug("Devices %(devices)s no longer exist at agent "
+                  "%(agent_id)s",
+                  {'devices': devices, 'agent_id': agent_id})
+        if not devices:
+            return []
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids, bound = self._get_bound_ports(rpc_context, devices, host)
+        try:
+            updated = plugin.update_ports_status(
+                rpc_context, [port_id for port_id in port_ids
+                              if port_id in bound],
+                q_const.PORT_STATUS_DOWN, host)
+        except exc.StaleDataError:
+            LOG.debug("delete_port and update_devices_down are being "
+                      "executed concurrently. Updating the devices one by "
+                      "one.")
+            return [self.update_device_down(rpc_context, device=device,
+                                            agent_id=agent_id, host=host)
+                    for device in devices]
+        return [{'device': device,
+                 'exists': port_id not in bound or bool(updated[port_id])}
+                for device, port_id in zip(devices, port_ids)]
+
+    def update_devices_up(self, rpc_context, **kwargs):
+        """Devices are up on agent.
+
+        Bulk version of update_device_up, the status of the ports is
+        updated in a single transaction.
+        """
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        host = kwargs.get('host')
+        LOG.debug("Devices %(devices)s up at agent %(agent_id)s",
+                  {'devices': devices, 'agent_id': agent_id})
+        if not devices:
+            return
+        plugin = manager.NeutronManager.get_plugin()
+        port_ids, bound = self._get_bound_ports(rpc_context, devices, host)
+        updated = plugin.update_ports_status(
+            rpc_context, [port_id for port_id in port_ids if port_id in bound],
+            q_const.PORT_STATUS_ACTIVE, host)
+        port_ids = [port_id for port_id in updated.values() if port_id]
+        if not port_ids:
+            return
+        # NOTE(armax): it's best to remove all objects from the
+        # session, before we try to retrieve the new port objects
+        rpc_context.session.expunge_all()
+        ports = plugin._get_ports_query(rpc_context,
+                                        filters={'id': port_ids})
+        for port in ports:
+            registry.notify(resources.PORT, events.AFTER_UPDATE, plugin,
+                            context=rpc_context, port=port,
+                            update_device_up=True)
+
 
 class AgentNotifierApi(dvr_rpc.DVRAgentRpcApiMixin,
                        sg_rpc.SecurityGroupAgentRpcApiMixin,
@@ -15,6 +15,7 @@
 #    under the License.
 
 import hashlib
+import itertools
 import signal
 import sys
 import time
@@ -31,6 +32,7 @@ from neutron.agent.common import polling
 from neutron.agent.common import utils
 from neutron.agent import l2population_rpc
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import utils as linux_utils
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
 from neutron.api.rpc.handlers import dvr_rpc
@@ -59,6 +61,10 @@ class DeviceListRetrievalError(exceptions.NeutronException):
                 "because of error: %(error)s")
 
 
+class FlowsApplyError(exceptions.NeutronException):
+    message = _("Unable to apply the deferred flows of bridges: %(bridges)s")
+
+
 # A class to represent a VIF (i.e., a port that has 'iface-id' and 'vif-mac'
 # attributes set).
 class LocalVLANMapping(object):
@@ -215,6 +221,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         self.polling_interval = polling_interval
         self.minimize_polling = minimize_polling
         self.ovsdb_monitor_respawn_interval = ovsdb_monitor_respawn_interval
+        self.full_scan_interval = cfg.CONF.AGENT.full_scan_interval
+        self.use_flow_bundles = cfg.CONF.OVS.use_flow_bundles
+        self.flow_stats = {'add': 0, 'mod': 0, 'del': 0, 'elapsed': 0}
         self.local_ip = local_ip
         self.tunnel_count = 0
         self.vxlan_udp_port = cfg.CONF.AGENT.vxlan_udp_port
@@ -275,6 +284,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
             self.int_br_device_count)
         self.agent_state.get('configurations')['in_distributed_mode'] = (
             self.dvr_agent.in_distributed_mode())
+        # Latency of the commands run by the agent
+        self.agent_state.get('configurations')['execute_latency'] = (
+            linux_utils.get_execute_latency_summary())
 
         try:
             self.state_rpc.report_state(self.context,
@@ -1127,6 +1139,48 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         port_info['removed'] = registered_ports - cur_ports
         return port_info
 
+    def process_ports_events(self, events, registered_ports,
+                             updated_ports=None):
+        """Build the port info from the interface events of ovsdb monitor.
+
+        Unlike scan_ports, only the ports of the interfaces the events are
+        about are looked up, so that the cost does not depend on the number
+        of ports on the integration bridge.
+        """
+        port_ids = set()
+        for device in itertools.chain(*events.values()):
+            external_ids = device['external_ids']
+            if 'iface-id' in external_ids:
+                port_ids.add(external_ids['iface-id'])
+            elif 'xs-vif-uuid' in external_ids:
+                # The port id has to be retrieved from XenAPI
+                return self.scan_ports(registered_ports, updated_ports)
+        cur_ports = set(registered_ports)
+        port_info = {'current': cur_ports}
+        added = set()
+        removed = set()
+        if updated_ports is None:
+            updated_ports = set()
+        for port_id in port_ids:
+            # The events may be out of date, rely on the current state
+            if self.int_br.get_vif_port_by_id(port_id):
+                if port_id in registered_ports:
+                    updated_ports.add(port_id)
+                else:
+                    added.add(port_id)
+            elif port_id in registered_ports:
+                removed.add(port_id)
+        cur_ports |= added
+        cur_ports -= removed
+        self.int_br_device_count = len(cur_ports)
+        updated_ports &= cur_ports
+        if updated_ports:
+            port_info['updated'] = updated_ports
+        if added or removed:
+            port_info['added'] = added
+            port_info['removed'] = removed
+        return port_info
+
     def check_changed_vlans(self, registered_ports):
         """Return ports which have lost their vlan tag.
 
@@ -1243,6 +1297,8 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
 
     def treat_devices_added_or_updated(self, devices, ovs_restarted):
         skipped_devices = []
+        devices_up = []
+        devices_down = []
         try:
             devices_details_list = self.plugin_rpc.get_devices_details_list(
                 self.context,
@@ -1277,24 +1333,30 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 if self.prevent_arp_spoofing:
                     self.setup_arp_spoofing_protection(self.int_br,
                                                        port, details)
-                # update plugin about port status
-                # FIXME(salv-orlando): Failures while updating device status
-                # must be handled appropriately. Otherwise this might prevent
-                # neutron server from sending network-vif-* events to the nova
-                # API server, thus possibly preventing instance spawn.
                 if details.get('admin_state_up'):
                     LOG.debug("Setting status for %s to UP", device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_up.append(device)
                 else:
                     LOG.debug("Setting status for %s to DOWN", device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+                    devices_down.append(device)
                 LOG.info(_LI("Configuration for device %s completed."), device)
             else:
                 LOG.warn(_LW("Device %s not defined on plugin"), device)
                 if (port and port.ofport != -1):
                     self.port_dead(port)
+        # The ports must not be reported up before their flows exist
+        self.apply_deferred_flows()
+        # update plugin about port status
+        # FIXME(salv-orlando): Failures while updating device status
+        # must be handled appropriately. Otherwise this might prevent
+        # neutron server from sending network-vif-* events to the nova
+        # API server, thus possibly preventing instance spawn.
+        if devices_up:
+            self.plugin_rpc.update_devices_up(
+                self.context, devices_up, self.agent_id, cfg.CONF.host)
+        if devices_down:
+            self.plugin_rpc.update_devices_down(
+                self.context, devices_down, self.agent_id, cfg.CONF.host)
         return skipped_devices
 
     def treat_ancillary_devices_added(self, devices):
@@ -1307,54 +1369,52 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
         except Exception as e:
             raise DeviceListRetrievalError(devices=devices, error=e)
 
-        for details in devices_details_list:
-            device = details['device']
+        devices = [details['device'] for details in devices_details_list]
+        for device in devices:
             LOG.info(_LI("Ancillary Port %s added"), device)
 
-            # update plugin about port status
-            self.plugin_rpc.update_device_up(self.context,
-                                             device,
-                                             self.agent_id,
-                                             cfg.CONF.host)
+        # update plugin about port status
+        if devices:
+            self.plugin_rpc.update_devices_up(self.context,
+                                              devices,
+                                              self.agent_id,
+                                              cfg.CONF.host)
 
     def treat_devices_removed(self, devices):
-        resync = False
         self.sg_agent.remove_devices_filter(devices)
         for device in devices:
             LOG.info(_LI("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug("port_removed failed for %(device)s: %(e)s",
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            self.plugin_rpc.update_devices_down(self.context,
+                                                list(devices),
+                                                self.agent_id,
+                                                cfg.CONF.host)
+        except Exception as e:
+            LOG.debug("port_removed failed for %(devices)s: %(e)s",
+                      {'devices': devices, 'e': e})
+            return True
+        for device in devices:
             self.port_unbound(device)
-        return resync
+        return False
 
     def treat_ancillary_devices_removed(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_LI("Attachment %s removed"), device)
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id,
-                                                             cfg.CONF.host)
-            except Exception as e:
-                LOG.debug("port_removed failed for %(device)s: %(e)s",
-                          {'device': device, 'e': e})
-                resync = True
-                continue
+        try:
+            devices_details = self.plugin_rpc.update_devices_down(
+                self.context, list(devices), self.agent_id, cfg.CONF.host)
+        except Exception as e:
+            LOG.debug("port_removed failed for %(devices)s: %(e)s",
+                      {'devices': devices, 'e': e})
+            return True
+        for details in devices_details:
+            device = details['device']
             if details['exists']:
                 LOG.info(_LI("Port %s updated."), device)
                 # Nothing to do regarding local networking
             else:
                 LOG.debug("Device %s not defined on plugin", device)
-        return resync
+        return False
 
     def process_network_ports(self, port_info, ovs_restarted):
         resync_a = False
@@ -1486,6 +1546,54 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 port_info.get('removed') or
                 port_info.get('updated'))
 
+    def _get_flow_bridges(self):
+        bridges = [self.int_br]
+        if self.tun_br:
+            bridges.append(self.tun_br)
+        bridges.extend(self.phys_brs.values())
+        return bridges
+
+    def defer_apply_flows_on(self):
+        """Defer the flow changes of the bridges until defer_apply_flows_off.
+        """
+        self.flow_stats = {'add': 0, 'mod': 0, 'del': 0, 'elapsed': 0}
+        for br in self._get_flow_bridges():
+            br.defer_apply_on(use_bundle=self.use_flow_bundles)
+
+    def _apply_bridges_flows(self, apply_flows):
+        failed = []
+        for br in self._get_flow_bridges():
+            try:
+                stats = apply_flows(br)
+            except Exception:
+                LOG.exception(_LE("Failed to apply the flows of bridge %s"),
+                              br.br_name)
+                failed.append(br.br_name)
+                continue
+            for key, value in stats.items():
+                self.flow_stats[key] += value
+        if failed:
+            raise FlowsApplyError(bridges=', '.join(failed))
+
+    def apply_deferred_flows(self):
+        """Apply the flow changes of the bridges deferred so far.
+
+        The flow changes made afterwards are still deferred.  Raise
+        FlowsApplyError if the flows of a bridge could not be applied.
+        """
+        self._apply_bridges_flows(lambda br: br.apply_deferred_flows())
+
+    def defer_apply_flows_off(self):
+        """Apply the deferred flow changes of the bridges.
+
+        Return the number of flows applied per action and the time it took
+        since defer_apply_flows_on.  The flow changes are no longer deferred
+        afterwards, and FlowsApplyError is raised if the flows of a bridge
+        could not be applied.
+        """
+        self._apply_bridges_flows(lambda br: br.defer_apply_off())
+        return self.flow_stats
+
     def check_ovs_status(self):
         # Check for the canary flow
         canary_flow = self.int_br.dump_flows_for_table(constants.CANARY_TABLE)
@@ -1525,6 +1633,8 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 minimize_polling=False)
 
         sync = True
+        full_scan = True
+        last_full_scan = 0
         ports = set()
         updated_ports_copy = set()
         ancillary_ports = set()
@@ -1545,6 +1655,7 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                 ports.clear()
                 ancillary_ports.clear()
                 sync = False
+                full_scan = True
                 polling_manager.force_polling()
             ovs_status = self.check_ovs_status()
             if ovs_status == constants.OVS_RESTARTED:
@@ -1577,6 +1688,9 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     tunnel_sync = True
             ovs_restarted |= (ovs_status == constants.OVS_RESTARTED)
             if self._agent_has_updates(polling_manager) or ovs_restarted:
+                # The flows of the iteration are applied at once per bridge
+                flows_failed = False
+                self.defer_apply_flows_on()
                 try:
                     LOG.debug("Agent rpc_loop - iteration:%(iter_num)d - "
                               "starting polling. Elapsed:%(elapsed).3f",
@@ -1589,7 +1703,18 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     updated_ports_copy = self.updated_ports
                     self.updated_ports = set()
                     reg_ports = (set() if ovs_restarted else ports)
-                    port_info = self.scan_ports(reg_ports, updated_ports_copy)
+                    # The events are consumed even when all the ports are
+                    # scanned, the scan covers them.
+                    events = polling_manager.get_events()
+                    if (events is None or full_scan or ovs_restarted or
+                            start - last_full_scan >= self.full_scan_interval):
+                        port_info = self.scan_ports(reg_ports,
+                                                    updated_ports_copy)
+                        full_scan = False
+                        last_full_scan = start
+                    else:
+                        port_info = self.process_ports_events(
+                            events, reg_ports, updated_ports_copy)
                     self.process_deleted_ports(port_info)
                     self.update_stale_ofport_rules()
                     LOG.debug("Agent rpc_loop - iteration:%(iter_num)d - "
@@ -1648,11 +1773,29 @@ class OVSNeutronAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin,
                     # so we can sure that no other Exception occurred.
                     if not sync:
                         ovs_restarted = False
+                except FlowsApplyError:
+                    flows_failed = True
                 except Exception:
                     LOG.exception(_LE("Error while processing VIF ports"))
                     # Put the ports back in self.updated_port
                     self.updated_ports |= updated_ports_copy
                     sync = True
+                    full_scan = True
+                finally:
+                    try:
+                        port_stats['flows'] = self.defer_apply_flows_off()
+                    except FlowsApplyError:
+                        flows_failed = True
+                if flows_failed:
+                    # The flows not applied were dropped, wire all the
+                    # ports again as after an OVS restart
+                    LOG.error(_LE("Failed to apply the flows of the "
+                                  "bridges, resyncing all the ports"))
+                    self.updated_ports |= updated_ports_copy
+                    sync = True
+                    full_scan = True
+                    ovs_restarted = True
+                    tunnel_sync = True
 
             self.loop_count_and_wait(start, port_stats)
 
@@ -44,6 +44,11 @@ ovs_opts = [
     cfg.BoolOpt('use_veth_interconnection', default=False,
                 help=_("Use veths instead of patch ports to interconnect the "
                        "integration bridge to physical bridges.")),
+    cfg.BoolOpt('use_flow_bundles', default=False,
+                help=_("Apply the flows of each bridge changed during an "
+                       "agent loop iteration atomically, with one ovs-ofctl "
+                       "call in an OpenFlow bundle. Requires Open vSwitch 2.4 "
+                       "or later with OpenFlow 1.4 enabled on the bridges.")),
 ]
 
 agent_opts = [
@@ -58,6 +63,12 @@ agent_opts = [
                default=constants.DEFAULT_OVSDBMON_RESPAWN,
                help=_("The number of seconds to wait before respawning the "
                       "ovsdb monitor after losing communication with it.")),
+    cfg.IntOpt('full_scan_interval', default=300,
+               help=_("When minimize_polling is set, the maximum number of "
+                      "seconds between two scans of all the ports of the "
+                      "integration bridge. In between, only the interfaces "
+                      "changed according to the ovsdb monitor are processed. "
+                      "0 scans all the ports at each iteration.")),
     cfg.ListOpt('tunnel_types', default=DEFAULT_TUNNEL_TYPES,
                 help=_("Network types supported by the agent "
                        "(gre and/or vxlan).")),
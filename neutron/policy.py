@@ -17,6 +17,7 @@
 Policy engine for neutron.  Largely copied from nova.
 """
 
+import ast
 import collections
 import itertools
 import logging as std_logging
@@ -36,6 +37,8 @@ from neutron.openstack.common import policy
 LOG = logging.getLogger(__name__)
 
 _ENFORCER = None
+# The match rules built, by action and attributes enforced on the target
+_MATCH_RULES = {}
 ADMIN_CTX_POLICY = 'context_is_admin'
 ADVSVC_CTX_POLICY = 'context_is_advsvc'
 # Maps deprecated 'extension' policies to new-style policies
@@ -54,6 +57,12 @@ DEPRECATED_ACTION_MAP = {
     'view': ['get'],
     'set': ['create', 'update']
 }
+# The filter of list requests under which the QueryFilter of the read
+# policy is passed to the plugins
+QUERY_FILTER_KEY = '_policy_query_filter'
+# The credentials under which a Checker memoizes the parent resources
+# fetched by OwnerCheck
+PARENT_RESOURCES_KEY = '_parent_resources'
 
 
 def reset():
@@ -61,6 +70,7 @@ def reset():
     if _ENFORCER:
         _ENFORCER.clear()
         _ENFORCER = None
+    _MATCH_RULES.clear()
 
 
 def init():
@@ -149,8 +159,8 @@ def _should_validate_sub_attributes(attribute, sub_attr):
                  v for (k, v) in validate.iteritems()]))
 
 
-def _build_subattr_match_rule(attr_name, attr, action, target):
-    """Create the rule to match for sub-attribute policy checks."""
+def _get_sub_attributes(attr_name, attr, target):
+    """List the sub-attributes of an attribute set in the target."""
     # TODO(salv-orlando): Instead of relying on validator info, introduce
     # typing for API attributes
     # Expect a dict as type descriptor
@@ -166,11 +176,23 @@ def _build_subattr_match_rule(attr_name, attr, action, target):
                   "generate any sub-attr policy rule for %s.",
                   attr_name)
         return
+    return tuple(sub_attr_name for sub_attr_name in data
+                 if sub_attr_name in target[attr_name])
+
+
+def _build_subattr_match_rule(attr_name, attr, action, target):
+    """Create the rule to match for sub-attribute policy checks."""
+    sub_attr_names = _get_sub_attributes(attr_name, attr, target)
+    if sub_attr_names is None:
+        return
+    return _build_sub_attr_names_rule(action, attr_name, sub_attr_names)
+
+
+def _build_sub_attr_names_rule(action, attr_name, sub_attr_names):
     sub_attr_rules = [policy.RuleCheck('rule', '%s:%s:%s' %
                                        (action, attr_name,
                                         sub_attr_name)) for
-                      sub_attr_name in data if sub_attr_name in
-                      target[attr_name]]
+                      sub_attr_name in sub_attr_names]
     return policy.AndCheck(sub_attr_rules)
 
 
@@ -184,19 +206,13 @@ def _process_rules_list(rules, match_rule):
     return rules
 
 
-def _build_match_rule(action, target, pluralized):
-    """Create the rule to match for a given action.
+def _get_enforced_attributes(action, target, pluralized):
+    """List the attributes of the target the action is enforced on.
 
-    The policy rule to be matched is built in the following way:
-    1) add entries for matching permission on objects
-    2) add an entry for the specific action (e.g.: create_network)
-    3) add an entry for attributes of a resource for which the action
-       is being executed (e.g.: create_network:shared)
-    4) add an entry for sub-attributes of a resource for which the
-       action is being executed
-       (e.g.: create_router:external_gateway_info:network_id)
+    Each attribute comes with the names of its sub-attributes set in the
+    target, or None when these are not validated.
     """
-    match_rule = policy.RuleCheck('rule', action)
+    enforced_attributes = []
     resource, is_write = get_resource_and_action(action, pluralized)
     # Attribute-based checks shall not be enforced on GETs
     if is_write:
@@ -209,16 +225,46 @@ def _build_match_rule(action, target, pluralized):
                                                 target, action):
                     attribute = res_map[resource][attribute_name]
                     if 'enforce_policy' in attribute:
-                        attr_rule = policy.RuleCheck('rule', '%s:%s' %
-                                                     (action, attribute_name))
-                        # Build match entries for sub-attributes
+                        sub_attr_names = None
                         if _should_validate_sub_attributes(
                                 attribute, target[attribute_name]):
-                            attr_rule = policy.AndCheck(
-                                [attr_rule, _build_subattr_match_rule(
-                                    attribute_name, attribute,
-                                    action, target)])
-                        match_rule = policy.AndCheck([match_rule, attr_rule])
+                            sub_attr_names = _get_sub_attributes(
+                                attribute_name, attribute, target)
+                        enforced_attributes.append((attribute_name,
+                                                    sub_attr_names))
+    return tuple(enforced_attributes)
+
+
+def _build_match_rule(action, target, pluralized):
+    """Create the rule to match for a given action.
+
+    The policy rule to be matched is built in the following way:
+    1) add entries for matching permission on objects
+    2) add an entry for the specific action (e.g.: create_network)
+    3) add an entry for attributes of a resource for which the action
+       is being executed (e.g.: create_network:shared)
+    4) add an entry for sub-attributes of a resource for which the
+       action is being executed
+       (e.g.: create_router:external_gateway_info:network_id)
+
+    The rule is built once per action and set of enforced attributes,
+    and then shared by all the targets of the action setting these.
+    """
+    key = (action, pluralized,
+           _get_enforced_attributes(action, target, pluralized))
+    match_rule = _MATCH_RULES.get(key)
+    if match_rule is None:
+        match_rule = policy.RuleCheck('rule', action)
+        for attribute_name, sub_attr_names in key[2]:
+            attr_rule = policy.RuleCheck('rule', '%s:%s' %
+                                         (action, attribute_name))
+            # Build match entries for sub-attributes
+            if sub_attr_names is not None:
+                attr_rule = policy.AndCheck(
+                    [attr_rule, _build_sub_attr_names_rule(
+                        action, attribute_name, sub_attr_names)])
+            match_rule = policy.AndCheck([match_rule, attr_rule])
+        _MATCH_RULES[key] = match_rule
     return match_rule
 
 
@@ -301,11 +347,18 @@ class OwnerCheck(policy.Check):
             # f *must* exist, if not found it is better to let neutron
             # explode. Check will be performed with admin context
             context = importutils.import_module('neutron.context')
+            # The parent resources are memoized with the credentials by a
+            # Checker, for all the targets it checks
+            parent_resources = creds.get(PARENT_RESOURCES_KEY, {})
             try:
-                data = f(context.get_admin_context(),
-                         target[parent_foreign_key],
-                         fields=[parent_field])
-                target[self.target_field] = data[parent_field]
+                parent_key = (parent_res, target[parent_foreign_key],
+                              parent_field)
+                if parent_key not in parent_resources:
+                    data = f(context.get_admin_context(),
+                             target[parent_foreign_key],
+                             fields=[parent_field])
+                    parent_resources[parent_key] = data[parent_field]
+                target[self.target_field] = parent_resources[parent_key]
             except Exception:
                 with excutils.save_and_reraise_exception():
                     LOG.exception(_LE('Policy check error while calling %s!'),
@@ -430,6 +483,153 @@ def enforce(context, action, target, plugin=None, pluralized=None):
     return result
 
 
+class Checker(object):
+    """Verifies the actions of one request on many targets.
+
+    The rules are loaded, and the credentials of the context are built,
+    once for all the targets. The parent resources fetched to verify
+    their ownership are memoized for the lifetime of the checker, which
+    should therefore not outlive the request.
+    """
+
+    def __init__(self, context):
+        init()
+        _ENFORCER.load_rules()
+        self._credentials = context.to_dict()
+        self._credentials[PARENT_RESOURCES_KEY] = {}
+
+    def check(self, action, target, might_not_exist=False, pluralized=None):
+        """Verifies that the action is valid on the target.
+
+        See check() for the parameters and the result.
+        """
+        if might_not_exist and not (_ENFORCER.rules and
+                                    action in _ENFORCER.rules):
+            return True
+        if target is None:
+            target = {}
+        match_rule = _build_match_rule(action, target, pluralized)
+        result = match_rule(target, self._credentials, _ENFORCER)
+        # logging applied rules in case of failure
+        if not result:
+            log_rule_list(match_rule)
+        return result
+
+
+class QueryFilter(object):
+    """The condition under which a read policy passes, for a query.
+
+    The condition is on the fields of the targets: either a
+    ('==', field, value) tuple, or an ('and', conditions) or
+    ('or', conditions) tuple. A plugin applying the condition to its
+    query sets applied, the targets it returns then need no check.
+    """
+
+    def __init__(self, condition):
+        self.condition = condition
+        self.applied = False
+
+
+def _compile_target_check(field, value, attrs):
+    if field in attrs:
+        return ('==', field, value)
+
+
+def _compile_check(rule, credentials, attrs):
+    """Compile a check into the condition on the targets it verifies.
+
+    Returns True or False when the check does not depend on the target,
+    and None when it can not be compiled.
+    """
+    if isinstance(rule, policy.TrueCheck):
+        return True
+    if isinstance(rule, policy.FalseCheck):
+        return False
+    if isinstance(rule, policy.RuleCheck):
+        try:
+            rule = _ENFORCER.rules[rule.match]
+        except KeyError:
+            # We don't have any matching rule; fail closed
+            return False
+        return _compile_check(rule, credentials, attrs)
+    if isinstance(rule, policy.NotCheck):
+        condition = _compile_check(rule.rule, credentials, attrs)
+        if isinstance(condition, bool):
+            return not condition
+        return None
+    if isinstance(rule, (policy.AndCheck, policy.OrCheck)):
+        is_and = isinstance(rule, policy.AndCheck)
+        conditions = []
+        compiled = True
+        for sub_rule in rule.rules:
+            condition = _compile_check(sub_rule, credentials, attrs)
+            if condition is None:
+                compiled = False
+            elif isinstance(condition, bool):
+                # False decides an and, True an or
+                if condition is not is_and:
+                    return condition
+            else:
+                conditions.append(condition)
+        if not compiled:
+            return None
+        if len(conditions) > 1:
+            return ('and' if is_and else 'or', conditions)
+        return conditions[0] if conditions else is_and
+    if isinstance(rule, policy.RoleCheck):
+        return rule({}, credentials, _ENFORCER)
+    if isinstance(rule, OwnerCheck):
+        if rule.kind not in credentials:
+            return False
+        return _compile_target_check(rule.target_field,
+                                     unicode(credentials[rule.kind]), attrs)
+    if isinstance(rule, FieldCheck):
+        return _compile_target_check(rule.field, rule.value, attrs)
+    if isinstance(rule, policy.GenericCheck):
+        if '%' not in rule.match:
+            return rule({}, credentials, _ENFORCER)
+        fields = re.findall(r'^\%\((.*)\)s$', rule.match)
+        if fields:
+            # The field of the target is compared with the literal, or
+            # the credential, of the kind
+            try:
+                kind_value = ast.literal_eval(rule.kind)
+            except (ValueError, SyntaxError):
+                kind_value = credentials
+                try:
+                    for kind_part in rule.kind.split('.'):
+                        kind_value = kind_value[kind_part]
+                except (KeyError, TypeError):
+                    return False
+            return _compile_target_check(fields[0], unicode(kind_value),
+                                         attrs)
+    return None
+
+
+def get_query_filter(context, action, pluralized=None):
+    """Compile the policy of a read action for a list query.
+
+    :param context: neutron context
+    :param action: the read action checked on each element of the list
+    :param pluralized: pluralized case of resource
+
+    :return: True when the context may read every target, False when it
+        may read none, a QueryFilter when the policy only depends on
+        attributes of the targets, and None when it can not be compiled
+        and the targets have to be checked one by one.
+    """
+    init()
+    _ENFORCER.load_rules()
+    resource, is_write = get_resource_and_action(action, pluralized)
+    match_rule = _build_match_rule(action, {}, pluralized)
+    condition = _compile_check(match_rule, context.to_dict(),
+                               attributes.RESOURCE_ATTRIBUTE_MAP.get(
+                                   resource, {}))
+    if isinstance(condition, tuple):
+        return QueryFilter(condition)
+    return condition
+
+
 def check_is_admin(context):
     """Verify context has admin rights according to policy settings."""
     init()
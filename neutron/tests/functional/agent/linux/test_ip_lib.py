@@ -15,6 +15,7 @@
 
 import collections
 
+import mock
 import netaddr
 from oslo_config import cfg
 from oslo_log import log as logging
@@ -138,3 +139,24 @@ class IpLibTestCase(IpLibTestFramework):
 
         routes = ip_lib.get_routing_table(namespace=attr.namespace)
         self.assertEqual(expected_routes, routes)
+
+    def test_netlink_backend_matches_ip_command(self):
+        attr = self.generate_device_details(
+            ip_cidrs=['240.0.0.1/24', '2001:db8::1/64'])
+        device = self.manage_device(attr)
+        device.route.add_gateway('240.0.0.254')
+
+        def query(backend):
+            self.config(ip_lib_backend=backend)
+            dev = ip_lib.IPDevice(attr.name, namespace=attr.namespace)
+            return (dev.link.address, dev.link.mtu, dev.link.state,
+                    dev.addr.list(), dev.addr.list(ip_version=4),
+                    dev.route.get_gateway(),
+                    sorted(d.name for d in ip_lib.IPWrapper(
+                        namespace=attr.namespace).get_devices()))
+
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        with mock.patch.object(ip_lib.SubProcessBase, '_execute') as execute:
+            netlink_results = query('netlink')
+            self.assertFalse(execute.called)
+        self.assertEqual(query('cli'), netlink_results)
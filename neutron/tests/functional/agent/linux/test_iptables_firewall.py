@@ -16,12 +16,18 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import time
+
+from oslo_config import cfg
+from oslo_log import log as logging
+
 from neutron.agent.linux import iptables_firewall
 from neutron.agent import securitygroups_rpc as sg_cfg
 from neutron.tests.common import net_helpers
 from neutron.tests.functional.agent.linux import base
 from neutron.tests.functional.agent.linux import helpers
-from oslo_config import cfg
+
+LOG = logging.getLogger(__name__)
 
 
 class IptablesFirewallTestCase(base.BaseIPVethTestCase):
@@ -95,3 +101,61 @@ class IptablesFirewallTestCase(base.BaseIPVethTestCase):
         self.src_port_desc['port_security_enabled'] = False
         self.firewall.update_port_filter(self.src_port_desc)
         pinger.assert_ping(self.DST_ADDRESS)
+
+
+class IptablesFirewallChainLayoutBenchmarkTestCase(base.BaseLinuxTestCase):
+    """Compare the per port and shared security group chain layouts.
+
+    The same ports and security group rules are applied with both layouts,
+    and the apply time and number of iptables rules of each are logged.
+    """
+    NUM_PORTS = 100
+    NUM_SG_RULES = 20
+    FAKE_SECURITY_GROUP_ID = "fake_sg_id"
+
+    def setUp(self):
+        cfg.CONF.register_opts(sg_cfg.security_group_opts, 'SECURITYGROUP')
+        super(IptablesFirewallChainLayoutBenchmarkTestCase, self).setUp()
+
+    def _apply_port_filters(self, shared_security_group_chains):
+        self.config(group='SECURITYGROUP',
+                    shared_security_group_chains=shared_security_group_chains)
+        ip_wrapper = self._create_namespace()
+        firewall = iptables_firewall.IptablesFirewallDriver(
+            namespace=ip_wrapper.namespace)
+        sg_rules = [{'ethertype': 'IPv4', 'direction': 'ingress',
+                     'protocol': 'tcp', 'port_range_min': port,
+                     'port_range_max': port}
+                    for port in range(1000, 1000 + self.NUM_SG_RULES)]
+
+        start = time.time()
+        with firewall.defer_apply():
+            firewall.update_security_group_rules(self.FAKE_SECURITY_GROUP_ID,
+                                                 sg_rules)
+            for i in range(self.NUM_PORTS):
+                firewall.prepare_port_filter(
+                    {'device': 'tap%011d' % i,
+                     'mac_address': 'fa:16:3e:00:%02x:%02x' % divmod(i, 256),
+                     'fixed_ips': ['10.0.%d.%d' % divmod(i + 1, 256)],
+                     'security_groups': [self.FAKE_SECURITY_GROUP_ID]})
+        apply_time = time.time() - start
+
+        dump = ip_wrapper.netns.execute(['iptables-save'])
+        rule_count = len([line for line in dump.splitlines()
+                          if line.startswith('-A ')])
+        return apply_time, rule_count
+
+    def test_shared_chains_reduce_rule_count(self):
+        per_port_time, per_port_rules = self._apply_port_filters(False)
+        shared_time, shared_rules = self._apply_port_filters(True)
+        LOG.info("%(ports)d ports, %(sg_rules)d security group rules: "
+                 "per port chains %(per_port_rules)d rules applied in "
+                 "%(per_port_time).3fs, shared chains %(shared_rules)d rules "
+                 "applied in %(shared_time).3fs",
+                 {'ports': self.NUM_PORTS, 'sg_rules': self.NUM_SG_RULES,
+                  'per_port_rules': per_port_rules,
+                  'per_port_time': per_port_time,
+                  'shared_rules': shared_rules, 'shared_time': shared_time})
+        self.assertGreaterEqual(
+            per_port_rules - shared_rules,
+            (self.NUM_PORTS - 1) * self.NUM_SG_RULES)
@@ -112,3 +112,15 @@ class TestSimpleInterfaceMonitor(BaseMonitorTest):
         # has_updates after port addition should become True
         while not self.monitor.has_updates:
             eventlet.sleep(0.01)
+
+    def test_get_events(self):
+        # Events are not known before the initial table content is processed
+        self.assertIsNone(self.monitor.get_events())
+        port = self.useFixture(net_helpers.OVSPortFixture()).port
+        added = []
+        while not added:
+            eventlet.sleep(0.01)
+            events = self.monitor.get_events()
+            self.assertIsNotNone(events)
+            added += [device['name'] for device in events['added']]
+        self.assertIn(port.name, added)
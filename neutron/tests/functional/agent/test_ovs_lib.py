@@ -122,6 +122,23 @@ class OVSBridgeTestCase(OVSBridgeTestBase):
             self.br.db_get_val('Bridge', self.br.br_name, 'protocols'),
             "OpenFlow10")
 
+    def _test_defer_apply_flows(self, use_bundle):
+        self.br.add_flow(table=1, in_port=1, actions='drop')
+        with self.br.defer_apply(use_bundle=use_bundle):
+            self.br.delete_flows(table=1)
+            self.br.add_flow(table=1, in_port=2, actions='drop')
+            self.assertIn('in_port=1', self.br.dump_flows_for_table(1))
+        flows = self.br.dump_flows_for_table(1)
+        self.assertNotIn('in_port=1', flows)
+        self.assertIn('in_port=2', flows)
+
+    def test_defer_apply_flows(self):
+        self._test_defer_apply_flows(use_bundle=False)
+
+    def test_defer_apply_flows_with_bundle(self):
+        self.br.set_protocols('OpenFlow10,OpenFlow14')
+        self._test_defer_apply_flows(use_bundle=True)
+
     def test_get_datapath_id(self):
         brdev = ip_lib.IPDevice(self.br.br_name)
         dpid = brdev.link.attributes['link/ether'].replace(':', '')
@@ -285,6 +285,78 @@ class OVS_Lib_Test(base.BaseTestCase):
             process_input="hard_timeout=0,idle_timeout=0,priority=1,"
                           "actions=normal")
 
+    def test_defer_apply_flows(self):
+        with self.br.defer_apply():
+            self.br.add_flow(in_port=1, actions='drop')
+            self.br.add_flow(in_port=2, actions='drop')
+            self.br.delete_flows(in_port=3)
+            self.br.mod_flow(in_port=4, actions='normal')
+            self.br.delete_flows(in_port=5)
+            self.assertFalse(self.execute.called)
+        add = ("hard_timeout=0,idle_timeout=0,priority=1,"
+               "in_port=%s,actions=drop")
+        self.assertEqual(
+            [self._ofctl_mock("add-flows", self.BR_NAME, '-',
+                              process_input='\n'.join([add % 1, add % 2])),
+             self._ofctl_mock("del-flows", self.BR_NAME, '-',
+                              process_input="in_port=3"),
+             self._ofctl_mock("mod-flows", self.BR_NAME, '-',
+                              process_input="in_port=4,actions=normal"),
+             self._ofctl_mock("del-flows", self.BR_NAME, '-',
+                              process_input="in_port=5")],
+            self.execute.call_args_list)
+
+    def test_defer_apply_flows_with_bundle(self):
+        self.br.defer_apply_on(use_bundle=True)
+        self.br.add_flow(in_port=1, actions='drop')
+        self.br.delete_flows(in_port=2)
+        self.br.mod_flow(in_port=3, actions='normal')
+        stats = self.br.defer_apply_off()
+        self._verify_ofctl_mock(
+            "add-flows", self.BR_NAME, '--bundle', '-',
+            process_input="add hard_timeout=0,idle_timeout=0,priority=1,"
+                          "in_port=1,actions=drop\n"
+                          "delete in_port=2\n"
+                          "modify in_port=3,actions=normal")
+        self.assertEqual({'add': 1, 'mod': 1, 'del': 1},
+                         dict((k, v) for k, v in stats.items()
+                              if k != 'elapsed'))
+
+    def test_apply_deferred_flows_keeps_deferring(self):
+        self.br.defer_apply_on()
+        self.br.add_flow(priority=1, actions='normal')
+        self.assertEqual(1, self.br.apply_deferred_flows()['add'])
+        self.assertEqual(1, self.execute.call_count)
+        self.br.add_flow(priority=2, actions='normal')
+        self.assertEqual(1, self.execute.call_count)
+        self.assertEqual(1, self.br.defer_apply_off()['add'])
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_defer_apply_off_raises_on_failure(self):
+        self.br.defer_apply_on()
+        self.br.add_flow(priority=1, actions='normal')
+        self.execute.side_effect = RuntimeError()
+        self.assertRaises(RuntimeError, self.br.defer_apply_off)
+        # The flows are no longer deferred
+        self.execute.side_effect = None
+        self.br.add_flow(priority=1, actions='normal')
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_defer_apply_off_without_flows(self):
+        self.br.defer_apply_on()
+        self.assertEqual({'add': 0, 'mod': 0, 'del': 0, 'elapsed': 0},
+                         self.br.defer_apply_off())
+        self.assertFalse(self.execute.called)
+
+    def test_do_bundle_flows(self):
+        self.br.do_bundle_flows([('del', {'in_port': 1}),
+                                 ('add', {'in_port': 1, 'actions': 'drop'})])
+        self._verify_ofctl_mock(
+            "add-flows", self.BR_NAME, '--bundle', '-',
+            process_input="delete in_port=1\n"
+                          "add hard_timeout=0,idle_timeout=0,priority=1,"
+                          "in_port=1,actions=drop")
+
     def _test_get_port_ofport(self, ofport, expected_result):
         pname = "tap99"
         self.br.vsctl_timeout = 0  # Don't waste precious time retrying
@@ -803,6 +875,83 @@ class OVS_Lib_Test(base.BaseTestCase):
         self._assert_vif_port(vif_port, ofport=1337, mac="de:ad:be:ef:13:37")
 
 
+class OVS_Lib_PortIndexTest(base.BaseTestCase):
+    def setUp(self):
+        super(OVS_Lib_PortIndexTest, self).setUp()
+        self.br = ovs_lib.OVSBridge('br-int')
+        self.execute = mock.patch.object(
+            utils, "execute", spec=utils.execute).start()
+        self.index = mock.Mock()
+        mock.patch.object(self.br.ovsdb, 'get_port_index',
+                          return_value=self.index).start()
+        self.index.get_interfaces.return_value = [
+            {'name': 'tap99', 'ofport': 1,
+             'external_ids': {'iface-id': 'tap99id',
+                              'attached-mac': 'tap99mac'}},
+            {'name': 'tap98', 'ofport': [],
+             'external_ids': {'iface-id': 'tap98id',
+                              'attached-mac': 'tap98mac'}},
+            {'name': 'patch-tun', 'ofport': 2, 'external_ids': {}}]
+
+    def tearDown(self):
+        self.assertFalse(self.execute.called)
+        super(OVS_Lib_PortIndexTest, self).tearDown()
+
+    def test_get_port_name_list(self):
+        self.assertEqual(self.index.get_port_names.return_value,
+                         self.br.get_port_name_list())
+        self.index.get_port_names.assert_called_once_with('br-int')
+
+    def test_get_vif_ports(self):
+        ports = self.br.get_vif_ports()
+        self.assertEqual([('tap99', 1, 'tap99id', 'tap99mac'),
+                          ('tap98', [], 'tap98id', 'tap98mac')],
+                         [(p.port_name, p.ofport, p.vif_id, p.vif_mac)
+                          for p in ports])
+
+    def test_get_vif_port_set(self):
+        self.assertEqual(set(['tap99id']), self.br.get_vif_port_set())
+
+    def test_get_vif_port_to_ofport_map(self):
+        self.assertEqual({'tap99id': 1, 'patch-tun': 2},
+                         self.br.get_vif_port_to_ofport_map())
+
+    def test_get_port_tag_dict(self):
+        self.assertEqual(self.index.get_port_tags.return_value,
+                         self.br.get_port_tag_dict())
+        self.index.get_port_tags.assert_called_once_with('br-int')
+
+    def test_get_vif_port_by_id(self):
+        self.index.get_interfaces_by_iface_id.return_value = [
+            {'name': 'tap97', 'ofport': 3, 'bridge': 'br-int',
+             'external_ids': {'iface-id': 'tap99id'}},
+            {'name': 'tap98', 'ofport': 4, 'bridge': 'br-ex',
+             'external_ids': {'iface-id': 'tap99id',
+                              'attached-mac': 'tap99mac'}},
+            {'name': 'tap99', 'ofport': 5, 'bridge': 'br-int',
+             'external_ids': {'iface-id': 'tap99id',
+                              'attached-mac': 'tap99mac'}}]
+        vif_port = self.br.get_vif_port_by_id('tap99id')
+        self.assertEqual(('tap99', 5, 'tap99id', 'tap99mac'),
+                         (vif_port.port_name, vif_port.ofport,
+                          vif_port.vif_id, vif_port.vif_mac))
+        self.index.get_interfaces_by_iface_id.assert_called_once_with(
+            'tap99id')
+
+    def test_get_vif_port_by_ofport(self):
+        self.index.get_interface_by_ofport.return_value = (
+            self.index.get_interfaces.return_value[0])
+        vif_port = self.br.get_vif_port_by_ofport(1)
+        self.assertEqual('tap99id', vif_port.vif_id)
+        self.index.get_interface_by_ofport.assert_called_once_with(
+            'br-int', 1)
+
+    def test_get_vif_port_by_ofport_not_vif(self):
+        self.index.get_interface_by_ofport.return_value = (
+            self.index.get_interfaces.return_value[2])
+        self.assertIsNone(self.br.get_vif_port_by_ofport(2))
+
+
 class TestDeferredOVSBridge(base.BaseTestCase):
 
     def setUp(self):
@@ -907,6 +1056,15 @@ class TestDeferredOVSBridge(base.BaseTestCase):
             deferred_br.mod_flow(**self.mod_flow_dict2)
         self._verify_mock_call(expected_calls)
 
+    def test_apply_with_bundle(self):
+        with ovs_lib.DeferredOVSBridge(self.br, full_ordered=True,
+                                       use_bundle=True) as deferred_br:
+            deferred_br.delete_flows(**self.del_flow_dict1)
+            deferred_br.add_flow(**self.add_flow_dict1)
+        self.br.do_bundle_flows.assert_called_once_with(
+            [('del', self.del_flow_dict1), ('add', self.add_flow_dict1)])
+        self.assertFalse(self.mocked_do_action_flows.called)
+
     def test_getattr_unallowed_attr(self):
         with ovs_lib.DeferredOVSBridge(self.br) as deferred_br:
             self.assertEqual(self.br.add_port, deferred_br.add_port)
@@ -27,6 +27,9 @@ class TestBasePollingManager(base.BaseTestCase):
     def test__is_polling_required_should_not_be_implemented(self):
         self.assertRaises(NotImplementedError, self.pm._is_polling_required)
 
+    def test_get_events_returns_none(self):
+        self.assertIsNone(self.pm.get_events())
+
     def test_force_polling_sets_interval_attribute(self):
         self.assertFalse(self.pm._force_polling)
         self.pm.force_polling()
@@ -258,6 +258,9 @@ class TestDhcpAgent(base.BaseTestCase):
                             [mock.call(mock.ANY),
                              mock.call().report_state(mock.ANY, mock.ANY,
                                                       mock.ANY)])
+                        self.assertIn(
+                            'execute_latency',
+                            agent_mgr.agent_state['configurations'])
 
     def test_dhcp_agent_main_agent_manager(self):
         logging_str = 'neutron.agent.common.config.setup_logging'
@@ -375,6 +378,24 @@ class TestDhcpAgent(base.BaseTestCase):
             self._test_sync_state_helper(known_net_ids, active_net_ids)
             w.assert_called_once_with()
 
+    def test_sync_state_pending_networks_first(self):
+        active_networks = [mock.Mock(id=netid) for netid in ['a', 'b', 'c']]
+        with mock.patch(DHCP_PLUGIN) as plug:
+            plug.return_value.get_active_networks_info.return_value = (
+                active_networks)
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            dhcp._pending_reloads.add('c')
+            with mock.patch.object(dhcp,
+                                   'safe_configure_dhcp_for_network') as conf:
+                dhcp.sync_state()
+        self.assertEqual(['c', 'a', 'b'],
+                         [c[0][0].id for c in conf.call_args_list])
+        state = dhcp.sync_stats.get_state()
+        self.assertFalse(state['in_progress'])
+        self.assertEqual(3, state['networks'])
+        self.assertEqual(3, state['networks_done'])
+        self.assertEqual(3, state['network_latency']['count'])
+
     def test_sync_state_plugin_error(self):
         with mock.patch(DHCP_PLUGIN) as plug:
             mock_plugin = mock.Mock()
@@ -434,6 +455,17 @@ class TestDhcpAgent(base.BaseTestCase):
 
         self.assertEqual(set(networks), set(dhcp.cache.get_network_ids()))
 
+    def test_configure_dhcp_for_restored_network(self):
+        self.driver.existing_dhcp_networks.return_value = [fake_network.id]
+        self.driver.should_enable_metadata.return_value = False
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        with mock.patch.object(dhcp, 'call_driver') as call_driver:
+            dhcp.configure_dhcp_for_network(fake_network)
+            dhcp.configure_dhcp_for_network(fake_network)
+        self.assertEqual([mock.call('restore', fake_network),
+                          mock.call('enable', fake_network)],
+                         call_driver.call_args_list)
+
     def test_none_interface_driver(self):
         cfg.CONF.set_override('interface_driver', None)
         with mock.patch.object(dhcp, 'LOG') as log:
@@ -454,6 +486,43 @@ class TestDhcpAgent(base.BaseTestCase):
             self.assertEqual(log.error.call_count, 1)
 
 
+class TestNetworkSyncStats(base.BaseTestCase):
+
+    def test_get_state(self):
+        stats = dhcp_agent.NetworkSyncStats()
+        stats.start(200)
+        for i in range(100, 0, -1):
+            stats.record(i / 1000.0)
+        state = stats.get_state()
+        self.assertTrue(state['in_progress'])
+        self.assertEqual(100, state['networks_done'])
+        latency = state['network_latency']
+        self.assertEqual(100, latency['count'])
+        self.assertAlmostEqual(50, latency['p50'])
+        self.assertAlmostEqual(90, latency['p90'])
+        self.assertAlmostEqual(99, latency['p99'])
+        self.assertAlmostEqual(100, latency['max'])
+
+        stats.finish()
+        state = stats.get_state()
+        self.assertFalse(state['in_progress'])
+        self.assertIsNotNone(state['last_duration'])
+
+    def test_get_state_no_network(self):
+        state = dhcp_agent.NetworkSyncStats().get_state()
+        self.assertIsNone(state['network_latency']['p50'])
+        self.assertIsNone(state['last_duration'])
+
+    def test_latest_samples(self):
+        stats = dhcp_agent.NetworkSyncStats(max_samples=2)
+        for duration in (1, 0.002, 0.001):
+            stats.record(duration)
+        latency = stats.get_state()['network_latency']
+        self.assertEqual(3, latency['count'])
+        self.assertAlmostEqual(2, latency['p99'])
+        self.assertAlmostEqual(1000, latency['max'])
+
+
 class TestLogArgs(base.BaseTestCase):
 
     def test_log_args_without_log_dir_and_file(self):
@@ -961,6 +1030,29 @@ class TestDhcpAgentEventHandler(base.BaseTestCase):
         self.call_driver.assert_has_calls(
             [mock.call.call_driver('reload_allocations', fake_network)])
 
+    def test_port_events_reload_batched(self):
+        cfg.CONF.set_override('dhcp_reload_delay', 2)
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = fake_port2
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, dict(port=fake_port2))
+            self.dhcp.port_delete_end(None, dict(port_id=fake_port2.id))
+        self.assertFalse(self.call_driver.called)
+        spawn_after.assert_called_once_with(
+            2, self.dhcp._reload_pending_allocations, fake_network.id)
+
+        self.dhcp._reload_pending_allocations(fake_network.id)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+        self.assertFalse(self.dhcp._pending_reloads)
+
+    def test_reload_pending_allocations_network_deleted(self):
+        self.cache.get_network_by_id.return_value = None
+        self.dhcp._pending_reloads.add(fake_network.id)
+        self.dhcp._reload_pending_allocations(fake_network.id)
+        self.assertFalse(self.call_driver.called)
+
     def test_port_delete_end_unknown_port(self):
         payload = dict(port_id='unknown')
         self.cache.get_port_by_id.return_value = None
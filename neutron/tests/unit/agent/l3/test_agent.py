@@ -23,6 +23,7 @@ import mock
 import netaddr
 from oslo_log import log
 import oslo_messaging
+from oslo_serialization import jsonutils
 from testtools import matchers
 
 from neutron.agent.common import config as agent_config
@@ -38,6 +39,7 @@ from neutron.agent.l3 import router_info as l3router
 from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
 from neutron.agent.linux import ra
+from neutron.agent.linux import utils as linux_utils
 from neutron.agent.metadata import driver as metadata_driver
 from neutron.agent import rpc as agent_rpc
 from neutron.callbacks import manager
@@ -45,6 +47,7 @@ from neutron.callbacks import registry
 from neutron.common import config as base_config
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
+from neutron.common import router_sync
 from neutron.i18n import _LE
 from neutron.openstack.common import uuidutils
 from neutron.plugins.common import constants as p_const
@@ -407,6 +410,7 @@ class TestBasicRouterOperations(BasicRouterOperationsFramework):
 
     def test_periodic_sync_routers_task_raise_exception(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.return_value = [_uuid()]
         self.plugin_api.get_routers.side_effect = ValueError
         self.assertRaises(ValueError,
                           agent.periodic_sync_routers_task,
@@ -439,12 +443,101 @@ class TestBasicRouterOperations(BasicRouterOperationsFramework):
                                                  use_call_arg)
             self.assertTrue(agent.agent_state.get('start_flag') is None)
 
+    def test_report_state_router_processing_latency(self):
+        with mock.patch.object(agent_rpc.PluginReportStateAPI,
+                               'report_state') as report_state:
+            agent = l3_agent.L3NATAgentWithStateReport(host=HOSTNAME,
+                                                       conf=self.conf)
+            router_id = _uuid()
+            agent.router_processing_stats.record(router_id, 1)
+            agent._report_state()
+        configurations = report_state.call_args[0][1]['configurations']
+        self.assertEqual(8, configurations['router_processing_workers'])
+        self.assertEqual(1, configurations['router_processing_latency'][
+            'count'])
+        self.assertEqual([router_id],
+                         [router['router_id'] for router in
+                          configurations['slowest_routers']])
+        self.assertEqual(0, configurations['router_queue']['depth'])
+        self.assertIn('execute_latency', configurations)
+
+    def test_report_state_configurations_size(self):
+        # The server stores the configurations in a column of 4095
+        # characters
+        commands = ['ip', 'iptables-save', 'iptables-restore',
+                    'ip6tables-save', 'ip6tables-restore', 'ipset', 'arping',
+                    'sysctl', 'kill', 'keepalived', 'radvd', 'conntrack',
+                    'neutron-ns-metadata-proxy', 'ovs-vsctl', 'ps', 'cat']
+        histogram = linux_utils.ExecuteLatencyHistogram()
+        for i, command in enumerate(commands):
+            for duration in (0.0001, 0.003, 0.02, 0.3, 2.5, 7.123456):
+                histogram.record([command], duration * (i + 1))
+        with mock.patch.object(agent_rpc.PluginReportStateAPI,
+                               'report_state') as report_state,\
+                mock.patch.object(linux_utils, 'execute_latency', histogram):
+            agent = l3_agent.L3NATAgentWithStateReport(host=HOSTNAME,
+                                                       conf=self.conf)
+            for i in range(300):
+                agent.router_processing_stats.record(_uuid(), 0.123456 * i,
+                                                     failed=not i % 7)
+            agent._report_state()
+        configurations = report_state.call_args[0][1]['configurations']
+        self.assertThat(len(jsonutils.dumps(configurations)),
+                        matchers.LessThan(2048))
+
     def test_periodic_sync_routers_task_call_clean_stale_namespaces(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         self.plugin_api.get_routers.return_value = []
         agent.periodic_sync_routers_task(agent.context)
         self.assertFalse(agent.namespaces_manager._clean_stale)
 
+    def _test_fetch_and_sync_all_routers(self, router_ids):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.sync_routers_chunk_size = 2
+        agent._queue = mock.Mock()
+        agent.router_info['stale'] = mock.Mock()
+        self.plugin_api.get_router_ids.return_value = router_ids
+        self.plugin_api.get_routers.side_effect = (
+            lambda context, ids=None: [{'id': id} for id in ids or ['all']])
+        agent.fetch_and_sync_all_routers(agent.context, mock.Mock())
+        self.assertFalse(agent.fullsync)
+        updates = [c[0][0] for c in agent._queue.add.call_args_list]
+        return agent, updates
+
+    def test_fetch_and_sync_all_routers_by_chunks(self):
+        agent, updates = self._test_fetch_and_sync_all_routers(
+            ['r1', 'r2', 'r3'])
+        self.assertEqual([mock.call(agent.context, ['r1', 'r2']),
+                          mock.call(agent.context, ['r3'])],
+                         self.plugin_api.get_routers.call_args_list)
+        self.assertEqual(['r1', 'r2', 'r3', 'stale'],
+                         [update.id for update in updates])
+        self.assertEqual(l3_agent.queue.DELETE_ROUTER, updates[-1].action)
+
+    def test_fetch_and_sync_all_routers_no_router(self):
+        agent, updates = self._test_fetch_and_sync_all_routers([])
+        self.assertFalse(self.plugin_api.get_routers.called)
+        self.assertEqual(['stale'], [update.id for update in updates])
+
+    def test_fetch_and_sync_all_routers_router_ids_unsupported(self):
+        self.plugin_api.get_router_ids.side_effect = (
+            oslo_messaging.UnsupportedVersion('1.7'))
+        agent, updates = self._test_fetch_and_sync_all_routers(None)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context)
+        self.assertEqual(['all', 'stale'], [update.id for update in updates])
+        self.assertFalse(agent._use_router_ids)
+
+    def test_fetch_and_sync_all_routers_timeout_decreases_chunk_size(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_ids.return_value = [_uuid()]
+        self.plugin_api.get_routers.side_effect = (
+            oslo_messaging.MessagingTimeout)
+        for expected in (128, 64, 32, 32):
+            self.assertRaises(n_exc.AbortSyncRouters,
+                              agent.fetch_and_sync_all_routers,
+                              agent.context, mock.Mock())
+            self.assertEqual(expected, agent.sync_routers_chunk_size)
+
     def test_router_info_create(self):
         id = _uuid()
         ri = l3router.RouterInfo(id, {}, **self.ri_kwargs)
@@ -2069,6 +2162,52 @@ class TestBasicRouterOperations(BasicRouterOperationsFramework):
         agent._process_router_update()
         self.assertTrue(agent.fullsync)
 
+    def test_process_routers_update_records_latency(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._process_router_if_compatible = mock.Mock()
+        agent._queue = mock.Mock()
+        update = mock.Mock()
+        update.router = {'id': update.id}
+        agent._queue.each_update_to_next_router.side_effect = [
+            [(mock.Mock(), update)]]
+        with mock.patch('time.time', side_effect=[10, 12.5]):
+            agent._process_router_update()
+        self.assertEqual([{'router_id': update.id, 'max': 2500}],
+                         agent.router_processing_stats.get_slowest_routers())
+        self.assertEqual(
+            0, agent.router_processing_stats.get_stats()['failed'])
+
+    def test_process_routers_update_records_failed_fetch(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.fullsync = False
+        agent._queue = mock.Mock()
+        update = mock.Mock()
+        update.router = None
+        update.action = 0
+        agent._queue.each_update_to_next_router.side_effect = [
+            [(mock.Mock(), update)]]
+        self.plugin_api.get_routers.side_effect = Exception()
+        agent._process_router_update()
+        self.assertTrue(agent.fullsync)
+        self.assertEqual([update.id],
+                         [r['router_id'] for r in
+                          agent.router_processing_stats.get_slowest_routers()])
+        self.assertEqual(
+            1, agent.router_processing_stats.get_stats()['failed'])
+
+    def test_process_routers_update_records_failed_processing(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._process_router_if_compatible = mock.Mock(
+            side_effect=Exception())
+        agent._queue = mock.Mock()
+        update = mock.Mock()
+        update.router = {'id': update.id}
+        agent._queue.each_update_to_next_router.side_effect = [
+            [(mock.Mock(), update)]]
+        agent._process_router_update()
+        self.assertEqual(
+            1, agent.router_processing_stats.get_stats()['failed'])
+
     def test_process_routers_update_router_deleted(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         agent._queue = mock.Mock()
@@ -2086,6 +2225,65 @@ class TestBasicRouterOperations(BasicRouterOperationsFramework):
         router_processor.fetched_and_processed.assert_called_once_with(
             update.timestamp)
 
+    def _test_process_routers_update_known_router(self, router):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._process_router_if_compatible = mock.Mock()
+        agent._queue = mock.Mock()
+        update = mock.Mock()
+        update.id = router['id']
+        update.router = None
+        update.action = 0
+        ri = mock.Mock()
+        ri.router = router
+        agent.router_info[router['id']] = ri
+        agent._queue.each_update_to_next_router.side_effect = [
+            [(mock.Mock(), update)]]
+        agent._process_router_update()
+        return agent
+
+    def test_process_routers_update_known_router_no_changes_by_default(self):
+        router = {'id': _uuid(), 'routes': []}
+        self.plugin_api.get_routers.return_value = [router]
+        agent = self._test_process_routers_update_known_router(router)
+        self.assertFalse(self.plugin_api.get_router_changes.called)
+        self.plugin_api.get_routers.assert_called_once_with(
+            agent.context, [router['id']])
+        agent._process_router_if_compatible.assert_called_once_with(router)
+
+    def test_process_routers_update_known_router_changes(self):
+        self.conf.set_override('incremental_router_sync', True)
+        fip = {'id': _uuid(), 'floating_ip_address': '15.1.2.3'}
+        router = {'id': _uuid(), 'routes': [],
+                  l3_constants.FLOATINGIP_KEY: [],
+                  router_sync.REVISIONS: {'router': 'rev'}}
+        self.plugin_api.get_router_changes.return_value = [
+            {'id': router['id'],
+             l3_constants.FLOATINGIP_KEY: [fip],
+             router_sync.REMOVED: {},
+             router_sync.REVISIONS: {'router': 'new_rev'}}]
+        agent = self._test_process_routers_update_known_router(router)
+        self.plugin_api.get_router_changes.assert_called_once_with(
+            agent.context, {router['id']: {'router': 'rev'}})
+        self.assertFalse(self.plugin_api.get_routers.called)
+        agent._process_router_if_compatible.assert_called_once_with(
+            {'id': router['id'], 'routes': [],
+             l3_constants.FLOATINGIP_KEY: [fip],
+             router_sync.REVISIONS: {'router': 'new_rev'}})
+
+    def test_process_routers_update_known_router_changes_unsupported(self):
+        self.conf.set_override('incremental_router_sync', True)
+        router = {'id': _uuid(), 'routes': []}
+        self.plugin_api.get_router_changes.side_effect = (
+            oslo_messaging.UnsupportedVersion('1.6'))
+        self.plugin_api.get_routers.return_value = [router]
+        agent = self._test_process_routers_update_known_router(router)
+        self.plugin_api.get_router_changes.assert_called_once_with(
+            agent.context, {router['id']: None})
+        self.plugin_api.get_routers.assert_called_once_with(
+            agent.context, [router['id']])
+        agent._process_router_if_compatible.assert_called_once_with(router)
+        self.assertFalse(agent._use_router_changes)
+
     def test_process_router_if_compatible_with_no_ext_net_in_conf(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         self.plugin_api.get_external_network_id.return_value = 'aaa'
@@ -15,6 +15,8 @@
 
 import datetime
 
+import mock
+
 from neutron.agent.l3 import router_processing_queue as l3_queue
 from neutron.openstack.common import uuidutils
 from neutron.tests import base
@@ -100,3 +102,119 @@ class TestExclusiveRouterProcessor(base.BaseTestCase):
             raise Exception("Only the master should process a router")
 
         self.assertEqual(2, len([i for i in master.updates()]))
+
+
+class TestRouterProcessingStats(base.BaseTestCase):
+    def setUp(self):
+        super(TestRouterProcessingStats, self).setUp()
+        self.stats = l3_queue.RouterProcessingStats()
+
+    def test_record(self):
+        self.stats.record(FAKE_ID, 0.2)
+        self.stats.record(FAKE_ID, 0.05, failed=True)
+        self.stats.record(FAKE_ID_2, 120.0004)
+        self.assertEqual([{'router_id': FAKE_ID_2, 'max': 120000},
+                          {'router_id': FAKE_ID, 'max': 200}],
+                         self.stats.get_slowest_routers())
+        stats = self.stats.get_stats()
+        self.assertEqual(3, stats['count'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(120250, stats['total'])
+        self.assertEqual(120000, stats['max'])
+        self.assertEqual(1, stats['buckets']['100'])
+        self.assertEqual(1, stats['buckets']['500'])
+        self.assertEqual(1, stats['buckets']['inf'])
+
+    def test_remove(self):
+        self.stats.record(FAKE_ID, 0.2)
+        self.stats.remove(FAKE_ID)
+        self.stats.remove(FAKE_ID_2)
+        self.assertEqual([], self.stats.get_slowest_routers())
+        self.assertEqual(1, self.stats.get_stats()['count'])
+
+    def test_get_slowest_routers_count(self):
+        for i in range(4):
+            self.stats.record('router%d' % i, i)
+        self.assertEqual(l3_queue.SLOWEST_ROUTERS_COUNT,
+                         len(self.stats.get_slowest_routers()))
+        self.assertEqual(['router3', 'router2'],
+                         [router['router_id'] for router in
+                          self.stats.get_slowest_routers(2)])
+
+
+class TestRouterProcessingQueue(base.BaseTestCase):
+    def setUp(self):
+        super(TestRouterProcessingQueue, self).setUp()
+        self.queue = l3_queue.RouterProcessingQueue()
+        self.now = datetime.datetime.utcnow()
+        # The routers processed are recorded by ExclusiveRouterProcessor
+        self.router_id, self.router_id_2 = _uuid(), _uuid()
+
+    def _update(self, router_id, priority, seconds=0, **kwargs):
+        return l3_queue.RouterUpdate(
+            router_id, priority,
+            timestamp=self.now + datetime.timedelta(seconds=seconds),
+            **kwargs)
+
+    def _next_updates(self):
+        updates = []
+        while self.queue.get_stats()['depth']:
+            for rp, update in self.queue.each_update_to_next_router():
+                updates.append(update)
+        return updates
+
+    def test_priority_lanes(self):
+        sync = l3_queue.PRIORITY_SYNC_ROUTERS_TASK
+        self.queue.add(self._update('sync1', sync))
+        self.queue.add(self._update('sync2', sync))
+        self.queue.add(self._update('rpc2', l3_queue.PRIORITY_RPC, 2))
+        self.queue.add(self._update('rpc1', l3_queue.PRIORITY_RPC, 1))
+        self.assertEqual(4, self.queue.get_stats()['depth'])
+        self.assertEqual(['rpc2', 'rpc1', 'sync1', 'sync2'],
+                         [update.id for update in self._next_updates()])
+
+    def test_coalesce_updates(self):
+        router = {'id': self.router_id}
+        self.queue.add(self._update(self.router_id_2, l3_queue.PRIORITY_RPC))
+        self.queue.add(self._update(self.router_id, l3_queue.PRIORITY_RPC, 1))
+        self.queue.add(self._update(self.router_id, l3_queue.PRIORITY_RPC, 2))
+        self.queue.add(self._update(self.router_id, l3_queue.PRIORITY_RPC, 3,
+                                    action=l3_queue.DELETE_ROUTER))
+        self.queue.add(self._update(self.router_id,
+                                    l3_queue.PRIORITY_SYNC_ROUTERS_TASK, 0,
+                                    router=router))
+        stats = self.queue.get_stats()
+        self.assertEqual(2, stats['depth'])
+        self.assertEqual(3, stats['coalesced'])
+        updates = self._next_updates()
+        self.assertEqual([self.router_id_2, self.router_id],
+                         [update.id for update in updates])
+        # The most recent update wins, with the highest priority
+        self.assertEqual(l3_queue.DELETE_ROUTER, updates[1].action)
+        self.assertIsNone(updates[1].router)
+        self.assertEqual(l3_queue.PRIORITY_RPC, updates[1].priority)
+        self.assertEqual(2, self.queue.get_stats()['dequeued'])
+
+    def test_coalesce_updates_moves_to_higher_priority_lane(self):
+        self.queue.add(self._update(self.router_id_2, l3_queue.PRIORITY_RPC))
+        self.queue.add(self._update(self.router_id,
+                                    l3_queue.PRIORITY_SYNC_ROUTERS_TASK))
+        self.queue.add(self._update(self.router_id, l3_queue.PRIORITY_RPC, 1))
+        self.assertEqual(2, self.queue.get_stats()['depth'])
+        self.assertEqual([(self.router_id_2, l3_queue.PRIORITY_RPC),
+                          (self.router_id, l3_queue.PRIORITY_RPC)],
+                         [(update.id, update.priority)
+                          for update in self._next_updates()])
+        self.assertEqual(0, self.queue.get_stats()['depth'])
+
+    def test_get_stats_wait(self):
+        with mock.patch('time.time', return_value=10):
+            self.queue.add(self._update(self.router_id, l3_queue.PRIORITY_RPC))
+            self.queue.add(self._update(self.router_id_2,
+                                        l3_queue.PRIORITY_RPC))
+        with mock.patch('time.time', return_value=10.0012):
+            self._next_updates()
+        stats = self.queue.get_stats()
+        self.assertEqual(2, stats['dequeued'])
+        self.assertEqual(2, stats['wait_total'])
+        self.assertEqual(1, stats['wait_max'])
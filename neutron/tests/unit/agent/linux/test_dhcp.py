@@ -653,6 +653,9 @@ class TestBase(base.BaseTestCase):
         self.external_process = mock.patch(
             'neutron.agent.linux.external_process.ProcessManager').start()
 
+        mock.patch.object(dhcp.Dnsmasq, '_rendered_files', {}).start()
+        mock.patch.object(dhcp.Dnsmasq, '_port_entries', {}).start()
+
 
 class TestDhcpBase(TestBase):
 
@@ -1348,6 +1351,86 @@ class TestDnsmasq(TestBase):
                 mock.call(exp_opt_name, exp_opt_data),
             ])
 
+    def test_reload_allocations_unchanged(self):
+        test_pm = mock.Mock()
+        dm = self._get_dnsmasq(FakeDualNetwork(), test_pm)
+        with mock.patch('os.path.exists', return_value=True),\
+                mock.patch.object(dhcp.Dnsmasq, '_release_unused_leases'):
+            dm.reload_allocations()
+            self.assertEqual(3, self.safe.call_count)
+            self.assertEqual(1, self.external_process().enable.call_count)
+
+            dm = self._get_dnsmasq(FakeDualNetwork(), test_pm)
+            dm.reload_allocations()
+        self.assertEqual(3, self.safe.call_count)
+        self.assertEqual(1, self.external_process().enable.call_count)
+
+    def test_reload_allocations_port_changed(self):
+        network = FakeDualNetwork()
+        dm = self._get_dnsmasq(network)
+        with mock.patch('os.path.exists', return_value=True),\
+                mock.patch.object(dhcp.Dnsmasq, '_release_unused_leases'):
+            dm.reload_allocations()
+            self.safe.reset_mock()
+            network.ports = network.ports[1:]
+            with mock.patch.object(dm, '_render_port_entries',
+                                   wraps=dm._render_port_entries) as render:
+                dm.reload_allocations()
+        self.assertFalse(render.called)
+        self.assertEqual(
+            [dm.get_conf_file_name('host'),
+             dm.get_conf_file_name('addn_hosts')],
+            [c[0][0] for c in self.safe.call_args_list])
+        self.assertEqual(2, self.external_process().enable.call_count)
+
+    def test_output_config_files_unchanged_on_disk(self):
+        dm = self._get_dnsmasq(FakeDualNetwork())
+        dm._output_config_files()
+        rendered = dict(dm._rendered_files[dm.network.id])
+        dhcp.Dnsmasq._rendered_files.clear()
+        self.safe.reset_mock()
+        with mock.patch('os.path.exists', return_value=True),\
+                mock.patch.object(dhcp.utils, 'get_value_from_file',
+                                  side_effect=rendered.get):
+            self.assertFalse(dm._output_config_files())
+        self.assertFalse(self.safe.called)
+
+    def _test_restore(self, cmdline_matches=True, config_changed=False):
+        mock.patch.object(dhcp.Dnsmasq, 'interface_name', 'tap0').start()
+        dm = self._get_dnsmasq(FakeDualNetwork())
+        pm = self.external_process.return_value
+        cmdline = dm._build_cmdline_callback(pm.get_pid_file_name())
+        pm.cmdline = cmdline if cmdline_matches else cmdline[:-1]
+        with mock.patch.object(dhcp.ip_lib, 'device_exists',
+                               return_value=True),\
+                mock.patch.object(dm, '_output_config_files',
+                                  return_value=config_changed),\
+                mock.patch.object(dm, 'enable') as enable:
+            dm.restore()
+        return dm, enable
+
+    def test_restore_running_dnsmasq(self):
+        dm, enable = self._test_restore()
+        self.assertFalse(enable.called)
+        dm.process_monitor.register.assert_called_once_with(
+            uuid=dm.network.id, service_name=dhcp.DNSMASQ_SERVICE_NAME,
+            monitored_process=self.external_process.return_value)
+
+    def test_restore_cmdline_changed(self):
+        dm, enable = self._test_restore(cmdline_matches=False)
+        enable.assert_called_once_with()
+
+    def test_restore_config_changed(self):
+        dm, enable = self._test_restore(config_changed=True)
+        enable.assert_called_once_with()
+
+    def test_remove_config_files_forgets_rendered_files(self):
+        dm = self._get_dnsmasq(FakeDualNetwork())
+        dm._output_config_files()
+        dm._remove_config_files()
+        self.assertNotIn(dm.network.id, dhcp.Dnsmasq._rendered_files)
+        self.assertNotIn(dm.network.id, dhcp.Dnsmasq._port_entries)
+
     def test_release_unused_leases(self):
         dnsmasq = self._get_dnsmasq(FakeDualNetwork())
 
@@ -269,3 +269,23 @@ class TestProcessManager(base.BaseTestCase):
                 self.assertFalse(manager.active)
 
             mock_open.assert_called_once_with('/proc/4/cmdline', 'r')
+
+    def test_cmdline(self):
+        with mock.patch('__builtin__.open') as mock_open:
+            mock_open.return_value.__enter__ = lambda s: s
+            mock_open.return_value.__exit__ = mock.Mock()
+            mock_open.return_value.read.return_value = \
+                'python\0foo\0--router_id=uuid\0'
+            with mock.patch.object(ep.ProcessManager, 'pid') as pid:
+                pid.__get__ = mock.Mock(return_value=4)
+                manager = ep.ProcessManager(self.conf, 'uuid')
+                self.assertEqual(['python', 'foo', '--router_id=uuid'],
+                                 manager.cmdline)
+
+            mock_open.assert_called_once_with('/proc/4/cmdline', 'r')
+
+    def test_cmdline_none(self):
+        with mock.patch.object(ep.ProcessManager, 'pid') as pid:
+            pid.__get__ = mock.Mock(return_value=None)
+            manager = ep.ProcessManager(self.conf, 'uuid')
+            self.assertIsNone(manager.cmdline)
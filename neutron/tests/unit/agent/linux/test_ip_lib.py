@@ -15,9 +15,12 @@
 
 import mock
 import netaddr
+from oslo_config import cfg
+import socket
 
 from neutron.agent.common import utils  # noqa
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink
 from neutron.common import exceptions
 from neutron.tests import base
 
@@ -518,6 +521,8 @@ class TestIPCmdBase(base.BaseTestCase):
         super(TestIPCmdBase, self).setUp()
         self.parent = mock.Mock()
         self.parent.name = 'eth0'
+        # Use the ip command backend
+        self.parent._netlink_query.return_value = None
 
     def _assert_call(self, options, args):
         self.parent.assert_has_calls([
@@ -979,6 +984,109 @@ class TestIpNeighCommand(TestIPCmdBase):
                            'dev', 'tap0'))
 
 
+class TestNetlinkBackend(base.BaseTestCase):
+    def setUp(self):
+        super(TestNetlinkBackend, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        self.config(ip_lib_backend='netlink')
+        self.execute = mock.patch.object(ip_lib.IPDevice,
+                                         '_execute').start()
+        self.device = ip_lib.IPDevice('eth0', namespace='ns')
+
+    def test_disabled_with_force_root(self):
+        self.config(ip_lib_force_root=True)
+        self.assertFalse(ip_lib.IPDevice('eth0').use_netlink)
+
+    def test_link_attributes(self):
+        link = {'index': 2, 'name': 'eth0', 'type': 'link/ether',
+                'address': 'cc:dd:ee:ff:ab:cd', 'mtu': 1500, 'qlen': 1000,
+                'qdisc': 'mq', 'state': 'UP', 'alias': 'openvswitch'}
+        with mock.patch.object(netlink, 'get_link',
+                               return_value=link) as get_link:
+            self.assertEqual({'link/ether': 'cc:dd:ee:ff:ab:cd',
+                              'mtu': 1500, 'qdisc': 'mq', 'qlen': 1000,
+                              'state': 'UP', 'alias': 'openvswitch'},
+                             self.device.link.attributes)
+            get_link.assert_called_once_with('eth0', namespace='ns')
+        self.assertFalse(self.execute.called)
+
+    def test_device_does_not_exist(self):
+        with mock.patch.object(netlink, 'get_link',
+                               side_effect=netlink.DeviceNotFound(
+                                   device='eth0')):
+            self.assertFalse(ip_lib.device_exists('eth0', namespace='ns'))
+        self.assertFalse(self.execute.called)
+
+    def test_falls_back_to_ip_command(self):
+        self.execute.return_value = LINK_SAMPLE[1]
+        with mock.patch.object(netlink, 'get_link',
+                               side_effect=netlink.NetlinkError(
+                                   reason='EPERM')):
+            self.assertEqual('UP', self.device.link.state)
+        self.execute.assert_called_once_with(
+            ['o'], 'link', ('show', 'eth0'), run_as_root=True,
+            namespace='ns', log_fail_as_error=True)
+
+    def test_namespace_restore_error_is_not_a_fallback(self):
+        with mock.patch.object(netlink, 'get_link',
+                               side_effect=netlink.NamespaceRestoreError(
+                                   namespace='ns', reason='EPERM')):
+            self.assertRaises(netlink.NamespaceRestoreError,
+                              getattr, self.device.link, 'state')
+        self.assertFalse(self.execute.called)
+
+    def test_get_devices(self):
+        links = [{'name': 'lo'}, {'name': 'eth0'}]
+        with mock.patch.object(netlink, 'get_links', return_value=links):
+            devices = ip_lib.IPWrapper(namespace='ns').get_devices(
+                exclude_loopback=True)
+        self.assertEqual([ip_lib.IPDevice('eth0', namespace='ns')], devices)
+
+    def test_addr_list(self):
+        addresses = [
+            {'cidr': '172.16.77.240/24', 'scope': 'global', 'dynamic': False},
+            {'cidr': '2001:470:9:1224:5595:dd51:6ba2:e788/64',
+             'scope': 'global', 'dynamic': True},
+            {'cidr': 'fe80::dfcc:aaff:feb9:76ce/64', 'scope': 'link',
+             'dynamic': False}]
+        with mock.patch.object(netlink, 'get_addresses',
+                               return_value=addresses) as get_addresses:
+            self.assertEqual(addresses, self.device.addr.list())
+            self.assertEqual(addresses[:1], self.device.addr.list(
+                scope='global', filters=['permanent']))
+            self.assertEqual(addresses[:1], self.device.addr.list(
+                to='172.16.77.0/24'))
+            self.device.addr.list(ip_version=6)
+        get_addresses.assert_called_with('eth0', family=socket.AF_INET6,
+                                         namespace='ns')
+        self.assertFalse(self.execute.called)
+
+    def test_get_gateway(self):
+        routes = [{'dst': '10.0.0.0/24', 'gateway': None, 'metric': None,
+                   'scope': 'link'},
+                  {'dst': 'default', 'gateway': '10.0.0.1', 'metric': 100,
+                   'scope': 'global'}]
+        with mock.patch.object(netlink, 'get_routes',
+                               return_value=routes) as get_routes:
+            self.assertEqual({'gateway': '10.0.0.1', 'metric': 100},
+                             self.device.route.get_gateway())
+            self.assertIsNone(self.device.route.get_gateway(scope='link'))
+        get_routes.assert_called_with('eth0', family=socket.AF_INET,
+                                      namespace='ns')
+        self.assertFalse(self.execute.called)
+
+    def test_neigh_show(self):
+        neighbours = [{'dst': '10.0.0.1', 'lladdr': 'cc:dd:ee:ff:ab:cd',
+                       'state': 'PERMANENT'},
+                      {'dst': '10.0.0.2', 'lladdr': None,
+                       'state': 'FAILED'}]
+        with mock.patch.object(netlink, 'get_neighbours',
+                               return_value=neighbours):
+            self.assertEqual('10.0.0.1 lladdr cc:dd:ee:ff:ab:cd PERMANENT\n'
+                             '10.0.0.2 FAILED\n',
+                             self.device.neigh.show())
+
+
 class TestArpPing(TestIPCmdBase):
     def _test_arping(self, function, address, spawn_n, mIPWrapper):
         spawn_n.side_effect = lambda f: f()
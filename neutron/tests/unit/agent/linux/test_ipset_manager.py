@@ -131,3 +131,64 @@ class IpsetManagerTestCase(BaseIpsetManagerTest):
         self.expect_destroy()
         self.ipset.destroy(TEST_SET_ID, ETHERTYPE)
         self.verify_mock_calls()
+
+
+class IpsetManagerDeferredTestCase(BaseIpsetManagerTest):
+
+    def setUp(self):
+        super(IpsetManagerDeferredTestCase, self).setUp()
+        self.expected_calls = []
+
+    def expect_restore(self, lines):
+        self.expected_calls.append(
+            mock.call(['ipset', 'restore', '-exist'],
+                      process_input='\n'.join(lines),
+                      run_as_root=True))
+
+    def test_set_members_deferred(self):
+        self.ipset.defer_apply_on()
+        self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:1])
+        self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:2])
+        self.assertTrue(self.ipset.set_exists(TEST_SET_ID, ETHERTYPE))
+        self.assertFalse(self.execute.called)
+        self.ipset.defer_apply_off()
+        self.expect_restore([
+            'create %s hash:net family inet' % TEST_SET_NAME,
+            'create %s hash:net family inet' % TEST_SET_NAME_NEW,
+            'add %s %s' % (TEST_SET_NAME_NEW, FAKE_IPS[0]),
+            'swap %s %s' % (TEST_SET_NAME_NEW, TEST_SET_NAME),
+            'destroy %s' % TEST_SET_NAME_NEW,
+            'add %s %s' % (TEST_SET_NAME, FAKE_IPS[1])])
+        self.assertEqual(self.expected_calls, self.execute.call_args_list)
+
+    def test_defer_apply_context(self):
+        with self.ipset.defer_apply():
+            self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:1])
+            self.assertFalse(self.execute.called)
+        self.assertEqual(1, self.execute.call_count)
+
+    def test_defer_apply_off_without_changes(self):
+        self.ipset.defer_apply_on()
+        self.ipset.defer_apply_off()
+        self.assertFalse(self.execute.called)
+
+    def test_destroy_flushes_deferred_changes(self):
+        self.ipset.defer_apply_on()
+        self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:1])
+        self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:2])
+        self.ipset.destroy(TEST_SET_ID, ETHERTYPE)
+        self.assertEqual(2, self.execute.call_count)
+        self.expect_destroy()
+        self.assertEqual(self.expected_calls[-1],
+                         self.execute.call_args_list[-1])
+        self.assertFalse(self.ipset.set_exists(TEST_SET_ID, ETHERTYPE))
+        self.ipset.defer_apply_off()
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_defer_apply_off_failure_forgets_sets(self):
+        self.execute.side_effect = RuntimeError()
+        self.ipset.defer_apply_on()
+        self.ipset.set_members(TEST_SET_ID, ETHERTYPE, FAKE_IPS[0:1])
+        self.assertRaises(RuntimeError, self.ipset.defer_apply_off)
+        self.assertFalse(self.ipset.set_exists(TEST_SET_ID, ETHERTYPE))
+        self.assertFalse(self.ipset.ipset_apply_deferred)
@@ -1407,6 +1407,141 @@ class IptablesFirewallTestCase(BaseIptablesFirewallTestCase):
                  mock.call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
 
+    def test_update_security_group_member_deltas_without_ipset(self):
+        self.firewall.enable_ipset = False
+        self.firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.1']})
+        self.assertTrue(self.firewall.update_security_group_member_deltas(
+            'fake_sgid', {'IPv6': {'added': ['fe80::1'], 'removed': []}}))
+        self.assertEqual({'IPv4': ['10.0.0.1'], 'IPv6': ['fe80::1']},
+                         self.firewall.sg_members['fake_sgid'])
+
+
+class IptablesFirewallSgRuleFragmentTestCase(BaseIptablesFirewallTestCase):
+
+    def setUp(self):
+        super(IptablesFirewallSgRuleFragmentTestCase, self).setUp()
+        self.firewall.update_security_group_rules(
+            FAKE_SGID, [{'direction': 'ingress', 'ethertype': _IPv4,
+                         'protocol': 'tcp', 'port_range_min': 22,
+                         'port_range_max': 22}])
+        mock.patch.object(self.firewall, '_generate_plain_rule_args',
+                          wraps=self.firewall._generate_plain_rule_args
+                          ).start()
+
+    def _fake_port(self, device):
+        return {'device': device,
+                'mac_address': 'ff:ff:ff:ff:ff:ff',
+                'fixed_ips': [FAKE_IP['IPv4']],
+                'security_groups': [FAKE_SGID]}
+
+    def _get_ingress_rules(self, device):
+        chain = 'i%s' % device[3:]
+        return [c[1][1] for c in self.v4filter_inst.add_rule.mock_calls
+                if c[1][0] == chain]
+
+    def test_fragment_shared_by_ports(self):
+        self.firewall.prepare_port_filter(self._fake_port('tapfake_dev1'))
+        self.firewall.prepare_port_filter(self._fake_port('tapfake_dev2'))
+        self.assertEqual(1,
+                         self.firewall._generate_plain_rule_args.call_count)
+        for device in ('tapfake_dev1', 'tapfake_dev2'):
+            self.assertIn('-p tcp -m tcp --dport 22 -j RETURN',
+                          self._get_ingress_rules(device))
+
+    def test_fragment_invalidated_on_rules_update(self):
+        self.firewall.prepare_port_filter(self._fake_port('tapfake_dev1'))
+        self.firewall.update_security_group_rules(
+            FAKE_SGID, [{'direction': 'ingress', 'ethertype': _IPv4,
+                         'protocol': 'udp', 'port_range_min': 53,
+                         'port_range_max': 53}])
+        self.v4filter_inst.reset_mock()
+        self.firewall.prepare_port_filter(self._fake_port('tapfake_dev2'))
+        rules = self._get_ingress_rules('tapfake_dev2')
+        self.assertIn('-p udp -m udp --dport 53 -j RETURN', rules)
+        self.assertNotIn('-p tcp -m tcp --dport 22 -j RETURN', rules)
+
+    def test_remote_group_rule_converted_per_port(self):
+        cfg.CONF.set_override('enable_ipset', False, 'SECURITYGROUP')
+        self.firewall.enable_ipset = False
+        self.firewall.update_security_group_rules(
+            FAKE_SGID, [{'direction': 'ingress', 'ethertype': _IPv4,
+                         'remote_group_id': FAKE_SGID}])
+        self.firewall.update_security_group_members(
+            FAKE_SGID, {_IPv4: ['10.0.0.1', '10.0.0.2']})
+        port = self._fake_port('tapfake_dev1')
+        self.firewall.prepare_port_filter(port)
+        rules = self._get_ingress_rules('tapfake_dev1')
+        self.assertIn('-s 10.0.0.2/32 -j RETURN', rules)
+        self.assertNotIn('-s 10.0.0.1/32 -j RETURN', rules)
+
+
+class IptablesFirewallSharedSgChainsTestCase(BaseIptablesFirewallTestCase):
+
+    def setUp(self):
+        super(IptablesFirewallSharedSgChainsTestCase, self).setUp()
+        cfg.CONF.set_override('shared_security_group_chains', True,
+                              'SECURITYGROUP')
+        self.firewall = iptables_firewall.IptablesFirewallDriver()
+        self.firewall.iptables = self.iptables_inst
+        self.firewall.update_security_group_rules(
+            FAKE_SGID, [{'direction': 'ingress', 'ethertype': _IPv4,
+                         'protocol': 'tcp', 'port_range_min': 22,
+                         'port_range_max': 22}])
+        self.shared_chain = self.firewall._shared_sg_chain_name(
+            {'security_groups': [FAKE_SGID]}, 'ingress')
+
+    def _fake_port(self, device):
+        return {'device': device,
+                'mac_address': 'ff:ff:ff:ff:ff:ff',
+                'fixed_ips': [FAKE_IP['IPv4']],
+                'security_groups': [FAKE_SGID]}
+
+    def _get_rules(self, chain):
+        return [c[1][1] for c in self.v4filter_inst.add_rule.mock_calls
+                if c[1][0] == chain]
+
+    def test_shared_chain_name(self):
+        self.assertTrue(self.shared_chain.startswith('gi'))
+        self.assertEqual(11, len(self.shared_chain))
+        self.assertEqual(
+            self.firewall._shared_sg_chain_name(
+                {'security_groups': ['sg2', 'sg1', 'sg1']}, 'egress'),
+            self.firewall._shared_sg_chain_name(
+                {'security_groups': ['sg1', 'sg2']}, 'egress'))
+
+    def test_ports_share_security_group_chain(self):
+        with self.firewall.defer_apply():
+            self.firewall.prepare_port_filter(self._fake_port('tapfake_dev1'))
+            self.firewall.prepare_port_filter(self._fake_port('tapfake_dev2'))
+
+        self.assertEqual(
+            1, self.v4filter_inst.add_chain.mock_calls.count(
+                mock.call(self.shared_chain)))
+        self.assertEqual(['-p tcp -m tcp --dport 22 -j RETURN',
+                          '-j $sg-fallback'],
+                         self._get_rules(self.shared_chain))
+        for chain in ('ifake_dev1', 'ifake_dev2'):
+            rules = self._get_rules(chain)
+            self.assertEqual('-g $%s' % self.shared_chain, rules[-1])
+            self.assertNotIn('-p tcp -m tcp --dport 22 -j RETURN', rules)
+
+    def test_remove_port_filter_removes_shared_chain(self):
+        port = self._fake_port('tapfake_dev1')
+        self.firewall.prepare_port_filter(port)
+        self.v4filter_inst.reset_mock()
+        self.firewall.remove_port_filter(port)
+        self.v4filter_inst.remove_chain.assert_any_call(self.shared_chain)
+        self.assertNotIn(mock.call(self.shared_chain),
+                         self.v4filter_inst.add_chain.mock_calls)
+
+    def test_port_without_security_group(self):
+        port = self._fake_port('tapfake_dev1')
+        port['security_groups'] = []
+        self.firewall.prepare_port_filter(port)
+        self.assertEqual('-j $sg-fallback',
+                         self._get_rules('ifake_dev1')[-1])
+
 
 class IptablesFirewallEnhancedIpsetTestCase(BaseIptablesFirewallTestCase):
     def setUp(self):
@@ -1456,6 +1591,25 @@ class IptablesFirewallEnhancedIpsetTestCase(BaseIptablesFirewallTestCase):
         ]
         self.firewall.ipset.assert_has_calls(calls)
 
+    def test_update_security_group_member_deltas(self):
+        self.firewall.sg_members[FAKE_SGID] = {'IPv4': ['10.0.0.1',
+                                                        '10.0.0.2']}
+        self.assertFalse(self.firewall.update_security_group_member_deltas(
+            FAKE_SGID, {'IPv4': {'added': ['10.0.0.3', '10.0.0.1'],
+                                 'removed': ['10.0.0.2']}}))
+        self.assertEqual(['10.0.0.1', '10.0.0.3'],
+                         self.firewall.sg_members[FAKE_SGID]['IPv4'])
+        self.firewall.ipset.set_members.assert_called_once_with(
+            FAKE_SGID, 'IPv4', ['10.0.0.1', '10.0.0.3'])
+
+    def test_update_security_group_member_deltas_without_set(self):
+        self.firewall.ipset.set_exists.return_value = False
+        self.assertTrue(self.firewall.update_security_group_member_deltas(
+            FAKE_SGID, {'IPv4': {'added': ['10.0.0.3'], 'removed': []}}))
+        self.assertFalse(self.firewall.ipset.set_members.called)
+        self.assertFalse(self.firewall.update_security_group_member_deltas(
+            OTHER_SGID, {'IPv4': {'added': [], 'removed': ['10.0.0.3']}}))
+
     def _setup_fake_firewall_members_and_rules(self, firewall):
         firewall.sg_rules = self._fake_sg_rules()
         firewall.pre_sg_rules = self._fake_sg_rules()
@@ -1612,6 +1766,8 @@ class IptablesFirewallEnhancedIpsetTestCase(BaseIptablesFirewallTestCase):
             mock.call.set_exists('fake_sgid', 'IPv4'),
             mock.call.get_name('fake_sgid', 'IPv6'),
             mock.call.set_exists('fake_sgid', 'IPv6'),
+            mock.call.defer_apply_on(),
+            mock.call.defer_apply_off(),
             mock.call.destroy('fake_sgid', 'IPv4'),
             mock.call.destroy('fake_sgid', 'IPv6')]
 
@@ -195,6 +195,72 @@ class IptablesCommentsTestCase(base.BaseTestCase):
         tools.verify_mock_calls(self.execute, expected_calls_and_values)
 
 
+class IptablesTableTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesTableTestCase, self).setUp()
+        self.table = iptables_manager.IptablesTable(binary_name='bn')
+        self.table.add_chain('INPUT')
+        self.table.add_chain('foo')
+        self.table.add_chain('foobar')
+
+    def _get_rules(self):
+        return [(rule.chain, rule.rule) for rule in self.table.rules]
+
+    def test_rules_keep_insertion_order(self):
+        self.table.add_rule('foo', '-j DROP')
+        self.table.add_rule('INPUT', '-j $foo')
+        self.table.add_rule('foo', '-j ACCEPT')
+        self.assertEqual([('foo', '-j DROP'), ('INPUT', '-j bn-foo'),
+                          ('foo', '-j ACCEPT')], self._get_rules())
+        self.assertEqual(['-j DROP', '-j ACCEPT'],
+                         [rule.rule for rule in
+                          self.table._get_chain_rules('foo', True)])
+
+    def test_remove_rule_removes_first_duplicate(self):
+        self.table.add_rule('INPUT', '-j DROP', tag='first')
+        self.table.add_rule('INPUT', '-j ACCEPT')
+        self.table.add_rule('INPUT', '-j DROP', tag='second')
+        self.table.remove_rule('INPUT', '-j DROP')
+        self.assertEqual([('INPUT', '-j ACCEPT'), ('INPUT', '-j DROP')],
+                         self._get_rules())
+        self.assertEqual('second', self.table.rules[1].tag)
+
+    def test_remove_chain_removes_jumps_to_it_only(self):
+        self.table.add_rule('foo', '-j DROP')
+        self.table.add_rule('INPUT', '-j $foo')
+        self.table.add_rule('INPUT', '-j $foobar')
+        self.table.remove_chain('foo')
+        self.assertEqual([('INPUT', '-j bn-foobar')], self._get_rules())
+
+    def test_remove_unwrapped_chain(self):
+        self.table.add_chain('shared', wrap=False)
+        self.table.add_rule('shared', '-j DROP', wrap=False)
+        self.table.add_rule('FORWARD', '-j shared', wrap=False)
+        self.table.add_rule('foo', '-j DROP')
+        self.table.remove_chain('shared', wrap=False)
+        self.assertEqual([('foo', '-j DROP')], self._get_rules())
+        self.assertEqual(set(['shared']), self.table.remove_chains)
+        self.assertEqual([('shared', '-j DROP'), ('FORWARD', '-j shared')],
+                         [(r.chain, r.rule) for r in self.table.remove_rules])
+
+    def test_clear_rules_by_tag(self):
+        self.table.add_rule('INPUT', '-s 10.0.0.1 -j DROP', tag='port1')
+        self.table.add_rule('foo', '-s 10.0.0.2 -j DROP', tag='port2')
+        self.table.add_rule('foo', '-s 10.0.0.3 -j DROP', tag='port1')
+        self.table.clear_rules_by_tag('port1')
+        self.assertEqual([('foo', '-s 10.0.0.2 -j DROP')], self._get_rules())
+        self.assertNotIn('port1', self.table._rules_by_tag)
+
+    def test_empty_chain(self):
+        self.table.add_rule('foo', '-j DROP')
+        self.table.add_rule('INPUT', '-j $foo')
+        self.table.add_rule('foo', '-j ACCEPT')
+        self.table.empty_chain('foo')
+        self.assertEqual([('INPUT', '-j bn-foo')], self._get_rules())
+        self.assertNotIn('foo', self.table._rules_by_chain)
+
+
 def _generate_mangle_dump(iptables_args):
     return ('# Generated by iptables_manager\n'
             '*mangle\n'
@@ -994,17 +1060,30 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
                        ':%(wrap)s - [0:0]',
                        ':%(bn)s-OUTPUT - [0:0]',
                        '[0:0] -A FORWARD -j neutron-filter-top',
-                       '[0:0] -A OUTPUT -j neutron-filter-top'
+                       '[0:0] -A OUTPUT -j neutron-filter-top',
+                       '[1:10] -A OUTPUT -j neutron-filter-top'
                        % IPTABLES_ARG]
 
-        return self.iptables._find_last_entry(filter_list, find_str)
+        filter_map = self.iptables._make_filter_map(filter_list)
+        return self.iptables._find_last_entry(filter_map, find_str)
 
     def test_find_last_entry_old_dup(self):
-        find_str = 'neutron-filter-top'
-        match_str = '[0:0] -A OUTPUT -j neutron-filter-top'
+        find_str = '-A OUTPUT -j neutron-filter-top'
+        match_str = '[1:10] -A OUTPUT -j neutron-filter-top'
         ret_str = self._test_find_last_entry(find_str)
         self.assertEqual(ret_str, match_str)
 
+    def test_find_last_entry_chain(self):
+        find_str = ':neutron-filter-top'
+        match_str = ':neutron-filter-top - [0:0]'
+        ret_str = self._test_find_last_entry(find_str)
+        self.assertEqual(ret_str, match_str)
+
+    def test_find_last_entry_no_partial_match(self):
+        find_str = 'neutron-filter-top'
+        ret_str = self._test_find_last_entry(find_str)
+        self.assertIsNone(ret_str)
+
     def test_find_last_entry_none(self):
         find_str = 'neutron-filter-NOTFOUND'
         ret_str = self._test_find_last_entry(find_str)
@@ -1024,3 +1103,105 @@ class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def test_mangle_not_found(self):
         self.assertNotIn('mangle', self.iptables.ipv4)
+
+
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        cfg.CONF.register_opts(a_cfg.IPTABLES_OPTS, 'AGENT')
+        cfg.CONF.set_override('comment_iptables_rules', False, 'AGENT')
+        cfg.CONF.set_override('iptables_incremental_apply', True, 'AGENT')
+        self.iptables = iptables_manager.IptablesManager(state_less=True)
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+        self.execute.return_value = ''
+        # the first apply always saves and restores the full tables
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+    def _assert_restored_incrementally(self, statements):
+        self.execute.assert_called_once_with(
+            ['iptables-restore', '-n'],
+            process_input='\n'.join(
+                ['*filter'] + statements + ['COMMIT']) + '\n',
+            run_as_root=True)
+
+    def _assert_restored_fully(self):
+        self.assertEqual(
+            [mock.call(['iptables-save', '-c'], run_as_root=True),
+             mock.call(['iptables-restore', '-c'], process_input=mock.ANY,
+                       run_as_root=True)],
+            self.execute.call_args_list)
+
+    def test_apply_without_changes(self):
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+
+    def test_apply_added_chain_and_rules(self):
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-s 0/0 -j $filter')
+        self.iptables.apply()
+        self._assert_restored_incrementally(
+            [':%(bn)s-filter - [0:0]' % IPTABLES_ARG,
+             '-I %(bn)s-INPUT 1 -s 0/0 -j %(bn)s-filter' % IPTABLES_ARG,
+             '-I %(bn)s-filter 1 -j DROP' % IPTABLES_ARG])
+
+    def test_apply_removed_chain(self):
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-s 0/0 -j $filter')
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        self.iptables.ipv4['filter'].remove_chain('filter')
+        self.iptables.apply()
+        self._assert_restored_incrementally(
+            ['-D %(bn)s-INPUT -s 0/0 -j %(bn)s-filter' % IPTABLES_ARG,
+             '-F %(bn)s-filter' % IPTABLES_ARG,
+             '-X %(bn)s-filter' % IPTABLES_ARG])
+
+    def test_apply_rules_in_the_middle_of_a_chain(self):
+        table = self.iptables.ipv4['filter']
+        for rule in ('-s 10.0.0.1 -j DROP', '-s 10.0.0.2 -j DROP',
+                     '-s 10.0.0.3 -j DROP'):
+            table.add_rule('INPUT', rule)
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        table.remove_rule('INPUT', '-s 10.0.0.2 -j DROP')
+        table.add_rule('INPUT', '-s 10.0.0.4 -j DROP')
+        table.add_rule('INPUT', '-s 10.0.0.0/24 -j ACCEPT', top=True)
+        self.iptables.apply()
+        self._assert_restored_incrementally(
+            ['-D %(bn)s-INPUT -s 10.0.0.2 -j DROP' % IPTABLES_ARG,
+             '-I %(bn)s-INPUT 1 -s 10.0.0.0/24 -j ACCEPT' % IPTABLES_ARG,
+             '-I %(bn)s-INPUT 4 -s 10.0.0.4 -j DROP' % IPTABLES_ARG])
+
+    def test_apply_unwrapped_changes_fully(self):
+        self.iptables.ipv4['filter'].add_rule('neutron-filter-top',
+                                              '-j DROP', wrap=False)
+        self.iptables.apply()
+        self._assert_restored_fully()
+
+    def test_apply_fully_after_incremental_failure(self):
+        self.execute.side_effect = [RuntimeError(), '', '']
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j DROP')
+        self.iptables.apply()
+        self.assertEqual(3, self.execute.call_count)
+        self.assertEqual(['iptables-save', '-c'],
+                         self.execute.call_args_list[1][0][0])
+
+    def test_apply_fully_after_resync_interval(self):
+        cfg.CONF.set_override('iptables_full_resync_interval', 10, 'AGENT')
+        self.iptables._last_full_apply -= 11
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j DROP')
+        self.iptables.apply()
+        self._assert_restored_fully()
+
+    def test_generate_chain_diff_iptables_commands(self):
+        statements = iptables_manager._generate_chain_diff_iptables_commands(
+            'chain', ['a', 'b', 'c', 'd'], ['a', 'x', 'y', 'd', 'e'])
+        self.assertEqual(['-D chain b', '-D chain c',
+                          '-I chain 2 x', '-I chain 3 y',
+                          '-I chain 5 e'], statements)
@@ -0,0 +1,177 @@
+# Copyright 2015 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import itertools
+import socket
+import struct
+
+import mock
+
+from neutron.agent.linux import netlink
+from neutron.tests import base
+
+
+def _message(msg_type, seq, body, flags=netlink.NLM_F_MULTI):
+    return (netlink.NLMSGHDR.pack(netlink.NLMSGHDR.size + len(body),
+                                  msg_type, flags, seq, 0) + body)
+
+
+def _done(seq):
+    return _message(netlink.NLMSG_DONE, seq, struct.pack('=i', 0))
+
+
+def _error(seq, error):
+    return _message(netlink.NLMSG_ERROR, seq,
+                    struct.pack('=i', -error) + '\0' * 16, flags=0)
+
+
+def _link(index, name, mac):
+    return (netlink.IFINFOMSG.pack(socket.AF_UNSPEC, 1, index, 0, 0) +
+            netlink._pack_attr(netlink.IFLA_IFNAME, name + '\0') +
+            netlink._pack_attr(netlink.IFLA_ADDRESS,
+                               ''.join(chr(int(b, 16))
+                                       for b in mac.split(':'))) +
+            netlink._pack_attr(netlink.IFLA_MTU, struct.pack('=I', 1500)) +
+            netlink._pack_attr(netlink.IFLA_QDISC, 'mq\0') +
+            netlink._pack_attr(netlink.IFLA_OPERSTATE, chr(6)))
+
+
+def _addr(index, family, address, prefixlen, scope=0, flags=0):
+    return (netlink.IFADDRMSG.pack(family, prefixlen, flags, scope, index) +
+            netlink._pack_attr(netlink.IFA_ADDRESS,
+                               socket.inet_pton(family, address)))
+
+
+def _route(index, gateway=None, dst=None, dst_len=0):
+    body = (netlink.RTMSG.pack(socket.AF_INET, dst_len, 0, 0,
+                               netlink.RT_TABLE_MAIN, 0, 0,
+                               netlink.RTN_UNICAST, 0) +
+            netlink._pack_attr(netlink.RTA_OIF, struct.pack('=i', index)))
+    if dst:
+        body += netlink._pack_attr(netlink.RTA_DST,
+                                   socket.inet_pton(socket.AF_INET, dst))
+    if gateway:
+        body += netlink._pack_attr(netlink.RTA_GATEWAY,
+                                   socket.inet_pton(socket.AF_INET, gateway))
+    return body
+
+
+class TestNetlink(base.BaseTestCase):
+    def setUp(self):
+        super(TestNetlink, self).setUp()
+        self.sock = mock.Mock()
+        self.socket_p = mock.patch.object(netlink, '_create_socket',
+                                          return_value=self.sock)
+        self.socket = self.socket_p.start()
+        # The requests are numbered from 1
+        mock.patch.object(netlink, '_sequence', itertools.count(1)).start()
+        self.replies = []
+        self.sock.recv.side_effect = lambda size: self.replies.pop(0)
+
+    def _reply_link(self, index=2, name='eth0', mac='cc:dd:ee:ff:ab:cd'):
+        self.replies.append(_message(netlink.RTM_NEWLINK, 1,
+                                     _link(index, name, mac), flags=0))
+
+    def test_get_link(self):
+        self._reply_link()
+        self.assertEqual({'index': 2, 'name': 'eth0', 'type': 'link/ether',
+                          'address': 'cc:dd:ee:ff:ab:cd', 'mtu': 1500,
+                          'qdisc': 'mq', 'state': 'UP'},
+                         netlink.get_link('eth0', namespace='ns'))
+        self.socket.assert_called_once_with('ns')
+        self.sock.bind.assert_called_once_with((0, 0))
+        self.assertTrue(self.sock.close.called)
+
+    def test_get_link_not_found(self):
+        self.replies.append(_error(1, errno.ENODEV))
+        self.assertRaises(netlink.DeviceNotFound,
+                          netlink.get_link, 'eth0')
+
+    def test_get_links_multipart(self):
+        self.replies = [
+            _message(netlink.RTM_NEWLINK, 1, _link(1, 'lo', '0:0:0:0:0:0')),
+            (_message(netlink.RTM_NEWLINK, 1, _link(2, 'eth0', '1:2:3:4:5:6'))
+             + _done(1))]
+        self.assertEqual(['lo', 'eth0'],
+                         [l['name'] for l in netlink.get_links()])
+
+    def test_get_links_error(self):
+        self.replies.append(_error(1, errno.EPERM))
+        self.assertRaises(netlink.NetlinkError, netlink.get_links)
+
+    def test_get_addresses(self):
+        self._reply_link()
+        self.replies.append(
+            _message(netlink.RTM_NEWADDR, 2,
+                     _addr(1, socket.AF_INET, '127.0.0.1', 8, scope=254)) +
+            _message(netlink.RTM_NEWADDR, 2,
+                     _addr(2, socket.AF_INET, '10.0.0.2', 24,
+                           flags=netlink.IFA_F_PERMANENT)) +
+            _message(netlink.RTM_NEWADDR, 2,
+                     _addr(2, socket.AF_INET6, 'fe80::1', 64, scope=253)) +
+            _done(2))
+        self.assertEqual(
+            [{'index': 2, 'family': socket.AF_INET, 'cidr': '10.0.0.2/24',
+              'scope': 'global', 'dynamic': False},
+             {'index': 2, 'family': socket.AF_INET6, 'cidr': 'fe80::1/64',
+              'scope': 'link', 'dynamic': True}],
+            netlink.get_addresses('eth0'))
+
+    def test_get_routes(self):
+        self._reply_link()
+        self.replies.append(
+            _message(netlink.RTM_NEWROUTE, 2, _route(2, gateway='10.0.0.1')) +
+            _message(netlink.RTM_NEWROUTE, 2, _route(3, gateway='10.1.0.1')) +
+            _message(netlink.RTM_NEWROUTE, 2,
+                     _route(2, dst='10.0.0.0', dst_len=24)) +
+            _done(2))
+        routes = netlink.get_routes('eth0')
+        self.assertEqual([('default', '10.0.0.1'), ('10.0.0.0/24', None)],
+                         [(r['dst'], r['gateway']) for r in routes])
+
+    def test_create_socket_namespace_not_found(self):
+        self.socket_p.stop()
+        with mock.patch.object(netlink, 'open', create=True,
+                               side_effect=[mock.Mock(), IOError()]):
+            self.assertRaises(netlink.NetlinkError,
+                              netlink._create_socket, 'ns')
+
+    def test_create_socket_namespace_restored(self):
+        self.socket_p.stop()
+        own_ns, target_ns = mock.Mock(), mock.Mock()
+        with mock.patch.object(netlink, 'open', create=True,
+                               side_effect=[own_ns, target_ns]),\
+                mock.patch.object(netlink, '_setns') as setns,\
+                mock.patch('socket.socket', side_effect=socket.error):
+            self.assertRaises(socket.error, netlink._create_socket, 'ns')
+        self.assertEqual([mock.call(target_ns.fileno.return_value),
+                          mock.call(own_ns.fileno.return_value)],
+                         setns.call_args_list)
+        self.assertTrue(own_ns.close.called)
+        self.assertTrue(target_ns.close.called)
+
+    def test_create_socket_namespace_not_restored(self):
+        self.socket_p.stop()
+        sock = mock.Mock()
+        with mock.patch.object(netlink, 'open', create=True,
+                               side_effect=[mock.Mock(), mock.Mock()]),\
+                mock.patch.object(netlink, '_setns',
+                                  side_effect=[None, netlink.NetlinkError(
+                                      reason='EPERM')]),\
+                mock.patch('socket.socket', return_value=sock):
+            self.assertRaises(netlink.NamespaceRestoreError,
+                              netlink._create_socket, 'ns')
+        self.assertTrue(sock.close.called)
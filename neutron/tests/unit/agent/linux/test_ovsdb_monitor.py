@@ -14,6 +14,7 @@
 
 import eventlet.event
 import mock
+from oslo_serialization import jsonutils
 
 from neutron.agent.linux import ovsdb_monitor
 from neutron.tests import base
@@ -97,3 +98,83 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+    def test__kill_sets_events_complete_to_false(self):
+        self.monitor.events_complete = True
+        with mock.patch(
+                'neutron.agent.linux.ovsdb_monitor.OvsdbMonitor._kill'):
+            self.monitor._kill()
+        self.assertFalse(self.monitor.events_complete)
+
+
+class TestSimpleInterfaceMonitorEvents(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestSimpleInterfaceMonitorEvents, self).setUp()
+        self.monitor = ovsdb_monitor.SimpleInterfaceMonitor()
+        mock.patch('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
+                   '.is_active',
+                   new_callable=mock.PropertyMock(return_value=True)).start()
+        self.output = []
+        mock.patch.object(self.monitor, 'iter_stdout',
+                          side_effect=self._iter_stdout).start()
+
+    def _iter_stdout(self):
+        output, self.output = self.output, []
+        return iter(output)
+
+    def _add_output(self, *rows):
+        self.output.append(jsonutils.dumps(
+            {'headings': ['row', 'action', 'name', 'ofport', 'external_ids'],
+             'data': rows}))
+
+    def _row(self, action, name, ofport=1, iface_id=None):
+        external_ids = [['attached-mac', 'fa:16:3e:00:00:01']]
+        if iface_id:
+            external_ids.append(['iface-id', iface_id])
+        return ['uuid-%s' % name, action, name, ofport,
+                ['map', external_ids]]
+
+    def test_get_events_is_none_after_initial_rows(self):
+        self.monitor.events_complete = True
+        self._add_output(self._row('initial', 'tap1', iface_id='port1'))
+        self.assertIsNone(self.monitor.get_events())
+        self.assertEqual({'added': [], 'removed': [], 'modified': []},
+                         self.monitor.get_events())
+
+    def test_get_events_is_none_if_not_active(self):
+        self.monitor.events_complete = True
+        with mock.patch('neutron.agent.linux.ovsdb_monitor.'
+                        'SimpleInterfaceMonitor.is_active',
+                        new_callable=mock.PropertyMock(return_value=False)):
+            self.assertIsNone(self.monitor.get_events())
+
+    def test_get_events_is_none_on_unparsable_output(self):
+        self.monitor.events_complete = True
+        self.output.append('garbage')
+        self.assertIsNone(self.monitor.get_events())
+
+    def test_get_events(self):
+        self.monitor.events_complete = True
+        self._add_output(self._row('insert', 'tap1', ofport=['set', []],
+                                   iface_id='port1'))
+        self.assertTrue(self.monitor.has_updates)
+        self._add_output(self._row('delete', 'tap2', iface_id='port2'),
+                         self._row('old', 'tap1', ofport=['set', []]),
+                         self._row('new', 'tap1', ofport=3,
+                                   iface_id='port1'))
+        external_ids = {'attached-mac': 'fa:16:3e:00:00:01'}
+        expected = {
+            'added': [{'name': 'tap1', 'ofport': [],
+                       'external_ids': dict(external_ids, **{
+                           'iface-id': 'port1'})}],
+            'removed': [{'name': 'tap2', 'ofport': 1,
+                         'external_ids': dict(external_ids, **{
+                             'iface-id': 'port2'})}],
+            'modified': [{'name': 'tap1', 'ofport': 3,
+                          'external_ids': dict(external_ids, **{
+                              'iface-id': 'port1'})}]}
+        self.assertEqual(expected, self.monitor.get_events())
+        self.assertFalse(self.monitor.has_updates)
+        self.assertEqual({'added': [], 'removed': [], 'modified': []},
+                         self.monitor.get_events())
@@ -107,6 +107,87 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
             self.assertFalse(log.error.called)
 
 
+class AgentUtilsExecuteRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsExecuteRootwrapDaemonTest, self).setUp()
+        self.config(group='AGENT', root_helper_daemon='rootwrap-daemon',
+                    root_helper_daemon_pool_size=2)
+        for attr, value in (('__clients', None), ('__num_clients', 0)):
+            mock.patch.object(utils.RootwrapDaemonHelper,
+                              '_RootwrapDaemonHelper' + attr, value).start()
+        self.create_client = mock.patch.object(
+            utils.RootwrapDaemonHelper, '_create_client').start()
+        self.create_client.side_effect = self._create_client
+        self.clients = []
+
+    def _create_client(self):
+        daemon_client = mock.Mock()
+        daemon_client.execute.return_value = (0, 'out', '')
+        self.clients.append(daemon_client)
+        return daemon_client
+
+    def test_execute_reuses_client(self):
+        utils.execute(['ls'], run_as_root=True)
+        utils.execute(['ls'], run_as_root=True)
+        self.assertEqual(1, len(self.clients))
+        self.assertEqual(2, self.clients[0].execute.call_count)
+
+    def test_get_client_grows_pool_up_to_size(self):
+        with utils.RootwrapDaemonHelper.get_client() as client1:
+            with utils.RootwrapDaemonHelper.get_client() as client2:
+                self.assertNotEqual(client1, client2)
+        with utils.RootwrapDaemonHelper.get_client():
+            with utils.RootwrapDaemonHelper.get_client():
+                pass
+        self.assertEqual(2, len(self.clients))
+
+
+class ExecuteLatencyHistogramTest(base.BaseTestCase):
+    def setUp(self):
+        super(ExecuteLatencyHistogramTest, self).setUp()
+        self.histogram = utils.ExecuteLatencyHistogram(buckets=(1, 10))
+
+    def test_get_command_name(self):
+        self.assertEqual('ip', self.histogram.get_command_name(
+            ['ip', 'link', 'show']))
+        self.assertEqual('iptables-save', self.histogram.get_command_name(
+            ['ip', 'netns', 'exec', 'qrouter-x', 'iptables-save']))
+        self.assertEqual('dnsmasq', self.histogram.get_command_name(
+            ['/usr/sbin/dnsmasq', '--no-hosts']))
+
+    def test_record(self):
+        self.histogram.record(['ip', 'link'], 0.0005)
+        self.histogram.record(['ip', 'addr'], 0.005)
+        self.histogram.record(['ip', 'route'], 0.05)
+        self.histogram.record(['ovs-vsctl', 'show'], 0.01)
+        stats = self.histogram.get_stats()
+        self.assertEqual(3, stats['ip']['count'])
+        self.assertAlmostEqual(55.5, stats['ip']['total'])
+        self.assertAlmostEqual(50.0, stats['ip']['max'])
+        self.assertEqual({'1': 1, '10': 1, 'inf': 1},
+                         stats['ip']['buckets'])
+        self.assertEqual({'1': 0, '10': 1, 'inf': 0},
+                         stats['ovs-vsctl']['buckets'])
+
+    def test_get_summary(self):
+        self.histogram.record(['ip', 'link'], 0.0005)
+        self.histogram.record(['ip', 'route'], 0.05)
+        self.histogram.record(['ovs-vsctl', 'show'], 0.01)
+        self.histogram.record(['ovs-ofctl', 'add-flows'], 0.02)
+        self.assertEqual({'ip': {'count': 2, 'total': 51, 'max': 50},
+                          'ovs-ofctl': {'count': 1, 'total': 20, 'max': 20}},
+                         self.histogram.get_summary(2))
+
+    def test_execute_records_latency(self):
+        with mock.patch.object(utils, 'execute_latency') as latency,\
+                mock.patch('eventlet.green.subprocess.Popen') as popen:
+            popen.return_value.returncode = 0
+            popen.return_value.communicate.return_value = ('', '')
+            self.config(group='AGENT', root_helper='sudo')
+            utils.execute(['ip', 'link'], run_as_root=True)
+        latency.record.assert_called_once_with(['ip', 'link'], mock.ANY)
+
+
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
         expect_val = '01:02:03:04:05:06'
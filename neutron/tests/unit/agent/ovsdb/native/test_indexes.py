@@ -0,0 +1,167 @@
+# Copyright (c) 2015 OpenStack Foundation
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import uuid
+
+import mock
+
+from neutron.agent.ovsdb.native import commands
+from neutron.agent.ovsdb.native import indexes
+from neutron.tests import base
+
+
+class FakeRow(object):
+    def __init__(self, table, **columns):
+        self.__dict__.update(columns)
+        self.uuid = uuid.uuid4()
+        self._table = mock.Mock()
+        self._table.name = table
+
+
+def _interface(name, ofport=None, **external_ids):
+    return FakeRow('Interface', name=name, external_ids=external_ids,
+                   ofport=[ofport] if ofport is not None else [])
+
+
+def _port(name, tag=None, interfaces=None):
+    return FakeRow('Port', name=name, tag=[tag] if tag is not None else [],
+                   interfaces=interfaces or [_interface(name)])
+
+
+class TestPortIndex(base.BaseTestCase):
+    def setUp(self):
+        super(TestPortIndex, self).setUp()
+        self.vif = _interface('tap1', 5, **{'iface-id': 'port1',
+                                            'attached-mac': 'fa:16:3e:0:0:1'})
+        self.bridges = {
+            'br-int': [_port('br-int'),
+                       _port('tap1', tag=1, interfaces=[self.vif]),
+                       _port('tap2', tag=2, interfaces=[_interface('tap2')]),
+                       _port('patch-tun', interfaces=[
+                           _interface('patch-tun', 1)])],
+            'br-tun': [_port('patch-int', interfaces=[
+                _interface('patch-int', 1)])]}
+        self.idl = mock.Mock(change_seqno=1)
+        self._set_bridges()
+        self.index = indexes.PortIndex(self.idl)
+        self.index.build()
+
+    def _set_bridges(self):
+        rows = getattr(self, 'bridge_rows', {})
+        for name, ports in self.bridges.items():
+            if name in rows:
+                rows[name].ports = ports
+            else:
+                rows[name] = FakeRow('Bridge', name=name, ports=ports)
+        for name in set(rows) - set(self.bridges):
+            del rows[name]
+        self.bridge_rows = rows
+        self.idl.tables = {'Bridge': mock.Mock(rows=dict(
+            (row.uuid, row) for row in rows.values()))}
+
+    def test_get_port_names(self):
+        self.assertEqual(['tap1', 'tap2', 'patch-tun'],
+                         self.index.get_port_names('br-int'))
+
+    def test_get_port_names_unknown_bridge(self):
+        self.assertRaises(commands.RowNotFound,
+                          self.index.get_port_names, 'br-foo')
+
+    def test_get_interfaces(self):
+        interfaces = self.index.get_interfaces('br-int')
+        self.assertEqual(
+            [('tap1', 5), ('tap2', []), ('patch-tun', 1)],
+            [(i['name'], i['ofport']) for i in interfaces])
+        self.assertEqual({'iface-id': 'port1',
+                          'attached-mac': 'fa:16:3e:0:0:1'},
+                         interfaces[0]['external_ids'])
+
+    def test_get_port_tags(self):
+        self.assertEqual({'tap1': 1, 'tap2': 2, 'patch-tun': []},
+                         self.index.get_port_tags('br-int'))
+
+    def test_get_interfaces_by_iface_id(self):
+        interfaces = self.index.get_interfaces_by_iface_id('port1')
+        self.assertEqual([('tap1', 'br-int')],
+                         [(i['name'], i['bridge']) for i in interfaces])
+        self.assertEqual([], self.index.get_interfaces_by_iface_id('port2'))
+
+    def test_get_interface_by_ofport(self):
+        self.assertEqual(
+            'patch-int',
+            self.index.get_interface_by_ofport('br-tun', 1)['name'])
+        self.assertEqual(
+            'patch-tun',
+            self.index.get_interface_by_ofport('br-int', 1)['name'])
+        self.assertIsNone(self.index.get_interface_by_ofport('br-int', 6))
+
+    def test_port_added(self):
+        self.bridges['br-int'].append(_port('tap3', tag=3))
+        self._set_bridges()
+        self.assertNotIn('tap3', self.index.get_port_names('br-int'))
+        self.index.notify('update', self.bridge_rows['br-int'])
+        self.index.apply_changes()
+        self.assertIn('tap3', self.index.get_port_names('br-int'))
+        self.assertEqual(3, self.index.get_port_tags('br-int')['tap3'])
+
+    def test_interface_updated(self):
+        self.vif.ofport = [6]
+        self.vif.external_ids = {'iface-id': 'port2'}
+        self.index.notify('update', self.vif)
+        self.index.apply_changes()
+        self.assertEqual([], self.index.get_interfaces_by_iface_id('port1'))
+        self.assertEqual(
+            ['tap1'], [i['name'] for i in
+                       self.index.get_interfaces_by_iface_id('port2')])
+        self.assertIsNone(self.index.get_interface_by_ofport('br-int', 5))
+        self.assertEqual(
+            'tap1', self.index.get_interface_by_ofport('br-int', 6)['name'])
+
+    def test_port_moved(self):
+        tap1 = self.bridges['br-int'].pop(1)
+        self.bridges['br-tun'].append(tap1)
+        self._set_bridges()
+        self.index.notify('update', self.bridge_rows['br-int'])
+        self.index.notify('update', self.bridge_rows['br-tun'])
+        self.index.apply_changes()
+        self.assertNotIn('tap1', self.index.get_port_names('br-int'))
+        self.assertIn('tap1', self.index.get_port_names('br-tun'))
+        self.assertEqual(
+            [('tap1', 'br-tun')],
+            [(i['name'], i['bridge'])
+             for i in self.index.get_interfaces_by_iface_id('port1')])
+
+    def test_bridge_deleted(self):
+        br_tun = self.bridge_rows['br-tun']
+        del self.bridges['br-tun']
+        self._set_bridges()
+        self.index.notify('delete', br_tun)
+        self.index.apply_changes()
+        self.assertRaises(commands.RowNotFound,
+                          self.index.get_port_names, 'br-tun')
+        self.assertIsNone(self.index.get_interface_by_ofport('br-tun', 1))
+
+    def test_unchanged_bridges_not_reindexed(self):
+        with mock.patch.object(self.index, '_add_bridge') as add_bridge:
+            self.index.apply_changes()
+            self.assertFalse(add_bridge.called)
+            self.index.notify('update', self.vif)
+            self.index.apply_changes()
+        add_bridge.assert_called_once_with(self.bridge_rows['br-int'])
+
+    def test_unknown_row_ignored(self):
+        self.index.notify('insert', _interface('tap9'))
+        with mock.patch.object(self.index, '_add_bridge') as add_bridge:
+            self.index.apply_changes()
+        self.assertFalse(add_bridge.called)
@@ -88,6 +88,10 @@ class SecurityGroupRpcTestPlugin(test_sg.SecurityGroupTestPlugin,
         self.devices[id] = updated_port
         self.update_security_group_on_port(
             context, id, port, original_port, updated_port)
+        updated_port = self.get_port(context, id)
+        self.is_security_group_member_updated(
+            context, original_port, updated_port)
+        return updated_port
 
     def delete_port(self, context, id):
         port = self.get_port(context, id)
@@ -136,6 +140,35 @@ class SGServerRpcCallBackTestCase(test_sg.SecurityGroupDBTestCase):
                                            req.get_response(self.api))
                 self._delete('ports', port_id)
 
+    def test_notify_security_groups_member_deltas(self):
+        plugin = manager.NeutronManager.get_plugin()
+        ctx = context.get_admin_context()
+        with self.network() as n, self.subnet(n), self.security_group() as sg:
+            sg_id = sg['security_group']['id']
+            port1 = self._make_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg_id])['port']
+            ip1 = port1['fixed_ips'][0]['ip_address']
+            notify = self.notifier.security_groups_member_updated
+            notify.reset_mock()
+            plugin.notify_security_groups_member_updated(
+                ctx, port1, member_change=sg_db_rpc.MEMBER_ADDED)
+            notify.assert_called_once_with(
+                ctx, [sg_id], member_deltas={sg_id: {const.IPv4: {
+                    'added': [ip1], 'removed': []}}})
+            # The IPs of the port are still members of the group
+            notify.reset_mock()
+            plugin.notify_security_groups_member_updated(
+                ctx, port1, member_change=sg_db_rpc.MEMBER_REMOVED)
+            notify.assert_called_once_with(
+                ctx, [sg_id], member_deltas={sg_id: {}})
+            self._delete('ports', port1['id'])
+            notify.reset_mock()
+            plugin.notify_security_groups_member_updated(
+                ctx, port1, member_change=sg_db_rpc.MEMBER_REMOVED)
+            notify.assert_called_once_with(
+                ctx, [sg_id], member_deltas={sg_id: {const.IPv4: {
+                    'added': [], 'removed': [ip1]}}})
+
     def test_notify_security_group_ipv6_gateway_port_added(self):
         self._test_security_group_port(
             const.DEVICE_OWNER_ROUTER_INTF,
@@ -1085,6 +1118,150 @@ class SGServerRpcCallBackTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id2)
 
 
+class SGServerRpcCallBackWithCacheTestCase(test_sg.SecurityGroupDBTestCase):
+    def setUp(self):
+        set_firewall_driver(FIREWALL_NOOP_DRIVER)
+        cfg.CONF.set_override('security_group_cache_ttl', 60)
+        super(SGServerRpcCallBackWithCacheTestCase, self).setUp(
+            TEST_PLUGIN_CLASS)
+        self.plugin = manager.NeutronManager.get_plugin()
+        self.rpc = securitygroups_rpc.SecurityGroupServerRpcCallback()
+
+    def _info_for_port(self, port):
+        # get_port_from_device of the test plugin alters the port it returns
+        self.plugin.devices[port['id']] = dict(port)
+        return self.rpc.security_group_info_for_devices(
+            context.get_admin_context(), devices=[port['id']])
+
+    def test_security_group_info_cached(self):
+        with self.network() as n, self.subnet(n), self.security_group() as sg:
+            sg_id = sg['security_group']['id']
+            port = self._make_port(self.fmt, n['network']['id'],
+                                   security_groups=[sg_id])['port']
+            first = self._info_for_port(port)
+            with mock.patch.object(
+                    self.plugin, '_query_rules_for_security_groups') as query:
+                second = self._info_for_port(port)
+            self.assertFalse(query.called)
+            self.assertEqual(first['security_groups'],
+                             second['security_groups'])
+            stats = self.plugin.get_security_group_cache_stats()
+            self.assertEqual(1, stats['hits'])
+            self.assertEqual(1, stats['misses'])
+
+    def test_security_group_info_rule_created_and_deleted(self):
+        with self.network() as n, self.subnet(n), self.security_group() as sg:
+            sg_id = sg['security_group']['id']
+            port = self._make_port(self.fmt, n['network']['id'],
+                                   security_groups=[sg_id])['port']
+            self.assertEqual(2, len(
+                self._info_for_port(port)['security_groups'][sg_id]))
+            rule = self._build_security_group_rule(
+                sg_id, 'ingress', const.PROTO_NAME_TCP, '22', '22')
+            rule = self._make_security_group_rule(self.fmt, rule)
+            self.assertEqual(3, len(
+                self._info_for_port(port)['security_groups'][sg_id]))
+            self._delete('security-group-rules',
+                         rule['security_group_rule']['id'])
+            self.assertEqual(2, len(
+                self._info_for_port(port)['security_groups'][sg_id]))
+
+    def test_security_group_info_member_added(self):
+        with self.network() as n, self.subnet(n), \
+                self.security_group() as sg1, self.security_group() as sg2:
+            sg1_id = sg1['security_group']['id']
+            sg2_id = sg2['security_group']['id']
+            rule = self._build_security_group_rule(
+                sg1_id, 'ingress', const.PROTO_NAME_TCP, '22', '22',
+                remote_group_id=sg2_id)
+            self._make_security_group_rule(self.fmt, rule)
+            port1 = self._make_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg1_id])['port']
+            self.assertEqual(
+                set(), self._info_for_port(port1)['sg_member_ips'][sg2_id][
+                    const.IPv4])
+            port2 = self._make_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg2_id])['port']
+            self.assertEqual(
+                set([port2['fixed_ips'][0]['ip_address']]),
+                self._info_for_port(port1)['sg_member_ips'][sg2_id][
+                    const.IPv4])
+
+    def test_security_group_info_member_updated(self):
+        with self.network() as n, self.subnet(n), \
+                self.security_group() as sg1, self.security_group() as sg2:
+            sg1_id = sg1['security_group']['id']
+            sg2_id = sg2['security_group']['id']
+            rule = self._build_security_group_rule(
+                sg1_id, 'ingress', const.PROTO_NAME_TCP, '22', '22',
+                remote_group_id=sg2_id)
+            self._make_security_group_rule(self.fmt, rule)
+            port1 = self._make_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg1_id])['port']
+            port2 = self._make_port(self.fmt, n['network']['id'],
+                                    security_groups=[sg2_id])['port']
+            self.assertEqual(
+                set([port2['fixed_ips'][0]['ip_address']]),
+                self._info_for_port(port1)['sg_member_ips'][sg2_id][
+                    const.IPv4])
+            self._update('ports', port2['id'],
+                         {'port': {'security_groups': [sg1_id]}})
+            self.assertEqual(
+                set(), self._info_for_port(port1)['sg_member_ips'][sg2_id][
+                    const.IPv4])
+
+    def test_security_group_info_not_cached_with_workers(self):
+        with mock.patch.object(sg_db_rpc, '_is_single_server_process',
+                               return_value=False):
+            self.assertIsNone(self.plugin._get_security_group_cache())
+            self.assertEqual({}, self.plugin.get_security_group_cache_stats())
+
+
+class SecurityGroupInfoCacheTestCase(base.BaseTestCase):
+    def setUp(self):
+        super(SecurityGroupInfoCacheTestCase, self).setUp()
+        self.cache = sg_db_rpc.SecurityGroupInfoCache(60)
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+        self.rules = {'sg1': [{'id': 'rule1', 'security_group_id': 'sg1'}],
+                      'sg2': [{'id': 'rule2', 'security_group_id': 'sg2'}]}
+        self.load = mock.Mock(side_effect=lambda missing: dict(
+            (sg_id, self.rules[sg_id]) for sg_id in missing))
+
+    def test_get_rules_loads_missing_groups(self):
+        self.cache.get_rules(['sg1'], self.load)
+        rules = self.cache.get_rules(['sg1', 'sg2'], self.load)
+        self.assertEqual({'sg1': tuple(self.rules['sg1']),
+                          'sg2': tuple(self.rules['sg2'])}, rules)
+        self.assertEqual([mock.call(['sg1']), mock.call(['sg2'])],
+                         self.load.call_args_list)
+        self.assertEqual({'hits': 1, 'misses': 2, 'invalidations': 0,
+                          'hit_rate': 1.0 / 3, 'rules': 2, 'member_ips': 0},
+                         self.cache.get_stats())
+
+    def test_get_rules_expired(self):
+        self.cache.get_rules(['sg1'], self.load)
+        self.time.return_value = 1061.0
+        self.cache.get_rules(['sg1'], self.load)
+        self.assertEqual(2, self.load.call_count)
+
+    def test_invalidate_rule(self):
+        self.cache.get_rules(['sg1', 'sg2'], self.load)
+        self.cache.invalidate_rule('rule1')
+        self.cache.invalidate_rule('unknown')
+        self.cache.get_rules(['sg1', 'sg2'], self.load)
+        self.load.assert_called_with(['sg1'])
+        self.assertEqual(1, self.cache.get_stats()['invalidations'])
+
+    def test_invalidated_load_not_stored(self):
+        def load(missing):
+            self.cache.invalidate_member_ips(missing)
+            return {'sg1': set(['10.0.0.1'])}
+
+        self.assertEqual({'sg1': frozenset(['10.0.0.1'])},
+                         self.cache.get_member_ips(['sg1'], load))
+        self.assertEqual(0, self.cache.get_stats()['member_ips'])
+
+
 class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
     def setUp(self):
         super(SGAgentRpcCallBackMixinTestCase, self).setUp()
@@ -1101,7 +1278,17 @@ class SGAgentRpcCallBackMixinTestCase(base.BaseTestCase):
         self.rpc.security_groups_member_updated(None,
                                                 security_groups=['fake_sgid'])
         self.rpc.sg_agent.assert_has_calls(
-            [mock.call.security_groups_member_updated(['fake_sgid'])])
+            [mock.call.security_groups_member_updated(['fake_sgid'],
+                                                      member_deltas=None)])
+
+    def test_security_groups_member_updated_with_deltas(self):
+        member_deltas = {'fake_sgid': {}}
+        self.rpc.security_groups_member_updated(
+            None, security_groups=['fake_sgid'],
+            sg_member_deltas=member_deltas)
+        self.rpc.sg_agent.assert_has_calls(
+            [mock.call.security_groups_member_updated(
+                ['fake_sgid'], member_deltas=member_deltas)])
 
     def test_security_groups_provider_updated(self):
         self.rpc.security_groups_provider_updated(None)
@@ -1327,6 +1514,40 @@ class SecurityGroupAgentEnhancedRpcTestCase(
             ['fake_sgid3', 'fake_sgid4'])
         self.assertFalse(self.agent.refresh_firewall.called)
 
+    def test_security_groups_member_updated_with_deltas(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_port_id'])
+        self.firewall.update_security_group_member_deltas.return_value = True
+        member_deltas = {'fake_sgid2': {'IPv4': {'added': ['10.0.0.2'],
+                                                 'removed': []}},
+                         'fake_sgid3': {}}
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2', 'fake_sgid3'], member_deltas=member_deltas)
+        self.assertFalse(self.agent.refresh_firewall.called)
+        update_deltas = self.firewall.update_security_group_member_deltas
+        update_deltas.assert_called_once_with(
+            'fake_sgid2', member_deltas['fake_sgid2'])
+        self.firewall.update_port_filter.assert_called_once_with(
+            self.fake_device)
+
+    def test_security_groups_member_updated_without_group_deltas(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_port_id'])
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'], member_deltas={'fake_sgid3': {}})
+        self.agent.refresh_firewall.assert_called_once_with(
+            [self.fake_device['device']])
+
+    def test_security_groups_member_updated_deltas_not_supported(self):
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.prepare_devices_filter(['fake_port_id'])
+        self.firewall.update_security_group_member_deltas.side_effect = (
+            NotImplementedError)
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'], member_deltas={'fake_sgid2': {}})
+        self.agent.refresh_firewall.assert_called_once_with(
+            [self.fake_device['device']])
+
     def test_security_groups_provider_updated_enhanced_rpc(self):
         self.agent.refresh_firewall = mock.Mock()
         self.agent.security_groups_provider_updated()
@@ -1466,6 +1687,30 @@ class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
         self.agent.security_groups_provider_updated()
         self.assertTrue(self.agent.global_refresh_firewall)
 
+    def test_security_groups_member_updated_with_deltas(self):
+        self.agent._use_enhanced_rpc = True
+        self.agent.refresh_firewall = mock.Mock()
+        self.firewall.update_security_group_member_deltas.return_value = False
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'], member_deltas={'fake_sgid2': {}})
+        self.assertFalse(self.firewall.update_security_group_member_deltas.
+                         called)
+        self.assertTrue(self.agent.firewall_refresh_needed())
+        self.agent.setup_port_filters(set(), set())
+        update_deltas = self.firewall.update_security_group_member_deltas
+        update_deltas.assert_called_once_with('fake_sgid2', {})
+        self.assertFalse(self.agent.refresh_firewall.called)
+        self.assertFalse(self.agent.firewall_refresh_needed())
+
+    def test_setup_port_filters_member_deltas_not_applied(self):
+        self.agent._use_enhanced_rpc = True
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.security_groups_member_updated(
+            ['fake_sgid2'], member_deltas={'fake_sgid3': {}})
+        self.agent.setup_port_filters(set(), set())
+        self.agent.refresh_firewall.assert_called_once_with(
+            set(['fake_device']))
+
     def test_setup_port_filters_new_ports_only(self):
         self.agent.prepare_devices_filter = mock.Mock()
         self.agent.refresh_firewall = mock.Mock()
@@ -1653,6 +1898,16 @@ class SecurityGroupAgentRpcApiTestCase(base.BaseTestCase):
             [mock.call(None, 'security_groups_member_updated',
                        security_groups=['fake_sgid'])])
 
+    def test_security_groups_member_updated_with_deltas(self):
+        member_deltas = {'fake_sgid': {'IPv4': {'added': ['10.0.0.1'],
+                                                'removed': []}}}
+        self.notifier.security_groups_member_updated(
+            None, security_groups=['fake_sgid'], member_deltas=member_deltas)
+        self.mock_cast.assert_has_calls(
+            [mock.call(None, 'security_groups_member_updated',
+                       security_groups=['fake_sgid'],
+                       sg_member_deltas=member_deltas)])
+
     def test_security_groups_rule_not_updated(self):
         self.notifier.security_groups_rule_updated(
             None, security_groups=[])
@@ -2892,7 +3147,7 @@ class SGNotificationTestMixin(object):
                     self._delete('ports', port['port']['id'])
                     self.notifier.assert_has_calls(
                         [mock.call.security_groups_member_updated(
-                            mock.ANY, [mock.ANY])])
+                            mock.ANY, [mock.ANY], member_deltas=mock.ANY)])
 
 
 class TestSecurityGroupAgentWithOVSIptables(
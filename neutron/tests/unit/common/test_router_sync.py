@@ -0,0 +1,90 @@
+# Copyright (c) 2015 OpenStack Foundation.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+
+from neutron.common import constants
+from neutron.common import router_sync
+from neutron.tests import base
+
+FIP_KEY = constants.FLOATINGIP_KEY
+INTF_KEY = constants.INTERFACE_KEY
+
+
+class TestRouterSync(base.BaseTestCase):
+    def setUp(self):
+        super(TestRouterSync, self).setUp()
+        self.router = {
+            'id': 'r1', 'name': 'router', 'routes': [],
+            INTF_KEY: [{'id': 'p%d' % i, 'fixed_ips': []} for i in range(3)],
+            FIP_KEY: [{'id': 'f1', 'floating_ip_address': '1.1.1.1'},
+                      {'id': 'f2', 'floating_ip_address': '1.1.1.2'}]}
+        self.revisions = router_sync.get_router_revisions(self.router)
+
+    def _sync(self, new_router):
+        known = copy.deepcopy(self.router)
+        known[router_sync.REVISIONS] = self.revisions
+        changes = router_sync.get_router_changes(new_router, self.revisions)
+        return changes, router_sync.apply_router_changes(known, changes)
+
+    def _assert_synced(self, new_router, synced):
+        self.assertEqual(router_sync.get_router_revisions(new_router),
+                         synced.pop(router_sync.REVISIONS))
+        self.assertEqual(new_router, synced)
+
+    def test_get_router_changes_without_revisions(self):
+        changes = router_sync.get_router_changes(self.router)
+        synced = router_sync.apply_router_changes({}, changes)
+        self.assertEqual(self.revisions, changes.pop(router_sync.REVISIONS))
+        self.assertEqual(self.router, changes)
+        self._assert_synced(self.router, synced)
+
+    def test_unchanged_router(self):
+        changes, synced = self._sync(copy.deepcopy(self.router))
+        self.assertEqual({'id': 'r1', router_sync.REMOVED: {},
+                          router_sync.REVISIONS: self.revisions}, changes)
+        self._assert_synced(self.router, synced)
+
+    def test_changed_sub_resources(self):
+        new_router = copy.deepcopy(self.router)
+        new_router[FIP_KEY][0]['floating_ip_address'] = '1.1.1.3'
+        del new_router[FIP_KEY][1]
+        new_router[FIP_KEY].append({'id': 'f3'})
+        changes, synced = self._sync(new_router)
+        self.assertEqual([{'id': 'f1', 'floating_ip_address': '1.1.1.3'},
+                          {'id': 'f3'}], changes[FIP_KEY])
+        self.assertEqual({FIP_KEY: ['f2']}, changes[router_sync.REMOVED])
+        self.assertNotIn(INTF_KEY, changes)
+        self.assertNotIn(router_sync.ROUTER, changes)
+        self._assert_synced(new_router, synced)
+
+    def test_changed_router_attributes(self):
+        new_router = copy.deepcopy(self.router)
+        new_router['name'] = 'new'
+        del new_router[INTF_KEY][0]
+        changes, synced = self._sync(new_router)
+        self.assertEqual({'id': 'r1', 'name': 'new', 'routes': []},
+                         changes[router_sync.ROUTER])
+        self.assertEqual({INTF_KEY: ['p0']}, changes[router_sync.REMOVED])
+        self._assert_synced(new_router, synced)
+
+    def test_removed_sub_resource_key(self):
+        new_router = copy.deepcopy(self.router)
+        del new_router[FIP_KEY]
+        changes, synced = self._sync(new_router)
+        self.assertEqual({FIP_KEY: ['f1', 'f2']},
+                         dict((k, sorted(v)) for k, v in
+                              changes[router_sync.REMOVED].items()))
+        self.assertEqual([], synced.pop(FIP_KEY))
+        self._assert_synced(new_router, synced)
@@ -40,6 +40,9 @@ from neutron import context
 from neutron.db import db_base_plugin_v2
 from neutron.db import models_v2
 from neutron import manager
+from neutron.openstack.common import policy as common_policy
+from neutron.openstack.common import uuidutils
+from neutron import policy
 from neutron.tests import base
 from neutron.tests.unit.api import test_extensions
 from neutron.tests.unit import testlib_api
@@ -2223,6 +2226,387 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
         self._test_delete_ports_ignores_port_not_found(plugin)
 
 
+class TestPortsRandomAddressAllocatorV2(NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestPortsRandomAddressAllocatorV2, self).setUp()
+        cfg.CONF.set_override(
+            'ipam_address_allocator',
+            'neutron.ipam.address_alloc.RandomAddressAllocator')
+
+    def _get_allocations(self, subnet_id):
+        query = context.get_admin_context().session.query(
+            models_v2.IPAllocation)
+        return dict((a.ip_address, a.port_id)
+                    for a in query.filter_by(subnet_id=subnet_id))
+
+    def test_create_ports(self):
+        with self.subnet(cidr='10.0.0.0/29') as subnet:
+            subnet_id = subnet['subnet']['id']
+            with contextlib.nested(
+                self.port(subnet=subnet),
+                self.port(subnet=subnet),
+                self.port(subnet=subnet)
+            ) as ports:
+                ips = dict((p['port']['fixed_ips'][0]['ip_address'],
+                            p['port']['id']) for p in ports)
+                self.assertEqual(ips, self._get_allocations(subnet_id))
+                pool = netaddr.IPRange('10.0.0.2', '10.0.0.6')
+                for ip in ips:
+                    self.assertIn(netaddr.IPAddress(ip), pool)
+
+    def test_create_port_pool_exhausted(self):
+        with self.subnet(cidr='10.0.0.0/30') as subnet:
+            with self.port(subnet=subnet):
+                res = self._create_port(self.fmt,
+                                        subnet['subnet']['network_id'])
+                self.assertEqual(webob.exc.HTTPConflict.code,
+                                 res.status_int)
+
+    def test_requested_duplicate_ip(self):
+        with self.subnet() as subnet:
+            kwargs = {"fixed_ips": [{'subnet_id': subnet['subnet']['id'],
+                                     'ip_address': '10.0.0.5'}]}
+            with self.port(subnet=subnet, **kwargs) as port:
+                self.assertEqual('10.0.0.5',
+                                 port['port']['fixed_ips'][0]['ip_address'])
+                res = self._create_port(self.fmt,
+                                        net_id=port['port']['network_id'],
+                                        **kwargs)
+                self.assertEqual(webob.exc.HTTPConflict.code,
+                                 res.status_int)
+
+    def test_create_ports_subnet_exhausted(self):
+        with self.network() as network:
+            with contextlib.nested(
+                self.subnet(network=network, cidr='10.0.0.0/30'),
+                self.subnet(network=network, cidr='10.0.1.0/29')
+            ) as (subnet1, subnet2):
+                # Once the address of the first subnet is allocated, the
+                # ports get theirs from the second subnet
+                for i in range(3):
+                    res = self._create_port(self.fmt,
+                                            network['network']['id'])
+                    self.assertEqual(webob.exc.HTTPCreated.code,
+                                     res.status_int)
+                self.assertEqual(1, len(self._get_allocations(
+                    subnet1['subnet']['id'])))
+                self.assertEqual(2, len(self._get_allocations(
+                    subnet2['subnet']['id'])))
+
+    def test_update_port_add_additional_ip(self):
+        with self.subnet() as subnet:
+            subnet_id = subnet['subnet']['id']
+            with self.port(subnet=subnet) as port:
+                data = {'port': {'fixed_ips': [{'subnet_id': subnet_id},
+                                               {'subnet_id': subnet_id,
+                                                'ip_address': '10.0.0.5'}]}}
+                req = self.new_update_request('ports', data,
+                                              port['port']['id'])
+                res = self.deserialize(self.fmt, req.get_response(self.api))
+                ips = [ip['ip_address'] for ip in res['port']['fixed_ips']]
+                self.assertEqual(2, len(ips))
+                self.assertIn('10.0.0.5', ips)
+                self.assertEqual(dict((ip, port['port']['id']) for ip in ips),
+                                 self._get_allocations(subnet_id))
+
+    def test_create_ports_bulk_spans_subnets(self):
+        with self.network() as network:
+            with contextlib.nested(
+                self.subnet(network=network, cidr='10.0.0.0/30'),
+                self.subnet(network=network, cidr='10.0.1.0/29')
+            ) as (subnet1, subnet2):
+                ctx = context.get_admin_context()
+                plugin = manager.NeutronManager.get_plugin()
+                ports = plugin._create_ports_bulk(ctx, [
+                    {'port': _get_port_request(network)} for i in range(3)])
+                allocations = self._get_allocations(subnet1['subnet']['id'])
+                allocations.update(
+                    self._get_allocations(subnet2['subnet']['id']))
+                self.assertEqual(
+                    dict((p['fixed_ips'][0]['ip_address'], p['id'])
+                         for p in ports), allocations)
+                self.assertEqual(['10.0.0.2'], [
+                    p['fixed_ips'][0]['ip_address'] for p in ports
+                    if p['fixed_ips'][0]['subnet_id'] ==
+                    subnet1['subnet']['id']])
+
+
+def _get_port_request(network, **kwargs):
+    port = {'network_id': network['network']['id'],
+            'tenant_id': network['network']['tenant_id'],
+            'name': '',
+            'admin_state_up': True,
+            'device_id': '',
+            'device_owner': '',
+            'mac_address': attributes.ATTR_NOT_SPECIFIED,
+            'fixed_ips': attributes.ATTR_NOT_SPECIFIED}
+    port.update(kwargs)
+    return port
+
+
+class TestCreatePortsBulkV2(NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestCreatePortsBulkV2, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.plugin = manager.NeutronManager.get_plugin()
+
+    def _create_ports_bulk(self, *ports):
+        return self.plugin._create_ports_bulk(
+            self.ctx, [{'port': port} for port in ports])
+
+    def _get_network(self, subnet):
+        return {'network': {'id': subnet['subnet']['network_id'],
+                            'tenant_id': subnet['subnet']['tenant_id']}}
+
+    def _get_allocations(self, network):
+        query = self.ctx.session.query(models_v2.IPAllocation)
+        return dict((a.ip_address, a.port_id) for a in query.filter_by(
+            network_id=network['network']['id']))
+
+    def test_create_ports_bulk(self):
+        with self.subnet(cidr='10.0.0.0/29') as subnet:
+            network = self._get_network(subnet)
+            fixed_ips = [{'subnet_id': subnet['subnet']['id'],
+                          'ip_address': '10.0.0.2'}]
+            ports = self._create_ports_bulk(
+                _get_port_request(network),
+                _get_port_request(network, fixed_ips=fixed_ips),
+                _get_port_request(network))
+            self.assertEqual(3, len(set(p['mac_address'] for p in ports)))
+            self.assertEqual(
+                dict((p['fixed_ips'][0]['ip_address'], p['id'])
+                     for p in ports), self._get_allocations(network))
+            self.assertEqual('10.0.0.2',
+                             ports[1]['fixed_ips'][0]['ip_address'])
+            listed = self._list('ports')['ports']
+            self.assertEqual(set(p['id'] for p in ports),
+                             set(p['id'] for p in listed))
+
+    def test_create_ports_bulk_auto_address(self):
+        with self.network() as network:
+            with contextlib.nested(
+                self.subnet(network=network, cidr='10.0.0.0/24'),
+                self.subnet(network=network, cidr='2001:db8::/64',
+                            ip_version=6,
+                            ipv6_ra_mode=constants.IPV6_SLAAC,
+                            ipv6_address_mode=constants.IPV6_SLAAC)
+            ) as (subnet, subnet_v6):
+                ports = self._create_ports_bulk(
+                    _get_port_request(network), _get_port_request(network))
+                for port in ports:
+                    eui_addr = ipv6_utils.get_ipv6_addr_by_EUI64(
+                        '2001:db8::/64', port['mac_address']).format()
+                    self.assertEqual(
+                        [subnet['subnet']['id'], subnet_v6['subnet']['id']],
+                        [ip['subnet_id'] for ip in port['fixed_ips']])
+                    self.assertEqual(eui_addr,
+                                     port['fixed_ips'][1]['ip_address'])
+
+    def test_create_ports_bulk_exhausted(self):
+        with self.subnet(cidr='10.0.0.0/30') as subnet:
+            network = self._get_network(subnet)
+            self.assertRaises(n_exc.IpAddressGenerationFailure,
+                              self._create_ports_bulk,
+                              _get_port_request(network),
+                              _get_port_request(network))
+            self.assertFalse(self._list('ports')['ports'])
+            # The address of the pool is still available
+            self.assertEqual(1, len(self._create_ports_bulk(
+                _get_port_request(network))))
+
+    def test_create_ports_bulk_mac_in_use(self):
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            with self.port(subnet=subnet) as port:
+                self.assertRaises(
+                    n_exc.MacAddressInUse, self._create_ports_bulk,
+                    _get_port_request(network),
+                    _get_port_request(
+                        network, mac_address=port['port']['mac_address']))
+
+    def test_create_ports_bulk_generated_mac_in_use(self):
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            with self.port(subnet=subnet) as port:
+                mac = port['port']['mac_address']
+                macs = [mac, mac, '00:11:22:33:44:55', '00:11:22:33:44:66']
+                with mock.patch.object(self.plugin, '_generate_mac',
+                                       side_effect=macs) as generate_mac:
+                    ports = self._create_ports_bulk(
+                        _get_port_request(network),
+                        _get_port_request(network))
+                self.assertEqual(4, generate_mac.call_count)
+                self.assertEqual(set(macs[2:]),
+                                 set(p['mac_address'] for p in ports))
+
+    def test_create_ports_bulk_mac_generation_failure(self):
+        cfg.CONF.set_override('mac_generation_retries', 2)
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            with self.port(subnet=subnet) as port:
+                with mock.patch.object(
+                    self.plugin, '_generate_mac',
+                    return_value=port['port']['mac_address']):
+                    self.assertRaises(n_exc.MacAddressGenerationFailure,
+                                      self._create_ports_bulk,
+                                      _get_port_request(network))
+
+    def test_create_ports_bulk_duplicate_id(self):
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            port_id = uuidutils.generate_uuid()
+            self.assertRaises(n_exc.PortIdInUse, self._create_ports_bulk,
+                              _get_port_request(network, id=port_id),
+                              _get_port_request(network, id=port_id))
+            self.assertFalse(self._list('ports')['ports'])
+
+    def test_create_ports_bulk_id_in_use(self):
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            with self.port(subnet=subnet) as port:
+                self.assertRaises(
+                    n_exc.PortIdInUse, self._create_ports_bulk,
+                    _get_port_request(network),
+                    _get_port_request(network, id=port['port']['id']))
+
+    def test_create_ports_bulk_other_duplicate_not_retried(self):
+        with self.subnet() as subnet:
+            network = self._get_network(subnet)
+            with self.port(subnet=subnet) as port:
+                # The id taken after the check is not a MAC collision
+                with contextlib.nested(
+                    mock.patch.object(self.plugin, '_check_port_ids_unused'),
+                    mock.patch.object(self.plugin, '_generate_macs',
+                                      wraps=self.plugin._generate_macs)
+                ) as (check_ids, generate_macs):
+                    self.assertRaises(
+                        db_exc.DBDuplicateEntry, self._create_ports_bulk,
+                        _get_port_request(network, id=port['port']['id']))
+                self.assertEqual(1, generate_macs.call_count)
+
+
+class TestPolicyQueryFilterV2(NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestPolicyQueryFilterV2, self).setUp()
+        self.ctx = context.get_admin_context()
+        self.plugin = manager.NeutronManager.get_plugin()
+
+    def _get_networks(self, condition):
+        query_filter = policy.QueryFilter(condition)
+        networks = self.plugin.get_networks(
+            self.ctx, filters={policy.QUERY_FILTER_KEY: query_filter})
+        return set(n['id'] for n in networks), query_filter.applied
+
+    def test_get_networks_policy_filter(self):
+        with contextlib.nested(
+            self.network(tenant_id='tenant1'),
+            self.network(tenant_id='tenant2'),
+            self.network(tenant_id='tenant3', shared=True)
+        ) as (net1, net2, net3):
+            ids, applied = self._get_networks(
+                ('or', [('==', 'tenant_id', 'tenant1'),
+                        ('==', 'shared', True)]))
+            self.assertTrue(applied)
+            self.assertEqual(set([net1['network']['id'],
+                                  net3['network']['id']]), ids)
+
+    def test_get_networks_policy_filter_not_a_column(self):
+        with contextlib.nested(
+            self.network(tenant_id='tenant1'),
+            self.network(tenant_id='tenant2')
+        ) as (net1, net2):
+            ids, applied = self._get_networks(
+                ('and', [('==', 'tenant_id', 'tenant1'),
+                         ('==', 'router:external', True)]))
+            self.assertFalse(applied)
+            self.assertEqual(set([net1['network']['id'],
+                                  net2['network']['id']]), ids)
+
+    def test_list_ports_policy_filter(self):
+        policy.init()
+        policy.set_rules({'get_port': common_policy.parse_rule(
+            "rule:admin_or_owner")}, overwrite=False)
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                self.port(subnet=subnet, tenant_id='tenant1'),
+                self.port(subnet=subnet, tenant_id='tenant2'),
+                self.port(subnet=subnet, tenant_id='tenant1'),
+                mock.patch.object(policy.Checker, 'check', autospec=True,
+                                  side_effect=policy.Checker.check)
+            ) as (port1, port2, port3, check):
+                ctx = context.Context('', 'tenant1')
+                ports = self._list('ports', neutron_context=ctx,
+                                   query_params='limit=2')['ports']
+                self.assertEqual(
+                    set([port1['port']['id'], port3['port']['id']]),
+                    set(p['id'] for p in ports))
+                # Only the visibility of the attributes is checked
+                self.assertTrue(check.called)
+                self.assertNotIn('get_port',
+                                 [c[0][1] for c in check.call_args_list])
+
+
+class TestColumnFieldsV2(NeutronDbPluginV2TestCase):
+
+    def setUp(self):
+        super(TestColumnFieldsV2, self).setUp()
+        self.plugin = manager.NeutronManager.get_plugin()
+
+    def test_list_ports_with_column_fields(self):
+        with self.port(device_id='dev') as port:
+            with mock.patch.object(self.plugin,
+                                   '_make_port_dict') as make_port_dict:
+                ports = self._list(
+                    'ports', query_params='fields=id&fields=device_id')
+            self.assertFalse(make_port_dict.called)
+            self.assertEqual([{'id': port['port']['id'],
+                               'device_id': 'dev'}], ports['ports'])
+
+    def test_list_ports_with_other_fields(self):
+        with self.port() as port:
+            with mock.patch.object(self.plugin, '_make_port_dict',
+                                   wraps=self.plugin._make_port_dict) as f:
+                ports = self._list(
+                    'ports', query_params='fields=id&fields=fixed_ips')
+            self.assertTrue(f.called)
+            self.assertEqual([{'id': port['port']['id'],
+                               'fixed_ips': port['port']['fixed_ips']}],
+                             ports['ports'])
+
+    def test_list_ports_with_column_fields_filtered_by_fixed_ip(self):
+        with self.subnet() as subnet:
+            fixed_ips = [{'subnet_id': subnet['subnet']['id']},
+                         {'subnet_id': subnet['subnet']['id']}]
+            with self.port(subnet=subnet, fixed_ips=fixed_ips) as port:
+                query_params = 'fixed_ips=subnet_id%%3D%s&fields=id' % (
+                    subnet['subnet']['id'])
+                ports = self._list('ports', query_params=query_params)
+                self.assertEqual([{'id': port['port']['id']}],
+                                 ports['ports'])
+
+    def test_get_networks_and_subnets_with_column_fields(self):
+        ctx = context.get_admin_context()
+        with self.subnet() as subnet:
+            with contextlib.nested(
+                mock.patch.object(self.plugin, '_make_network_dict'),
+                mock.patch.object(self.plugin, '_make_subnet_dict')
+            ) as (make_network_dict, make_subnet_dict):
+                networks = self.plugin.get_networks(
+                    ctx, fields=['id', 'shared'])
+                subnets = self.plugin.get_subnets(
+                    ctx, fields=['cidr', 'cidr', 'network_id'])
+            self.assertFalse(make_network_dict.called)
+            self.assertFalse(make_subnet_dict.called)
+            self.assertEqual([{'id': subnet['subnet']['network_id'],
+                               'shared': False}], networks)
+            self.assertEqual([{'cidr': subnet['subnet']['cidr'],
+                               'network_id': subnet['subnet']['network_id']}],
+                             subnets)
+
+
 class TestNetworksV2(NeutronDbPluginV2TestCase):
     # NOTE(cerberus): successful network update and delete are
     #                 effectively tested above
@@ -208,6 +208,22 @@ class L3DvrTestCase(testlib_api.SqlTestCase):
         routers = self.mixin._build_routers_list(self.ctx, routers, gw_ports)
         self.assertIsNone(routers[0].get('gw_port'))
 
+    def test_process_routers_queries_snat_ports_at_once(self):
+        routers = [{'id': 'r1', 'gw_port_id': 'gw1'},
+                   {'id': 'r2', 'gw_port_id': 'gw2'},
+                   {'id': 'r3', 'gw_port_id': None}]
+        snat_ports = [{'id': 'p1', 'device_id': 'r1'},
+                      {'id': 'p2', 'device_id': 'r1'}]
+        with mock.patch.object(self.mixin, 'get_snat_sync_interfaces',
+                               return_value=snat_ports) as get_snat_ports:
+            routers_dict = self.mixin._process_routers(self.ctx, routers)
+        get_snat_ports.assert_called_once_with(self.ctx, ['r1', 'r2'])
+        self.assertEqual(snat_ports,
+                         routers_dict['r1'][l3_const.SNAT_ROUTER_INTF_KEY])
+        self.assertEqual([],
+                         routers_dict['r2'][l3_const.SNAT_ROUTER_INTF_KEY])
+        self.assertNotIn(l3_const.SNAT_ROUTER_INTF_KEY, routers_dict['r3'])
+
     def test_clear_unused_fip_agent_gw_port(self):
         floatingip = {
             'id': _uuid(),
@@ -22,6 +22,7 @@ import netaddr
 from oslo_config import cfg
 from oslo_log import log as logging
 from oslo_utils import importutils
+from sqlalchemy import event
 from webob import exc
 
 from neutron.api.rpc.agentnotifiers import l3_rpc_agent_api
@@ -31,7 +32,9 @@ from neutron.callbacks import exceptions
 from neutron.callbacks import registry
 from neutron.common import constants as l3_constants
 from neutron.common import exceptions as n_exc
+from neutron.common import router_sync
 from neutron import context
+from neutron.db import api as db_api
 from neutron.db import common_db_mixin
 from neutron.db import db_base_plugin_v2
 from neutron.db import external_net_db
@@ -2472,6 +2475,57 @@ class L3AgentDbTestCaseBase(L3NatTestCaseMixin):
             self.assertIsNotNone(floatingips[0]['fixed_ip_address'])
             self.assertIsNotNone(floatingips[0]['router_id'])
 
+    def _count_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def after_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = db_api.get_engine()
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            event.remove(engine, 'after_cursor_execute',
+                         after_cursor_execute)
+        return len(statements), result
+
+    def _make_routers_with_resources(self, count):
+        router_ids = []
+        with self.subnet(cidr='11.0.0.0/24') as public_sub:
+            public_net_id = public_sub['subnet']['network_id']
+            self._set_net_external(public_net_id)
+            for i in range(count):
+                with self.subnet(cidr='10.0.%d.0/24' % i) as sub,\
+                        self.port(subnet=sub) as port:
+                    r = self._make_router(self.fmt, _uuid())
+                    router_ids.append(r['router']['id'])
+                    self._add_external_gateway_to_router(
+                        r['router']['id'], public_net_id)
+                    self._router_interface_action(
+                        'add', r['router']['id'], sub['subnet']['id'], None)
+                    self._make_floatingip(self.fmt, public_net_id,
+                                          port_id=port['port']['id'])
+        return router_ids
+
+    def _count_sync_data_queries(self, router_ids):
+        queries, routers = self._count_queries(
+            self.plugin.get_sync_data, context.get_admin_context(),
+            router_ids)
+        self.assertEqual(len(router_ids), len(routers))
+        for router in routers:
+            self.assertEqual(1, len(router[l3_constants.INTERFACE_KEY]))
+            self.assertEqual(1, len(router[l3_constants.FLOATINGIP_KEY]))
+            self.assertEqual(1, len(router['gw_port']['subnets']))
+        return queries
+
+    def test_get_sync_data_queries_per_router(self):
+        router_ids = self._make_routers_with_resources(3)
+        # The number of queries of a sync does not grow with the number
+        # of routers.
+        self.assertEqual(self._count_sync_data_queries(router_ids[:1]),
+                         self._count_sync_data_queries(router_ids))
+
     def _test_notify_op_agent(self, target_func, *args):
         l3_rpc_agent_api_str = (
             'neutron.api.rpc.agentnotifiers.l3_rpc_agent_api.L3AgentNotifyAPI')
@@ -2692,6 +2746,42 @@ class L3RpcCallbackTestCase(base.BaseTestCase):
         actual_message = mock_log.call_args[0][0] % mock_log.call_args[0][1]
         self.assertEqual(expected_message, actual_message)
 
+    def test_sync_router_changes(self):
+        routers = [{'id': 'r1', 'name': 'r1'}, {'id': 'r2', 'name': 'r2'}]
+        revisions = {'r1': router_sync.get_router_revisions(routers[0]),
+                     'r2': None}
+        with mock.patch.object(self.l3_rpc_cb, 'sync_routers',
+                               return_value=routers) as sync_routers:
+            changes = self.l3_rpc_cb.sync_router_changes(
+                mock.ANY, host='host', revisions=revisions)
+        sync_routers.assert_called_once_with(
+            mock.ANY, host='host', router_ids=mock.ANY)
+        self.assertEqual(['r1', 'r2'],
+                         sorted(sync_routers.call_args[1]['router_ids']))
+        self.assertEqual(
+            [{'id': 'r1', router_sync.REMOVED: {},
+              router_sync.REVISIONS: revisions['r1']},
+             {'id': 'r2', 'name': 'r2',
+              router_sync.REVISIONS:
+              router_sync.get_router_revisions(routers[1])}],
+            changes)
+
+    def test_get_router_ids_no_l3_agent_scheduler(self):
+        self.l3_rpc_cb.l3plugin.get_routers.return_value = [{'id': 'r1'},
+                                                            {'id': 'r2'}]
+        with mock.patch.object(l3_rpc.utils, 'is_extension_supported',
+                               return_value=False):
+            self.assertEqual(['r1', 'r2'], self.l3_rpc_cb.get_router_ids(
+                mock.ANY, host='host'))
+        self.l3_rpc_cb.l3plugin.get_routers.assert_called_once_with(
+            mock.ANY, fields=['id'])
+
+    def test_sync_router_changes_no_revisions(self):
+        with mock.patch.object(self.l3_rpc_cb, 'sync_routers') as sync:
+            self.assertEqual([], self.l3_rpc_cb.sync_router_changes(
+                mock.ANY, host='host', revisions={}))
+        self.assertFalse(sync.called)
+
 
 class L3AgentDbIntTestCase(L3BaseForIntTests, L3AgentDbTestCaseBase):
 
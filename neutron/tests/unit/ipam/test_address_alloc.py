@@ -0,0 +1,196 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import netaddr
+
+from neutron.api.v2 import attributes
+from neutron.common import exceptions as n_exc
+from neutron import context
+from neutron.db import models_v2
+import neutron.ipam as ipam
+from neutron.ipam import address_alloc
+from neutron import manager
+from neutron.tests.unit.db import test_db_base_plugin_v2
+from neutron.tests.unit import testlib_api
+
+
+class TestRandomAddressAllocator(testlib_api.SqlTestCase):
+
+    def setUp(self):
+        super(TestRandomAddressAllocator, self).setUp()
+        self._tenant_id = 'test-tenant'
+        self.setup_coreplugin(test_db_base_plugin_v2.DB_PLUGIN_KLASS)
+        self.plugin = manager.NeutronManager.get_plugin()
+        self.ctx = context.get_admin_context()
+        self.network = self.plugin.create_network(
+            self.ctx, {'network': {'name': 'net',
+                                   'tenant_id': self._tenant_id,
+                                   'admin_state_up': True,
+                                   'shared': False}})
+
+    def _create_subnet(self, cidr, allocation_pools=None, ip_version=4):
+        if allocation_pools is None:
+            allocation_pools = attributes.ATTR_NOT_SPECIFIED
+        subnet = {'subnet': {'name': 'subnet',
+                             'tenant_id': self._tenant_id,
+                             'network_id': self.network['id'],
+                             'cidr': cidr,
+                             'ip_version': ip_version,
+                             'gateway_ip': attributes.ATTR_NOT_SPECIFIED,
+                             'allocation_pools': allocation_pools,
+                             'enable_dhcp': False,
+                             'dns_nameservers': attributes.ATTR_NOT_SPECIFIED,
+                             'host_routes': attributes.ATTR_NOT_SPECIFIED}}
+        return self.plugin.create_subnet(self.ctx, subnet)
+
+    def _allocate(self, subnet, address):
+        self.ctx.session.add(models_v2.IPAllocation(
+            ip_address=address, subnet_id=subnet['id'],
+            network_id=subnet['network_id']))
+        self.ctx.session.flush()
+
+    def _get_allocator(self, subnet):
+        return address_alloc.RandomAddressAllocator(self.ctx.session, subnet)
+
+    def test_get_free_ranges(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.20'},
+                            {'start': '10.0.0.30', 'end': '10.0.0.30'}])
+        for address in ('10.0.0.10', '10.0.0.15', '10.0.0.16', '10.0.0.30',
+                        '10.0.0.1'):
+            self._allocate(subnet, address)
+        ranges = self._get_allocator(subnet).get_free_ranges()
+        self.assertEqual([('10.0.0.11', '10.0.0.14'),
+                          ('10.0.0.17', '10.0.0.20')],
+                         [(str(netaddr.IPAddress(first)),
+                           str(netaddr.IPAddress(last)))
+                          for first, last in ranges])
+
+    def test_allocate(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.20'}])
+        with self.ctx.session.begin(subtransactions=True):
+            address = self._get_allocator(subnet).allocate(
+                ipam.AnyAddressRequest())
+        self.assertIn(address, netaddr.IPRange('10.0.0.10', '10.0.0.20'))
+        allocation = self.ctx.session.query(models_v2.IPAllocation).one()
+        self.assertEqual(str(address), allocation.ip_address)
+        self.assertIsNone(allocation.port_id)
+
+    def test_bulk_allocate(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.20'}])
+        self._allocate(subnet, '10.0.0.12')
+        with self.ctx.session.begin(subtransactions=True):
+            addresses = self._get_allocator(subnet).bulk_allocate(10)
+        self.assertEqual(
+            set(netaddr.IPRange('10.0.0.10', '10.0.0.20')) -
+            set([netaddr.IPAddress('10.0.0.12')]),
+            set(addresses))
+
+    def test_bulk_allocate_ipv6(self):
+        subnet = self._create_subnet('2001:db8::/64', ip_version=6)
+        with self.ctx.session.begin(subtransactions=True):
+            addresses = self._get_allocator(subnet).bulk_allocate(3)
+        self.assertEqual(3, len(set(addresses)))
+        for address in addresses:
+            self.assertEqual(6, address.version)
+            self.assertIn(address, netaddr.IPNetwork('2001:db8::/64'))
+
+    def test_allocate_exhausted(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.11'}])
+        allocator = self._get_allocator(subnet)
+        allocator.bulk_allocate(2)
+        self.assertRaises(n_exc.IpAddressGenerationFailure,
+                          allocator.allocate, ipam.AnyAddressRequest())
+
+    def test_allocate_without_loading_allocations(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.20'}])
+        allocator = self._get_allocator(subnet)
+        with mock.patch.object(allocator, '_get_allocated') as get_allocated:
+            address = allocator.allocate(ipam.AnyAddressRequest())
+        self.assertFalse(get_allocated.called)
+        self.assertIn(address, netaddr.IPRange('10.0.0.10', '10.0.0.20'))
+
+    def test_allocate_picks_free_address_after_conflicts(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.12'}])
+        self._allocate(subnet, '10.0.0.10')
+        self._allocate(subnet, '10.0.0.11')
+        allocator = self._get_allocator(subnet)
+        # The first address of the ranges given is always picked
+        with mock.patch('random.sample', return_value=[0]), \
+                mock.patch.object(allocator, 'get_free_ranges',
+                                  wraps=allocator.get_free_ranges) as ranges:
+            address = allocator.allocate(ipam.AnyAddressRequest())
+        self.assertEqual(netaddr.IPAddress('10.0.0.12'), address)
+        self.assertEqual(1, ranges.call_count)
+
+    @mock.patch.object(address_alloc, 'RANDOM_ATTEMPTS', 0)
+    def test_allocate_retries_concurrent_allocation(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.11'}])
+        self._allocate(subnet, '10.0.0.10')
+        allocator = self._get_allocator(subnet)
+        # The address is allocated after the free ranges were loaded
+        free_ranges = [[(int(netaddr.IPAddress('10.0.0.10')),
+                         int(netaddr.IPAddress('10.0.0.10')))],
+                       allocator.get_free_ranges()]
+        with mock.patch.object(allocator, 'get_free_ranges',
+                               side_effect=free_ranges):
+            address = allocator.allocate(ipam.AnyAddressRequest())
+        self.assertEqual(netaddr.IPAddress('10.0.0.11'), address)
+
+    def test_allocate_exhausted_keeps_transaction(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.10'}])
+        self._allocate(subnet, '10.0.0.10')
+        other_subnet = self._create_subnet('10.0.1.0/24')
+        with self.ctx.session.begin(subtransactions=True):
+            self.assertRaises(n_exc.IpAddressGenerationFailure,
+                              self._get_allocator(subnet).allocate,
+                              ipam.AnyAddressRequest())
+            # The transaction of the caller can go on with another subnet
+            self._get_allocator(other_subnet).allocate(
+                ipam.AnyAddressRequest())
+        self.assertEqual(1, self.ctx.session.query(
+            models_v2.IPAllocation).filter_by(
+                subnet_id=other_subnet['id']).count())
+
+    def test_allocate_specific_address_in_use(self):
+        subnet = self._create_subnet('10.0.0.0/24')
+        self._allocate(subnet, '10.0.0.5')
+        allocator = self._get_allocator(subnet)
+        self.assertRaises(n_exc.IpAddressInUse, allocator.allocate,
+                          ipam.SpecificAddressRequest('10.0.0.5'))
+        self.assertEqual(netaddr.IPAddress('10.0.0.6'), allocator.allocate(
+            ipam.SpecificAddressRequest('10.0.0.6')))
+
+    def test_deallocate(self):
+        subnet = self._create_subnet('10.0.0.0/24')
+        self._allocate(subnet, '10.0.0.5')
+        allocator = self._get_allocator(subnet)
+        allocator.deallocate(netaddr.IPAddress('10.0.0.5'))
+        self.assertFalse(self.ctx.session.query(models_v2.IPAllocation).all())
+        self.assertRaises(n_exc.NotFound, allocator.deallocate, '10.0.0.5')
+
+    def test_get_details(self):
+        subnet = self._create_subnet(
+            '10.0.0.0/24', [{'start': '10.0.0.10', 'end': '10.0.0.20'}])
+        details = self._get_allocator(subnet).get_details()
+        self.assertEqual(subnet['id'], details.subnet_id)
+        self.assertEqual(netaddr.IPNetwork('10.0.0.0/24'), details.subnet)
+        self.assertEqual([netaddr.IPRange('10.0.0.10', '10.0.0.20')],
+                         details.allocation_pools)
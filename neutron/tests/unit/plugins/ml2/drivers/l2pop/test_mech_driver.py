@@ -217,6 +217,44 @@ class TestL2PopulationRpcTestCase(test_plugin.Ml2PluginV2TestCase):
         self.assertEqual(['00:00:00:00:00:00', '0.0.0.0'], port_info_list[0])
         self.assertEqual(['fa:16:3e:ff:8c:0f', '10.0.0.6'], port_info_list[1])
 
+    def test_notify_batch_merges_fdb_entries(self):
+        notifier = mock.Mock()
+        batch = l2pop_rpc.L2populationAgentNotifyBatch(notifier)
+        port1 = l2pop_rpc.PortInfo('fa:16:3e:ff:8c:0f', '10.0.0.6')
+        port2 = l2pop_rpc.PortInfo('fa:16:3e:ff:8c:10', '10.0.0.7')
+
+        def fdb_entries(*port_infos):
+            return {'foouuid': {'segment_id': 1001,
+                                'network_type': 'vxlan',
+                                'ports': {'192.168.0.10': list(port_infos)}}}
+
+        batch.add_fdb_entries('ctx', fdb_entries(constants.FLOODING_ENTRY,
+                                                 port1))
+        batch.add_fdb_entries('ctx', fdb_entries(port2))
+        batch.add_fdb_entries('ctx', fdb_entries(constants.FLOODING_ENTRY),
+                              'host')
+        batch.add_fdb_entries('ctx', None)
+        batch.update_fdb_entries(
+            'ctx', {'chg_ip': {'foouuid': {'192.168.0.10': {
+                'before': [port1]}}}})
+        batch.update_fdb_entries(
+            'ctx', {'chg_ip': {'foouuid': {'192.168.0.10': {
+                'before': [port2], 'after': [port1]}}}})
+        self.assertFalse(notifier.method_calls)
+
+        batch.notify('ctx')
+        self.assertEqual(
+            [mock.call.add_fdb_entries(
+                'ctx', fdb_entries(constants.FLOODING_ENTRY, port1, port2),
+                None),
+             mock.call.add_fdb_entries(
+                'ctx', fdb_entries(constants.FLOODING_ENTRY), 'host'),
+             mock.call.update_fdb_entries(
+                'ctx', {'chg_ip': {'foouuid': {'192.168.0.10': {
+                    'before': [port1, port2], 'after': [port1]}}}},
+                None)],
+            notifier.method_calls)
+
     def test_fdb_add_called(self):
         self._register_ml2_agents()
 
@@ -408,6 +446,61 @@ class TestL2PopulationRpcTestCase(test_plugin.Ml2PluginV2TestCase):
                     self.mock_fanout.assert_called_with(
                         mock.ANY, 'add_fdb_entries', expected2)
 
+    def test_fdb_add_devices_up(self):
+        self._register_ml2_agents()
+
+        with self.subnet(network=self._network) as subnet:
+            host_arg = {portbindings.HOST_ID: HOST}
+            with self.port(subnet=subnet,
+                           device_owner=DEVICE_OWNER_COMPUTE,
+                           arg_list=(portbindings.HOST_ID,),
+                           **host_arg) as port1:
+                with self.port(subnet=subnet,
+                               device_owner=DEVICE_OWNER_COMPUTE,
+                               arg_list=(portbindings.HOST_ID,),
+                               **host_arg) as port2:
+                    host_arg = {portbindings.HOST_ID: HOST + '_2'}
+                    with self.port(subnet=subnet,
+                                   device_owner=DEVICE_OWNER_COMPUTE,
+                                   arg_list=(portbindings.HOST_ID,),
+                                   **host_arg) as port3:
+                        p1 = port1['port']
+                        p2 = port2['port']
+                        p3 = port3['port']
+
+                        self.callbacks.update_device_up(
+                            self.adminContext, agent_id=HOST + '_2',
+                            device='tap' + p3['id'])
+                        self.mock_cast.reset_mock()
+                        self.mock_fanout.reset_mock()
+                        self.callbacks.update_devices_up(
+                            self.adminContext, agent_id=HOST,
+                            devices=['tap' + p1['id'], 'tap' + p2['id']])
+
+                        p3_ips = [p['ip_address'] for p in p3['fixed_ips']]
+                        expected1 = {p1['network_id']:
+                                     {'ports':
+                                      {'20.0.0.2': [constants.FLOODING_ENTRY,
+                                                    l2pop_rpc.PortInfo(
+                                                        p3['mac_address'],
+                                                        p3_ips[0])]},
+                                      'network_type': 'vxlan',
+                                      'segment_id': 1}}
+                        self.mock_cast.assert_called_once_with(
+                            mock.ANY, 'add_fdb_entries', expected1, HOST)
+
+                        expected2 = {p1['network_id']:
+                                     {'ports':
+                                      {'20.0.0.1': [constants.FLOODING_ENTRY] +
+                                       [l2pop_rpc.PortInfo(
+                                           p['mac_address'],
+                                           p['fixed_ips'][0]['ip_address'])
+                                        for p in (p1, p2)]},
+                                      'network_type': 'vxlan',
+                                      'segment_id': 1}}
+                        self.mock_fanout.assert_called_once_with(
+                            mock.ANY, 'add_fdb_entries', expected2)
+
     def test_fdb_add_called_two_networks(self):
         self._register_ml2_agents()
 
@@ -517,6 +610,46 @@ class TestL2PopulationRpcTestCase(test_plugin.Ml2PluginV2TestCase):
                     self.mock_fanout.assert_called_with(
                         mock.ANY, 'remove_fdb_entries', expected)
 
+    def test_update_devices_down(self):
+        self._register_ml2_agents()
+
+        with self.subnet(network=self._network) as subnet:
+            host_arg = {portbindings.HOST_ID: HOST}
+            with self.port(subnet=subnet,
+                           device_owner=DEVICE_OWNER_COMPUTE,
+                           arg_list=(portbindings.HOST_ID,),
+                           **host_arg) as port1:
+                with self.port(subnet=subnet,
+                               device_owner=DEVICE_OWNER_COMPUTE,
+                               arg_list=(portbindings.HOST_ID,),
+                               **host_arg) as port2:
+                    p1 = port1['port']
+                    p2 = port2['port']
+                    devices = ['tap' + p1['id'], 'tap' + p2['id']]
+
+                    self.callbacks.update_devices_up(self.adminContext,
+                                                     agent_id=HOST,
+                                                     devices=devices)
+                    self.mock_fanout.reset_mock()
+                    self.assertEqual(
+                        [{'device': device, 'exists': True}
+                         for device in devices],
+                        self.callbacks.update_devices_down(
+                            self.adminContext, agent_id=HOST,
+                            devices=devices))
+
+                    expected = {p1['network_id']:
+                                {'ports':
+                                 {'20.0.0.1': [constants.FLOODING_ENTRY] +
+                                  [l2pop_rpc.PortInfo(
+                                      p['mac_address'],
+                                      p['fixed_ips'][0]['ip_address'])
+                                   for p in (p1, p2)]},
+                                 'network_type': 'vxlan',
+                                 'segment_id': 1}}
+                    self.mock_fanout.assert_called_once_with(
+                        mock.ANY, 'remove_fdb_entries', expected)
+
     def test_update_port_down_last_port_up(self):
         self._register_ml2_agents()
 
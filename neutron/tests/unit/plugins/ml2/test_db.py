@@ -125,6 +125,43 @@ class Ml2DBTestCase(testlib_api.SqlTestCase):
         net_segment = ml2_db.get_segment_by_id(self.ctx.session, segment_uuid)
         self.assertIsNone(net_segment)
 
+    def test_get_networks_segments(self):
+        segments = [{api.NETWORK_TYPE: 'vlan',
+                     api.PHYSICAL_NETWORK: 'physnet1',
+                     api.SEGMENTATION_ID: 1},
+                    {api.NETWORK_TYPE: 'vlan',
+                     api.PHYSICAL_NETWORK: 'physnet1',
+                     api.SEGMENTATION_ID: 2}]
+        net_segments = self._create_segments(segments)
+        self._setup_neutron_network('bar-network-id')
+
+        networks_segments = ml2_db.get_networks_segments(
+            self.ctx.session, ['foo-network-id', 'bar-network-id'])
+        self.assertEqual({'foo-network-id': net_segments,
+                          'bar-network-id': []}, networks_segments)
+
+    def test_get_ports_binding_levels(self):
+        network_id = 'foo-network-id'
+        segment = self._create_segments([{api.NETWORK_TYPE: 'vlan',
+                                          api.PHYSICAL_NETWORK: 'physnet1',
+                                          api.SEGMENTATION_ID: 1}])[0]
+        for port_id in ('port-1', 'port-2'):
+            self._setup_neutron_port(network_id, port_id)
+        with self.ctx.session.begin(subtransactions=True):
+            for port_id, host, level in (('port-1', 'host', 1),
+                                         ('port-1', 'host', 0),
+                                         ('port-2', 'other', 0)):
+                self.ctx.session.add(models.PortBindingLevel(
+                    port_id=port_id, host=host, level=level,
+                    driver='foo', segment_id=segment[api.ID]))
+
+        levels = ml2_db.get_ports_binding_levels(self.ctx.session,
+                                                 ['port-1', 'port-2'])
+        self.assertEqual([0, 1],
+                         [l.level for l in levels['port-1', 'host']])
+        self.assertEqual([0], [l.level for l in levels['port-2', 'other']])
+        self.assertEqual([], levels['port-2', 'host'])
+
     def test_add_port_binding(self):
         network_id = 'foo-network-id'
         port_id = 'foo-port-id'
@@ -195,6 +232,17 @@ class Ml2DBTestCase(testlib_api.SqlTestCase):
         port = ml2_db.get_port(self.ctx.session, port_id)
         self.assertIsNone(port)
 
+    def test_get_ports_by_id_prefixes(self):
+        network_id = 'foo-network-id'
+        port_ids = [uuidutils.generate_uuid() for i in range(3)]
+        self._setup_neutron_network(network_id)
+        for port_id in port_ids:
+            self._setup_neutron_port(network_id, port_id)
+
+        ports = ml2_db.get_ports_by_id_prefixes(
+            self.ctx.session, [port_ids[0], port_ids[1][:11]])
+        self.assertEqual(set(port_ids[:2]), set(port.id for port in ports))
+
     def test_get_port_from_device_mac(self):
         network_id = 'foo-network-id'
         port_id = 'foo-port-id'
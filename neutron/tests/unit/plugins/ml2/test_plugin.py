@@ -311,6 +311,59 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
                 plugin.update_port_status(ctx, short_id, 'UP')
                 mock_gbl.assert_called_once_with(mock.ANY, port_id, mock.ANY)
 
+    def test_update_ports_status(self):
+        ctx = context.get_admin_context()
+        plugin = manager.NeutronManager.get_plugin()
+        with contextlib.nested(self.port(), self.port()) as (port1, port2):
+            port_ids = [port1['port']['id'], port2['port']['id'][:11],
+                        'nonexistent']
+            with contextlib.nested(
+                mock.patch.object(plugin.mechanism_manager,
+                                  'update_port_precommit'),
+                mock.patch.object(plugin.mechanism_manager,
+                                  'update_ports_postcommit')
+            ) as (precommit, postcommit):
+                self.assertEqual(
+                    {port_ids[0]: port1['port']['id'],
+                     port_ids[1]: port2['port']['id'],
+                     'nonexistent': None},
+                    plugin.update_ports_status(ctx, port_ids,
+                                               constants.PORT_STATUS_ACTIVE))
+            self.assertEqual(2, precommit.call_count)
+            contexts = postcommit.call_args[0][0]
+            self.assertEqual(
+                [(constants.PORT_STATUS_DOWN, constants.PORT_STATUS_ACTIVE)] *
+                2,
+                [(c.original['status'], c.current['status'])
+                 for c in contexts])
+            for port in (port1, port2):
+                self.assertEqual(
+                    constants.PORT_STATUS_ACTIVE,
+                    plugin.get_port(ctx, port['port']['id'])['status'])
+
+    def test_update_ports_status_unchanged(self):
+        ctx = context.get_admin_context()
+        plugin = manager.NeutronManager.get_plugin()
+        with self.port() as port:
+            with mock.patch.object(plugin.mechanism_manager,
+                                   'update_ports_postcommit') as postcommit:
+                plugin.update_ports_status(ctx, [port['port']['id']],
+                                           constants.PORT_STATUS_DOWN)
+            self.assertFalse(postcommit.called)
+
+    def test_ports_bound_to_host(self):
+        ctx = context.get_admin_context()
+        plugin = manager.NeutronManager.get_plugin()
+        host_arg = {portbindings.HOST_ID: HOST}
+        with contextlib.nested(
+            self.port(arg_list=(portbindings.HOST_ID,), **host_arg),
+            self.port()
+        ) as (port1, port2):
+            self.assertEqual(
+                set([port1['port']['id']]),
+                plugin.ports_bound_to_host(
+                    ctx, [port1['port']['id'], port2['port']['id']], HOST))
+
     def test_update_port_mac(self):
         self.check_update_port_mac(
             host_arg={portbindings.HOST_ID: HOST},
@@ -366,6 +419,62 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
                 self._validate_behavior_on_bulk_failure(
                     res, 'ports', webob.exc.HTTPServerError.code)
 
+    def _test_create_ports_bulk_plugin_failure(self):
+        # The ports of a bulk create are not created one by one by
+        # _create_port_db, inject the fault in their processing instead
+        ctx = context.get_admin_context()
+        with self.network() as net:
+            plugin = manager.NeutronManager.get_plugin()
+            orig = plugin._process_port_create
+            with mock.patch.object(plugin,
+                                   '_process_port_create') as patched_plugin:
+
+                def side_effect(*args, **kwargs):
+                    return self._fail_second_call(patched_plugin, orig,
+                                                  *args, **kwargs)
+
+                patched_plugin.side_effect = side_effect
+                res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
+                                             'test', True, context=ctx)
+                # We expect a 500 as we injected a fault in the plugin
+                self._validate_behavior_on_bulk_failure(
+                    res, 'ports', webob.exc.HTTPServerError.code)
+
+    def test_create_ports_bulk_native_plugin_failure(self):
+        self._test_create_ports_bulk_plugin_failure()
+
+    def test_create_ports_bulk_emulated_plugin_failure(self):
+        self._test_create_ports_bulk_plugin_failure()
+
+    def test_create_ports_bulk_mech_drivers_batched(self):
+        with contextlib.nested(
+            self.network(),
+            mock.patch.object(mech_test.TestMechanismDriver,
+                              'create_port_bulk_precommit'),
+            mock.patch.object(mech_test.TestMechanismDriver,
+                              'create_port_bulk_postcommit')
+        ) as (net, precommit, postcommit):
+            res = self._create_port_bulk(self.fmt, 3, net['network']['id'],
+                                         'test', True)
+            ports = self.deserialize(self.fmt, res)['ports']
+            for batch in (precommit, postcommit):
+                self.assertEqual(1, batch.call_count)
+                contexts = batch.call_args[0][0]
+                self.assertEqual([port['id'] for port in ports],
+                                 [c.current['id'] for c in contexts])
+
+    def test_create_ports_bulk_postcommit_failure(self):
+        with contextlib.nested(
+            self.network(),
+            mock.patch.object(mech_test.TestMechanismDriver,
+                              'create_port_bulk_postcommit',
+                              side_effect=ml2_exc.MechanismDriverError)
+        ) as (net, postcommit):
+            res = self._create_port_bulk(self.fmt, 2, net['network']['id'],
+                                         'test', True)
+            self._validate_behavior_on_bulk_failure(
+                res, 'ports', webob.exc.HTTPServerError.code)
+
     def test_create_ports_bulk_with_sec_grp(self):
         ctx = context.get_admin_context()
         plugin = manager.NeutronManager.get_plugin()
@@ -381,7 +490,8 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
                                          'test', True, context=ctx)
             ports = self.deserialize(self.fmt, res)
             used_sg = ports['ports'][0]['security_groups']
-            m_upd.assert_called_once_with(ctx, used_sg)
+            m_upd.assert_called_once_with(
+                ctx, used_sg, member_deltas={used_sg[0]: {}})
             self.assertFalse(p_upd.called)
 
     def test_create_ports_bulk_with_sec_grp_member_provider_update(self):
@@ -411,7 +521,8 @@ class TestMl2PortsV2(test_plugin.TestPortsV2, Ml2PluginV2TestCase):
                                               data, context=ctx)
             ports = self.deserialize(self.fmt, res)
             used_sg = ports['ports'][0]['security_groups']
-            m_upd.assert_called_once_with(ctx, used_sg)
+            m_upd.assert_called_once_with(
+                ctx, used_sg, member_deltas={used_sg[0]: {}})
             p_upd.assert_called_once_with(ctx)
 
             m_upd.reset_mock()
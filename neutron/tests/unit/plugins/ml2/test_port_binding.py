@@ -13,9 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
+from sqlalchemy import event
 
 from neutron import context
+from neutron.db import api as db_api
 from neutron.extensions import portbindings
 from neutron import manager
 from neutron.plugins.ml2 import config as config
@@ -136,6 +140,82 @@ class PortBindingTestCase(test_plugin.NeutronDbPluginV2TestCase):
                                                cached_networks={})
             self.assertEqual(1, self.plugin.get_network.call_count)
 
+    def _bound_ports(self, count):
+        host_arg = {portbindings.HOST_ID: 'host-ovs-no_filter'}
+        return contextlib.nested(*[
+            self.port(arg_list=(portbindings.HOST_ID,), **host_arg)
+            for i in range(count)])
+
+    def test_get_bound_ports_contexts(self):
+        ctx = context.get_admin_context()
+        with self._bound_ports(2) as (port1, port2):
+            port_ids = [port1['port']['id'], port2['port']['id'][:11],
+                        'nonexistent']
+            contexts = self.plugin.get_bound_ports_contexts(
+                ctx, port_ids, host='host-ovs-no_filter')
+            self.assertIsNone(contexts['nonexistent'])
+            for port_id in port_ids[:2]:
+                expected = self.plugin.get_bound_port_context(
+                    ctx, port_id, host='host-ovs-no_filter')
+                actual = contexts[port_id]
+                self.assertEqual(expected.current, actual.current)
+                self.assertEqual(expected.network.current,
+                                 actual.network.current)
+                self.assertEqual(expected.network.network_segments,
+                                 actual.network.network_segments)
+                self.assertEqual(expected.bottom_bound_segment,
+                                 actual.bottom_bound_segment)
+
+    def test_get_bound_ports_contexts_no_binding(self):
+        ctx = context.get_admin_context()
+        with self.port() as port:
+            (ctx.session.query(ml2_models.PortBinding).
+             filter_by(port_id=port['port']['id']).delete())
+            self.assertEqual(
+                {port['port']['id']: None},
+                self.plugin.get_bound_ports_contexts(ctx,
+                                                     [port['port']['id']]))
+
+    def _count_queries(self, func, *args, **kwargs):
+        statements = []
+
+        def after_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = db_api.get_engine()
+        event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+        try:
+            func(*args, **kwargs)
+        finally:
+            event.remove(engine, 'after_cursor_execute',
+                         after_cursor_execute)
+        return len(statements)
+
+    def _count_devices_details_queries(self, count):
+        ctx = context.get_admin_context()
+        callbacks = self.plugin.endpoints[0]
+        with self._bound_ports(count) as ports:
+            devices = [port['port']['id'] for port in ports]
+            kwargs = {'agent_id': 'theAgentId', 'host': 'host-ovs-no_filter'}
+            # Leave out the port status updates to BUILD of the first call
+            callbacks.get_devices_details_list(ctx, devices=devices, **kwargs)
+            bulk = self._count_queries(callbacks.get_devices_details_list,
+                                       ctx, devices=devices, **kwargs)
+            single = self._count_queries(
+                lambda: [callbacks.get_device_details(ctx, device=device,
+                                                      **kwargs)
+                         for device in devices])
+        return bulk, single
+
+    def test_get_devices_details_list_queries_per_device(self):
+        bulk_1, single_1 = self._count_devices_details_queries(1)
+        bulk_4, single_4 = self._count_devices_details_queries(4)
+        # The queries of the device by device requests grow with the number
+        # of devices, the ones of the bulk request do not.
+        self.assertEqual(bulk_1, bulk_4)
+        self.assertGreater(single_4, single_1)
+        self.assertLess(bulk_4, single_4)
+
     def _test_update_port_binding(self, host, new_host=None):
         with mock.patch.object(self.plugin,
                                '_notify_port_updated') as notify_mock:
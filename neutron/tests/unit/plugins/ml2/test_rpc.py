@@ -132,25 +132,39 @@ class RpcCallbacksTestCase(base.BaseTestCase):
         self.assertTrue(self.plugin.update_port_status.called)
 
     def test_get_devices_details_list(self):
-        devices = [1, 2, 3, 4, 5]
+        devices = ['dev1', 'dev2', 'dev3']
         kwargs = {'host': 'fake_host', 'agent_id': 'fake_agent_id'}
-        with mock.patch.object(self.callbacks, 'get_device_details',
+        self.plugin._device_to_port_id.side_effect = lambda d: 'port-' + d
+        port_contexts = {'port-dev1': mock.Mock(), 'port-dev2': None,
+                         'port-dev3': mock.Mock()}
+        self.plugin.get_bound_ports_contexts.return_value = port_contexts
+        with mock.patch.object(self.callbacks, '_get_device_details',
                                side_effect=devices) as f:
             res = self.callbacks.get_devices_details_list('fake_context',
                                                           devices=devices,
                                                           **kwargs)
-            self.assertEqual(devices, res)
-            self.assertEqual(len(devices), f.call_count)
-            calls = [mock.call('fake_context', device=i,
-                               cached_networks={}, **kwargs)
-                     for i in devices]
-            f.assert_has_calls(calls)
+        self.assertEqual(devices, res)
+        self.plugin.get_bound_ports_contexts.assert_called_once_with(
+            'fake_context', ['port-dev1', 'port-dev2', 'port-dev3'],
+            'fake_host')
+        f.assert_has_calls([mock.call('fake_context', 'fake_agent_id',
+                                      'fake_host', device, 'port-' + device,
+                                      port_contexts['port-' + device])
+                            for device in devices])
+
+    def test_get_devices_details_list_without_port_context(self):
+        self.plugin._device_to_port_id.return_value = 'fake_port'
+        self.plugin.get_bound_ports_contexts.return_value = {
+            'fake_port': None}
+        self.assertEqual(
+            [{'device': 'fake_device'}],
+            self.callbacks.get_devices_details_list('fake_context',
+                                                    devices=['fake_device']))
 
     def test_get_devices_details_list_with_empty_devices(self):
-        with mock.patch.object(self.callbacks, 'get_device_details') as f:
-            res = self.callbacks.get_devices_details_list('fake_context')
-            self.assertFalse(f.called)
-            self.assertEqual([], res)
+        res = self.callbacks.get_devices_details_list('fake_context')
+        self.assertFalse(self.plugin.get_bound_ports_contexts.called)
+        self.assertEqual([], res)
 
     def _test_update_device_not_bound_to_host(self, func):
         self.plugin.port_bound_to_host.return_value = False
@@ -189,6 +203,60 @@ class RpcCallbacksTestCase(base.BaseTestCase):
                          self.callbacks.update_device_down(
                              'fake_context', device='fake_device'))
 
+    def _test_update_devices(self, func, status, rpc_context='fake_context'):
+        self.plugin._device_to_port_id.side_effect = lambda d: 'port-' + d
+        self.plugin.ports_bound_to_host.return_value = set(['port-dev1',
+                                                            'port-dev3'])
+        self.plugin.update_ports_status.return_value = {
+            'port-dev1': 'port-dev1-full', 'port-dev3': None}
+        res = func(rpc_context, devices=['dev1', 'dev2', 'dev3'],
+                   agent_id='fake_agent_id', host='fake_host')
+        self.plugin.ports_bound_to_host.assert_called_once_with(
+            rpc_context, ['port-dev1', 'port-dev2', 'port-dev3'],
+            'fake_host')
+        self.plugin.update_ports_status.assert_called_once_with(
+            rpc_context, ['port-dev1', 'port-dev3'], status, 'fake_host')
+        return res
+
+    def test_update_devices_down(self):
+        self.assertEqual(
+            [{'device': 'dev1', 'exists': True},
+             {'device': 'dev2', 'exists': True},
+             {'device': 'dev3', 'exists': False}],
+            self._test_update_devices(self.callbacks.update_devices_down,
+                                      constants.PORT_STATUS_DOWN))
+
+    def test_update_devices_down_stale_data(self):
+        self.plugin.update_ports_status.side_effect = exc.StaleDataError
+        with mock.patch.object(self.callbacks, 'update_device_down',
+                               side_effect=lambda ctx, **kw: kw) as f:
+            self.assertEqual(
+                [{'device': device, 'agent_id': 'fake_agent_id',
+                  'host': 'fake_host'} for device in ('dev1', 'dev2')],
+                self.callbacks.update_devices_down(
+                    'fake_context', devices=['dev1', 'dev2'],
+                    agent_id='fake_agent_id', host='fake_host'))
+        self.assertEqual(2, f.call_count)
+
+    def test_update_devices_down_with_empty_devices(self):
+        self.assertEqual([],
+                         self.callbacks.update_devices_down('fake_context'))
+        self.assertFalse(self.plugin.update_ports_status.called)
+
+    def test_update_devices_up(self):
+        rpc_context = mock.Mock()
+        port = mock.Mock()
+        self.plugin._get_ports_query.return_value = [port]
+        with mock.patch('neutron.callbacks.registry.notify') as notify:
+            self.assertIsNone(self._test_update_devices(
+                self.callbacks.update_devices_up, constants.PORT_STATUS_ACTIVE,
+                rpc_context=rpc_context))
+        self.plugin._get_ports_query.assert_called_once_with(
+            rpc_context, filters={'id': ['port-dev1-full']})
+        notify.assert_called_once_with(
+            'port', 'after_update', self.plugin, context=rpc_context,
+            port=port, update_device_up=True)
+
 
 class RpcApiTestCase(base.BaseTestCase):
 
@@ -299,6 +367,22 @@ class RpcApiTestCase(base.BaseTestCase):
                            agent_id='fake_agent_id',
                            host='fake_host')
 
+    def test_update_devices_down(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, None,
+                           'update_devices_down', rpc_method='call',
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id', host='fake_host',
+                           version='1.5')
+
+    def test_update_devices_up(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, None,
+                           'update_devices_up', rpc_method='call',
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id', host='fake_host',
+                           version='1.5')
+
     def test_tunnel_sync(self):
         rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
         self._test_rpc_api(rpcapi, None,
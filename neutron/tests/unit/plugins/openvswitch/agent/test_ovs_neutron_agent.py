@@ -139,6 +139,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             # to mocked out RPC calls
             self.agent.use_call = True
             self.agent.tun_br = mock.Mock()
+            self.agent.tun_br.defer_apply_off.return_value = {}
+            self.agent.tun_br.apply_deferred_flows.return_value = {}
         self.agent.sg_agent = mock.Mock()
 
     def _mock_port_bound(self, ofport=None, new_local_vlan=None,
@@ -311,6 +313,198 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 vif_port_set, registered_ports, port_tags_dict=port_tags_dict)
         self.assertEqual(expected, actual)
 
+    def _device_event(self, port_id, name=None, ofport=1):
+        return {'name': name or 'tap%s' % port_id, 'ofport': ofport,
+                'external_ids': {'iface-id': port_id,
+                                 'attached-mac': 'fa:16:3e:00:00:01'}}
+
+    def mock_process_ports_events(self, events, present_ports,
+                                  registered_ports, updated_ports=None):
+        def get_vif_port_by_id(port_id):
+            if port_id in present_ports:
+                return mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              side_effect=get_vif_port_by_id),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_set'),
+        ) as (get_vif_port_by_id_fn, get_vif_port_set_fn):
+            port_info = self.agent.process_ports_events(
+                events, registered_ports, updated_ports)
+        self.assertFalse(get_vif_port_set_fn.called)
+        return port_info
+
+    def test_process_ports_events(self):
+        events = {'added': [self._device_event('4')],
+                  'removed': [self._device_event('2')],
+                  'modified': [self._device_event('3', ofport=5)]}
+        expected = dict(current=set(['1', '3', '4']), added=set(['4']),
+                        removed=set(['2']), updated=set(['3']))
+        actual = self.mock_process_ports_events(
+            events, set(['1', '3', '4']), set(['1', '2', '3']))
+        self.assertEqual(expected, actual)
+        self.assertEqual(3, self.agent.int_br_device_count)
+
+    def test_process_ports_events_relies_on_current_state(self):
+        # The port 4 was removed and the port 1 recreated since the events
+        events = {'added': [self._device_event('4')],
+                  'removed': [self._device_event('1')],
+                  'modified': []}
+        expected = dict(current=set(['1', '2']), updated=set(['1']))
+        actual = self.mock_process_ports_events(
+            events, set(['1', '2']), set(['1', '2']))
+        self.assertEqual(expected, actual)
+
+    def test_process_ports_events_returns_known_updated_ports(self):
+        events = {'added': [], 'removed': [], 'modified': []}
+        expected = dict(current=set(['1', '2']), updated=set(['2']))
+        actual = self.mock_process_ports_events(
+            events, set(['1', '2']), set(['1', '2']), set(['2', '5']))
+        self.assertEqual(expected, actual)
+
+    def test_process_ports_events_scans_ports_for_xenapi_vifs(self):
+        events = {'added': [{'name': 'tap1', 'ofport': 1,
+                             'external_ids': {'xs-vif-uuid': 'vif1'}}],
+                  'removed': [], 'modified': []}
+        with mock.patch.object(self.agent, 'scan_ports') as scan_ports:
+            self.assertEqual(
+                scan_ports.return_value,
+                self.agent.process_ports_events(events, set(['1'])))
+        scan_ports.assert_called_once_with(set(['1']), None)
+
+    def _test_rpc_loop_ports_events(self, events, full_scan_interval=300):
+        self.agent.full_scan_interval = full_scan_interval
+        polling_manager = mock.Mock()
+        polling_manager.get_events.return_value = events
+        port_info = {'current': set(['tap0'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value=port_info),
+            mock.patch.object(self.agent, 'process_ports_events',
+                              return_value=port_info),
+            mock.patch.object(self.agent, 'check_ovs_status',
+                              return_value=constants.OVS_NORMAL),
+            mock.patch.object(self.agent, 'update_stale_ofport_rules'),
+            mock.patch.object(self.agent, 'loop_count_and_wait',
+                              side_effect=[None, TypeError('loop exit')]),
+            mock.patch.object(self.agent, 'defer_apply_flows_on'),
+            mock.patch.object(self.agent, 'defer_apply_flows_off')
+        ) as (scan_ports, process_ports_events, check_ovs_status,
+              update_stale, loop_count_and_wait, defer_apply_flows_on,
+              defer_apply_flows_off):
+            self.assertRaises(TypeError, self.agent.rpc_loop,
+                              polling_manager=polling_manager)
+        self.assertEqual(2, polling_manager.get_events.call_count)
+        # The flows of each iteration are deferred
+        self.assertEqual(2, defer_apply_flows_on.call_count)
+        self.assertEqual(2, defer_apply_flows_off.call_count)
+        return scan_ports, process_ports_events
+
+    def test_rpc_loop_processes_ports_events(self):
+        events = {'added': [], 'removed': [], 'modified': []}
+        scan_ports, process_ports_events = (
+            self._test_rpc_loop_ports_events(events))
+        scan_ports.assert_called_once_with(set(), set())
+        process_ports_events.assert_called_once_with(
+            events, set(['tap0']), set())
+
+    def test_rpc_loop_scans_ports_without_events(self):
+        scan_ports, process_ports_events = (
+            self._test_rpc_loop_ports_events(None))
+        self.assertEqual(2, scan_ports.call_count)
+        self.assertFalse(process_ports_events.called)
+
+    def test_rpc_loop_scans_ports_periodically(self):
+        events = {'added': [], 'removed': [], 'modified': []}
+        scan_ports, process_ports_events = (
+            self._test_rpc_loop_ports_events(events, full_scan_interval=0))
+        self.assertEqual(2, scan_ports.call_count)
+        self.assertFalse(process_ports_events.called)
+
+    def test_defer_apply_flows(self):
+        phys_br = mock.Mock()
+        phys_br.defer_apply_off.return_value = {
+            'add': 1, 'mod': 0, 'del': 2, 'elapsed': 0.5}
+        self.agent.tun_br.defer_apply_off.return_value = {
+            'add': 3, 'mod': 1, 'del': 0, 'elapsed': 0.25}
+        self.agent.phys_brs = {'physnet1': phys_br}
+        self.agent.use_flow_bundles = True
+        with mock.patch.object(self.agent.int_br,
+                               'defer_apply_on') as int_br_defer_apply_on:
+            self.agent.defer_apply_flows_on()
+        for defer_apply_on in (int_br_defer_apply_on,
+                               self.agent.tun_br.defer_apply_on,
+                               phys_br.defer_apply_on):
+            defer_apply_on.assert_called_once_with(use_bundle=True)
+        with mock.patch.object(self.agent.int_br, 'defer_apply_off',
+                               return_value={'add': 0, 'mod': 0, 'del': 1,
+                                             'elapsed': 0}):
+            self.assertEqual({'add': 4, 'mod': 1, 'del': 3, 'elapsed': 0.75},
+                             self.agent.defer_apply_flows_off())
+
+    def test_defer_apply_flows_off_failure(self):
+        phys_br = mock.Mock()
+        phys_br.defer_apply_off.return_value = {}
+        self.agent.phys_brs = {'physnet1': phys_br}
+        self.agent.tun_br.br_name = 'br-tun'
+        self.agent.tun_br.defer_apply_off.side_effect = RuntimeError()
+        with mock.patch.object(self.agent.int_br, 'defer_apply_off',
+                               return_value={}):
+            self.assertRaises(ovs_neutron_agent.FlowsApplyError,
+                              self.agent.defer_apply_flows_off)
+        # The deferral is turned off on the other bridges
+        self.assertTrue(phys_br.defer_apply_off.called)
+
+    def test_rpc_loop_resyncs_on_flows_failure(self):
+        polling_manager = mock.Mock()
+        polling_manager.get_events.return_value = None
+        port_info = {'current': set(['tap0']), 'added': set(['tap0'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value=port_info),
+            mock.patch.object(self.agent, 'process_network_ports',
+                              return_value=False),
+            mock.patch.object(self.agent, 'check_ovs_status',
+                              return_value=constants.OVS_NORMAL),
+            mock.patch.object(self.agent, 'update_stale_ofport_rules'),
+            mock.patch.object(self.agent, 'loop_count_and_wait',
+                              side_effect=[None, TypeError('loop exit')]),
+            mock.patch.object(self.agent, 'defer_apply_flows_on'),
+            mock.patch.object(self.agent, 'defer_apply_flows_off',
+                              side_effect=[ovs_neutron_agent.FlowsApplyError(
+                                  bridges='br-int'), {}])
+        ) as (scan_ports, process_network_ports, check_ovs_status,
+              update_stale, loop_count_and_wait, defer_apply_flows_on,
+              defer_apply_flows_off):
+            self.assertRaises(TypeError, self.agent.rpc_loop,
+                              polling_manager=polling_manager)
+        # The ports are wired again as after an OVS restart
+        self.assertEqual([mock.call(port_info, False),
+                          mock.call(port_info, True)],
+                         process_network_ports.call_args_list)
+
+    def test_treat_devices_added_applies_flows_before_reporting_up(self):
+        details = {'device': 'tap0', 'port_id': 'tap0', 'network_id': 'net',
+                   'network_type': 'vlan', 'physical_network': 'physnet1',
+                   'segmentation_id': 1, 'admin_state_up': True,
+                   'fixed_ips': [], 'device_owner': 'compute:None'}
+        manager = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.Mock()),
+            mock.patch.object(self.agent, 'treat_vif_port'),
+            mock.patch.object(self.agent, 'apply_deferred_flows'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up')
+        ) as (get_dev_fn, get_vif_func, treat_vif_port, apply_flows,
+              update_devices_up):
+            manager.attach_mock(apply_flows, 'apply_deferred_flows')
+            manager.attach_mock(update_devices_up, 'update_devices_up')
+            self.agent.treat_devices_added_or_updated(['tap0'], False)
+        self.assertEqual(['apply_deferred_flows', 'update_devices_up'],
+                         [name for name, _args, _kwargs in manager.mock_calls])
+
     def test_treat_devices_added_returns_raises_for_missing_device(self):
         with contextlib.nested(
             mock.patch.object(self.agent.plugin_rpc,
@@ -336,8 +530,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[details]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=port),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, func_name)
         ) as (get_dev_fn, get_vif_func, upd_dev_up, upd_dev_down, func):
             skip_devs = self.agent.treat_devices_added_or_updated([{}], False)
@@ -380,8 +574,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[dev_mock]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=None),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
         ) as (get_dev_fn, get_vif_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
@@ -412,8 +606,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[fake_details_dict]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.MagicMock()),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
         ) as (get_dev_fn, get_vif_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
@@ -421,16 +615,47 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             # The function should return False for resync
             self.assertFalse(skip_devs)
             self.assertTrue(treat_vif_port.called)
-            self.assertTrue(upd_dev_down.called)
+            upd_dev_down.assert_called_once_with(
+                self.agent.context, ['xxx'], self.agent.agent_id,
+                cfg.CONF.host)
+            self.assertFalse(upd_dev_up.called)
+
+    def test_treat_devices_added_updated_updates_status_in_bulk(self):
+        details = [{'admin_state_up': True,
+                    'port_id': device,
+                    'device': device,
+                    'network_id': 'yyy',
+                    'physical_network': 'foo',
+                    'segmentation_id': 'bar',
+                    'network_type': 'baz',
+                    'fixed_ips': [],
+                    'device_owner': 'compute:None'}
+                   for device in ('xxx', 'zzz')]
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=details),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ) as (get_dev_fn, get_vif_func, upd_dev_up,
+              upd_dev_down, treat_vif_port):
+            self.agent.treat_devices_added_or_updated(['xxx', 'zzz'], False)
+        upd_dev_up.assert_called_once_with(
+            self.agent.context, ['xxx', 'zzz'], self.agent.agent_id,
+            cfg.CONF.host)
+        self.assertFalse(upd_dev_down.called)
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                side_effect=Exception()):
             self.assertTrue(self.agent.treat_devices_removed([{}]))
 
     def _mock_treat_devices_removed(self, port_exists):
         details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                return_value=details):
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
                 self.assertFalse(self.agent.treat_devices_removed([{}]))
@@ -442,6 +667,23 @@ class TestOvsNeutronAgent(base.BaseTestCase):
     def test_treat_devices_removed_ignores_missing_port(self):
         self._mock_treat_devices_removed(False)
 
+    def test_treat_ancillary_devices_removed(self):
+        details = [{'device': 'xxx', 'exists': True},
+                   {'device': 'zzz', 'exists': False}]
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                               return_value=details) as upd_dev_down:
+            self.assertFalse(
+                self.agent.treat_ancillary_devices_removed(['xxx', 'zzz']))
+        upd_dev_down.assert_called_once_with(
+            self.agent.context, ['xxx', 'zzz'], self.agent.agent_id,
+            cfg.CONF.host)
+
+    def test_treat_ancillary_devices_removed_failed(self):
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                               side_effect=Exception()):
+            self.assertTrue(
+                self.agent.treat_ancillary_devices_removed(['xxx']))
+
     def _test_process_network_ports(self, port_info):
         with contextlib.nested(
             mock.patch.object(self.agent.sg_agent, "setup_port_filters"),
@@ -484,6 +726,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 self.agent.agent_state["configurations"]["devices"],
                 self.agent.int_br_device_count
             )
+            self.assertIn(
+                "execute_latency", self.agent.agent_state["configurations"])
             self.agent._report_state()
             report_st.assert_called_with(self.agent.context,
                                          self.agent.agent_state, False)
@@ -1126,6 +1370,7 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         # treat_devices_added_or_updated that checks the prevent_arp_spoofing
         # flag
         self.agent.int_br = mock.Mock()
+        self.agent.int_br.apply_deferred_flows.return_value = {}
         self.agent.treat_vif_port = mock.Mock()
         self.agent.get_vif_port_by_id = mock.Mock(return_value=FakeVif())
         self.agent.plugin_rpc = mock.Mock()
@@ -1319,6 +1564,8 @@ class TestOvsDvrNeutronAgent(base.BaseTestCase):
             # to mocked out RPC calls
             self.agent.use_call = True
             self.agent.tun_br = mock.Mock()
+            self.agent.tun_br.defer_apply_off.return_value = {}
+            self.agent.tun_br.apply_deferred_flows.return_value = {}
         self.agent.sg_agent = mock.Mock()
 
     def _setup_for_dvr_test(self, ofport=10):
@@ -1706,7 +1953,7 @@ class TestOvsDvrNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                               return_value=None),
             mock.patch.object(self.agent.dvr_agent.int_br, 'delete_flows'),
             mock.patch.object(self.agent.dvr_agent.tun_br,
@@ -1793,7 +2040,7 @@ class TestOvsDvrNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                               return_value=None),
             mock.patch.object(self.agent.dvr_agent.int_br,
                               'delete_flows')) as (reclaim_vlan_fn,
@@ -1864,7 +2111,7 @@ class TestOvsDvrNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                               return_value=None),
             mock.patch.object(self.agent.dvr_agent.int_br,
                               'delete_flows')) as (reclaim_vlan_fn,
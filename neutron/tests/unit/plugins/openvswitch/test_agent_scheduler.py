@@ -809,6 +809,21 @@ class OvsAgentSchedulerTestCase(OvsAgentSchedulerTestCaseBase):
             ret_b = l3_rpc_cb.sync_routers(self.adminContext, host=L3_HOSTB)
             self.assertFalse(ret_b)
 
+    def test_get_router_ids_auto_schedule(self):
+        with self.router() as r:
+            l3_rpc_cb = l3_rpc.L3RpcCallback()
+            self._register_agent_states()
+
+            # the router is scheduled to host A, then kept by it
+            ret_a = l3_rpc_cb.get_router_ids(self.adminContext, host=L3_HOSTA)
+            ret_b = l3_rpc_cb.get_router_ids(self.adminContext, host=L3_HOSTB)
+            self.assertEqual([r['router']['id']], ret_a)
+            self.assertEqual([], ret_b)
+
+            self._set_agent_admin_state_up(L3_HOSTA, False)
+            ret_a = l3_rpc_cb.get_router_ids(self.adminContext, host=L3_HOSTA)
+            self.assertEqual([], ret_a)
+
     def test_router_auto_schedule_with_invalid_router(self):
         with self.router() as router:
             l3_rpc_cb = l3_rpc.L3RpcCallback()
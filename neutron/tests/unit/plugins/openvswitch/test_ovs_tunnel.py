@@ -510,10 +510,18 @@ class TunnelTest(base.BaseTestCase):
                   'added': set([]),
                   'removed': set(['tap0'])}
 
-        self.mock_int_bridge_expected += [
-            mock.call.dump_flows_for_table(constants.CANARY_TABLE),
-            mock.call.dump_flows_for_table(constants.CANARY_TABLE)
-        ]
+        # The flows of each iteration are deferred on every bridge
+        deferred_flows = [mock.call.defer_apply_on(use_bundle=False),
+                          mock.call.defer_apply_off()]
+        self.mock_int_bridge_expected += (
+            [mock.call.dump_flows_for_table(constants.CANARY_TABLE)] +
+            deferred_flows +
+            [mock.call.dump_flows_for_table(constants.CANARY_TABLE)] +
+            deferred_flows)
+        self.mock_tun_bridge_expected += deferred_flows * 2
+        self.mock_map_tun_bridge_expected += deferred_flows * 2
+        for bridge in self.ovs_bridges.values():
+            bridge.defer_apply_off.return_value = {}
 
         with contextlib.nested(
             mock.patch.object(log.KeywordArgumentAdapter, 'exception'),
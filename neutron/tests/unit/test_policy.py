@@ -419,6 +419,19 @@ class NeutronPolicyTestCase(base.BaseTestCase):
         result = policy._build_match_rule(action, target, None)
         self.assertEqual("rule:" + action, str(result))
 
+    def test_build_match_rule_reused_for_same_attributes(self):
+        action = "create_" + FAKE_RESOURCE_NAME
+        rule = policy._build_match_rule(
+            action, {'attr': {'sub_attr_1': 'x'}}, None)
+        self.assertIs(rule, policy._build_match_rule(
+            action, {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'y'}},
+            None))
+        self.assertIsNot(rule, policy._build_match_rule(
+            action, {'attr': {'sub_attr_1': 'x', 'sub_attr_2': 'y'}}, None))
+        self.assertIs(policy._build_match_rule('get_network', {}, None),
+                      policy._build_match_rule(
+                          'get_network', {'shared': True}, None))
+
     def test_enforce_subattribute(self):
         action = "create_" + FAKE_RESOURCE_NAME
         target = {'tenant_id': 'fake', 'attr': {'sub_attr_1': 'x'}}
@@ -510,6 +523,36 @@ class NeutronPolicyTestCase(base.BaseTestCase):
             result = policy.enforce(self.context, action, target)
             self.assertTrue(result)
 
+    def test_checker(self):
+        checker = policy.Checker(self.context)
+        self.assertTrue(checker.check('get_network', {'tenant_id': 'fake'}))
+        self.assertFalse(checker.check('get_network',
+                                       {'tenant_id': 'somebody_else'}))
+        self.assertTrue(checker.check('get_network',
+                                      {'tenant_id': 'somebody_else',
+                                       'shared': True}))
+
+    def test_checker_might_not_exist(self):
+        checker = policy.Checker(self.context)
+        self.assertTrue(checker.check('get_network:foo', {},
+                                      might_not_exist=True))
+        self.assertFalse(checker.check('create_network:shared',
+                                       {'tenant_id': 'fake'},
+                                       might_not_exist=True))
+
+    def test_checker_memoizes_parent_resources(self):
+        action = "create_port:mac"
+        plugin = manager.NeutronManager.get_instance().plugin
+        with mock.patch.object(plugin, 'get_network',
+                               return_value={'tenant_id': 'fake'}) as f:
+            checker = policy.Checker(self.context)
+            for network_id in ('net1', 'net1', 'net2'):
+                self.assertTrue(checker.check(action,
+                                              {'network_id': network_id}))
+            self.assertEqual(2, f.call_count)
+            policy.Checker(self.context).check(action, {'network_id': 'net1'})
+            self.assertEqual(3, f.call_count)
+
     def test_tenant_id_check_no_target_field_raises(self):
         # Try and add a bad rule
         self.assertRaises(
@@ -632,3 +675,43 @@ class NeutronPolicyTestCase(base.BaseTestCase):
             policy.log_rule_list(common_policy.RuleCheck('rule', 'create_'))
             self.assertTrue(is_e.called)
             self.assertTrue(dbg.called)
+
+    def _get_query_filter(self, action, ctx=None):
+        return policy.get_query_filter(ctx or self.context, action)
+
+    def test_get_query_filter_admin(self):
+        admin_context = context.get_admin_context()
+        self.assertIs(True, self._get_query_filter('get_port', admin_context))
+
+    def test_get_query_filter_owner(self):
+        query_filter = self._get_query_filter('get_port')
+        self.assertIsInstance(query_filter, policy.QueryFilter)
+        self.assertEqual(('==', 'tenant_id', 'fake'), query_filter.condition)
+        self.assertFalse(query_filter.applied)
+
+    def test_get_query_filter_owner_or_shared(self):
+        self.rules['get_network'] = common_policy.parse_rule(
+            "rule:admin_or_owner or rule:shared or rule:context_is_advsvc")
+        query_filter = self._get_query_filter('get_network')
+        self.assertEqual(('or', [('==', 'tenant_id', 'fake'),
+                                 ('==', 'shared', True)]),
+                         query_filter.condition)
+
+    def test_get_query_filter_parent_owner_not_compiled(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_network_owner")
+        self.assertIsNone(self._get_query_filter('get_port'))
+
+    def test_get_query_filter_denied(self):
+        self.rules['get_port'] = common_policy.parse_rule('!')
+        self.assertIs(False, self._get_query_filter('get_port'))
+
+    def test_get_query_filter_role(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:regular_user or tenant_id:%(tenant_id)s")
+        self.assertIs(True, self._get_query_filter('get_port'))
+
+    def test_get_query_filter_unknown_attribute_not_compiled(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "tenant_id:%(tenant_id)s or field:ports:foo=bar")
+        self.assertIsNone(self._get_query_filter('get_port'))
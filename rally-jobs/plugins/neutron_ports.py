@@ -0,0 +1,56 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from rally.benchmark.scenarios import base
+from rally.benchmark.scenarios.neutron import utils
+from rally.benchmark.scenarios import utils as scenario_utils
+
+
+class NeutronBulkPorts(utils.NeutronScenario):
+    """Benchmark scenarios for the bulk creation of Neutron ports."""
+
+    @scenario_utils.atomic_action_timer("neutron.create_port_bulk")
+    def _create_port_bulk(self, network, ports_per_request,
+                          port_create_args):
+        ports = []
+        for i in range(ports_per_request):
+            port = {"network_id": network["network"]["id"],
+                    "name": self._generate_random_name("rally_port_")}
+            port.update(port_create_args)
+            ports.append(port)
+        return self.clients("neutron").create_port({"ports": ports})
+
+    @base.scenario(context={"cleanup": ["neutron"]})
+    def create_and_list_ports_bulk(self, network_create_args=None,
+                                   subnet_create_args=None,
+                                   subnet_cidr_start=None,
+                                   port_create_args=None,
+                                   ports_per_request=100):
+        """Create ports with a single bulk request and list them.
+
+        Measure the "neutron port-create" command performance when the
+        ports are all created by one request, as an orchestrator
+        creating the ports of a stack does.
+
+        :param network_create_args: dict, POST /v2.0/networks request options
+        :param subnet_create_args: dict, POST /v2.0/subnets request options
+        :param subnet_cidr_start: str, start value for the subnet CIDR
+        :param port_create_args: dict, options of each port of the
+                                 POST /v2.0/ports request
+        :param ports_per_request: int, number of ports of the request
+        """
+        network = self._create_network(network_create_args or {})
+        self._create_subnet(network, subnet_create_args or {},
+                            subnet_cidr_start)
+        self._create_port_bulk(network, ports_per_request,
+                               port_create_args or {})
+        self._list_ports()